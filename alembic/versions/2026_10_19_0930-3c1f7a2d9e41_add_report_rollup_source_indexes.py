@@ -0,0 +1,32 @@
+"""add_report_rollup_source_indexes
+
+Revision ID: 3c1f7a2d9e41
+Revises: 405fd6725f21
+Create Date: 2026-10-19 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f7a2d9e41'
+down_revision: Union[str, None] = '405fd6725f21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Пересчет дневных агрегатов отчетов выбирает задачи и записи времени по дню
+    op.create_index(op.f('ix_tasks_created_at'), 'tasks', ['created_at'], unique=False, if_not_exists=True)
+    op.create_index(op.f('ix_task_time_logs_start_time'), 'task_time_logs', ['start_time'], unique=False,
+                    if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_task_time_logs_start_time'), table_name='task_time_logs', if_exists=True)
+    op.drop_index(op.f('ix_tasks_created_at'), table_name='tasks', if_exists=True)
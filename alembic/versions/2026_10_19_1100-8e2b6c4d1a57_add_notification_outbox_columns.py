@@ -0,0 +1,85 @@
+"""add_notification_outbox_columns
+
+Revision ID: 8e2b6c4d1a57
+Revises: 3c1f7a2d9e41
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e2b6c4d1a57'
+down_revision: Union[str, None] = '3c1f7a2d9e41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns(table: str) -> set:
+    """Колонки существующей таблицы (пусто, если таблицы нет: ее создаст create_all по модели)"""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return set()
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Идемпотентное создание уведомлений: ключ уникален в пределах получателя
+    columns = _columns('notifications')
+    if columns and 'idempotency_key' not in columns:
+        op.add_column('notifications', sa.Column('idempotency_key', sa.String(length=100), nullable=True))
+        with op.batch_alter_table('notifications') as batch_op:
+            batch_op.create_unique_constraint('uq_notifications_recipient_idempotency',
+                                              ['recipient_id', 'idempotency_key'])
+
+    # Очередь исходящих: одна запись на канал с ключом идемпотентности, расписанием попыток и арендой
+    columns = _columns('notification_deliveries')
+    if not columns:
+        return
+    for name in ('next_attempt_at', 'locked_until', 'last_attempt_at', 'dead_lettered_at'):
+        if name not in columns:
+            op.add_column('notification_deliveries', sa.Column(name, sa.DateTime(), nullable=True))
+    if 'next_attempt_at' not in columns:
+        # Существующие записи считаются готовыми к попытке с момента создания
+        op.execute("UPDATE notification_deliveries SET next_attempt_at = COALESCE(created_at, CURRENT_TIMESTAMP)")
+        with op.batch_alter_table('notification_deliveries') as batch_op:
+            batch_op.alter_column('next_attempt_at', existing_type=sa.DateTime(), nullable=False)
+    if 'idempotency_key' not in columns:
+        op.add_column('notification_deliveries', sa.Column('idempotency_key', sa.String(length=100), nullable=True))
+        # Тот же ключ, что дает delivery_idempotency_key: "<uuid уведомления>:<канал>"
+        op.execute(
+            "UPDATE notification_deliveries SET idempotency_key = "
+            "(SELECT notifications.notification_uuid FROM notifications "
+            "WHERE notifications.id = notification_deliveries.notification_id) || ':' || channel"
+        )
+        # Записи без уведомления не могут быть доставлены - ключ по id, чтобы выполнить NOT NULL
+        op.execute(
+            "UPDATE notification_deliveries SET idempotency_key = 'orphan:' || CAST(id AS VARCHAR(20)) "
+            "WHERE idempotency_key IS NULL"
+        )
+        with op.batch_alter_table('notification_deliveries') as batch_op:
+            batch_op.alter_column('idempotency_key', existing_type=sa.String(length=100), nullable=False)
+            batch_op.create_unique_constraint('uq_notification_deliveries_idempotency_key', ['idempotency_key'])
+    op.create_index('idx_notification_deliveries_due', 'notification_deliveries',
+                    ['channel', 'status', 'next_attempt_at'], unique=False, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    columns = _columns('notification_deliveries')
+    if columns:
+        op.drop_index('idx_notification_deliveries_due', table_name='notification_deliveries', if_exists=True)
+        with op.batch_alter_table('notification_deliveries') as batch_op:
+            if 'idempotency_key' in columns:
+                batch_op.drop_constraint('uq_notification_deliveries_idempotency_key', type_='unique')
+            for name in ('idempotency_key', 'dead_lettered_at', 'last_attempt_at', 'locked_until', 'next_attempt_at'):
+                if name in columns:
+                    batch_op.drop_column(name)
+    if 'idempotency_key' in _columns('notifications'):
+        with op.batch_alter_table('notifications') as batch_op:
+            batch_op.drop_constraint('uq_notifications_recipient_idempotency', type_='unique')
+            batch_op.drop_column('idempotency_key')
@@ -0,0 +1,41 @@
+"""add_notification_webhook_signing_secret
+
+Revision ID: b4d9e07f3c12
+Revises: 8e2b6c4d1a57
+Create Date: 2026-10-19 11:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d9e07f3c12'
+down_revision: Union[str, None] = '8e2b6c4d1a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns(table: str) -> set:
+    """Колонки существующей таблицы (пусто, если таблицы нет: ее создаст create_all по модели)"""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return set()
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Секрет подписи HMAC тела webhook'а (без секрета запросы не подписываются)
+    columns = _columns('notification_webhooks')
+    if columns and 'signing_secret' not in columns:
+        op.add_column('notification_webhooks', sa.Column('signing_secret', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if 'signing_secret' in _columns('notification_webhooks'):
+        with op.batch_alter_table('notification_webhooks') as batch_op:
+            batch_op.drop_column('signing_secret')
@@ -0,0 +1,68 @@
+"""add_notification_digest_columns
+
+Revision ID: c7a3f81e5d26
+Revises: b4d9e07f3c12
+Create Date: 2026-10-19 11:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7a3f81e5d26'
+down_revision: Union[str, None] = 'b4d9e07f3c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns(table: str) -> set:
+    """Колонки существующей таблицы (пусто, если таблицы нет: ее создаст create_all по модели)"""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return set()
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Запись доставки, переданная в сводку, ссылается на нее
+    columns = _columns('notification_deliveries')
+    if columns and 'batch_id' not in columns:
+        with op.batch_alter_table('notification_deliveries') as batch_op:
+            batch_op.add_column(sa.Column('batch_id', sa.BigInteger(), nullable=True))
+            batch_op.create_foreign_key('fk_notification_deliveries_batch_id', 'notification_batches',
+                                        ['batch_id'], ['id'])
+    if columns:
+        op.create_index('idx_notification_deliveries_batch', 'notification_deliveries', ['batch_id'],
+                        unique=False, if_not_exists=True)
+
+    if not _columns('notification_batches'):
+        return
+    # Не больше одной открытой сводки на пользователя, тип и канал: лишние открытые закрываются
+    op.execute(
+        "UPDATE notification_batches SET status = 'failed' WHERE status = 'pending' AND id NOT IN "
+        "(SELECT keep_id FROM (SELECT MAX(id) AS keep_id FROM notification_batches WHERE status = 'pending' "
+        "GROUP BY user_id, notification_type, channel) AS open_batches)"
+    )
+    op.create_index('idx_notification_batches_due', 'notification_batches', ['status', 'scheduled_at'],
+                    unique=False, if_not_exists=True)
+    op.create_index('uq_notification_batches_open', 'notification_batches',
+                    ['user_id', 'notification_type', 'channel'], unique=True, if_not_exists=True,
+                    postgresql_where=sa.text("status = 'pending'"), sqlite_where=sa.text("status = 'pending'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _columns('notification_batches'):
+        op.drop_index('uq_notification_batches_open', table_name='notification_batches', if_exists=True)
+        op.drop_index('idx_notification_batches_due', table_name='notification_batches', if_exists=True)
+    columns = _columns('notification_deliveries')
+    if columns:
+        op.drop_index('idx_notification_deliveries_batch', table_name='notification_deliveries', if_exists=True)
+    if 'batch_id' in columns:
+        with op.batch_alter_table('notification_deliveries') as batch_op:
+            batch_op.drop_constraint('fk_notification_deliveries_batch_id', type_='foreignkey')
+            batch_op.drop_column('batch_id')
@@ -0,0 +1,42 @@
+"""add_notification_feed_indexes
+
+Revision ID: d2e6a9b45f83
+Revises: c7a3f81e5d26
+Create Date: 2026-10-19 11:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2e6a9b45f83'
+down_revision: Union[str, None] = 'c7a3f81e5d26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблицы нет - ее создаст create_all по модели вместе с индексами
+    if not sa.inspect(op.get_bind()).has_table('notifications'):
+        return
+    # Лента пользователя, массовые операции по непрочитанным и очистка по дате создания
+    op.create_index('idx_notifications_recipient_created', 'notifications', ['recipient_id', 'created_at'],
+                    unique=False, if_not_exists=True)
+    op.create_index('idx_notifications_recipient_unread', 'notifications', ['recipient_id'], unique=False,
+                    if_not_exists=True, postgresql_where=sa.text('read_at IS NULL'),
+                    sqlite_where=sa.text('read_at IS NULL'))
+    op.create_index('idx_notifications_created', 'notifications', ['created_at'], unique=False,
+                    if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if not sa.inspect(op.get_bind()).has_table('notifications'):
+        return
+    op.drop_index('idx_notifications_created', table_name='notifications', if_exists=True)
+    op.drop_index('idx_notifications_recipient_unread', table_name='notifications', if_exists=True)
+    op.drop_index('idx_notifications_recipient_created', table_name='notifications', if_exists=True)
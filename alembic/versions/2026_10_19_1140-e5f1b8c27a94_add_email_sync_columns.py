@@ -0,0 +1,110 @@
+"""add_email_sync_columns
+
+Revision ID: e5f1b8c27a94
+Revises: d2e6a9b45f83
+Create Date: 2026-10-19 11:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f1b8c27a94'
+down_revision: Union[str, None] = 'd2e6a9b45f83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Имя безымянного ограничения (SQLite) при пересоздании таблицы
+NAMING_CONVENTION = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+
+
+def _columns(table: str) -> set:
+    """Колонки существующей таблицы (пусто, если таблицы нет: ее создаст create_all по модели)"""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return set()
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def _unique_constraints(table: str) -> dict:
+    """Ограничения уникальности таблицы: колонки -> имя (безымянные - по NAMING_CONVENTION)"""
+    return {
+        tuple(constraint['column_names']): constraint['name'] or f"uq_{table}_{constraint['column_names'][0]}"
+        for constraint in sa.inspect(op.get_bind()).get_unique_constraints(table)
+    }
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Расписание синхронизации аккаунтов обработчиком
+    columns = _columns('email_accounts')
+    if columns:
+        for name in ('imap_next_sync_at', 'imap_last_sync_at'):
+            if name not in columns:
+                op.add_column('email_accounts', sa.Column(name, sa.DateTime(), nullable=True))
+        if 'imap_sync_error' not in columns:
+            op.add_column('email_accounts', sa.Column('imap_sync_error', sa.Text(), nullable=True))
+        op.create_index('idx_email_accounts_imap_next_sync', 'email_accounts', ['imap_next_sync_at'],
+                        unique=False, if_not_exists=True)
+
+    # Состояние синхронизации папки: UIDVALIDITY, последний UID и HIGHESTMODSEQ
+    columns = _columns('email_folders')
+    if columns:
+        for name in ('uid_validity', 'highest_modseq'):
+            if name not in columns:
+                op.add_column('email_folders', sa.Column(name, sa.BigInteger(), nullable=True))
+        if 'last_uid' not in columns:
+            op.add_column('email_folders', sa.Column('last_uid', sa.BigInteger(), nullable=False,
+                                                     server_default='0'))
+        if 'last_synced_at' not in columns:
+            op.add_column('email_folders', sa.Column('last_synced_at', sa.DateTime(), nullable=True))
+
+    # UID письма в папке на сервере
+    columns = _columns('email_folder_mappings')
+    if columns:
+        if 'imap_uid' not in columns:
+            op.add_column('email_folder_mappings', sa.Column('imap_uid', sa.BigInteger(), nullable=True))
+        op.create_index('idx_email_folder_mappings_folder_uid', 'email_folder_mappings', ['folder_id', 'imap_uid'],
+                        unique=False, if_not_exists=True)
+
+    # Message-ID уникален в пределах аккаунта, а не глобально
+    if _columns('emails'):
+        constraints = _unique_constraints('emails')
+        if ('sender_id', 'message_id') not in constraints:
+            with op.batch_alter_table('emails', naming_convention=NAMING_CONVENTION) as batch_op:
+                if ('message_id',) in constraints:
+                    batch_op.drop_constraint(constraints[('message_id',)], type_='unique')
+                batch_op.create_unique_constraint('uq_emails_sender_message_id', ['sender_id', 'message_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _columns('emails') and ('sender_id', 'message_id') in _unique_constraints('emails'):
+        with op.batch_alter_table('emails') as batch_op:
+            batch_op.drop_constraint('uq_emails_sender_message_id', type_='unique')
+            batch_op.create_unique_constraint('uq_emails_message_id', ['message_id'])
+
+    columns = _columns('email_folder_mappings')
+    if columns:
+        op.drop_index('idx_email_folder_mappings_folder_uid', table_name='email_folder_mappings', if_exists=True)
+        if 'imap_uid' in columns:
+            with op.batch_alter_table('email_folder_mappings') as batch_op:
+                batch_op.drop_column('imap_uid')
+
+    columns = _columns('email_folders')
+    if columns:
+        with op.batch_alter_table('email_folders') as batch_op:
+            for name in ('last_synced_at', 'highest_modseq', 'last_uid', 'uid_validity'):
+                if name in columns:
+                    batch_op.drop_column(name)
+
+    columns = _columns('email_accounts')
+    if columns:
+        op.drop_index('idx_email_accounts_imap_next_sync', table_name='email_accounts', if_exists=True)
+        with op.batch_alter_table('email_accounts') as batch_op:
+            for name in ('imap_sync_error', 'imap_last_sync_at', 'imap_next_sync_at'):
+                if name in columns:
+                    batch_op.drop_column(name)
@@ -3,7 +3,7 @@ __all__ = ("Routers", "Server",
             "get_current_user", "get_current_active_user", "validate_token_type",
             "get_user_by_token_sub", "get_current_token_payload",
             "verify_authorization", "authenticate_user", "create_user",
-            "require_role", "require_roles", "get_current_user_id")
+            "require_role", "require_roles", "get_current_user_id", "is_email")
 
 from backend.api.configuration.routers.routers import Routers
 from backend.api.configuration.server import Server
@@ -14,6 +14,7 @@ from backend.api.configuration.auth import (verify_password, get_password_hash,
                                             get_current_active_user, validate_token_type, 
                                             get_user_by_token_sub, get_current_token_payload,
                                             verify_authorization, authenticate_user, create_user,
-                                            require_role, require_roles, get_current_user_id)
+                                            require_role, require_roles, get_current_user_id,
+                                            is_email)
 
 from backend.api.configuration.rabbitmq_server import rabbit
\ No newline at end of file
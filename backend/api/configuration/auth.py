@@ -6,18 +6,21 @@ from fastapi import HTTPException, Depends, status, Form
 from jose import jwt, JWTError
 from datetime import datetime, timedelta, timezone
 import re
-from passlib.context import CryptContext
 
 from core.settings import settings
-from core.database import User, orm_get_user_by_login
+from core.database import User, orm_get_user_by_login, get_db_helper
 
 from backend.api.configuration import TokenData, Server, UserResponse, UserLoginResponse
+from backend.api.configuration.token_keys import token_key_ring
+from backend.api.configuration.principal_cache import Principal, principal_cache
+from backend.api.configuration.password_hasher import password_hasher
+from backend.api.configuration.permission_matrix import check_user_permission
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-# Настройка хеширования паролей
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Настройка хеширования паролей (асинхронные вызовы - через password_hasher)
+pwd_context = password_hasher.context
 
 TOKEN_TYPE_FIELD = "type"
 TOKEN_TYPE_ACCESS = "access"
@@ -30,11 +33,11 @@ def is_email(string: str) -> bool:
     return re.fullmatch(EMAIL_REGEX, string) is not None
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Проверка пароля"""
+    """Проверка пароля (блокирует поток; в обработчиках - await password_hasher.verify)"""
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    """Хеширование пароля"""
+    """Хеширование пароля (блокирует поток; в обработчиках - await password_hasher.hash)"""
     return pwd_context.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -46,24 +49,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     
     to_encode.update({"exp": expire, TOKEN_TYPE_FIELD: TOKEN_TYPE_ACCESS})
     
-    # Используем secret_key для HS256 и private_key для RS256
-    if settings.security.algorithm == "HS256":
-        key = settings.security.secret_key
-    else:
-        key = settings.security.private_key_path.read_text()
-    
-    encoded_jwt = jwt.encode(to_encode, key, algorithm=settings.security.algorithm)
+    # Ключи (secret_key для HS256, private_key для RS256) загружены один раз в token_key_ring
+    encoded_jwt = token_key_ring.encode(to_encode)
     return encoded_jwt
 
 def decode_access_token(token: str, algorithm: str = settings.security.algorithm):
     try:
-        # Используем secret_key для HS256 и public_key для RS256
-        if algorithm == "HS256":
-            key = settings.security.secret_key
-        else:
-            key = settings.security.public_key_path.read_text()
-        
-        payload = jwt.decode(token, key, algorithms=[algorithm])
+        # Ключ выбирается по kid из заголовка; токены прежних ключей принимаются до истечения
+        payload = token_key_ring.decode(token)
         return payload
         
     except JWTError as e:
@@ -106,7 +99,7 @@ async def get_user_by_token_sub(payload: dict, session: AsyncSession) -> User:
         )
     
     try:
-        user = await orm_get_user_by_login(session, username)
+        user = await orm_get_user_by_login(session, UserLoginResponse(login=username, password=""))
         
         if user:
             return user
@@ -117,6 +110,8 @@ async def get_user_by_token_sub(payload: dict, session: AsyncSession) -> User:
                 headers={"WWW-Authenticate": "Bearer"},
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -124,6 +119,17 @@ async def get_user_by_token_sub(payload: dict, session: AsyncSession) -> User:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+async def get_principal_by_token_sub(payload: dict, session: AsyncSession) -> Principal:
+    """Пользователь токена из кэша principal; в БД - только при промахе"""
+    subject = payload.get("sub")
+    
+    async def load() -> Principal:
+        return Principal.from_user(await get_user_by_token_sub(payload, session))
+    
+    if not subject:
+        return await load()
+    return await principal_cache.get_or_load(subject, load)
+
 async def verify_authorization(
     token: str = Depends(Server.oauth2_scheme),
     session: AsyncSession = Depends(Server.get_db)
@@ -138,9 +144,11 @@ async def verify_authorization(
     try:
         payload = get_current_token_payload(token)
         validate_token_type(payload, TOKEN_TYPE_ACCESS)
-        user = await get_user_by_token_sub(payload, session)
+        user = await get_principal_by_token_sub(payload, session)
         
-        if hasattr(user, 'is_active') and user.is_active:
+        if user.is_active:
+            # Чтения после собственных записей пользователя идут в основную БД
+            await get_db_helper().start_read_your_writes(user.id)
             return user
         else:
             raise HTTPException(
@@ -177,10 +185,10 @@ async def get_current_active_user(
     return current_user
 
 async def authenticate_user(session: AsyncSession, username: str, password: str):
-    user = await orm_get_user_by_login(session, username)
+    user = await orm_get_user_by_login(session, UserLoginResponse(login=username, password=""))
     if not user:
         return False
-    if not user.verify_password(password):
+    if not await password_hasher.verify(password, user.password_hash):
         return False
     return user
 
@@ -220,6 +228,20 @@ def require_roles(required_roles: list[str]):
         return user
     return roles_checker
 
+def require_permission(resource: str, action: str):
+    """Зависимость для проверки разрешения роли по матрице разрешений"""
+    async def permission_checker(
+        user = Depends(verify_authorization),
+        session: AsyncSession = Depends(Server.get_db)
+    ):
+        if not await check_user_permission(session, user.id, resource, action, role=user.role):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Permission {resource}:{action} required"
+            )
+        return user
+    return permission_checker
+
 async def get_current_user_id(token: str = Depends(Server.oauth2_scheme)) -> int:
     """Получить ID текущего пользователя"""
     try:
@@ -229,4 +251,17 @@ async def get_current_user_id(token: str = Depends(Server.oauth2_scheme)) -> int
             raise HTTPException(status_code=401, detail="Invalid token")
         return user_id
     except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+async def authenticate_websocket(token: Optional[str]) -> Optional[Principal]:
+    """Пользователь access-токена WebSocket-соединения (браузер передает токен в query); None - отказ"""
+    if not token:
+        return None
+    try:
+        payload = decode_access_token(token)
+        validate_token_type(payload, TOKEN_TYPE_ACCESS)
+        async with get_db_helper().get_session() as session:
+            principal = await get_principal_by_token_sub(payload, session)
+    except HTTPException:
+        return None
+    return principal if principal.is_active else None
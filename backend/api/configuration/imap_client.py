@@ -0,0 +1,294 @@
+"""
+Асинхронный IMAP-клиент для синхронизации почты
+
+Подмножество IMAP4rev1 на asyncio streams, нужное для инкрементальной
+синхронизации: LOGIN, SELECT (с CONDSTORE, RFC 7162), UID FETCH (в том числе
+CHANGEDSINCE) и LOGOUT. Литералы ответа больше inline_limit байт не
+собираются в памяти: они по частям пишутся во временный файл в spool_dir
+(SpooledLiteral), откуда синхронизация переносит письмо в хранилище.
+"""
+
+import asyncio
+import os
+import re
+import ssl
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+import aiofiles
+
+IMPLICIT_TLS_PORT = 993
+CHUNK_SIZE = 64 * 1024
+
+_LITERAL = re.compile(r"\{(\d+)\}$")
+_TOKEN = re.compile(r'\(|\)|"(?:\\.|[^"\\])*"|[^\s()"]+')
+_RESPONSE_CODE = re.compile(r"\[(UIDVALIDITY|UIDNEXT|HIGHESTMODSEQ) (\d+)\]")
+
+
+class IMAPError(Exception):
+    """Сервер ответил NO или BAD"""
+
+
+class IMAPDisconnected(ConnectionError):
+    """Сервер закрыл соединение"""
+
+
+@dataclass
+class SpooledLiteral:
+    """Литерал ответа, записанный во временный файл"""
+    path: str
+    size: int
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+Literal = Union[bytes, SpooledLiteral]
+
+
+@dataclass
+class MailboxInfo:
+    """Состояние папки после SELECT"""
+    uid_validity: Optional[int] = None
+    uid_next: Optional[int] = None
+    highest_modseq: Optional[int] = None
+    exists: int = 0
+
+
+@dataclass
+class FetchedMessage:
+    """Элемент ответа UID FETCH"""
+    uid: int
+    flags: Set[str] = field(default_factory=set)
+    modseq: Optional[int] = None
+    size: Optional[int] = None
+    body: Optional[Literal] = None
+
+
+def quote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def uid_set(uids: Sequence[int]) -> str:
+    """Набор UID в виде диапазонов: [1, 2, 3, 7] -> "1:3,7" """
+    ranges = []
+    for uid in sorted(uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(start) if start == end else f"{start}:{end}" for start, end in ranges)
+
+
+def _tokens(segments: List[Union[str, Literal]]) -> List[Any]:
+    tokens: List[Any] = []
+    for segment in segments:
+        if isinstance(segment, str):
+            tokens.extend(_TOKEN.findall(segment))
+        else:
+            tokens.append(segment)
+    return tokens
+
+
+def _nest(tokens: List[Any]) -> List[Any]:
+    stack: List[List[Any]] = [[]]
+    for token in tokens:
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            inner = stack.pop()
+            stack[-1].append(inner)
+        elif isinstance(token, str) and token.startswith('"'):
+            stack[-1].append(re.sub(r"\\(.)", r"\1", token[1:-1]))
+        else:
+            stack[-1].append(token)
+    while len(stack) > 1:
+        inner = stack.pop()
+        stack[-1].append(inner)
+    return stack[0]
+
+
+def parse_fetch(segments: List[Union[str, Literal]]) -> Optional[FetchedMessage]:
+    """Разбор "* n FETCH (...)"; None - это не FETCH"""
+    items = _nest(_tokens(segments))
+    if len(items) < 4 or items[0] != "*" or str(items[2]).upper() != "FETCH" or not isinstance(items[3], list):
+        return None
+    attributes = items[3]
+    values = dict(zip((str(key).upper() for key in attributes[0::2]), attributes[1::2]))
+    if "UID" not in values:
+        return None
+    modseq = values.get("MODSEQ")
+    return FetchedMessage(
+        uid=int(values["UID"]),
+        flags=set(values.get("FLAGS") or []),
+        modseq=int(modseq[0]) if modseq else None,
+        size=int(values["RFC822.SIZE"]) if "RFC822.SIZE" in values else None,
+        body=values.get("BODY[]"),
+    )
+
+
+class IMAPClient:
+    """Одна IMAP-сессия"""
+
+    def __init__(self, host: str, port: int = IMPLICIT_TLS_PORT, use_ssl: bool = True,
+                 connect_timeout: float = 10.0, command_timeout: float = 60.0,
+                 inline_limit: int = 256 * 1024, spool_dir: str = "uploads/email_raw/.spool",
+                 ssl_context: Optional[ssl.SSLContext] = None):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self.inline_limit = inline_limit
+        self.spool_dir = spool_dir
+        self.ssl_context = ssl_context
+        self.capabilities: Set[str] = set()
+        self._tag = 0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    @property
+    def condstore(self) -> bool:
+        return "CONDSTORE" in self.capabilities or "QRESYNC" in self.capabilities
+
+    async def connect(self):
+        context = None
+        if self.use_ssl:
+            context = self.ssl_context or ssl.create_default_context()
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=context),
+            timeout=self.connect_timeout
+        )
+        greeting = await self._read_segments()
+        if not greeting[0].startswith("* OK") and not greeting[0].startswith("* PREAUTH"):
+            raise IMAPError(f"Unexpected IMAP greeting: {greeting[0]}")
+
+    async def login(self, username: str, password: str):
+        await self.command(f"LOGIN {quote(username)} {quote(password)}")
+        # Возможности после входа могут отличаться от возможностей до него
+        await self.capability()
+
+    async def capability(self) -> Set[str]:
+        _, untagged = await self.command("CAPABILITY")
+        for segments in untagged:
+            if segments[0].upper().startswith("* CAPABILITY"):
+                self.capabilities = set(segments[0].upper().split()[2:])
+        return self.capabilities
+
+    async def select(self, mailbox: str) -> MailboxInfo:
+        command = f"SELECT {quote(mailbox)}"
+        if self.condstore:
+            command += " (CONDSTORE)"
+        _, untagged = await self.command(command)
+        info = MailboxInfo()
+        for segments in untagged:
+            text = segments[0]
+            for name, value in _RESPONSE_CODE.findall(text):
+                setattr(info, {"UIDVALIDITY": "uid_validity", "UIDNEXT": "uid_next",
+                               "HIGHESTMODSEQ": "highest_modseq"}[name], int(value))
+            parts = text.split()
+            if len(parts) == 3 and parts[2].upper() == "EXISTS":
+                info.exists = int(parts[1])
+        return info
+
+    async def uid_fetch(self, uids: str, items: str, changed_since: Optional[int] = None) -> List[FetchedMessage]:
+        command = f"UID FETCH {uids} {items}"
+        if changed_since is not None:
+            command += f" (CHANGEDSINCE {changed_since})"
+        _, untagged = await self.command(command)
+        messages = []
+        for segments in untagged:
+            message = parse_fetch(segments)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+    async def logout(self):
+        try:
+            if self._writer is not None and not self._writer.is_closing():
+                await self.command("LOGOUT")
+        except (OSError, IMAPError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def command(self, command: str) -> Tuple[str, List[List[Union[str, Literal]]]]:
+        """Команда и ответ: (текст завершения, непомеченные ответы по сегментам)"""
+        self._tag += 1
+        tag = f"A{self._tag:04d}"
+        self._writer.write(f"{tag} {command}\r\n".encode())
+        await self._writer.drain()
+        untagged: List[List[Union[str, Literal]]] = []
+        while True:
+            segments = await self._read_segments()
+            line = segments[0]
+            if line.startswith(f"{tag} "):
+                status, _, text = line[len(tag) + 1:].partition(" ")
+                if status.upper() != "OK":
+                    for segment_list in untagged:
+                        for segment in segment_list:
+                            if isinstance(segment, SpooledLiteral):
+                                segment.discard()
+                    raise IMAPError(f"{command.split(' ')[0]} failed: {status} {text}")
+                return text, untagged
+            untagged.append(segments)
+
+    async def _readline(self) -> bytes:
+        line = await asyncio.wait_for(self._reader.readline(), timeout=self.command_timeout)
+        if not line:
+            raise IMAPDisconnected(f"Connection to {self.host} closed by server")
+        return line
+
+    async def _read_segments(self) -> List[Union[str, Literal]]:
+        """Строка ответа с литералами: текст и литералы по порядку"""
+        segments: List[Union[str, Literal]] = []
+        while True:
+            text = (await self._readline()).decode("utf-8", errors="replace").rstrip("\r\n")
+            match = _LITERAL.search(text)
+            if match is None:
+                segments.append(text)
+                return segments
+            segments.append(text[:match.start()])
+            segments.append(await self._read_literal(int(match.group(1))))
+
+    async def _read_literal(self, size: int) -> Literal:
+        if size <= self.inline_limit:
+            return await asyncio.wait_for(self._reader.readexactly(size), timeout=self.command_timeout)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        literal = SpooledLiteral(os.path.join(self.spool_dir, f"{uuid.uuid4().hex}.part"), size)
+        remaining = size
+        try:
+            async with aiofiles.open(literal.path, "wb") as spool:
+                while remaining:
+                    chunk = await asyncio.wait_for(self._reader.read(min(CHUNK_SIZE, remaining)),
+                                                   timeout=self.command_timeout)
+                    if not chunk:
+                        raise IMAPDisconnected(f"Connection to {self.host} closed inside a literal")
+                    await spool.write(chunk)
+                    remaining -= len(chunk)
+        except BaseException:
+            literal.discard()
+            raise
+        return literal
+
+
+__all__ = [
+    "FetchedMessage",
+    "IMAPClient",
+    "IMAPDisconnected",
+    "IMAPError",
+    "MailboxInfo",
+    "SpooledLiteral",
+    "parse_fetch",
+    "quote",
+    "uid_set",
+]
@@ -4,8 +4,22 @@ from fastapi import FastAPI
 
 # from .tasks import tasks
 from .rabbitmq_server import rabbit
+from .principal_cache import principal_cache, principal_cache_invalidator
+from .password_hasher import password_hasher
+from .permission_matrix import permission_matrix, permission_matrix_invalidator
+from .metrics import mark_process_dead, run_stats_sync
+from .profiler import loop_lag_monitor, profiler
+from .webhook_client import webhook_client
+from .smtp_pool import smtp_pool
 from core.database import get_db_helper
 from backend.api.services.rabbitmq_consumer import start_code_execution_consumer, stop_code_execution_consumer
+from backend.api.services.report_rollup_service import start_report_rollups, stop_report_rollups
+from backend.api.services.reports_service import report_cache_invalidator
+from backend.api.services.report_job_service import report_job_events, start_report_job_worker, stop_report_job_worker
+from backend.api.services.notification_delivery_service import start_notification_workers, stop_notification_workers
+from backend.api.services.notification_push_service import flush_push_events, notification_push_hub
+from backend.api.services.email_sync_service import start_email_workers, stop_email_workers
+from core.settings import settings
 
 import logging
 
@@ -16,9 +30,35 @@ logger = logging.getLogger(__name__)
 async def app_lifespan(app: FastAPI):
     """Менеджер жизненного цикла приложения"""
     consumer_task = None
+    rollups_task = None
+    report_events_task = None
+    report_worker_task = None
+    notification_workers_task = None
+    notification_push_task = None
+    email_workers_task = None
+    principal_events_task = None
+    permission_events_task = None
+    replica_monitor_task = None
+    pool_monitor_task = None
+    metrics_task = None
+    loop_monitor_task = None
     try:
+        # Blocked event loop is logged with the stack holding it; sampling profiler is opt-in
+        if settings.profiling.loop_monitor_enabled:
+            loop_monitor_task = asyncio.create_task(loop_lag_monitor.run())
+        if settings.profiling.enabled:
+            profiler.start()
+
         logger.info("Initializing database...")
         await get_db_helper().init_db()
+
+        # Long-held pool connections are logged with the stack that checked them out
+        pool_monitor_task = asyncio.create_task(get_db_helper().run_pool_monitor())
+
+        # Read replicas: lag checks decide whether reads may use them
+        if get_db_helper().replicas:
+            await get_db_helper().check_replicas()
+            replica_monitor_task = asyncio.create_task(get_db_helper().run_replica_monitor())
         logger.info("Starting application...")
 
         # Setup RabbitMQ
@@ -28,6 +68,51 @@ async def app_lifespan(app: FastAPI):
         logger.info("Starting code execution consumer...")
         consumer_task = asyncio.create_task(start_code_execution_consumer())
 
+        # Drop cached principals when users change, here and in the other workers
+        principal_cache_invalidator.register()
+        principal_events_task = asyncio.create_task(principal_cache.listen())
+
+        # Compiled role -> permission matrix, rebuilt when permissions change
+        await permission_matrix.reload()
+        permission_matrix_invalidator.register()
+        permission_events_task = asyncio.create_task(permission_matrix.listen())
+
+        # Invalidate cached reports when tasks or time logs change
+        report_cache_invalidator.register()
+
+        # Incremental report rollups and their reconciliation
+        if settings.reports.use_rollups:
+            logger.info("Starting report rollups reconciler...")
+            rollups_task = asyncio.create_task(start_report_rollups())
+
+        # Progress events of background report jobs for SSE subscribers of this worker
+        report_events_task = asyncio.create_task(report_job_events.start())
+
+        # Report jobs normally run in run_report_worker.py; in-process only for local setups
+        if settings.reports.jobs_run_in_api:
+            logger.info("Starting in-process report job worker...")
+            report_worker_task = asyncio.create_task(start_report_job_worker())
+
+        # Notification events from every process pushed to WebSocket subscribers of this worker
+        notification_push_task = asyncio.create_task(notification_push_hub.start())
+
+        # Shared keep-alive pool for outgoing webhooks
+        await webhook_client.start()
+
+        # Notification outbox normally drained by run_notification_worker.py; in-process only for local setups
+        if settings.notifications.workers_run_in_api:
+            logger.info("Starting in-process notification workers...")
+            notification_workers_task = asyncio.create_task(start_notification_workers())
+
+        # Incoming mail normally synced by run_email_worker.py; in-process only for local setups
+        if settings.email.imap_sync_run_in_api:
+            logger.info("Starting in-process email workers...")
+            email_workers_task = asyncio.create_task(start_email_workers())
+
+        # Cache, rate limiter and pool counters of this worker exported to /metrics
+        if settings.metrics.enabled:
+            metrics_task = asyncio.create_task(run_stats_sync(settings.metrics.sync_interval_seconds))
+
         logger.info("Application startup complete")
         yield
     finally:
@@ -43,6 +128,59 @@ async def app_lifespan(app: FastAPI):
                 pass
 
         await stop_code_execution_consumer()
+
+        if rollups_task and not rollups_task.done():
+            await stop_report_rollups()
+            rollups_task.cancel()
+            try:
+                await rollups_task
+            except asyncio.CancelledError:
+                pass
+
+        if report_worker_task and not report_worker_task.done():
+            await stop_report_job_worker()
+            report_worker_task.cancel()
+            try:
+                await report_worker_task
+            except asyncio.CancelledError:
+                pass
+
+        if notification_workers_task and not notification_workers_task.done():
+            await stop_notification_workers()
+            notification_workers_task.cancel()
+            try:
+                await notification_workers_task
+            except asyncio.CancelledError:
+                pass
+
+        if email_workers_task and not email_workers_task.done():
+            await stop_email_workers()
+            email_workers_task.cancel()
+            try:
+                await email_workers_task
+            except asyncio.CancelledError:
+                pass
+
+        # Push events published after request commits
+        await flush_push_events()
+
+        for background_task in (report_events_task, notification_push_task, principal_events_task,
+                                permission_events_task, replica_monitor_task, pool_monitor_task, metrics_task,
+                                loop_monitor_task):
+            if background_task and not background_task.done():
+                background_task.cancel()
+                try:
+                    await background_task
+                except asyncio.CancelledError:
+                    pass
+
+        await webhook_client.close()
+        # QUIT idle SMTP sessions instead of dropping them
+        await smtp_pool.close()
+        profiler.stop()
+        password_hasher.shutdown()
+
         await get_db_helper().dispose()
         await rabbit.close()
+        mark_process_dead()
         logger.info("Application shutdown complete")
\ No newline at end of file
@@ -0,0 +1,282 @@
+"""
+Метрики Prometheus
+
+Горячие пути инструментируются напрямую: задержка и число запросов по
+шаблону маршрута (MetricsMiddleware), число и время SQL-запросов (события
+движков SQLAlchemy, в том числе с разбивкой по HTTP-запросу), WebSocket-
+соединения, публикация и обработка сообщений RabbitMQ, длительность
+выполнения кода и подпроцессов DataCode. Счетчики, которые компоненты уже
+ведут сами (кэши, лимитер, пулы соединений), переносятся в метрики
+периодически функцией sync_stats.
+
+Несколько воркеров uvicorn: если задана переменная окружения
+PROMETHEUS_MULTIPROC_DIR, каждый процесс пишет значения в файлы этого
+каталога, а /metrics собирает их через MultiProcessCollector, поэтому любой
+воркер отдает сумму по всем процессам. Каталог очищается до запуска
+воркеров (run_backend.py), файлы остановленного воркера помечаются
+mark_process_dead. Без переменной используется реестр процесса.
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest)
+from prometheus_client import multiprocess
+
+from core.database.query_timing import add_query_observer
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SUBPROCESS_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# Метка маршрута для запросов, не совпавших ни с одним маршрутом (ограничивает число рядов)
+UNMATCHED_ROUTE = "<unmatched>"
+
+HTTP_REQUESTS = Counter(
+    "aic_http_requests_total", "HTTP requests by route template and status",
+    ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "aic_http_request_duration_seconds", "HTTP request latency",
+    ["method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_PROGRESS = Gauge(
+    "aic_http_requests_in_progress", "HTTP requests being processed",
+    ["method"], multiprocess_mode="livesum"
+)
+REQUEST_DB_QUERIES = Histogram(
+    "aic_http_request_db_queries", "SQL statements executed per HTTP request",
+    ["route"], buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    "aic_http_request_db_seconds", "Time spent in SQL statements per HTTP request",
+    ["route"], buckets=LATENCY_BUCKETS
+)
+DB_QUERIES = Counter("aic_db_queries_total", "SQL statements executed", ["engine"])
+DB_QUERY_DURATION = Histogram(
+    "aic_db_query_duration_seconds", "SQL statement duration", ["engine"], buckets=QUERY_BUCKETS
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "aic_db_pool_connections", "Connections of the engine pools by state",
+    ["pool", "state"], multiprocess_mode="livesum"
+)
+DB_POOL_EVENTS = Counter("aic_db_pool_events_total", "Pool checkouts, timeouts and long-held connections",
+                         ["pool", "event"])
+WEBSOCKET_CONNECTIONS = Gauge(
+    "aic_websocket_connections", "Open WebSocket connections",
+    ["route"], multiprocess_mode="livesum"
+)
+WEBSOCKET_OPENED = Counter("aic_websocket_connections_opened_total", "Accepted WebSocket connections", ["route"])
+RABBITMQ_PUBLISHED = Counter("aic_rabbitmq_published_total", "Messages published to RabbitMQ", ["destination"])
+RABBITMQ_CONSUMED = Counter(
+    "aic_rabbitmq_consumed_total", "Messages consumed from RabbitMQ", ["source", "outcome"]
+)
+CODE_EXECUTION_DURATION = Histogram(
+    "aic_code_execution_duration_seconds", "Code execution duration",
+    ["language", "status"], buckets=SUBPROCESS_BUCKETS
+)
+DATACODE_DURATION = Histogram(
+    "aic_datacode_duration_seconds", "DataCode subprocess duration", ["outcome"], buckets=SUBPROCESS_BUCKETS
+)
+CACHE_REQUESTS = Counter("aic_cache_requests_total", "Cache lookups by result", ["cache", "result"])
+RATE_LIMIT_REJECTED = Counter("aic_rate_limit_rejected_total", "Requests rejected by the rate limiter",
+                              ["route", "scope"])
+NOTIFICATION_DELIVERIES = Counter("aic_notification_deliveries_total", "Notification delivery attempts by outcome",
+                                  ["channel", "outcome"])
+EVENT_LOOP_LAG = Histogram("aic_event_loop_lag_seconds", "Event loop scheduling delay", buckets=LOOP_LAG_BUCKETS)
+
+
+class RequestDbStats:
+    """SQL-запросы текущего HTTP-запроса"""
+
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Счетчик SQL текущего HTTP-запроса (выставляет MetricsMiddleware)
+request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+
+def _engine_label(conn) -> str:
+    # Движки приложения подписаны именем телеметрии пула ("primary", "replica:0")
+    telemetry = getattr(conn.engine.pool, "telemetry", None)
+    return telemetry.name if telemetry is not None else conn.engine.url.get_backend_name()
+
+
+def _observe_query(conn, statement, parameters, context, executemany, seconds):
+    engine = _engine_label(conn)
+    DB_QUERIES.labels(engine).inc()
+    DB_QUERY_DURATION.labels(engine).observe(seconds)
+    stats = request_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += seconds
+
+
+def instrument_queries():
+    """Учет SQL-запросов в метриках; подключается только при включенных метриках"""
+    add_query_observer(_observe_query)
+
+
+@contextmanager
+def track_request_db():
+    """Считать SQL-запросы, выполненные внутри блока (в том числе в greenlet движка)"""
+    stats = RequestDbStats()
+    token = request_db_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        request_db_stats.reset(token)
+
+
+def observe_code_execution(language: str, status: str, seconds: float):
+    CODE_EXECUTION_DURATION.labels(language.lower(), status).observe(seconds)
+
+
+def observe_datacode(outcome: str, seconds: float):
+    DATACODE_DURATION.labels(outcome).observe(seconds)
+
+
+def count_published(destination: str):
+    RABBITMQ_PUBLISHED.labels(destination).inc()
+
+
+def count_consumed(source: str, outcome: str):
+    RABBITMQ_CONSUMED.labels(source, outcome).inc()
+
+
+class StatsExporter:
+    """Перенос счетчиков компонентов (collections.Counter) в метрики Prometheus.
+
+    Компоненты ведут накопительные счетчики в памяти процесса; экспортер
+    запоминает последнее перенесенное значение и увеличивает метрику на
+    разницу, поэтому в режиме нескольких процессов суммы остаются верными.
+    """
+
+    def __init__(self):
+        self._seen: Dict[Tuple, float] = {}
+
+    def _inc(self, metric, labels: Tuple[str, ...], value: float):
+        key = (metric._name, labels)
+        delta = value - self._seen.get(key, 0)
+        if delta > 0:
+            metric.labels(*labels).inc(delta)
+        self._seen[key] = value
+
+    def export_cache(self, name: str, stats, hit_keys=("hits",)):
+        self._inc(CACHE_REQUESTS, (name, "hit"), sum(stats[key] for key in hit_keys))
+        self._inc(CACHE_REQUESTS, (name, "miss"), stats["misses"])
+
+    def export_rate_limiter(self, stats):
+        for key, value in list(stats.items()):
+            if key.startswith("rejected:"):
+                _, route, scope = key.split(":", 2)
+                self._inc(RATE_LIMIT_REJECTED, (route, scope), value)
+
+    def export_pools(self, database):
+        for name, telemetry in list(database.pool_telemetry.items()):
+            gauges = telemetry.gauges()
+            for state in ("checked_out", "idle", "overflow"):
+                DB_POOL_CONNECTIONS.labels(name, state).set(gauges.get(state, 0))
+            for stat, label in (("checkouts", "checkout"), ("timeouts", "timeout"), ("long_held", "long_held")):
+                self._inc(DB_POOL_EVENTS, (name, label), telemetry.stats[stat])
+
+
+stats_exporter = StatsExporter()
+
+
+def sync_stats():
+    """Перенести текущие счетчики кэшей, лимитера и пулов этого процесса в метрики"""
+    from backend.api.configuration.principal_cache import principal_cache
+    from backend.api.configuration.rate_limiter import rate_limiter
+    from backend.api.services.reports_service import report_generator
+    from core.database import get_db_helper
+
+    stats_exporter.export_cache("principal", principal_cache.stats)
+    stats_exporter.export_cache("report", report_generator.cache.stats, hit_keys=("hits", "shared_hits"))
+    stats_exporter.export_rate_limiter(rate_limiter.stats)
+    stats_exporter.export_pools(get_db_helper())
+
+
+async def run_stats_sync(interval: float):
+    """Периодический перенос счетчиков (выполняется до отмены)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            sync_stats()
+        except Exception as e:
+            logger.error(f"Metrics stats sync failed: {e}")
+
+
+def multiprocess_dir() -> Optional[str]:
+    return os.environ.get(MULTIPROC_ENV) or None
+
+
+def render() -> Tuple[bytes, str]:
+    """Текст метрик: сумма по всем воркерам или реестр текущего процесса"""
+    path = multiprocess_dir()
+    if path is None:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=path)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: Optional[int] = None):
+    """Убрать live-значения остановленного воркера из суммы"""
+    if multiprocess_dir() is not None:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+__all__ = [
+    "CACHE_REQUESTS",
+    "CODE_EXECUTION_DURATION",
+    "DATACODE_DURATION",
+    "DB_POOL_CONNECTIONS",
+    "DB_POOL_EVENTS",
+    "DB_QUERIES",
+    "DB_QUERY_DURATION",
+    "EVENT_LOOP_LAG",
+    "HTTP_IN_PROGRESS",
+    "HTTP_LATENCY",
+    "HTTP_REQUESTS",
+    "MULTIPROC_ENV",
+    "NOTIFICATION_DELIVERIES",
+    "RABBITMQ_CONSUMED",
+    "RABBITMQ_PUBLISHED",
+    "RATE_LIMIT_REJECTED",
+    "REQUEST_DB_QUERIES",
+    "REQUEST_DB_SECONDS",
+    "UNMATCHED_ROUTE",
+    "WEBSOCKET_CONNECTIONS",
+    "WEBSOCKET_OPENED",
+    "RequestDbStats",
+    "StatsExporter",
+    "count_consumed",
+    "count_published",
+    "instrument_queries",
+    "mark_process_dead",
+    "multiprocess_dir",
+    "observe_code_execution",
+    "observe_datacode",
+    "render",
+    "request_db_stats",
+    "run_stats_sync",
+    "stats_exporter",
+    "sync_stats",
+    "track_request_db",
+]
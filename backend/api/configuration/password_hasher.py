@@ -0,0 +1,132 @@
+"""
+Хеширование паролей вне цикла событий
+
+bcrypt занимает 100-300 мс процессорного времени на вызов. Вызовы
+выполняются в отдельном ограниченном пуле потоков (bcrypt отпускает GIL,
+поэтому потоки работают параллельно и не блокируют цикл событий), а
+допуск в пул ограничен: при переполнении очереди или долгом ожидании
+запрос отклоняется сразу (PasswordHasherOverloaded -> 503), а не копит
+задержку для всех остальных запросов воркера.
+
+При успешном входе хеш, созданный с устаревшими параметрами (меньше
+раундов, устаревшая схема), пересчитывается с текущими.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasherOverloaded(Exception):
+    """Очередь хеширования переполнена или ожидание слишком долгое"""
+
+
+def build_crypt_context(rounds: Optional[int] = None) -> CryptContext:
+    """Контекст passlib с текущими параметрами стоимости"""
+    rounds = rounds or settings.security.password_bcrypt_rounds
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+    )
+
+
+class PasswordHasher:
+    """Ограниченный пул хеширования паролей с контролем допуска"""
+
+    def __init__(
+        self,
+        context: Optional[CryptContext] = None,
+        workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        wait_timeout: Optional[float] = None
+    ):
+        security = settings.security
+        self.context = context or build_crypt_context()
+        self.workers = workers or security.password_hash_workers
+        self.max_pending = max_pending or security.password_hash_max_pending
+        self.wait_timeout = security.password_hash_wait_timeout_seconds if wait_timeout is None else wait_timeout
+        self.pending = 0
+        self.stats: Counter = Counter()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.pending -= 1
+
+    async def _run(self, func, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise PasswordHasherOverloaded(f"{self.pending} password hashing calls pending")
+            self.pending += 1
+
+        started = time.monotonic()
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self._release()
+            raise
+        # Слот освобождается, когда поток действительно закончил (или задача снята из очереди)
+        future.add_done_callback(self._release)
+
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.wait_timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            self.stats["timeouts"] += 1
+            raise PasswordHasherOverloaded("Password hashing wait timeout")
+
+        self.stats["calls"] += 1
+        self.stats["total_ms"] += int((time.monotonic() - started) * 1000)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._run(self.context.verify, password, password_hash)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        """(пароль верен, новый хеш или None); новый хеш - если параметры стоимости изменились"""
+        valid, new_hash = await self._run(self.context.verify_and_update, password, password_hash)
+        if new_hash is not None:
+            self.stats["rehashed"] += 1
+        return valid, new_hash
+
+    def needs_update(self, password_hash: str) -> bool:
+        return self.context.needs_update(password_hash)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+
+__all__ = [
+    "PasswordHasher",
+    "PasswordHasherOverloaded",
+    "build_crypt_context",
+    "password_hasher",
+]
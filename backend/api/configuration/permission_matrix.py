@@ -0,0 +1,248 @@
+"""
+Скомпилированная матрица разрешений ролей
+
+Каждой паре (resource, action) назначается номер бита, каждой роли -
+целое число с установленными битами ее разрешений. Проверка разрешения -
+поиск бита по паре и битовый тест маски роли, без обращения к БД.
+
+Матрица строится при старте одним запросом и версионируется: каждая
+пересборка заменяет снимок целиком и увеличивает version. После коммита
+изменений Permission/RolePermission матрица пересобирается в этом процессе,
+а остальные воркеры получают событие через fanout-обменник RabbitMQ.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from core.database.models.main_models import Permission, RolePermission
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "permission_matrix_pending"
+
+
+class PermissionMatrix:
+    """Роль -> битовая маска пар (resource, action)"""
+
+    def __init__(self, session_factory: Optional[Callable[[], Any]] = None):
+        self.session_factory = session_factory
+        self.instance_id = uuid.uuid4().hex
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+        self.stats: Counter = Counter()
+        # Снимок заменяется целиком: (биты пар, маски ролей)
+        self._bits: Dict[Tuple[str, str], int] = {}
+        self._roles: Dict[str, int] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._requested = 0
+        self._applied = 0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def build(self, rows: Iterable[Tuple[str, str, str]]) -> int:
+        """Сборка снимка из строк (role, resource, action); возвращает новую версию"""
+        bits: Dict[Tuple[str, str], int] = {}
+        roles: Dict[str, int] = {}
+        for role, resource, action in rows:
+            bit = bits.setdefault((resource, action), len(bits))
+            roles[role] = roles.get(role, 0) | (1 << bit)
+
+        self._bits, self._roles = bits, roles
+        self.version += 1
+        self.loaded_at = time.time()
+        logger.info(f"Permission matrix v{self.version}: {len(roles)} roles, {len(bits)} permissions")
+        return self.version
+
+    def has_permission(self, role: Optional[str], resource: str, action: str) -> bool:
+        self.stats["checks"] += 1
+        bit = self._bits.get((resource, action))
+        if bit is None or role is None:
+            return False
+        return bool(self._roles.get(role, 0) >> bit & 1)
+
+    def allows(self, role: Optional[str], resource: str, action: str) -> bool:
+        """Проверка доступа: администратору разрешено все, остальным - по матрице"""
+        return role == "admin" or self.has_permission(role, resource, action)
+
+    def permissions_for(self, role: str) -> FrozenSet[Tuple[str, str]]:
+        mask = self._roles.get(role, 0)
+        return frozenset(pair for pair, bit in self._bits.items() if mask >> bit & 1)
+
+    def roles(self) -> FrozenSet[str]:
+        return frozenset(self._roles)
+
+    async def load(self, session) -> int:
+        """Сборка матрицы по данным текущей сессии"""
+        result = await session.execute(
+            select(RolePermission.role, Permission.resource, Permission.action)
+            .join(Permission, Permission.id == RolePermission.permission_id)
+            .order_by(Permission.id)
+        )
+        return self.build(result.all())
+
+    async def reload(self) -> int:
+        """Пересборка из БД; запросы, пришедшие во время загрузки, объединяются"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        self._requested += 1
+        ticket = self._requested
+        async with self._lock:
+            # Загрузка, начатая после этого запроса, уже учла изменения
+            if self._applied >= ticket:
+                self.stats["coalesced"] += 1
+                return self.version
+            target = self._requested
+            async with self._new_session() as session:
+                version = await self.load(session)
+            self._applied = target
+            self.stats["reloads"] += 1
+            return version
+
+    def _new_session(self):
+        if self.session_factory is None:
+            from core.database import get_db_helper
+
+            self.session_factory = get_db_helper().async_session
+        return self.session_factory()
+
+    async def handle_event(self, event_data: Dict[str, Any]):
+        """Событие об изменении разрешений из другого воркера"""
+        # Собственное событие: матрица уже пересобрана до публикации
+        if event_data.get("origin") == self.instance_id:
+            return
+        try:
+            await self.reload()
+        except Exception as e:
+            logger.error(f"Permission matrix reload failed: {e}")
+
+    async def listen(self):
+        """Подписка процесса на события перезагрузки (выполняется до остановки)"""
+        from backend.api.configuration.rabbitmq_server import rabbit
+
+        try:
+            await rabbit.subscribe_events(settings.security.permission_events_exchange, self.handle_event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Permission matrix event subscription failed: {e}")
+
+
+async def check_user_permission(
+    session,
+    user_id: int,
+    resource: str,
+    action: str,
+    role: Optional[str] = None
+) -> bool:
+    """Проверить разрешение пользователя по скомпилированной матрице ролей.
+
+    Если роль уже известна (principal из verify_authorization), проверка
+    выполняется без обращения к БД.
+    """
+    from core.database.orm import orm_get_user_by_id
+
+    if role is None:
+        user = await orm_get_user_by_id(session, user_id)
+        if not user:
+            return False
+        role = user.role
+
+    # Матрица строится при старте приложения; в скриптах - при первой проверке
+    if not permission_matrix.is_loaded:
+        await permission_matrix.load(session)
+
+    return permission_matrix.allows(role, resource, action)
+
+
+class PermissionMatrixInvalidator:
+    """Пересборка матрицы после коммита изменений разрешений и их связей с ролями"""
+
+    def __init__(self, matrix: PermissionMatrix):
+        self.matrix = matrix
+        self.is_registered = False
+        self._tasks: Set[asyncio.Task] = set()
+
+    def register(self):
+        if self.is_registered:
+            return
+        event.listen(Session, "after_flush", self._after_flush)
+        event.listen(Session, "do_orm_execute", self._do_orm_execute)
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_rollback", self._after_rollback)
+        self.is_registered = True
+
+    def unregister(self):
+        if not self.is_registered:
+            return
+        event.remove(Session, "after_flush", self._after_flush)
+        event.remove(Session, "do_orm_execute", self._do_orm_execute)
+        event.remove(Session, "after_commit", self._after_commit)
+        event.remove(Session, "after_rollback", self._after_rollback)
+        self.is_registered = False
+
+    def _after_flush(self, session, flush_context):
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, (Permission, RolePermission)):
+                session.info[_PENDING_KEY] = True
+                return
+
+    def _do_orm_execute(self, orm_execute_state):
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in (Permission, RolePermission):
+            orm_execute_state.session.info[_PENDING_KEY] = True
+
+    def _after_commit(self, session):
+        if not session.info.pop(_PENDING_KEY, False):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        async def reload_and_broadcast():
+            from backend.api.configuration.rabbitmq_server import rabbit
+
+            try:
+                version = await self.matrix.reload()
+            except Exception as e:
+                logger.error(f"Permission matrix reload failed: {e}")
+                return
+            try:
+                await rabbit.publish_event(
+                    settings.security.permission_events_exchange,
+                    {"version": version, "origin": self.matrix.instance_id}
+                )
+            except Exception as e:
+                logger.warning(f"Failed to broadcast permission matrix reload: {e}")
+
+        task = loop.create_task(reload_and_broadcast())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _after_rollback(self, session):
+        session.info.pop(_PENDING_KEY, None)
+
+
+permission_matrix = PermissionMatrix()
+permission_matrix_invalidator = PermissionMatrixInvalidator(permission_matrix)
+
+
+__all__ = [
+    "PermissionMatrix",
+    "PermissionMatrixInvalidator",
+    "check_user_permission",
+    "permission_matrix",
+    "permission_matrix_invalidator",
+]
@@ -0,0 +1,296 @@
+"""
+Кэш аутентифицированных пользователей
+
+verify_authorization после проверки подписи токена берет пользователя из
+ограниченного LRU-кэша с TTL по sub токена (логину), поэтому на горячем
+пути аутентификации нет ни запроса в БД, ни чтения файлов. Запись
+сбрасывается после коммита изменений пользователя (деактивация, роль,
+пароль и другие поля профиля) в этом процессе и во всех остальных воркерах
+через fanout-обменник RabbitMQ; TTL ограничивает устаревание, если событие
+потеряно.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from core.database.models.main_models import User
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Поля пользователя, доступные обработчикам через principal
+PRINCIPAL_FIELDS = (
+    "id", "login", "username", "email", "role", "is_active",
+    "manager_id", "department_id", "organization_id",
+    "position", "phone", "avatar_url", "bio",
+    "created_at", "updated_at", "last_login",
+)
+
+# Изменение этих полей сбрасывает кэш (last_login/updated_at меняются при каждом входе)
+INVALIDATING_FIELDS = tuple(
+    field for field in PRINCIPAL_FIELDS if field not in ("created_at", "updated_at", "last_login")
+) + ("password_hash",)
+
+_PENDING_KEY = "principal_cache_pending"
+_ALL = "*"
+
+
+class Principal:
+    """Снимок пользователя, прошедшего аутентификацию.
+
+    Не привязан к сессии: его можно безопасно переиспользовать между
+    запросами. Поддерживает оба стиля обращения, принятых в роутерах:
+    user.role и user.get("role") / user["role"].
+    """
+
+    __slots__ = PRINCIPAL_FIELDS
+
+    def __init__(self, **values):
+        for field in PRINCIPAL_FIELDS:
+            object.__setattr__(self, field, values.get(field))
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(**{field: getattr(user, field) for field in PRINCIPAL_FIELDS})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Principal is read-only")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default) if key in PRINCIPAL_FIELDS else default
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in PRINCIPAL_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in PRINCIPAL_FIELDS}
+
+    def __repr__(self) -> str:
+        return f"Principal(id={self.id}, login={self.login!r}, role={self.role!r})"
+
+
+class PrincipalCache:
+    """LRU-кэш principal по sub токена с TTL и объединением одновременных промахов"""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_entries = max_entries or settings.security.principal_cache_max_entries
+        self.ttl = settings.security.principal_cache_ttl_seconds if ttl is None else ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.subjects_by_user: Dict[int, Set[str]] = {}
+        self.stats: Counter = Counter()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._generation = 0
+
+    def get(self, subject: str) -> Optional[Principal]:
+        entry = self.entries.get(subject)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        principal, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._drop(subject)
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(subject)
+        self.stats["hits"] += 1
+        return principal
+
+    def set(self, subject: str, principal: Principal):
+        self._drop(subject)
+        self.entries[subject] = (principal, time.monotonic() + self.ttl)
+        self.subjects_by_user.setdefault(principal.id, set()).add(subject)
+        while len(self.entries) > self.max_entries:
+            oldest = next(iter(self.entries))
+            self._drop(oldest)
+            self.stats["evictions"] += 1
+
+    def _drop(self, subject: str):
+        entry = self.entries.pop(subject, None)
+        if entry is None:
+            return
+        subjects = self.subjects_by_user.get(entry[0].id)
+        if subjects is not None:
+            subjects.discard(subject)
+            if not subjects:
+                del self.subjects_by_user[entry[0].id]
+
+    async def get_or_load(
+        self,
+        subject: str,
+        load: Callable[[], Awaitable[Optional[Principal]]]
+    ) -> Optional[Principal]:
+        """Principal из кэша или загрузка; одновременные промахи по одному sub - один запрос"""
+        principal = self.get(subject)
+        if principal is not None:
+            return principal
+
+        pending = self._loading.get(subject)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[subject] = future
+        generation = self._generation
+        try:
+            principal = await load()
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение уже получил ведущий запрос; ожидающих может не быть
+            future.exception()
+            raise
+        else:
+            future.set_result(principal)
+            # Пользователь изменился во время загрузки - не кэшируем возможно устаревшее значение
+            if principal is not None and generation == self._generation:
+                self.set(subject, principal)
+            return principal
+        finally:
+            self._loading.pop(subject, None)
+
+    def invalidate(self, user_ids: Iterable[int] = (), subjects: Iterable[str] = ()):
+        self._generation += 1
+        for user_id in list(user_ids):
+            if user_id == _ALL:
+                self.clear()
+                return
+            for subject in list(self.subjects_by_user.get(user_id, ())):
+                self._drop(subject)
+        for subject in subjects:
+            self._drop(subject)
+        self.stats["invalidations"] += 1
+
+    def clear(self):
+        self._generation += 1
+        self.entries.clear()
+        self.subjects_by_user.clear()
+
+    def hit_ratio(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    async def handle_event(self, event_data: Dict[str, Any]):
+        """Событие об изменении пользователей из другого воркера"""
+        self.invalidate(event_data.get("user_ids", ()), event_data.get("subjects", ()))
+
+    async def listen(self):
+        """Подписка процесса на события инвалидации (выполняется до остановки)"""
+        from backend.api.configuration.rabbitmq_server import rabbit
+
+        try:
+            await rabbit.subscribe_events(settings.security.principal_events_exchange, self.handle_event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Без событий других воркеров устаревание ограничено TTL
+            logger.error(f"Principal cache event subscription failed: {e}")
+
+
+class PrincipalCacheInvalidator:
+    """Сброс кэша после коммита изменений пользователей.
+
+    Изменения собираются в after_flush, применяются только после коммита
+    (откат ничего не сбрасывает) и рассылаются остальным воркерам.
+    """
+
+    def __init__(self, cache: PrincipalCache):
+        self.cache = cache
+        self.is_registered = False
+        self._tasks: Set[asyncio.Task] = set()
+
+    def register(self):
+        if self.is_registered:
+            return
+        event.listen(Session, "after_flush", self._after_flush)
+        event.listen(Session, "do_orm_execute", self._do_orm_execute)
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_rollback", self._after_rollback)
+        self.is_registered = True
+
+    def unregister(self):
+        if not self.is_registered:
+            return
+        event.remove(Session, "after_flush", self._after_flush)
+        event.remove(Session, "do_orm_execute", self._do_orm_execute)
+        event.remove(Session, "after_commit", self._after_commit)
+        event.remove(Session, "after_rollback", self._after_rollback)
+        self.is_registered = False
+
+    @staticmethod
+    def _pending(session) -> Dict[str, set]:
+        return session.info.setdefault(_PENDING_KEY, {"user_ids": set(), "subjects": set()})
+
+    def _after_flush(self, session, flush_context):
+        for obj in list(session.dirty) + list(session.deleted):
+            if not isinstance(obj, User):
+                continue
+            state = inspect(obj)
+            if obj in session.deleted or any(
+                state.attrs[field].history.has_changes() for field in INVALIDATING_FIELDS
+            ):
+                pending = self._pending(session)
+                pending["user_ids"].add(obj.id)
+                # Прежний логин (sub старых токенов)
+                pending["subjects"].update(
+                    value for value in state.attrs["login"].history.deleted if value
+                )
+
+    def _do_orm_execute(self, orm_execute_state):
+        # Массовые UPDATE/DELETE пользователей минуют flush - сбрасываем кэш целиком
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is User:
+            self._pending(orm_execute_state.session)["user_ids"].add(_ALL)
+
+    def _after_commit(self, session):
+        pending = session.info.pop(_PENDING_KEY, None)
+        if not pending or not (pending["user_ids"] or pending["subjects"]):
+            return
+        user_ids = list(pending["user_ids"])
+        subjects = list(pending["subjects"])
+        self.cache.invalidate(user_ids, subjects)
+        self._broadcast({"user_ids": user_ids, "subjects": subjects})
+
+    def _after_rollback(self, session):
+        session.info.pop(_PENDING_KEY, None)
+
+    def _broadcast(self, event_data: Dict[str, Any]):
+        from backend.api.configuration.rabbitmq_server import rabbit
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        async def publish():
+            try:
+                await rabbit.publish_event(settings.security.principal_events_exchange, event_data)
+            except Exception as e:
+                logger.warning(f"Failed to broadcast principal invalidation: {e}")
+
+        task = loop.create_task(publish())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+principal_cache = PrincipalCache()
+principal_cache_invalidator = PrincipalCacheInvalidator(principal_cache)
+
+
+__all__ = [
+    "Principal",
+    "PrincipalCache",
+    "PrincipalCacheInvalidator",
+    "principal_cache",
+    "principal_cache_invalidator",
+]
@@ -0,0 +1,250 @@
+"""
+Профилирование воркера: сэмплирующий профайлер и монитор задержки цикла событий
+
+SamplingProfiler - фоновый поток, который с заданным интервалом снимает
+стек потока цикла событий (sys._current_frames) и считает одинаковые стеки
+по секундам в кольцевом буфере. Результат за окно отдается в формате
+collapsed stacks ("корень;...;лист число"), который принимают flamegraph.pl,
+speedscope и другие построители flame graph. Стоимость - один обход стека
+за интервал в отдельном потоке; обработчики запросов не инструментируются.
+
+LoopLagMonitor - задача цикла событий обновляет метку времени, сторожевой
+поток проверяет ее: если цикл не отвечает дольше порога, поток снимает стек
+цикла в момент блокировки и пишет в лог задачу и код, который его держит.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from backend.api.configuration.metrics import EVENT_LOOP_LAG
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame) -> str:
+    module = frame.f_globals.get("__name__") or os.path.basename(frame.f_code.co_filename)
+    return f"{module}:{frame.f_code.co_name}"
+
+
+def collapse_stack(frame, max_depth: int = 64, root: Optional[str] = None) -> str:
+    """Стек в формате collapsed: кадры от корня к листу через ';'"""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    if root:
+        labels.append(root)
+    return ";".join(reversed(labels))
+
+
+def render_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class SamplingProfiler:
+    """Сэмплирующий профайлер потока цикла событий (или всех потоков)"""
+
+    def __init__(
+        self,
+        interval: float = 0.01,
+        window_seconds: int = 300,
+        max_depth: int = 64,
+        all_threads: bool = False,
+    ):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.all_threads = all_threads
+        # (секунда, стеки этой секунды); старые секунды вытесняются
+        self._buckets: deque = deque(maxlen=max(window_seconds, 1))
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._target: Optional[int] = None
+        self.samples = 0
+        self.started_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, thread_id: Optional[int] = None):
+        """Запуск сэмплирования потока thread_id (по умолчанию - текущего, где работает цикл)"""
+        if self.running:
+            return
+        self._target = thread_id or threading.get_ident()
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started (interval {self.interval * 1000:.0f}ms)")
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        self._thread = None
+        logger.info("Sampling profiler stopped")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Profiler sample failed: {e}")
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()} if self.all_threads else {}
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (not self.all_threads and thread_id != self._target):
+                continue
+            root = names.get(thread_id, str(thread_id)) if self.all_threads else None
+            stacks.append(collapse_stack(frame, self.max_depth, root))
+        second = int(time.time())
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append((second, Counter()))
+            bucket = self._buckets[-1][1]
+            for stack in stacks:
+                bucket[stack] += 1
+            self.samples += 1
+
+    def collect(self, seconds: int) -> Counter:
+        """Стеки за последние seconds секунд"""
+        since = int(time.time()) - seconds
+        result = Counter()
+        with self._lock:
+            for second, stacks in self._buckets:
+                if second >= since:
+                    result.update(stacks)
+        return result
+
+    async def capture(self, seconds: float) -> Counter:
+        """Профиль следующих seconds секунд (профайлер запускается на это время, если выключен)"""
+        started_here = not self.running
+        if started_here:
+            self.start()
+        try:
+            await asyncio.sleep(seconds)
+            return self.collect(int(seconds) + 1)
+        finally:
+            if started_here:
+                self.stop()
+                with self._lock:
+                    self._buckets.clear()
+
+
+class LoopLagMonitor:
+    """Монитор задержки цикла событий со снимком стека блокирующего кода"""
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05, stack_limit: int = 30, history: int = 50):
+        self.threshold = threshold
+        self.interval = interval
+        self.stack_limit = stack_limit
+        self.stalls: deque = deque(maxlen=history)
+        self.max_lag = 0.0
+        self.checks = 0
+        self._beat = time.monotonic()
+        self._reported_beat: Optional[float] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+
+    async def run(self):
+        """Измерение задержки (выполняется до отмены); сторожевой поток - на время работы"""
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                self._beat = time.monotonic()
+                await asyncio.sleep(self.interval)
+                lag = max(time.monotonic() - self._beat - self.interval, 0.0)
+                self.checks += 1
+                self.max_lag = max(self.max_lag, lag)
+                EVENT_LOOP_LAG.observe(lag)
+        finally:
+            self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            blocked = time.monotonic() - beat
+            if blocked < self.threshold + self.interval or self._reported_beat == beat:
+                continue
+            self._reported_beat = beat
+            self.report_stall(blocked)
+
+    def report_stall(self, blocked: float) -> Optional[dict]:
+        """Снимок потока цикла в момент блокировки"""
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return None
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        coro = task.get_coro() if task is not None else None
+        stall = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "blocked_ms": round(blocked * 1000, 1),
+            "task": task.get_name() if task is not None else None,
+            "coroutine": getattr(coro, "__qualname__", None),
+            "stack": traceback.format_stack(frame, limit=self.stack_limit),
+        }
+        self.stalls.append(stall)
+        logger.warning(
+            f"Event loop blocked for {stall['blocked_ms']:.0f}ms by task {stall['task']} "
+            f"({stall['coroutine']}):\n{''.join(stall['stack'])}"
+        )
+        return stall
+
+    def snapshot(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "checks": self.checks,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": list(self.stalls),
+        }
+
+
+def stacks_by_thread() -> Dict[str, List[str]]:
+    """Текущие стеки всех потоков процесса"""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    return {
+        names.get(thread_id, str(thread_id)): traceback.format_stack(frame)
+        for thread_id, frame in sys._current_frames().items()
+    }
+
+
+profiler = SamplingProfiler(
+    interval=settings.profiling.sample_interval_ms / 1000,
+    window_seconds=settings.profiling.window_seconds,
+    max_depth=settings.profiling.max_depth,
+    all_threads=settings.profiling.all_threads,
+)
+loop_lag_monitor = LoopLagMonitor(
+    threshold=settings.profiling.loop_lag_threshold_ms / 1000,
+    interval=settings.profiling.loop_lag_interval_ms / 1000,
+)
+
+
+__all__ = [
+    "LoopLagMonitor",
+    "SamplingProfiler",
+    "collapse_stack",
+    "loop_lag_monitor",
+    "profiler",
+    "render_collapsed",
+    "stacks_by_thread",
+]
@@ -1,6 +1,8 @@
 import aio_pika
+import asyncio
 import json
 from core import settings
+from backend.api.configuration.metrics import count_consumed, count_published
 import logging
 
 logger = logging.getLogger(__name__)
@@ -35,8 +37,17 @@ class AsyncRabbitMQ:
 
         return self._channel
 
-    async def send_message(self, queue: str, message: dict):
-        """Асинхронная отправка сообщения в очередь"""
+    async def open_channel(self) -> aio_pika.Channel:
+        """Создает отдельный канал (собственный prefetch, не мешает общему каналу)"""
+        connection = await self.get_connection()
+        return await connection.channel()
+
+    async def send_message(self, queue: str, message: dict, arguments: dict = None, priority: int = None):
+        """Асинхронная отправка сообщения в очередь.
+
+        arguments переопределяют унифицированные аргументы очереди (например,
+        для очередей длинных заданий без TTL сообщений).
+        """
         channel = await self.get_channel()
         
         # Используем единый метод объявления с обработкой ошибок
@@ -44,16 +55,18 @@ class AsyncRabbitMQ:
             channel,
             queue,
             durable=True,
-            arguments=self.queue_arguments  # Унифицированные аргументы
+            arguments=self.queue_arguments if arguments is None else arguments
         )
         
         await channel.default_exchange.publish(
             aio_pika.Message(
                 body=json.dumps(message).encode(),
-                delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                priority=priority
             ),
             routing_key=queue,
         )
+        count_published(queue)
 
     async def _declare_queue(self, channel: aio_pika.Channel, queue_name: str, **kwargs) -> aio_pika.Queue:
         """Безопасное объявление очереди с обработкой ошибок"""
@@ -84,11 +97,100 @@ class AsyncRabbitMQ:
                         body = message.body.decode()
                         data = json.loads(body)
                         await callback(data)
+                    count_consumed(queue, "ack")
                 except Exception as e:
+                    count_consumed(queue, "error")
                     logger.error(f"Error processing message: {e}")
                     # При ошибке отправляем сообщение в DLX
                     await message.nack(requeue=False)
 
+    async def consume_concurrently(self, queue: str, callback: callable, concurrency: int = 1, arguments: dict = None):
+        """Обработка сообщений очереди с ограниченным параллелизмом.
+
+        Работает на отдельном канале с prefetch = concurrency: брокер не выдает
+        обработчику больше сообщений, чем он может обрабатывать одновременно,
+        остальные ждут в очереди и достаются другим обработчикам. Сообщение
+        подтверждается после завершения callback; при отмене (остановке
+        обработчика) неподтвержденные сообщения возвращаются в очередь.
+        """
+        concurrency = max(1, concurrency)
+        channel = await self.open_channel()
+        await channel.set_qos(prefetch_count=concurrency)
+        queue_obj = await self._declare_queue(
+            channel,
+            queue,
+            durable=True,
+            arguments=self.queue_arguments if arguments is None else arguments
+        )
+        
+        slots = asyncio.Semaphore(concurrency)
+        in_flight = set()
+        
+        async def handle(message: aio_pika.abc.AbstractIncomingMessage):
+            try:
+                data = json.loads(message.body.decode())
+                await callback(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing message from {queue}: {e}")
+                count_consumed(queue, "error")
+                await message.nack(requeue=False)
+            else:
+                count_consumed(queue, "ack")
+                await message.ack()
+            finally:
+                slots.release()
+        
+        try:
+            async with queue_obj.iterator() as queue_iter:
+                async for message in queue_iter:
+                    await slots.acquire()
+                    task = asyncio.create_task(handle(message))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+        finally:
+            for task in list(in_flight):
+                task.cancel()
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
+            if not channel.is_closed:
+                await channel.close()
+
+    async def publish_event(self, exchange: str, message: dict):
+        """Публикация события всем подписчикам (fanout, без сохранения)"""
+        channel = await self.get_channel()
+        exchange_obj = await channel.declare_exchange(exchange, aio_pika.ExchangeType.FANOUT)
+        await exchange_obj.publish(
+            aio_pika.Message(body=json.dumps(message, default=str).encode()),
+            routing_key=""
+        )
+        count_published(exchange)
+
+    async def subscribe_events(self, exchange: str, callback: callable):
+        """Подписка процесса на события fanout-обменника.
+
+        Каждый подписчик получает собственную временную очередь, поэтому событие
+        доходит до всех воркеров. Ошибки callback логируются и не прерывают подписку.
+        """
+        channel = await self.open_channel()
+        try:
+            exchange_obj = await channel.declare_exchange(exchange, aio_pika.ExchangeType.FANOUT)
+            queue_obj = await channel.declare_queue(exclusive=True, auto_delete=True)
+            await queue_obj.bind(exchange_obj)
+            
+            async with queue_obj.iterator(no_ack=True) as queue_iter:
+                async for message in queue_iter:
+                    try:
+                        await callback(json.loads(message.body.decode()))
+                        count_consumed(exchange, "ack")
+                    except Exception as e:
+                        count_consumed(exchange, "error")
+                        logger.error(f"Error handling event from {exchange}: {e}")
+        finally:
+            if not channel.is_closed:
+                await channel.close()
+
     async def setup_dlx(self):
         channel = await self.get_channel()
         await channel.declare_exchange("dlx", aio_pika.ExchangeType.FANOUT)
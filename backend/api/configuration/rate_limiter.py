@@ -0,0 +1,216 @@
+"""
+Ограничение частоты запросов к входу и регистрации
+
+Алгоритм - token bucket: корзина вмещает capacity запросов и пополняется
+со скоростью capacity / period. Корзины ведутся раздельно по IP клиента и
+по логину, для каждого маршрута - своя политика из настроек. Проверка
+выполняется первой строкой обработчика, до запросов в БД и хеширования
+пароля, и стоит O(1): одно обращение к словарю процесса или один EVAL в
+Redis, если настроено общее хранилище для всех воркеров. При недоступном
+Redis проверка переходит на корзины процесса, а не пропускает запросы.
+"""
+
+import logging
+import math
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class RateLimitExceeded(Exception):
+    """Корзина исчерпана; retry_after - через сколько секунд появится токен"""
+
+    def __init__(self, route: str, scope: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for {route} by {scope}")
+        self.route = route
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class BucketPolicy:
+    """Политика корзины: ключ (ip/login), емкость и скорость пополнения"""
+
+    __slots__ = ("scope", "capacity", "rate")
+
+    def __init__(self, scope: str, capacity: int, period_seconds: float):
+        if capacity <= 0 or period_seconds <= 0:
+            raise ValueError(f"Invalid rate limit policy for {scope}: {capacity}/{period_seconds}s")
+        self.scope = scope
+        self.capacity = capacity
+        self.rate = capacity / period_seconds
+
+    @classmethod
+    def parse(cls, scope: str, value: str) -> "BucketPolicy":
+        """Политика из строки вида "20/minute" """
+        count, _, period = value.partition("/")
+        try:
+            return cls(scope, int(count), _PERIODS[period.strip().lower()])
+        except (KeyError, ValueError):
+            raise ValueError(f"Invalid rate limit policy {value!r}, expected '<count>/<second|minute|hour|day>'")
+
+    def __repr__(self) -> str:
+        return f"BucketPolicy({self.scope!r}, capacity={self.capacity}, rate={self.rate:.3f}/s)"
+
+
+class LocalTokenBucketStore:
+    """Корзины в памяти процесса; при переполнении вытесняются давно не используемые"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, capacity: int, rate: float, cost: float = 1.0) -> float:
+        """Списать cost токенов; 0 - разрешено, иначе секунды до появления токенов"""
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / rate
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self):
+        self.buckets.clear()
+
+
+# Атомарное пополнение и списание по часам Redis (одинаковым для всех воркеров)
+_TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RedisTokenBucketStore:
+    """Общие для всех воркеров корзины в Redis"""
+
+    def __init__(self, redis_url: str, namespace: str = "ratelimit"):
+        self.redis_url = redis_url
+        self.namespace = namespace
+        self._redis = None
+        self._script = None
+
+    def _get_script(self):
+        if self._script is None:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+            self._script = self._redis.register_script(_TOKEN_BUCKET_LUA)
+        return self._script
+
+    async def take(self, key: str, capacity: int, rate: float, cost: float = 1.0) -> float:
+        script = self._get_script()
+        return float(await script(keys=[f"{self.namespace}:{key}"], args=[capacity, rate, cost]))
+
+
+class RateLimiter:
+    """Проверка политик маршрутов по корзинам IP и логина"""
+
+    def __init__(self, config=None, local_store: Optional[LocalTokenBucketStore] = None, shared_store=None):
+        config = config or settings.rate_limit
+        self.enabled = config.enabled
+        self.trust_forwarded_for = config.trust_forwarded_for
+        self.trusted_hops = config.forwarded_for_trusted_hops
+        self.local_store = local_store or LocalTokenBucketStore(config.max_local_keys)
+        self.shared_store = shared_store
+        if self.shared_store is None and config.redis_url:
+            self.shared_store = RedisTokenBucketStore(config.redis_url)
+        self.policies: Dict[str, List[BucketPolicy]] = {
+            "login": [
+                BucketPolicy.parse("ip", config.login_per_ip),
+                BucketPolicy.parse("login", config.login_per_login),
+            ],
+            "register": [
+                BucketPolicy.parse("ip", config.register_per_ip),
+            ],
+        }
+        self.stats: Counter = Counter()
+
+    async def _take(self, key: str, policy: BucketPolicy) -> float:
+        if self.shared_store is not None:
+            try:
+                return await self.shared_store.take(key, policy.capacity, policy.rate)
+            except Exception as e:
+                self.stats["shared_errors"] += 1
+                logger.warning(f"Shared rate limit store unavailable, using local buckets: {e}")
+        return await self.local_store.take(key, policy.capacity, policy.rate)
+
+    async def hit(self, route: str, **keys: Optional[str]):
+        """Учесть запрос; RateLimitExceeded, если исчерпана любая из корзин маршрута"""
+        if not self.enabled:
+            return
+        for policy in self.policies.get(route, ()):
+            value = keys.get(policy.scope)
+            if not value:
+                continue
+            retry_after = await self._take(f"{route}:{policy.scope}:{value}", policy)
+            if retry_after > 0:
+                self.stats[f"rejected:{route}:{policy.scope}"] += 1
+                raise RateLimitExceeded(route, policy.scope, retry_after)
+        self.stats[f"allowed:{route}"] += 1
+
+    def client_ip(self, request: Request) -> str:
+        if self.trust_forwarded_for:
+            forwarded = [entry.strip() for entry in request.headers.get("x-forwarded-for", "").split(",")]
+            forwarded = [entry for entry in forwarded if entry]
+            if forwarded:
+                # Адрес, дописанный ближайшим к клиенту доверенным прокси; левее - что прислал клиент
+                return forwarded[-min(self.trusted_hops, len(forwarded))]
+        return request.client.host if request.client else "unknown"
+
+    async def check(self, route: str, request: Request, login: Optional[str] = None):
+        """Проверка в обработчике: 429 с Retry-After при превышении"""
+        try:
+            await self.hit(
+                route,
+                ip=self.client_ip(request),
+                login=login.strip().lower() if login else None
+            )
+        except RateLimitExceeded as e:
+            logger.warning(f"Rate limit exceeded: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, try again later",
+                headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+            )
+
+
+rate_limiter = RateLimiter()
+
+
+__all__ = [
+    "BucketPolicy",
+    "LocalTokenBucketStore",
+    "RateLimitExceeded",
+    "RateLimiter",
+    "RedisTokenBucketStore",
+    "rate_limiter",
+]
@@ -31,6 +31,12 @@ class Server:
         async with get_db_helper().get_session() as session:
             yield session
 
+    @staticmethod
+    async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+        """Сессия только для чтения: реплика, если она не отстает"""
+        async with get_db_helper().read_session() as session:
+            yield session
+
     def get_app(self) -> FastAPI:
         return self.__app
 
@@ -0,0 +1,423 @@
+"""
+Пул SMTP-соединений для отправки почты
+
+Асинхронный SMTP-клиент на asyncio streams (отправка не занимает потоки
+исполнителя) и пул авторизованных соединений на процесс, по аккаунту
+(хост, порт, логин): TCP, TLS и AUTH выполняются один раз на соединение, а
+не на каждое письмо. Поверх пула:
+
+- не больше max_per_account одновременных отправок через аккаунт
+  (почтовые серверы ограничивают число сессий);
+- соединение, простоявшее idle_timeout или отправившее max_messages писем,
+  закрывается (QUIT) вместо повторного использования;
+- если сервер объявил PIPELINING (RFC 2920), MAIL FROM, все RCPT TO и DATA
+  уходят одним пакетом: один круг обмена вместо N + 2;
+- переиспользованное соединение, которое сервер успел закрыть, заменяется
+  новым, и письмо отправляется еще раз - только если обрыв случился до
+  передачи текста письма (иначе возможна двойная доставка).
+"""
+
+import asyncio
+import base64
+import logging
+import re
+import socket
+import ssl
+import time
+from dataclasses import dataclass
+from email.message import Message
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+IMPLICIT_TLS_PORT = 465
+
+_LINE_ENDINGS = re.compile(rb"\r\n|\n|\r")
+_LEADING_DOT = re.compile(rb"^\.", re.MULTILINE)
+
+
+class SMTPError(Exception):
+    """Сервер отклонил команду (код ответа 4xx/5xx)"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.message = message
+
+
+class SMTPRecipientsRefused(SMTPError):
+    """Сервер отклонил всех получателей письма"""
+
+    def __init__(self, refused: Dict[str, Tuple[int, str]]):
+        super().__init__(550, f"All recipients were refused: {', '.join(refused)}")
+        self.refused = refused
+
+
+class SMTPDisconnected(ConnectionError):
+    """Сервер закрыл соединение"""
+
+
+class SMTPPoolOverloaded(Exception):
+    """Нет свободного слота для аккаунта за pool_timeout"""
+
+
+@dataclass(frozen=True)
+class SMTPTarget:
+    """Параметры подключения аккаунта к SMTP-серверу"""
+    host: str
+    port: int = 587
+    username: Optional[str] = None
+    password: Optional[str] = None
+    use_tls: bool = True
+
+    @classmethod
+    def from_account(cls, account: Any) -> "SMTPTarget":
+        return cls(
+            host=account.smtp_host,
+            port=account.smtp_port or 587,
+            username=account.smtp_username,
+            password=account.smtp_password,
+            use_tls=bool(account.smtp_use_tls),
+        )
+
+    @property
+    def key(self) -> Tuple[str, int, Optional[str]]:
+        return self.host, self.port, self.username
+
+
+def message_bytes(message: Union[Message, bytes]) -> bytes:
+    if isinstance(message, bytes):
+        return message
+    return message.as_bytes(policy=message.policy.clone(linesep="\r\n"))
+
+
+def quote_data(data: bytes) -> bytes:
+    """Текст письма для DATA: переводы строк CRLF, точка в начале строки удвоена, завершающая точка"""
+    data = _LEADING_DOT.sub(b"..", _LINE_ENDINGS.sub(b"\r\n", data))
+    if not data.endswith(b"\r\n"):
+        data += b"\r\n"
+    return data + b".\r\n"
+
+
+class SMTPConnection:
+    """Одна SMTP-сессия: подключение, EHLO, STARTTLS, AUTH и отправка писем"""
+
+    def __init__(self, target: SMTPTarget, local_hostname: Optional[str] = None,
+                 connect_timeout: float = 10.0, command_timeout: float = 30.0,
+                 ssl_context: Optional[ssl.SSLContext] = None):
+        self.target = target
+        self.local_hostname = local_hostname or socket.getfqdn()
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self.ssl_context = ssl_context
+        self.extensions: Dict[str, str] = {}
+        self.messages_sent = 0
+        self.last_used = 0.0
+        # Текст письма начал передаваться: после обрыва повторять отправку нельзя
+        self.payload_started = False
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    @property
+    def pipelining(self) -> bool:
+        return "pipelining" in self.extensions
+
+    @property
+    def is_connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    def _tls_context(self) -> ssl.SSLContext:
+        if self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+        return self.ssl_context
+
+    async def connect(self):
+        implicit_tls = self.target.port == IMPLICIT_TLS_PORT and self.target.use_tls
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.target.host, self.target.port,
+                ssl=self._tls_context() if implicit_tls else None
+            ),
+            timeout=self.connect_timeout
+        )
+        await self._expect(220)
+        await self._ehlo()
+        if self.target.use_tls and not implicit_tls:
+            if "starttls" not in self.extensions:
+                raise SMTPError(502, "STARTTLS extension not supported by server")
+            await self._command("STARTTLS", 220)
+            await asyncio.wait_for(
+                self._writer.start_tls(self._tls_context(), server_hostname=self.target.host),
+                timeout=self.connect_timeout
+            )
+            await self._ehlo()
+        if self.target.username and self.target.password:
+            await self._login()
+
+    async def _read_reply(self) -> Tuple[int, List[str]]:
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self._reader.readline(), timeout=self.command_timeout)
+            if not line:
+                raise SMTPDisconnected(f"Connection to {self.target.host} closed by server")
+            text = line.decode("utf-8", errors="replace").rstrip("\r\n")
+            lines.append(text[4:])
+            if len(text) < 4 or text[3] != "-":
+                try:
+                    return int(text[:3]), lines
+                except ValueError:
+                    raise SMTPDisconnected(f"Malformed SMTP reply: {text!r}")
+
+    async def _expect(self, *codes: int) -> Tuple[int, str]:
+        code, lines = await self._read_reply()
+        message = "\n".join(lines)
+        if code not in codes:
+            raise SMTPError(code, message)
+        return code, message
+
+    def _write(self, *commands: str):
+        self._writer.write("".join(f"{command}\r\n" for command in commands).encode())
+
+    async def _command(self, command: str, *codes: int) -> Tuple[int, str]:
+        self._write(command)
+        await self._writer.drain()
+        return await self._expect(*(codes or (250,)))
+
+    async def _ehlo(self):
+        _, message = await self._command(f"EHLO {self.local_hostname}", 250)
+        self.extensions = {}
+        for line in message.split("\n")[1:]:
+            keyword, _, params = line.partition(" ")
+            self.extensions[keyword.lower()] = params
+
+    async def _login(self):
+        mechanisms = self.extensions.get("auth", "").upper().split()
+        username, password = self.target.username, self.target.password
+        if "PLAIN" in mechanisms:
+            token = base64.b64encode(f"\0{username}\0{password}".encode()).decode()
+            await self._command(f"AUTH PLAIN {token}", 235)
+        elif "LOGIN" in mechanisms:
+            await self._command("AUTH LOGIN", 334)
+            await self._command(base64.b64encode(username.encode()).decode(), 334)
+            await self._command(base64.b64encode(password.encode()).decode(), 235)
+        else:
+            raise SMTPError(502, "No supported SMTP AUTH mechanism")
+
+    async def send_message(self, from_addr: str, recipients: Sequence[str],
+                           data: bytes) -> Dict[str, Tuple[int, str]]:
+        """Отправка письма; возвращает отклоненных получателей (адрес -> (код, ответ))"""
+        self.payload_started = False
+        envelope = [f"MAIL FROM:<{from_addr}>", *(f"RCPT TO:<{recipient}>" for recipient in recipients)]
+        refused: Dict[str, Tuple[int, str]] = {}
+
+        if self.pipelining:
+            self._write(*envelope, "DATA")
+            await self._writer.drain()
+            replies = [await self._read_reply() for _ in range(len(envelope) + 1)]
+        else:
+            replies = []
+            for command in envelope:
+                self._write(command)
+                await self._writer.drain()
+                replies.append(await self._read_reply())
+                if replies[0][0] != 250:
+                    break
+            if replies[0][0] == 250 and any(code in (250, 251) for code, _ in replies[1:]):
+                self._write("DATA")
+                await self._writer.drain()
+                replies.append(await self._read_reply())
+
+        mail_code, mail_lines = replies[0]
+        for recipient, (code, lines) in zip(recipients, replies[1:len(envelope)]):
+            if code not in (250, 251):
+                refused[recipient] = (code, "\n".join(lines))
+        data_reply = replies[len(envelope)] if len(replies) > len(envelope) else None
+
+        if mail_code != 250 or len(refused) == len(recipients) or data_reply is None or data_reply[0] != 354:
+            if data_reply is not None and data_reply[0] == 354:
+                # Сервер принял DATA без получателей: завершаем пустое письмо
+                self._write(".")
+                await self._writer.drain()
+                await self._read_reply()
+            await self.reset()
+            if mail_code != 250:
+                raise SMTPError(mail_code, "\n".join(mail_lines))
+            if len(refused) == len(recipients):
+                raise SMTPRecipientsRefused(refused)
+            raise SMTPError(data_reply[0], "\n".join(data_reply[1]))
+
+        self.payload_started = True
+        self._writer.write(quote_data(data))
+        await self._writer.drain()
+        await self._expect(250)
+        self.messages_sent += 1
+        return refused
+
+    async def reset(self):
+        await self._command("RSET", 250)
+
+    async def quit(self):
+        try:
+            if self.is_connected:
+                await self._command("QUIT", 221)
+        except (OSError, SMTPError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class _AccountPool:
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.slots = asyncio.Semaphore(max_connections)
+        self.idle: List[SMTPConnection] = []
+
+
+class SMTPConnectionPool:
+    """Авторизованные SMTP-соединения по аккаунтам с лимитом одновременных отправок"""
+
+    def __init__(
+        self,
+        max_per_account: int = 4,
+        idle_timeout: float = 60.0,
+        max_messages: int = 100,
+        connect_timeout: float = 10.0,
+        command_timeout: float = 30.0,
+        pool_timeout: float = 30.0,
+        local_hostname: Optional[str] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_per_account = max_per_account
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.connect_timeout = connect_timeout
+        self.command_timeout = command_timeout
+        self.pool_timeout = pool_timeout
+        self.local_hostname = local_hostname or None
+        self.ssl_context = ssl_context
+        self.clock = clock
+        self._pools: Dict[Tuple[str, int, Optional[str]], _AccountPool] = {}
+        self.connections_opened = 0
+
+    def _pool(self, target: SMTPTarget) -> _AccountPool:
+        pool = self._pools.get(target.key)
+        if pool is None:
+            pool = self._pools[target.key] = _AccountPool(self.max_per_account)
+        return pool
+
+    async def _checkout(self, target: SMTPTarget, pool: _AccountPool) -> Tuple[SMTPConnection, bool]:
+        """Свободное соединение аккаунта (reused=True) или новое"""
+        while pool.idle:
+            connection = pool.idle.pop()
+            if connection.target != target:
+                # Пароль аккаунта изменился: старую сессию не используем
+                await connection.quit()
+                continue
+            if self.clock() - connection.last_used > self.idle_timeout or not connection.is_connected:
+                await connection.quit()
+                continue
+            return connection, True
+        connection = SMTPConnection(target, self.local_hostname, self.connect_timeout,
+                                    self.command_timeout, self.ssl_context)
+        try:
+            await connection.connect()
+        except BaseException:
+            connection.close()
+            raise
+        self.connections_opened += 1
+        return connection, False
+
+    async def _checkin(self, pool: _AccountPool, connection: SMTPConnection):
+        if connection.messages_sent >= self.max_messages or not connection.is_connected:
+            await connection.quit()
+            return
+        connection.last_used = self.clock()
+        pool.idle.append(connection)
+
+    async def send_message(self, target: SMTPTarget, message: Union[Message, bytes], from_addr: str,
+                           recipients: Sequence[str]) -> Dict[str, Tuple[int, str]]:
+        """Отправка письма через пул; возвращает отклоненных получателей (остальным письмо ушло)"""
+        data = message_bytes(message)
+        pool = self._pool(target)
+        try:
+            await asyncio.wait_for(pool.slots.acquire(), timeout=self.pool_timeout)
+        except asyncio.TimeoutError:
+            raise SMTPPoolOverloaded(f"No free SMTP connection slot for {target.host}:{target.port}")
+        try:
+            while True:
+                connection, reused = await self._checkout(target, pool)
+                try:
+                    refused = await connection.send_message(from_addr, recipients, data)
+                except OSError:
+                    connection.close()
+                    if reused and not connection.payload_started:
+                        # Сервер закрыл простаивавшую сессию: письмо не передано, пробуем новое соединение
+                        logger.info(f"Stale SMTP connection to {target.host}:{target.port}, reconnecting")
+                        continue
+                    raise
+                except SMTPError:
+                    # Отказ команды: сессия после RSET пригодна для следующих писем
+                    await self._checkin(pool, connection)
+                    raise
+                except BaseException:
+                    # Отмена посреди обмена: состояние сессии неизвестно
+                    connection.close()
+                    raise
+                await self._checkin(pool, connection)
+                return refused
+        finally:
+            pool.slots.release()
+
+    async def close(self):
+        for pool in self._pools.values():
+            while pool.idle:
+                await pool.idle.pop().quit()
+        self._pools.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            f"{host}:{port}/{username or ''}": {
+                "idle": len(pool.idle),
+                "in_use": pool.max_connections - pool.slots._value,
+            }
+            for (host, port, username), pool in self._pools.items()
+        }
+
+
+def _pool_from_settings() -> SMTPConnectionPool:
+    config = settings.email
+    return SMTPConnectionPool(
+        max_per_account=config.smtp_max_connections_per_account,
+        idle_timeout=config.smtp_idle_timeout_seconds,
+        max_messages=config.smtp_max_messages_per_connection,
+        connect_timeout=config.smtp_connect_timeout_seconds,
+        command_timeout=config.smtp_command_timeout_seconds,
+        pool_timeout=config.smtp_pool_timeout_seconds,
+        local_hostname=config.smtp_local_hostname,
+    )
+
+
+# Глобальный экземпляр
+smtp_pool = _pool_from_settings()
+
+
+__all__ = [
+    "SMTPConnection",
+    "SMTPConnectionPool",
+    "SMTPDisconnected",
+    "SMTPError",
+    "SMTPPoolOverloaded",
+    "SMTPRecipientsRefused",
+    "SMTPTarget",
+    "message_bytes",
+    "quote_data",
+    "smtp_pool",
+]
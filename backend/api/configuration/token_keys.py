@@ -0,0 +1,144 @@
+"""
+Ключи подписи и проверки JWT
+
+Ключи читаются один раз и хранятся уже разобранными (jose Key), поэтому
+проверка токена не обращается к диску и не парсит PEM на каждый запрос.
+Ротация: новые токены подписываются текущим ключом и получают заголовок
+kid, а токены, выпущенные предыдущими ключами, проверяются до истечения
+срока по списку previous_* из настроек. Для RS256 изменение файлов ключей
+подхватывается проверкой mtime не чаще key_reload_interval_seconds.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from jose import JWTError, jwk, jwt
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _key_id(material: bytes) -> str:
+    return hashlib.sha256(material).hexdigest()[:16]
+
+
+class TokenKeyRing:
+    """Текущий ключ подписи и набор ключей проверки, идентифицируемых по kid"""
+
+    def __init__(self, security_settings=None):
+        self._settings = security_settings
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._algorithm: Optional[str] = None
+        self._signing_kid: Optional[str] = None
+        self._signing_key = None
+        self._verification_keys: Dict[str, object] = {}
+        self._mtimes: Dict[Path, float] = {}
+        self._next_check = 0.0
+
+    @property
+    def security(self):
+        return self._settings or settings.security
+
+    def _watched_files(self) -> List[Path]:
+        return [Path(self.security.private_key_path), Path(self.security.public_key_path)] + [
+            Path(path) for path in self.security.previous_public_key_paths
+        ]
+
+    def load(self):
+        """Чтение и разбор ключей из настроек"""
+        security = self.security
+        algorithm = security.algorithm
+        verification: Dict[str, object] = {}
+
+        if algorithm.startswith("HS"):
+            secrets = [security.secret_key] + list(security.previous_secret_keys)
+            for secret in secrets:
+                verification.setdefault(_key_id(secret.encode()), jwk.construct(secret, algorithm))
+            signing_kid = _key_id(security.secret_key.encode())
+            signing_key = verification[signing_kid]
+            mtimes = {}
+        else:
+            private_pem = Path(security.private_key_path).read_bytes()
+            public_pems = [Path(security.public_key_path).read_bytes()] + [
+                Path(path).read_bytes() for path in security.previous_public_key_paths
+            ]
+            for pem in public_pems:
+                verification.setdefault(_key_id(pem), jwk.construct(pem, algorithm))
+            signing_kid = _key_id(public_pems[0])
+            signing_key = jwk.construct(private_pem, algorithm)
+            mtimes = {path: path.stat().st_mtime for path in self._watched_files() if path.exists()}
+
+        with self._lock:
+            self._algorithm = algorithm
+            self._signing_kid = signing_kid
+            self._signing_key = signing_key
+            self._verification_keys = verification
+            self._mtimes = mtimes
+            self._loaded = True
+            self._next_check = time.monotonic() + self.security.key_reload_interval_seconds
+        logger.info(f"Loaded JWT keys ({algorithm}): signing kid {signing_kid}, {len(verification)} verification keys")
+
+    def reload(self):
+        """Принудительная перезагрузка ключей (ротация)"""
+        self.load()
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+            return
+        if not self._mtimes or time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.security.key_reload_interval_seconds
+        for path, mtime in self._mtimes.items():
+            try:
+                if path.stat().st_mtime != mtime:
+                    logger.info(f"JWT key file {path} changed, reloading keys")
+                    self.load()
+                    return
+            except OSError:
+                continue
+
+    @property
+    def algorithm(self) -> str:
+        self._ensure_loaded()
+        return self._algorithm
+
+    def signing_key(self) -> Tuple[str, object]:
+        """(kid, ключ) для подписи новых токенов"""
+        self._ensure_loaded()
+        return self._signing_kid, self._signing_key
+
+    def verification_keys(self, token: str) -> List[object]:
+        """Ключи для проверки токена: по kid из заголовка или все известные"""
+        self._ensure_loaded()
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except Exception:
+            kid = None
+        if kid is not None:
+            key = self._verification_keys.get(kid)
+            return [key] if key is not None else []
+        # Токены, выпущенные до появления kid: текущий ключ проверяется первым
+        keys = [self._verification_keys[self._signing_kid]]
+        keys.extend(key for kid, key in self._verification_keys.items() if kid != self._signing_kid)
+        return keys
+
+    def encode(self, claims: dict) -> str:
+        kid, key = self.signing_key()
+        return jwt.encode(claims, key, algorithm=self._algorithm, headers={"kid": kid})
+
+    def decode(self, token: str) -> dict:
+        """Проверка подписи и срока действия; JWTError при неизвестном ключе"""
+        keys = self.verification_keys(token)
+        if not keys:
+            raise JWTError("Unknown signing key")
+        return jwt.decode(token, keys, algorithms=[self._algorithm])
+
+
+token_key_ring = TokenKeyRing()
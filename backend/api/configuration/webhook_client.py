@@ -0,0 +1,255 @@
+"""
+Общий HTTP-клиент для исходящих webhook'ов
+
+Один httpx.AsyncClient на процесс (создается и закрывается в lifespan):
+соединения с получателями переиспользуются (keep-alive), поэтому повторные
+вызовы не платят за DNS, TCP и TLS, а число открытых сокетов ограничено
+пулом. Поверх пула:
+
+- лимит одновременных запросов к одному адресу (scheme://host:port), чтобы
+  медленный получатель не занял весь пул;
+- предохранитель на адрес: после failure_threshold ошибок подряд (сеть,
+  таймаут, 5xx, 429) запросы к адресу отклоняются без вызова на
+  reset_seconds, затем пропускается одна пробная попытка;
+- подпись HMAC-SHA256 тела запроса секретом webhook'а: заголовки
+  X-Webhook-Timestamp и X-Webhook-Signature ("sha256=<hex>" от
+  "<timestamp>.<тело>"); получатель проверяет ее verify_signature.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-Webhook-Signature"
+TIMESTAMP_HEADER = "X-Webhook-Timestamp"
+
+
+class CircuitOpenError(Exception):
+    """Предохранитель адреса разомкнут: запрос не выполнялся"""
+
+
+class WebhookClientOverloaded(Exception):
+    """Нет свободного слота для адреса за pool_timeout"""
+
+
+def sign_payload(secret: str, body: bytes, timestamp: int) -> str:
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def verify_signature(secret: str, body: bytes, timestamp: str, signature: str,
+                     tolerance_seconds: int = 300, now: Optional[float] = None) -> bool:
+    """Проверка подписи на стороне получателя (с защитой от повтора старых запросов)"""
+    try:
+        sent_at = int(timestamp)
+    except (TypeError, ValueError):
+        return False
+    if abs((now or time.time()) - sent_at) > tolerance_seconds:
+        return False
+    return hmac.compare_digest(sign_payload(secret, body, sent_at), signature or "")
+
+
+class CircuitBreaker:
+    """Предохранитель одного адреса: closed -> open -> half_open -> closed"""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        probe, self._probe_in_flight = self._probe_in_flight, False
+        # Неудачная пробная попытка снова размыкает предохранитель на reset_seconds
+        if probe or (self.opened_at is None and self.failures >= self.failure_threshold):
+            self.opened_at = self.clock()
+            logger.warning(f"Webhook circuit opened after {self.failures} failures")
+
+
+def _origin(url: httpx.URL) -> str:
+    port = url.port or (443 if url.scheme == "https" else 80)
+    return f"{url.scheme}://{url.host}:{port}"
+
+
+class WebhookHttpClient:
+    """Пул соединений, лимиты по адресам и предохранители для webhook'ов"""
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        max_per_host: int = 10,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 10.0,
+        write_timeout: float = 10.0,
+        pool_timeout: float = 5.0,
+        failure_threshold: int = 5,
+        reset_seconds: float = 60.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout,
+                                     write=write_timeout, pool=pool_timeout)
+        self.max_per_host = max_per_host
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Вне lifespan (скрипты, тесты) клиент создается при первом запросе
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout,
+                                             transport=self.transport, follow_redirects=False)
+        return self._client
+
+    async def start(self):
+        self.client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._slots.clear()
+
+    def breaker(self, origin: str) -> CircuitBreaker:
+        breaker = self.breakers.get(origin)
+        if breaker is None:
+            breaker = self.breakers[origin] = CircuitBreaker(self.failure_threshold, self.reset_seconds)
+        return breaker
+
+    def _host_slots(self, origin: str) -> asyncio.Semaphore:
+        slots = self._slots.get(origin)
+        if slots is None:
+            slots = self._slots[origin] = asyncio.Semaphore(self.max_per_host)
+        return slots
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        json_body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        secret: Optional[str] = None,
+        read_timeout: Optional[float] = None,
+    ) -> httpx.Response:
+        """Запрос к webhook'у; CircuitOpenError - адрес временно отключен, тело не отправлялось"""
+        target = httpx.URL(url)
+        origin = _origin(target)
+        body = json.dumps(json_body, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+        request_headers = {"Content-Type": "application/json", **(headers or {})}
+        if secret:
+            timestamp = int(time.time())
+            request_headers[TIMESTAMP_HEADER] = str(timestamp)
+            request_headers[SIGNATURE_HEADER] = sign_payload(secret, body, timestamp)
+        timeout = self.timeout
+        if read_timeout is not None:
+            timeout = httpx.Timeout(connect=timeout.connect, read=read_timeout, write=timeout.write, pool=timeout.pool)
+
+        slots = self._host_slots(origin)
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.timeout.pool)
+        except asyncio.TimeoutError:
+            raise WebhookClientOverloaded(f"No free connection slot for {origin}")
+        try:
+            breaker = self.breaker(origin)
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {origin}")
+            # Исход фиксируется при любом выходе, включая отмену задачи (BaseException): иначе
+            # пробная попытка half_open останется занятой и предохранитель не замкнется
+            failed = True
+            try:
+                response = await self.client.request(method, target, content=body,
+                                                      headers=request_headers, timeout=timeout)
+                failed = response.status_code >= 500 or response.status_code == 429
+                return response
+            finally:
+                if failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+        finally:
+            slots.release()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            origin: {"state": breaker.state, "failures": breaker.failures}
+            for origin, breaker in self.breakers.items()
+        }
+
+
+def _client_from_settings() -> WebhookHttpClient:
+    config = settings.notifications
+    return WebhookHttpClient(
+        max_connections=config.webhook_max_connections,
+        max_keepalive_connections=config.webhook_max_keepalive_connections,
+        keepalive_expiry=config.webhook_keepalive_expiry_seconds,
+        max_per_host=config.webhook_max_per_host,
+        connect_timeout=config.webhook_connect_timeout_seconds,
+        read_timeout=config.webhook_read_timeout_seconds,
+        write_timeout=config.webhook_write_timeout_seconds,
+        pool_timeout=config.webhook_pool_timeout_seconds,
+        failure_threshold=config.webhook_circuit_failure_threshold,
+        reset_seconds=config.webhook_circuit_reset_seconds,
+    )
+
+
+# Глобальный экземпляр
+webhook_client = _client_from_settings()
+
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "SIGNATURE_HEADER",
+    "TIMESTAMP_HEADER",
+    "WebhookClientOverloaded",
+    "WebhookHttpClient",
+    "sign_payload",
+    "verify_signature",
+    "webhook_client",
+]
@@ -12,6 +12,10 @@ from starlette.responses import HTMLResponse
 from backend.api.configuration.server import Server
 from backend.api.configuration.lifespan import app_lifespan as lifespan
 from backend.api.middleware.auth_middleware import setup_auth_middleware
+from backend.api.middleware.metrics_middleware import setup_metrics_middleware
+from backend.api.middleware.query_budget_middleware import setup_query_budget_middleware
+from backend.api.middleware.query_origin_middleware import setup_query_origin_middleware
+from core.settings import settings
 
 import logging
 
@@ -55,13 +59,31 @@ def create_app(
     )
 
     # Настраиваем middleware для аутентификации и авторизации
-    # setup_auth_middleware(app)  # Временно отключено для отладки
+    if settings.security.route_permissions_enabled:
+        setup_auth_middleware(app)
+
+    # Маршрут HTTP-запроса как источник в журнале медленных запросов
+    if settings.db.slow_query_enabled:
+        setup_query_origin_middleware(app)
+
+    # Число SQL-запросов на запрос и поиск N+1 (разработка и CI)
+    if settings.db.query_budget_enabled:
+        setup_query_budget_middleware(
+            app,
+            max_queries=settings.db.query_budget_max_queries,
+            max_repeats=settings.db.query_budget_max_repeats,
+            strict=settings.db.query_budget_strict
+        )
+
+    # Метрики снаружи проверки прав: учитываются и отклоненные запросы
+    if settings.metrics.enabled:
+        setup_metrics_middleware(app)
 
     # app.mount("/static", StaticFiles(directory="backend/app/front/static"), name="static")
 
     if create_custom_static_urls:
         register_static_docs_routes(app)
 
-    logger.info("App created with auth middleware")
+    logger.info(f"App created (route permissions enabled: {settings.security.route_permissions_enabled})")
 
     return Server(app).get_app()
@@ -1,156 +1,114 @@
 """
 Middleware для проверки прав доступа
+
+Требования к маршрутам задаются правилами из route_rules и компилируются
+один раз в setup_auth_middleware; на запрос приходится один поиск в дереве
+правил. Проверка токена использует кэш principal, проверка разрешений -
+скомпилированную матрицу ролей, поэтому на горячем пути нет запросов к БД.
 """
-from typing import Optional, List
-from fastapi import Request, HTTPException, status
+from typing import Optional
+from fastapi import HTTPException, status
 from fastapi.responses import JSONResponse
-from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.api.configuration.auth import verify_authorization
+from backend.api.configuration.auth import (get_current_token_payload, get_principal_by_token_sub,
+                                            validate_token_type, TOKEN_TYPE_ACCESS)
+from backend.api.configuration.permission_matrix import permission_matrix
+from backend.api.middleware.route_rules import RouteMatcher, RouteRule, compile_route_rules
 from core.database import get_db_helper
 
 
+def _bearer_token(scope) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token.strip()
+            return None
+    return None
+
+
+async def _error(scope, receive, send, exc: HTTPException):
+    response = JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=exc.headers)
+    await response(scope, receive, send)
+
+
 class AuthMiddleware:
     """Middleware для проверки аутентификации и авторизации"""
     
-    def __init__(self, app):
+    def __init__(self, app, matcher: Optional[RouteMatcher] = None):
         self.app = app
+        self.matcher = matcher or compile_route_rules()
     
     async def __call__(self, scope, receive, send):
-        if scope["type"] == "http":
-            request = Request(scope, receive)
-            
-            # Проверяем, нужна ли аутентификация для этого пути
-            if self._requires_auth(request.url.path):
-                try:
-                    # Проверяем аутентификацию
-                    user = await verify_authorization(request)
-                    
-                    # Добавляем пользователя в scope для использования в endpoint'ах
-                    scope["user"] = user
-                    
-                    # Проверяем права доступа если нужно
-                    if self._requires_role_check(request.url.path):
-                        await self._check_role_access(request, user)
-                        
-                except HTTPException as e:
-                    response = JSONResponse(
-                        status_code=e.status_code,
-                        content={"detail": e.detail}
-                    )
-                    await response(scope, receive, send)
-                    return
-                except Exception as e:
-                    response = JSONResponse(
-                        status_code=status.HTTP_401_UNAUTHORIZED,
-                        content={"detail": "Authentication failed"}
-                    )
-                    await response(scope, receive, send)
-                    return
-        
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        rule = self.matcher.match(scope["method"], scope["path"])
+        # PermissionMiddleware использует уже найденное правило
+        scope["route_rule"] = rule
+
+        if not rule.public:
+            try:
+                user = await self._authenticate(scope)
+                # Добавляем пользователя в scope для использования в endpoint'ах
+                scope["user"] = user
+                self._check_role_access(rule, user)
+            except HTTPException as e:
+                await _error(scope, receive, send, e)
+                return
+            except Exception:
+                await _error(scope, receive, send, HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Authentication failed"
+                ))
+                return
+
         await self.app(scope, receive, send)
-    
-    def _requires_auth(self, path: str) -> bool:
-        """Проверяет, нужна ли аутентификация для данного пути"""
-        # Пути, которые не требуют аутентификации
-        public_paths = [
-            "/auth/register/",
-            "/auth/login_user/",
-            "/auth/test/",
-            "/auth/test-token/",
-            "/auth/test-user-lookup/",
-            "/docs",
-            "/redoc",
-            "/openapi.json",
-            "/health",
-            "/favicon.ico",
-            # Временно добавляем dashboard endpoints для диагностики
-            "/api/dashboards/stats",
-            "/api/dashboards/templates",
-            "/api/dashboards/"
-        ]
-        
-        # Проверяем, начинается ли путь с публичного
-        for public_path in public_paths:
-            if path.startswith(public_path):
-                return False
-        
-        return True
-    
-    def _requires_role_check(self, path: str) -> bool:
-        """Проверяет, нужна ли проверка ролей для данного пути"""
-        # Пути, которые требуют проверки ролей
-        role_required_paths = [
-            "/auth/users/",
-            "/auth/organizations/",
-            "/auth/departments/",
-            "/auth/permissions/"
-        ]
-        
-        for role_path in role_required_paths:
-            if path.startswith(role_path):
-                return True
-        
-        return False
-    
-    async def _check_role_access(self, request: Request, user) -> None:
-        """Проверяет права доступа пользователя"""
-        path = request.url.path
-        method = request.method
-        
-        # Определяем требуемые роли для разных путей
-        required_roles = self._get_required_roles(path, method)
-        
-        if required_roles and user.role not in required_roles and user.role != "admin":
+
+    async def _authenticate(self, scope):
+        token = _bearer_token(scope)
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Not authenticated",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        payload = get_current_token_payload(token)
+        validate_token_type(payload, TOKEN_TYPE_ACCESS)
+        # Сессия открывает соединение только при промахе кэша principal
+        async with get_db_helper().get_session() as session:
+            user = await get_principal_by_token_sub(payload, session)
+        if not user.is_active:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Access denied. Required roles: {', '.join(required_roles)}"
+                detail="User account is not active",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        await get_db_helper().start_read_your_writes(user.id)
+        return user
+
+    @staticmethod
+    def _check_role_access(rule: RouteRule, user) -> None:
+        """Проверяет роль пользователя по правилу маршрута"""
+        if rule.roles and user.role not in rule.roles and user.role != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Access denied. Required roles: {', '.join(rule.roles)}"
             )
-    
-    def _get_required_roles(self, path: str, method: str) -> Optional[List[str]]:
-        """Возвращает требуемые роли для данного пути и метода"""
-        # Маппинг путей и методов к требуемым ролям
-        role_mapping = {
-            # Управление пользователями
-            ("/auth/users/", "GET"): ["admin", "CEO"],
-            ("/auth/users/", "POST"): ["admin"],
-            ("/auth/users/", "PUT"): ["admin", "CEO"],
-            ("/auth/users/", "DELETE"): ["admin"],
-            
-            # Управление организациями
-            ("/auth/organizations/", "GET"): ["admin", "CEO"],
-            ("/auth/organizations/", "POST"): ["admin"],
-            ("/auth/organizations/", "PUT"): ["admin", "CEO"],
-            ("/auth/organizations/", "DELETE"): ["admin"],
-            
-            # Управление департаментами
-            ("/auth/departments/", "GET"): ["admin", "CEO", "manager"],
-            ("/auth/departments/", "POST"): ["admin", "CEO"],
-            ("/auth/departments/", "PUT"): ["admin", "CEO", "manager"],
-            ("/auth/departments/", "DELETE"): ["admin", "CEO"],
-            
-            # Управление разрешениями
-            ("/auth/permissions/", "GET"): ["admin"],
-            ("/auth/permissions/", "POST"): ["admin"],
-            ("/auth/permissions/", "PUT"): ["admin"],
-            ("/auth/permissions/", "DELETE"): ["admin"],
-        }
-        
-        return role_mapping.get((path, method))
 
 
 class PermissionMiddleware:
     """Middleware для проверки конкретных разрешений"""
     
-    def __init__(self, app):
+    def __init__(self, app, matcher: Optional[RouteMatcher] = None):
         self.app = app
+        self.matcher = matcher or compile_route_rules()
     
     async def __call__(self, scope, receive, send):
-        if scope["type"] == "http":
-            request = Request(scope, receive)
-            
-            # Проверяем, нужна ли проверка разрешений
-            if self._requires_permission_check(request.url.path):
+        if scope["type"] == "http" and scope["method"] != "OPTIONS":
+            rule = scope.get("route_rule") or self.matcher.match(scope["method"], scope["path"])
+            if rule.permission is not None and not rule.public:
                 try:
                     # Получаем пользователя из scope (должен быть добавлен AuthMiddleware)
                     user = scope.get("user")
@@ -159,44 +117,28 @@ class PermissionMiddleware:
                             status_code=status.HTTP_401_UNAUTHORIZED,
                             detail="User not found in request scope"
                         )
-                    
-                    # Проверяем разрешения
-                    await self._check_permissions(request, user)
-                    
+                    self._check_permissions(rule, user)
                 except HTTPException as e:
-                    response = JSONResponse(
-                        status_code=e.status_code,
-                        content={"detail": e.detail}
-                    )
-                    await response(scope, receive, send)
+                    await _error(scope, receive, send, e)
                     return
         
         await self.app(scope, receive, send)
     
-    def _requires_permission_check(self, path: str) -> bool:
-        """Проверяет, нужна ли проверка разрешений для данного пути"""
-        # Пути, которые требуют проверки разрешений
-        permission_required_paths = [
-            "/auth/users/",
-            "/auth/organizations/",
-            "/auth/departments/",
-            "/auth/permissions/"
-        ]
-        
-        for permission_path in permission_required_paths:
-            if path.startswith(permission_path):
-                return True
-        
-        return False
-    
-    async def _check_permissions(self, request: Request, user) -> None:
-        """Проверяет разрешения пользователя"""
-        # Здесь можно добавить логику проверки конкретных разрешений
-        # Например, проверка разрешений на уровне организации/департамента
-        pass
+    @staticmethod
+    def _check_permissions(rule: RouteRule, user) -> None:
+        """Проверяет разрешение роли пользователя по матрице разрешений"""
+        resource, action = rule.permission
+        if not permission_matrix.allows(user.role, resource, action):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Access denied. Required permission: {resource}:{action}"
+            )
 
 
-def setup_auth_middleware(app):
+def setup_auth_middleware(app, rules=None):
     """Настраивает middleware для аутентификации и авторизации"""
-    app.add_middleware(AuthMiddleware)
-    app.add_middleware(PermissionMiddleware)
+    matcher = compile_route_rules(rules)
+    # Последний добавленный middleware выполняется первым: AuthMiddleware
+    # должен заполнить scope["user"] до PermissionMiddleware
+    app.add_middleware(PermissionMiddleware, matcher=matcher)
+    app.add_middleware(AuthMiddleware, matcher=matcher)
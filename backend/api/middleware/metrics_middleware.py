@@ -0,0 +1,82 @@
+"""
+Middleware метрик HTTP и WebSocket
+
+Метка маршрута - шаблон пути ("/api/tasks/{task_id}"), а не сам путь,
+поэтому число рядов не растет с числом объектов. Шаблон известен только
+после маршрутизации: FastAPI кладет найденный маршрут в scope["route"].
+"""
+import time
+
+from backend.api.configuration.metrics import (HTTP_IN_PROGRESS, HTTP_LATENCY, HTTP_REQUESTS,
+                                               REQUEST_DB_QUERIES, REQUEST_DB_SECONDS, UNMATCHED_ROUTE,
+                                               WEBSOCKET_CONNECTIONS, WEBSOCKET_OPENED, instrument_queries,
+                                               track_request_db)
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Задержка, статус и число SQL-запросов HTTP-запросов; открытые WebSocket-соединения"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def _http(self, scope, receive, send):
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = HTTP_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            with track_request_db() as db_stats:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_progress.dec()
+            route = _route_label(scope)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            HTTP_LATENCY.labels(method, route).observe(elapsed)
+            REQUEST_DB_QUERIES.labels(route).observe(db_stats.queries)
+            REQUEST_DB_SECONDS.labels(route).observe(db_stats.seconds)
+
+    async def _websocket(self, scope, receive, send):
+        gauge = None
+
+        async def send_wrapper(message):
+            nonlocal gauge
+            if message["type"] == "websocket.accept" and gauge is None:
+                route = _route_label(scope)
+                WEBSOCKET_OPENED.labels(route).inc()
+                gauge = WEBSOCKET_CONNECTIONS.labels(route)
+                gauge.inc()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if gauge is not None:
+                gauge.dec()
+
+
+def setup_metrics_middleware(app):
+    """Подключение middleware метрик и учета SQL-запросов"""
+    instrument_queries()
+    app.add_middleware(MetricsMiddleware)
@@ -0,0 +1,107 @@
+"""
+Middleware бюджета SQL-запросов (режим разработки и CI)
+
+Считает SQL-запросы каждого HTTP-запроса и сообщает о превышении бюджета
+и о повторах одного отпечатка (N+1). Бюджет маршрута задается декоратором
+query_budget у обработчика, иначе действует общий из настроек. В строгом
+режиме (CI) нарушение заменяет ответ на 500 с отчетом, чтобы регрессия
+не прошла незамеченной; иначе пишется предупреждение в лог, а число
+запросов возвращается в заголовке X-Query-Count.
+"""
+import logging
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+
+from core.database.query_inspector import check_budget, record_queries
+
+logger = logging.getLogger("app_fastapi.query_budget")
+
+QUERY_COUNT_HEADER = b"x-query-count"
+
+
+def query_budget(max_queries: int, max_repeats: Optional[int] = None):
+    """Бюджет SQL-запросов обработчика (ставится под декоратором маршрута)
+
+        @router.get("/unread")
+        @query_budget(3, max_repeats=1)
+        async def unread_counts(...):
+    """
+    def decorator(endpoint):
+        endpoint.__query_budget__ = (max_queries, max_repeats)
+        return endpoint
+    return decorator
+
+
+class QueryBudgetMiddleware:
+    """Подсчет SQL-запросов на HTTP-запрос и проверка бюджета"""
+
+    def __init__(self, app, max_queries: int = 50, max_repeats: Optional[int] = 4, strict: bool = False):
+        self.app = app
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.strict = strict
+
+    def _budget(self, scope):
+        route = scope.get("route")
+        budget = getattr(getattr(route, "endpoint", None), "__query_budget__", None)
+        return budget or (self.max_queries, self.max_repeats)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        replaced = False
+
+        with record_queries() as recorder:
+            async def send_wrapper(message):
+                nonlocal replaced
+                if replaced:
+                    return
+                if message["type"] == "http.response.start":
+                    # Обработчик завершен - запросы, выполненные до ответа, уже учтены
+                    violations = check_budget(recorder, *self._budget(scope))
+                    if violations:
+                        self._report(scope, recorder, violations)
+                        if self.strict:
+                            replaced = True
+                            await self._reject(scope, send, recorder, violations)
+                            return
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (QUERY_COUNT_HEADER, str(recorder.count).encode())
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _route(scope) -> str:
+        route = scope.get("route")
+        return getattr(route, "path", None) or scope["path"]
+
+    def _report(self, scope, recorder, violations):
+        logger.warning(
+            f"Query budget violated by {scope['method']} {self._route(scope)}: "
+            f"{'; '.join(violations)}\n{recorder.report()}"
+        )
+
+    async def _reject(self, scope, send, recorder, violations):
+        response = JSONResponse(
+            status_code=500,
+            content={
+                "detail": "Query budget exceeded",
+                "route": f"{scope['method']} {self._route(scope)}",
+                "violations": violations,
+                "statements": [
+                    {"count": count, "sql": shape} for shape, count in recorder.fingerprints.most_common(10)
+                ],
+            },
+        )
+        await response(scope, None, send)
+
+
+def setup_query_budget_middleware(app, max_queries: int = 50, max_repeats: Optional[int] = 4, strict: bool = False):
+    """Подключение middleware бюджета запросов"""
+    app.add_middleware(QueryBudgetMiddleware, max_queries=max_queries, max_repeats=max_repeats, strict=strict)
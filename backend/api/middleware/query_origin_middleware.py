@@ -0,0 +1,37 @@
+"""
+Middleware источника SQL-запросов
+
+Запросы к БД, выполненные при обработке HTTP-запроса, подписываются
+методом и шаблоном маршрута ("GET /api/tasks/{task_id}") для журнала
+медленных запросов. Шаблон известен только после маршрутизации, поэтому
+источник вычисляется при записи медленного запроса.
+"""
+from core.database.slow_queries import query_origin
+
+
+def _origin(scope) -> str:
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', None) or scope['path']}"
+
+
+class QueryOriginMiddleware:
+    """Источник SQL-запросов HTTP-запроса"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = query_origin.set(lambda: _origin(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            query_origin.reset(token)
+
+
+def setup_query_origin_middleware(app):
+    """Подключение middleware источника запросов"""
+    app.add_middleware(QueryOriginMiddleware)
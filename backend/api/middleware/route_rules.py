@@ -0,0 +1,180 @@
+"""
+Правила доступа к маршрутам
+
+Шаблоны путей компилируются один раз при создании приложения в дерево по
+сегментам пути (радиксное дерево, где ребро - сегмент). Поиск правила для
+запроса - спуск по сегментам пути без перебора списков префиксов: сначала
+по точному сегменту, и только если в этой ветке правила нет - по
+{параметру} (иначе /users/me закрывал бы /users/{id}/secret).
+
+Синтаксис шаблонов:
+    /auth/users/              - точный путь (завершающий "/" не важен)
+    /auth/users/{user_id}/    - {имя} совпадает с любым одним сегментом
+    /api/dashboards/*         - сам путь и все пути под ним
+
+Приоритет: ветка точного сегмента важнее ветки {параметра}; точное
+совпадение всего пути важнее "*"; из нескольких "*" выигрывает самый глубокий. Правило с
+конкретным методом важнее правила для всех методов на том же узле.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+ANY_METHOD = "*"
+
+
+class RouteRule:
+    """Требования доступа для шаблона пути"""
+
+    __slots__ = ("pattern", "methods", "public", "roles", "permission")
+
+    def __init__(
+        self,
+        pattern: str,
+        methods: Optional[Sequence[str]] = None,
+        public: bool = False,
+        roles: Sequence[str] = (),
+        permission: Optional[Tuple[str, str]] = None
+    ):
+        self.pattern = pattern
+        self.methods = tuple(method.upper() for method in methods) if methods else (ANY_METHOD,)
+        self.public = public
+        self.roles = tuple(roles)
+        # (resource, action) для проверки по матрице разрешений ролей
+        self.permission = permission
+
+    def __repr__(self) -> str:
+        return f"RouteRule({self.pattern!r}, methods={self.methods}, public={self.public})"
+
+
+# Правило по умолчанию: только аутентификация
+AUTHENTICATED = RouteRule("*")
+
+
+def _segments(path: str) -> List[str]:
+    return [segment for segment in path.split("/") if segment]
+
+
+class _Node:
+    __slots__ = ("children", "param", "exact", "subtree")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.param: Optional["_Node"] = None
+        self.exact: Dict[str, RouteRule] = {}
+        self.subtree: Dict[str, RouteRule] = {}
+
+
+class RouteMatcher:
+    """Скомпилированное дерево правил; match() - спуск по сегментам с возвратом к {параметру}"""
+
+    def __init__(self, rules: Iterable[RouteRule] = (), default: RouteRule = AUTHENTICATED):
+        self.default = default
+        self.root = _Node()
+        self.size = 0
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule: RouteRule):
+        segments = _segments(rule.pattern)
+        subtree = bool(segments) and segments[-1] == "*"
+        if subtree:
+            segments = segments[:-1]
+
+        node = self.root
+        for segment in segments:
+            if segment == "*":
+                raise ValueError(f"'*' is only allowed at the end of a pattern: {rule.pattern}")
+            if segment.startswith("{") and segment.endswith("}"):
+                if node.param is None:
+                    node.param = _Node()
+                node = node.param
+            else:
+                node = node.children.setdefault(segment, _Node())
+
+        target = node.subtree if subtree else node.exact
+        for method in rule.methods:
+            if method in target:
+                raise ValueError(f"Duplicate route rule for {method} {rule.pattern}")
+            target[method] = rule
+        self.size += 1
+
+    @staticmethod
+    def _pick(rules: Dict[str, RouteRule], method: str) -> Optional[RouteRule]:
+        if not rules:
+            return None
+        return rules.get(method) or rules.get(ANY_METHOD)
+
+    def _find(self, node: _Node, segments: List[str], index: int, method: str) -> Optional[RouteRule]:
+        if index == len(segments):
+            return self._pick(node.exact, method) or self._pick(node.subtree, method)
+        for child in (node.children.get(segments[index]), node.param):
+            if child is not None:
+                rule = self._find(child, segments, index + 1, method)
+                if rule is not None:
+                    return rule
+        return self._pick(node.subtree, method)
+
+    def match(self, method: str, path: str) -> RouteRule:
+        """Правило для запроса; правило по умолчанию, если ни один шаблон не подошел"""
+        return self._find(self.root, _segments(path), 0, method.upper()) or self.default
+
+
+# Правила приложения (перенесены из списков префиксов AuthMiddleware)
+DEFAULT_ROUTE_RULES: List[RouteRule] = [
+    # Пути, которые не требуют аутентификации
+    RouteRule("/auth/register/*", public=True),
+    RouteRule("/auth/login_user/*", public=True),
+    RouteRule("/auth/refresh-token/*", public=True),
+    RouteRule("/auth/test/*", public=True),
+    RouteRule("/auth/test-token/*", public=True),
+    RouteRule("/auth/test-user-lookup/*", public=True),
+    RouteRule("/auth/test-cors/*", public=True),
+    RouteRule("/docs/*", public=True),
+    RouteRule("/redoc/*", public=True),
+    RouteRule("/openapi.json", public=True),
+    RouteRule("/health/*", public=True),
+    RouteRule("/metrics", public=True),
+    RouteRule("/favicon.ico", public=True),
+    # Временно добавляем dashboard endpoints для диагностики
+    RouteRule("/api/dashboards/*", public=True),
+
+    # Управление пользователями
+    RouteRule("/auth/users/", ["GET", "PUT"], roles=["admin", "CEO"]),
+    RouteRule("/auth/users/", ["POST", "DELETE"], roles=["admin"]),
+
+    # Управление организациями
+    RouteRule("/auth/organizations/", ["GET", "PUT"], roles=["admin", "CEO"]),
+    RouteRule("/auth/organizations/", ["POST", "DELETE"], roles=["admin"]),
+
+    # Управление департаментами
+    RouteRule("/auth/departments/", ["GET", "PUT"], roles=["admin", "CEO", "manager"]),
+    RouteRule("/auth/departments/", ["POST", "DELETE"], roles=["admin", "CEO"]),
+
+    # Управление разрешениями
+    RouteRule("/auth/permissions/*", roles=["admin"]),
+    RouteRule("/auth/role-permissions/*", roles=["admin"]),
+
+    # Диагностика производительности
+    RouteRule("/api/admin/*", roles=["admin"]),
+
+    # Очередь доставки уведомлений
+    RouteRule("/notifications/deliveries/*", roles=["admin"]),
+
+    # Обслуживание отчетов: администратор или роль с разрешением из матрицы
+    RouteRule("/api/reports/rollups/reconcile", ["POST"], permission=("report", "reconcile")),
+    RouteRule("/api/reports/cache", ["DELETE"], permission=("report", "clear_cache")),
+]
+
+
+def compile_route_rules(rules: Optional[Iterable[RouteRule]] = None) -> RouteMatcher:
+    return RouteMatcher(DEFAULT_ROUTE_RULES if rules is None else rules)
+
+
+__all__ = [
+    "ANY_METHOD",
+    "AUTHENTICATED",
+    "DEFAULT_ROUTE_RULES",
+    "RouteMatcher",
+    "RouteRule",
+    "compile_route_rules",
+]
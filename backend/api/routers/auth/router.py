@@ -1,7 +1,7 @@
 from jose import jwt, JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from fastapi import APIRouter, HTTPException, Depends, status, Body
+from fastapi import APIRouter, HTTPException, Depends, Request, status, Body
 from fastapi.security import (HTTPBearer,
                               OAuth2PasswordRequestForm)
 from datetime import timedelta
@@ -27,6 +27,10 @@ from backend.api.configuration import (Server,
                                        verify_authorization, require_role, require_roles,
                                        PermissionResponse, RolePermissionResponse)
 
+from backend.api.configuration.password_hasher import password_hasher, PasswordHasherOverloaded
+from backend.api.configuration.rate_limiter import rate_limiter
+from backend.api.middleware.query_budget_middleware import query_budget
+
 import logging
 
 http_bearer = HTTPBearer(auto_error=False)
@@ -86,7 +90,10 @@ async def test_user_lookup_endpoint(token: str = Depends(Server.oauth2_scheme),
         return {"message": "User lookup failed", "error": str(e)}
 
 @router.post("/register/", response_model=Token)
-async def register(user: UserRegisterResponse, session: AsyncSession = Depends(Server.get_db)):
+async def register(user: UserRegisterResponse, request: Request, session: AsyncSession = Depends(Server.get_db)):
+    # Отсекаем всплески до запросов в БД и хеширования
+    await rate_limiter.check("register", request)
+
     try:
         db_user = await orm_get_user(session, UserEmailResponse(login=user.email, password=user.password))
 
@@ -98,7 +105,7 @@ async def register(user: UserRegisterResponse, session: AsyncSession = Depends(S
         if db_user:
             raise HTTPException(status_code=400, detail="Login already registered")
         
-        hashed_password = get_password_hash(user.password)
+        hashed_password = await password_hasher.hash(user.password)
 
         await orm_add_user(session, 
                             username=user.username,
@@ -115,7 +122,7 @@ async def register(user: UserRegisterResponse, session: AsyncSession = Depends(S
         access_token_expires = timedelta(minutes=settings.security.access_token_expire_minutes)
 
         return {
-            "access_token": create_access_token(payload={"sub": user.login, "email": user.email}, 
+            "access_token": create_access_token(data={"sub": user.login, "email": user.email}, 
                                                 expires_delta=access_token_expires),
             "token_type": "bearer",
             "message": "User registered successfully"
@@ -124,6 +131,8 @@ async def register(user: UserRegisterResponse, session: AsyncSession = Depends(S
     except HTTPException:
         # Перебрасываем HTTP исключения как есть
         raise
+    except PasswordHasherOverloaded:
+        raise HTTPException(status_code=503, detail="Server is busy, try again later", headers={"Retry-After": "1"})
     except Exception as e:
         # Обрабатываем ошибки базы данных
         error_message = str(e)
@@ -137,8 +146,10 @@ async def register(user: UserRegisterResponse, session: AsyncSession = Depends(S
 
 
 @router.post("/login_user/", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(Server.get_db)):
-    
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(Server.get_db)):
+    # Подбор паролей отсекается до запросов в БД и проверки bcrypt
+    await rate_limiter.check("login", request, login=form_data.username)
+
     unauthed_exc = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -155,10 +166,12 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     if not user:
         raise unauthed_exc
     
-    if not verify_password(
-        plain_password=form_data.password,
-        hashed_password=user.password_hash,
-    ):
+    try:
+        password_valid, new_hash = await password_hasher.verify_and_update(form_data.password, user.password_hash)
+    except PasswordHasherOverloaded:
+        raise HTTPException(status_code=503, detail="Server is busy, try again later", headers={"Retry-After": "1"})
+
+    if not password_valid:
         raise unauthed_exc
     
     if not user.is_active:
@@ -167,10 +180,16 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
             detail="user inactive",
         )
     
+    # Хеш с устаревшими параметрами стоимости пересчитан при проверке
+    if new_hash is not None:
+        user.password_hash = new_hash
+        await session.commit()
+        logger.info(f"Rehashed password of user {user.id} with current cost parameters")
+    
     access_token_expires = timedelta(minutes=settings.security.access_token_expire_minutes)
 
     access_token = create_access_token(
-        payload={"sub": user.login, "email": user.email}, expires_delta=access_token_expires
+        data={"sub": user.login, "email": user.email}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, 
             "token_type": "bearer",
@@ -187,7 +206,7 @@ async def refresh_token(refresh_token: str):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
     
-    new_access_token = create_access_token(payload={"sub": username})
+    new_access_token = create_access_token(data={"sub": username})
     # new_refresh_token = create_refresh_token(data={"sub": username})
     
     return {
@@ -255,6 +274,7 @@ async def update_user(
     return updated_user
 
 @router.get("/users/{user_id}/hierarchy/", response_model=UserHierarchyResponse)
+@query_budget(4, max_repeats=1)
 async def get_user_hierarchy(
     user_id: int,
     current_user = Depends(require_roles(["admin", "CEO", "manager"])),
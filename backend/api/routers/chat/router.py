@@ -15,6 +15,7 @@ from core.database.models.chat_model import (
 )
 from backend.api.services.chat_service import ChatService, websocket_manager
 from backend.api.middleware.auth import get_current_user
+from backend.api.middleware.query_budget_middleware import query_budget
 from core.database.models.user_model import User
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
@@ -454,6 +455,7 @@ async def update_chat_settings(
 
 
 @router.get("/unread-count")
+@query_budget(3, max_repeats=1)
 async def get_unread_count(
     current_user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
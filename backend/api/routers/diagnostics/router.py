@@ -0,0 +1,100 @@
+"""
+API диагностики производительности (только для администраторов)
+"""
+
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+
+from backend.api.configuration.auth import require_role
+from backend.api.configuration.profiler import loop_lag_monitor, profiler, render_collapsed, stacks_by_thread
+from backend.api.configuration.webhook_client import webhook_client
+from core.database.slow_queries import slow_query_log
+
+import logging
+
+logger = logging.getLogger("app_fastapi.diagnostics")
+
+router = APIRouter(prefix="/api/admin/diagnostics", tags=["diagnostics"])
+
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=500),
+    min_ms: Optional[float] = Query(None, ge=0, description="Не короче, мс"),
+    origin: Optional[str] = Query(None, description="Подстрока источника (маршрута)"),
+    contains: Optional[str] = Query(None, description="Подстрока нормализованного SQL"),
+    top: int = Query(20, ge=0, le=200, description="Число видов запросов в сводке"),
+    order_by: str = Query("total_ms", pattern="^(total_ms|max_ms|count)$"),
+    user=Depends(require_role("admin")),
+):
+    """Медленные запросы этого воркера: последние записи и сводка по видам запросов"""
+    return {
+        "enabled": slow_query_log.enabled,
+        "threshold_ms": slow_query_log.threshold_ms,
+        "explain": slow_query_log.explain,
+        "top": slow_query_log.top(top, order_by=order_by),
+        "recent": slow_query_log.recent(limit, min_ms=min_ms, origin=origin, contains=contains),
+    }
+
+
+@router.delete("/slow-queries")
+async def clear_slow_queries(user=Depends(require_role("admin"))):
+    """Очистить журнал медленных запросов этого воркера"""
+    slow_query_log.clear()
+    logger.info(f"Slow query log cleared by {user.login}")
+    return {"message": "Slow query log cleared"}
+
+
+@router.get("/profile")
+async def get_profile(
+    seconds: int = Query(30, ge=1, le=3600, description="Окно профиля, с"),
+    format: str = Query("collapsed", pattern="^(collapsed|json)$"),
+    user=Depends(require_role("admin")),
+):
+    """Профиль цикла событий этого воркера в формате collapsed stacks (flamegraph.pl, speedscope).
+
+    При включенном непрерывном профилировании отдаются последние seconds секунд,
+    иначе профиль снимается сейчас - не дольше минуты.
+    """
+    if profiler.running:
+        stacks = profiler.collect(seconds)
+        mode = "continuous"
+    else:
+        seconds = min(seconds, 60)
+        logger.info(f"On-demand profile for {seconds}s requested by {user.login}")
+        stacks = await profiler.capture(seconds)
+        mode = "on-demand"
+    samples = sum(stacks.values())
+    if format == "json":
+        return {
+            "pid": os.getpid(),
+            "mode": mode,
+            "seconds": seconds,
+            "samples": samples,
+            "stacks": [{"stack": stack, "count": count} for stack, count in stacks.most_common()],
+        }
+    return PlainTextResponse(
+        render_collapsed(stacks),
+        headers={"X-Worker-Pid": str(os.getpid()), "X-Profile-Mode": mode, "X-Profile-Samples": str(samples)},
+    )
+
+
+@router.get("/event-loop")
+async def get_event_loop_stats(user=Depends(require_role("admin"))):
+    """Задержка цикла событий этого воркера и последние блокировки со стеком"""
+    return dict(loop_lag_monitor.snapshot(), pid=os.getpid(), profiler_running=profiler.running)
+
+
+@router.get("/threads")
+async def get_thread_stacks(user=Depends(require_role("admin"))):
+    """Текущие стеки всех потоков этого воркера"""
+    return {"pid": os.getpid(), "threads": stacks_by_thread()}
+
+
+@router.get("/webhooks")
+async def get_webhook_circuits(user=Depends(require_role("admin"))):
+    """Состояние предохранителей адресов webhook'ов в этом воркере"""
+    return {"pid": os.getpid(), "circuits": webhook_client.stats()}
@@ -3,16 +3,18 @@ API роутер для корпоративной почты
 """
 from datetime import datetime
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, Form, Query
 from fastapi.responses import FileResponse
 from pydantic import BaseModel, Field, EmailStr
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.database import get_session
 from core.database.models.email_model import (
-    EmailStatus, EmailPriority, EmailCategory, EmailFilterType, EmailFilterAction
+    EmailStatus, EmailPriority, EmailCategory, EmailFilter, EmailFilterType, EmailFilterAction
 )
 from backend.api.services.email_service import EmailService
+from backend.api.services.email_sync_service import request_sync
+from backend.api.services.email_filter_engine import run_filter_job
 from backend.api.middleware.auth import get_current_user
 from core.database.models.user_model import User
 
@@ -259,6 +261,25 @@ async def update_email_account(
     return updated_account
 
 
+@router.post("/accounts/{account_id}/sync", status_code=202)
+async def sync_email_account(
+    account_id: int,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """Внеочередная синхронизация входящих (при ближайшем проходе обработчика)"""
+    email_service = EmailService(session)
+    
+    account = await email_service.get_email_account(account_id)
+    if not account or account.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Email account not found")
+    
+    if not await request_sync(session, account_id):
+        raise HTTPException(status_code=400, detail="IMAP is not configured for this account")
+    
+    return {"message": "Sync scheduled"}
+
+
 @router.post("/accounts/{account_id}/emails", response_model=EmailResponse)
 async def create_email(
     account_id: int,
@@ -532,6 +553,29 @@ async def create_email_filter(
     return filter_obj
 
 
+@router.post("/accounts/{account_id}/filters/{filter_id}/apply", status_code=202)
+async def apply_email_filter_to_existing(
+    account_id: int,
+    filter_id: int,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session)
+):
+    """Применение фильтра к уже полученной почте (фоновая пакетная задача)"""
+    email_service = EmailService(session)
+    
+    account = await email_service.get_email_account(account_id)
+    if not account or account.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Email account not found")
+    
+    filter_obj = await session.get(EmailFilter, filter_id)
+    if not filter_obj or filter_obj.email_account_id != account_id:
+        raise HTTPException(status_code=404, detail="Email filter not found")
+    
+    background_tasks.add_task(run_filter_job, filter_id)
+    return {"message": "Filter application scheduled"}
+
+
 @router.post("/templates", response_model=EmailTemplateResponse)
 async def create_email_template(
     request: EmailTemplateCreateRequest,
@@ -0,0 +1,26 @@
+"""
+Метрики Prometheus (/metrics)
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from backend.api.configuration.metrics import render, sync_stats
+
+import logging
+
+logger = logging.getLogger("app_fastapi.metrics")
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Метрики всех воркеров в текстовом формате Prometheus"""
+    try:
+        # Счетчики этого воркера - без задержки периодической синхронизации
+        sync_stats()
+    except Exception as e:
+        logger.error(f"Metrics stats sync failed: {e}")
+    body, content_type = render()
+    return Response(content=body, media_type=content_type)
@@ -1,17 +1,31 @@
 """
 API роутер для системы уведомлений
 """
+import asyncio
+import logging
 from datetime import datetime
-from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from typing import List, Optional, Dict, Any, Set
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket, WebSocketDisconnect, status
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.database import get_session
+from core.database import get_db_helper, get_session
 from core.database.models.notification_model import (
-    NotificationType, NotificationPriority, NotificationStatus, NotificationChannel
+    NotificationType, NotificationPriority, NotificationStatus, NotificationChannel, BroadcastAudience
+)
+from core.database.models.main_models import User
+from backend.api.configuration.auth import authenticate_websocket, get_current_user, require_role, require_roles
+from backend.api.services.notification_broadcast_service import (
+    audience_organization_id, create_broadcast, get_broadcast
 )
 from backend.api.services.notification_service import NotificationService
+from backend.api.services.notification_delivery_service import notification_outbox
+from backend.api.services.notification_push_service import RESYNC_EVENT, notification_push_hub, resume_state
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+HH_MM_PATTERN = r"^([01]\d|2[0-3]):[0-5]\d$"
 
 
 # Pydantic модели для запросов
@@ -64,8 +78,8 @@ class UserPreferenceUpdateRequest(BaseModel):
     push_enabled: Optional[bool] = Field(None, description="Включить push")
     in_app_enabled: Optional[bool] = Field(None, description="Включить в приложении")
     min_priority: Optional[NotificationPriority] = Field(None, description="Минимальный приоритет")
-    quiet_hours_start: Optional[str] = Field(None, description="Начало тихих часов (HH:MM)")
-    quiet_hours_end: Optional[str] = Field(None, description="Конец тихих часов (HH:MM)")
+    quiet_hours_start: Optional[str] = Field(None, pattern=HH_MM_PATTERN, description="Начало тихих часов (HH:MM)")
+    quiet_hours_end: Optional[str] = Field(None, pattern=HH_MM_PATTERN, description="Конец тихих часов (HH:MM)")
     timezone: Optional[str] = Field(None, description="Часовой пояс")
     batch_notifications: Optional[bool] = Field(None, description="Пакетные уведомления")
     batch_interval_minutes: Optional[int] = Field(None, description="Интервал пакетов (минуты)")
@@ -83,6 +97,7 @@ class WebhookCreateRequest(BaseModel):
     auth_credentials: Optional[Dict[str, str]] = Field(None, description="Учетные данные")
     retry_count: int = Field(3, description="Количество повторов")
     timeout_seconds: int = Field(30, description="Таймаут в секундах")
+    signing_secret: Optional[str] = Field(None, description="Секрет подписи HMAC-SHA256 (X-Webhook-Signature)")
 
 
 # Pydantic модели для ответов
@@ -107,7 +122,7 @@ class NotificationResponse(BaseModel):
     delivered_at: Optional[datetime]
     read_at: Optional[datetime]
     created_at: datetime
-    metadata: Dict[str, Any]
+    metadata: Dict[str, Any] = Field(default_factory=dict, validation_alias="notification_metadata")
     
     class Config:
         from_attributes = True
@@ -192,6 +207,66 @@ class WebhookResponse(BaseModel):
         from_attributes = True
 
 
+class NotificationDeliveryResponse(BaseModel):
+    """Ответ с информацией о записи доставки"""
+    id: int
+    notification_id: int
+    channel: str
+    status: str
+    idempotency_key: str
+    retry_count: int
+    error_message: Optional[str]
+    next_attempt_at: Optional[datetime]
+    last_attempt_at: Optional[datetime]
+    dead_lettered_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
+
+
+class DeliveryRequeueRequest(BaseModel):
+    """Запрос на повторную доставку записей dead letter"""
+    delivery_ids: Optional[List[int]] = Field(None, description="ID записей (по умолчанию - все)")
+    channel: Optional[NotificationChannel] = Field(None, description="Только этот канал")
+
+
+class NotificationBulkDeleteRequest(BaseModel):
+    """Запрос на массовое удаление уведомлений"""
+    notification_ids: Optional[List[int]] = Field(None, description="ID уведомлений")
+    all: bool = Field(False, description="Удалить все уведомления пользователя (без notification_ids)")
+    read_only: bool = Field(False, description="Только прочитанные")
+
+
+class BroadcastCreateRequest(BaseModel):
+    """Запрос на рассылку уведомления отделу или организации"""
+    audience_type: BroadcastAudience = Field(..., description="Аудитория: отдел или организация")
+    audience_id: int = Field(..., description="ID отдела или организации")
+    notification_type: NotificationType = Field(NotificationType.SYSTEM, description="Тип уведомления")
+    title: str = Field(..., max_length=255, description="Заголовок уведомления")
+    message: str = Field(..., description="Текст уведомления")
+    priority: NotificationPriority = Field(NotificationPriority.NORMAL, description="Приоритет")
+    channels: Optional[List[NotificationChannel]] = Field(None, description="Каналы доставки (по умолчанию - in_app)")
+    expires_at: Optional[datetime] = Field(None, description="Время истечения")
+    metadata: Optional[Dict[str, Any]] = Field(None, description="Дополнительные данные")
+
+
+class BroadcastResponse(BaseModel):
+    """Ответ с состоянием рассылки"""
+    broadcast_uuid: str
+    audience_type: str
+    audience_id: int
+    title: str
+    status: str
+    total_recipients: int
+    processed_recipients: int
+    created_at: datetime
+    started_at: Optional[datetime]
+    completed_at: Optional[datetime]
+    
+    class Config:
+        from_attributes = True
+
+
 # Создаем роутер
 router = APIRouter(prefix="/notifications", tags=["Notifications"])
 
@@ -207,9 +282,10 @@ async def get_notification_service(session: AsyncSession = Depends(get_session))
 async def create_notification(
     request: NotificationCreateRequest,
     recipient_id: int = 1,  # TODO: Получать из аутентификации
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=100),
     service: NotificationService = Depends(get_notification_service)
 ):
-    """Создание нового уведомления"""
+    """Создание нового уведомления (доставка - в фоне; повтор с тем же Idempotency-Key вернет его же)"""
     try:
         notification = await service.create_notification(
             recipient_id=recipient_id,
@@ -224,7 +300,8 @@ async def create_notification(
             scheduled_at=request.scheduled_at,
             expires_at=request.expires_at,
             variables=request.variables,
-            metadata=request.metadata
+            metadata=request.metadata,
+            idempotency_key=idempotency_key
         )
         
         if notification is None:
@@ -296,6 +373,28 @@ async def mark_all_notifications_as_read(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/bulk-delete")
+async def delete_notifications(
+    request: NotificationBulkDeleteRequest,
+    current_user: User = Depends(get_current_user),
+    service: NotificationService = Depends(get_notification_service)
+):
+    """Массовое удаление уведомлений текущего пользователя: по списку id или все при all=true"""
+    if request.notification_ids is None and not request.all:
+        raise HTTPException(status_code=400, detail="Either notification_ids or all=true is required")
+    if request.notification_ids is not None and request.all:
+        raise HTTPException(status_code=400, detail="notification_ids and all=true are mutually exclusive")
+    try:
+        count = await service.delete_notifications(
+            user_id=current_user.id,
+            notification_ids=request.notification_ids,
+            read_only=request.read_only
+        )
+        return {"message": f"Deleted {count} notifications", "deleted": count}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.delete("/{notification_id}")
 async def delete_notification(
     notification_id: int,
@@ -425,31 +524,142 @@ async def create_webhook(
             auth_type=request.auth_type,
             auth_credentials=request.auth_credentials,
             retry_count=request.retry_count,
-            timeout_seconds=request.timeout_seconds
+            timeout_seconds=request.timeout_seconds,
+            signing_secret=request.signing_secret
         )
         return webhook
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+# Очередь доставки
+@router.get("/deliveries/dead-letters", response_model=List[NotificationDeliveryResponse])
+async def get_dead_letters(
+    channel: Optional[NotificationChannel] = Query(None, description="Канал доставки"),
+    limit: int = Query(100, ge=1, le=1000),
+    session: AsyncSession = Depends(get_session),
+    user=Depends(require_role("admin"))
+):
+    """Записи доставки, исчерпавшие попытки"""
+    return await notification_outbox.list_dead_letters(session, channel=channel, limit=limit)
+
+
+@router.post("/deliveries/dead-letters/requeue")
+async def requeue_dead_letters(
+    request: DeliveryRequeueRequest,
+    session: AsyncSession = Depends(get_session),
+    user=Depends(require_role("admin"))
+):
+    """Повторная постановка записей dead letter в очередь доставки"""
+    requeued = await notification_outbox.requeue(session, delivery_ids=request.delivery_ids, channel=request.channel)
+    return {"requeued": requeued}
+
+
+# Рассылки
+@router.post("/broadcasts", response_model=BroadcastResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_notification_broadcast(
+    request: BroadcastCreateRequest,
+    session: AsyncSession = Depends(get_session),
+    user=Depends(require_roles(["admin", "CEO"]))
+):
+    """Рассылка отделу или организации: получатели фиксируются сразу, уведомления создаются в фоне"""
+    # Администратор адресует любую аудиторию, остальные - только свою организацию и ее отделы
+    if user.role != "admin":
+        organization_id = await audience_organization_id(session, request.audience_type, request.audience_id)
+        if organization_id is None:
+            raise HTTPException(status_code=404, detail="Broadcast audience not found")
+        if organization_id != user.organization_id:
+            raise HTTPException(status_code=403, detail="Broadcast audience is outside your organization")
+    return await create_broadcast(
+        session,
+        audience_type=request.audience_type,
+        audience_id=request.audience_id,
+        notification_type=request.notification_type,
+        title=request.title,
+        message=request.message,
+        priority=request.priority,
+        channels=request.channels,
+        sender_id=user.id,
+        expires_at=request.expires_at,
+        metadata=request.metadata
+    )
+
+
+@router.get("/broadcasts/{broadcast_uuid}", response_model=BroadcastResponse)
+async def get_notification_broadcast(
+    broadcast_uuid: str,
+    session: AsyncSession = Depends(get_session),
+    user=Depends(require_roles(["admin", "CEO"]))
+):
+    """Ход рассылки: сколько получателей уже получили уведомление"""
+    broadcast = await get_broadcast(session, broadcast_uuid)
+    if broadcast is None or (user.role != "admin" and broadcast.sender_id != user.id):
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return broadcast
+
+
 # WebSocket эндпоинт для реального времени
+async def _push_events(websocket: WebSocket, queue: asyncio.Queue, seen: Set[int]):
+    """Отправка событий из очереди соединения; без событий - ping раз в push_heartbeat_seconds"""
+    while True:
+        try:
+            event = await asyncio.wait_for(queue.get(), timeout=settings.notifications.push_heartbeat_seconds)
+        except asyncio.TimeoutError:
+            await websocket.send_json({"type": "ping"})
+            continue
+        if event.get("type") == "notification" and event["id"] in seen:
+            continue  # уже учтено в replay и снимке непрочитанных
+        await websocket.send_json({key: value for key, value in event.items() if key != "user_id"})
+
+
+async def _receive_client_messages(websocket: WebSocket):
+    while True:
+        message = await websocket.receive_json()
+        if message.get("type") == "ping":
+            await websocket.send_json({"type": "pong"})
+
+
 @router.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
-    user_id: int = 1  # TODO: Получать из аутентификации
+    token: Optional[str] = Query(None, description="Access-токен"),
+    last_event_id: Optional[int] = Query(None, description="ID последнего полученного уведомления")
 ):
-    """WebSocket эндпоинт для уведомлений в реальном времени"""
+    """WebSocket эндпоинт для уведомлений в реальном времени.
+
+    События: notification (новое уведомление, id - event id), unread (приращение
+    числа непрочитанных или снимок unread_count), resync (перечитать ленту), ping.
+    После переподключения с last_event_id приходят пропущенные уведомления.
+    """
+    user = await authenticate_websocket(token)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
     await websocket.accept()
+    # Подписка до чтения состояния: события, пришедшие во время чтения, не теряются
+    queue = notification_push_hub.subscribe(user.id)
+    tasks = []
     try:
-        while True:
-            # Получаем сообщение от клиента
-            data = await websocket.receive_text()
-            message = {"user_id": user_id, "data": data}
-            
-            # Отправляем ответ обратно (здесь можно добавить логику обработки)
-            await websocket.send_text(f"Notification message received: {data}")
+        async with get_db_helper().get_session() as session:
+            seen, missed, complete, unread = await resume_state(session, user.id, last_event_id)
+        for event in missed:
+            await websocket.send_json({key: value for key, value in event.items() if key != "user_id"})
+        if not complete:
+            await websocket.send_json(RESYNC_EVENT)
+        await websocket.send_json({"type": "unread", "unread_count": unread})
+
+        tasks = [asyncio.create_task(_push_events(websocket, queue, seen)),
+                 asyncio.create_task(_receive_client_messages(websocket))]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
     except WebSocketDisconnect:
-        print(f"Client {user_id} disconnected from notifications")
+        pass
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        logger.warning(f"Notification WebSocket error for user {user.id}: {e}")
         await websocket.close()
+    finally:
+        for task in tasks:
+            task.cancel()
+        notification_push_hub.unsubscribe(user.id, queue)
@@ -11,6 +11,7 @@ from datetime import datetime
 
 from backend.api.configuration.auth import verify_authorization, require_role
 from backend.api.configuration.server import Server
+from backend.api.middleware.query_budget_middleware import query_budget
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.api.services.widget_service import PersonalDashboardService, WidgetService
@@ -179,6 +180,7 @@ def can_access_widget(user: Dict[str, Any], widget_user_id: int) -> bool:
 # API endpoints
 
 @router.get("/layout", response_model=DashboardLayoutResponse)
+@query_budget(12, max_repeats=2)
 async def get_dashboard_layout(
     user: dict = Depends(verify_authorization),
     session: AsyncSession = Depends(Server.get_db)
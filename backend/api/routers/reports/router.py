@@ -5,17 +5,27 @@ API для генерации отчетов и аналитики
 import uuid
 from typing import List, Optional, Dict, Any, Union
 from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
 import logging
 from datetime import datetime, date
 
+import aiofiles.os
+
 from backend.api.configuration.auth import verify_authorization, require_role
+from backend.api.configuration.auth import require_permission
 from backend.api.configuration.server import Server
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.api.services.reports_service import (
     ReportsService, ReportGenerator, ReportType, ExportFormat, report_generator
 )
+from backend.api.services.report_rollup_service import report_rollup_reconciler
+from backend.api.services.report_export_service import EXPORT_DATASETS, get_stream_writer, stream_dataset
+from backend.api.services.report_job_service import (
+    ReportJobService, ReportJobLimitError, job_event_stream, job_to_dict
+)
+from core.database.models.report_model import ReportJob
 from core.database.models.task_model import TaskStatus, TaskPriority, TaskType
 
 logger = logging.getLogger(__name__)
@@ -62,6 +72,26 @@ class ExportRequest(BaseModel):
     filters: Optional[Dict[str, Any]] = Field(None, description="Фильтры для отчета")
 
 
+class ReportJobFilters(BaseModel):
+    """Фильтры фонового задания (объединение фильтров отчетов и выгрузок)"""
+    start_date: Optional[datetime] = Field(None, description="Дата начала периода")
+    end_date: Optional[datetime] = Field(None, description="Дата окончания периода")
+    user_id: Optional[int] = Field(None, description="ID пользователя")
+    task_id: Optional[int] = Field(None, description="ID задачи")
+    department_id: Optional[int] = Field(None, description="ID департамента")
+    organization_id: Optional[int] = Field(None, description="ID организации")
+    status_filter: Optional[List[TaskStatus]] = Field(None, description="Фильтр по статусам")
+    priority_filter: Optional[List[TaskPriority]] = Field(None, description="Фильтр по приоритетам")
+
+
+class ReportJobRequest(BaseModel):
+    """Запрос на фоновое построение отчета или выгрузки"""
+    report_type: Optional[ReportType] = Field(None, description="Тип отчета")
+    dataset: Optional[str] = Field(None, description="Набор данных для построчной выгрузки: time_logs или tasks")
+    format_type: ExportFormat = Field(ExportFormat.CSV, description="Формат файла")
+    filters: ReportJobFilters = Field(default_factory=ReportJobFilters, description="Фильтры")
+
+
 class ReportResponse(BaseModel):
     """Ответ с данными отчета"""
     report_type: str
@@ -98,6 +128,30 @@ def can_access_reports(user: Dict[str, Any], organization_id: Optional[int] = No
     return False
 
 
+def check_report_access(
+    user: Dict[str, Any],
+    report_type: Optional[ReportType] = None,
+    dataset: Optional[str] = None,
+    user_id: Optional[int] = None,
+    organization_id: Optional[int] = None,
+    department_id: Optional[int] = None
+):
+    """Права на отчет или выгрузку - те же, что у синхронных эндпоинтов"""
+    if report_type == ReportType.TIME_TRACKING or dataset == "time_logs":
+        if user_id and user_id != user.get("id") and user.get("role") not in ["admin", "CEO", "manager"]:
+            raise HTTPException(status_code=403, detail="Недостаточно прав для просмотра отчетов других пользователей")
+    elif not can_access_reports(user, organization_id, department_id):
+        raise HTTPException(status_code=403, detail="Недостаточно прав для просмотра отчетов")
+
+
+async def get_own_report_job(job_id: str, user: Dict[str, Any], session: AsyncSession) -> ReportJob:
+    """Задание текущего пользователя (администраторы видят все задания)"""
+    job = await ReportJobService(session).get_job(job_id)
+    if job is None or (job.user_id != user.get("id") and user.get("role") not in ["admin", "CEO"]):
+        raise HTTPException(status_code=404, detail="Задание отчета не найдено")
+    return job
+
+
 # API endpoints
 
 @router.get("/task-summary", response_model=Dict[str, Any])
@@ -110,7 +164,7 @@ async def get_task_summary_report(
     status_filter: Optional[List[str]] = Query(None, description="Фильтр по статусам"),
     priority_filter: Optional[List[str]] = Query(None, description="Фильтр по приоритетам"),
     user: dict = Depends(verify_authorization),
-    session: AsyncSession = Depends(Server.get_db)
+    session: AsyncSession = Depends(Server.get_read_db)
 ):
     """Получение сводного отчета по задачам"""
     
@@ -155,7 +209,7 @@ async def get_performance_report(
     department_id: Optional[int] = Query(None, description="ID департамента"),
     organization_id: Optional[int] = Query(None, description="ID организации"),
     user: dict = Depends(verify_authorization),
-    session: AsyncSession = Depends(Server.get_db)
+    session: AsyncSession = Depends(Server.get_read_db)
 ):
     """Получение отчета по производительности"""
     
@@ -187,7 +241,7 @@ async def get_time_tracking_report(
     user_id: Optional[int] = Query(None, description="ID пользователя"),
     task_id: Optional[int] = Query(None, description="ID задачи"),
     user: dict = Depends(verify_authorization),
-    session: AsyncSession = Depends(Server.get_db)
+    session: AsyncSession = Depends(Server.get_read_db)
 ):
     """Получение отчета по учету времени"""
     
@@ -260,6 +314,161 @@ async def export_report(
         raise HTTPException(status_code=500, detail="Ошибка при экспорте отчета")
 
 
+@router.get("/export/stream")
+async def stream_export(
+    dataset: str = Query("time_logs", description="Набор данных: time_logs или tasks"),
+    format_type: ExportFormat = Query(ExportFormat.CSV, description="Формат экспорта"),
+    start_date: Optional[datetime] = Query(None, description="Дата начала периода"),
+    end_date: Optional[datetime] = Query(None, description="Дата окончания периода"),
+    user_id: Optional[int] = Query(None, description="ID пользователя"),
+    task_id: Optional[int] = Query(None, description="ID задачи"),
+    department_id: Optional[int] = Query(None, description="ID департамента"),
+    organization_id: Optional[int] = Query(None, description="ID организации"),
+    user: dict = Depends(verify_authorization)
+):
+    """Потоковая выгрузка строк отчета без загрузки всего набора в память"""
+    
+    export_dataset = EXPORT_DATASETS.get(dataset)
+    if export_dataset is None:
+        raise HTTPException(status_code=400, detail="Неизвестный набор данных для экспорта")
+    
+    # Права доступа как у соответствующих отчетов
+    if dataset == "time_logs":
+        if user_id and user_id != user.get("id") and user.get("role") not in ["admin", "CEO", "manager"]:
+            raise HTTPException(status_code=403, detail="Недостаточно прав для просмотра отчетов других пользователей")
+    elif not can_access_reports(user, organization_id, department_id):
+        raise HTTPException(status_code=403, detail="Недостаточно прав для просмотра отчетов")
+    
+    try:
+        writer = get_stream_writer(format_type, title=export_dataset.title)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неподдерживаемый формат экспорта")
+    
+    filename = f"{dataset}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{writer.extension}"
+    
+    return StreamingResponse(
+        stream_dataset(
+            export_dataset,
+            writer,
+            start_date=start_date,
+            end_date=end_date,
+            user_id=user_id,
+            task_id=task_id,
+            department_id=department_id,
+            organization_id=organization_id
+        ),
+        media_type=writer.media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+@router.post("/jobs", status_code=202)
+async def submit_report_job(
+    job_request: ReportJobRequest,
+    user: dict = Depends(verify_authorization),
+    session: AsyncSession = Depends(Server.get_db)
+):
+    """Постановка отчета в очередь фонового построения; возвращает ID задания"""
+    
+    filters = job_request.filters
+    check_report_access(
+        user,
+        report_type=job_request.report_type,
+        dataset=job_request.dataset,
+        user_id=filters.user_id,
+        organization_id=filters.organization_id,
+        department_id=filters.department_id
+    )
+    
+    try:
+        job = await ReportJobService(session).submit_job(
+            user_id=user.get("id"),
+            format_type=job_request.format_type,
+            report_type=job_request.report_type,
+            dataset=job_request.dataset,
+            params=filters.model_dump(mode="json", exclude_none=True)
+        )
+    except ValueError as e:
+        logger.warning(f"Invalid report job request: {e}")
+        raise HTTPException(status_code=400, detail="Некорректные параметры задания отчета")
+    except ReportJobLimitError:
+        raise HTTPException(status_code=429, detail="Слишком много активных заданий отчетов")
+    except Exception as e:
+        logger.error(f"Error submitting report job: {str(e)}")
+        raise HTTPException(status_code=503, detail="Очередь отчетов недоступна")
+    
+    return job_to_dict(job)
+
+
+@router.get("/jobs")
+async def list_report_jobs(
+    limit: int = Query(20, ge=1, le=100, description="Количество заданий"),
+    user: dict = Depends(verify_authorization),
+    session: AsyncSession = Depends(Server.get_db)
+):
+    """Последние задания отчетов текущего пользователя"""
+    
+    jobs = await ReportJobService(session).list_jobs(user.get("id"), limit=limit)
+    return {"jobs": [job_to_dict(job) for job in jobs]}
+
+
+@router.get("/jobs/{job_id}")
+async def get_report_job(
+    job_id: str,
+    user: dict = Depends(verify_authorization),
+    session: AsyncSession = Depends(Server.get_db)
+):
+    """Состояние и прогресс задания (для опроса)"""
+    
+    return job_to_dict(await get_own_report_job(job_id, user, session))
+
+
+@router.get("/jobs/{job_id}/events")
+async def report_job_events_stream(
+    job_id: str,
+    user: dict = Depends(verify_authorization),
+    session: AsyncSession = Depends(Server.get_db)
+):
+    """Подписка на прогресс задания (Server-Sent Events) до его завершения"""
+    
+    await get_own_report_job(job_id, user, session)
+    
+    return StreamingResponse(
+        job_event_stream(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/jobs/{job_id}/download")
+async def download_report_job(
+    job_id: str,
+    user: dict = Depends(verify_authorization),
+    session: AsyncSession = Depends(Server.get_db)
+):
+    """Скачивание готового файла задания"""
+    
+    job = await get_own_report_job(job_id, user, session)
+    if not job_to_dict(job)["download_ready"]:
+        raise HTTPException(status_code=409, detail="Отчет еще не готов")
+    if not await aiofiles.os.path.exists(job.artifact_path):
+        raise HTTPException(status_code=410, detail="Файл отчета удален")
+    
+    return FileResponse(job.artifact_path, media_type=job.content_type, filename=job.artifact_name)
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_report_job(
+    job_id: str,
+    user: dict = Depends(verify_authorization),
+    session: AsyncSession = Depends(Server.get_db)
+):
+    """Отмена задания в очереди или в процессе построения"""
+    
+    job = await get_own_report_job(job_id, user, session)
+    return job_to_dict(await ReportJobService(session).cancel_job(job))
+
+
 @router.get("/types")
 async def get_report_types(
     user: dict = Depends(verify_authorization)
@@ -300,7 +509,7 @@ async def get_report_types(
 @router.get("/dashboard-data")
 async def get_reports_dashboard_data(
     user: dict = Depends(verify_authorization),
-    session: AsyncSession = Depends(Server.get_db)
+    session: AsyncSession = Depends(Server.get_read_db)
 ):
     """Получение данных для дашборда отчетов"""
     
@@ -341,6 +550,21 @@ async def get_reports_dashboard_data(
         raise HTTPException(status_code=500, detail="Ошибка при получении данных дашборда")
 
 
+@router.post("/rollups/reconcile")
+async def reconcile_report_rollups(
+    full: bool = Query(True, description="Пересчитать все окно сверки, а не только просроченные задачи"),
+    user: dict = Depends(require_permission("report", "reconcile"))
+):
+    """Принудительная сверка агрегатов отчетов с исходными данными (администраторы и роли с report:reconcile)"""
+    
+    try:
+        return await report_rollup_reconciler.reconcile_once(full=full)
+        
+    except Exception as e:
+        logger.error(f"Error reconciling report rollups: {str(e)}")
+        raise HTTPException(status_code=500, detail="Ошибка при сверке агрегатов отчетов")
+
+
 @router.delete("/cache")
 async def clear_reports_cache(
     user: dict = Depends(require_role(["admin", "CEO"]))
@@ -700,42 +700,23 @@ class ChatService:
     
     async def get_unread_count(self, user_id: int) -> Dict[int, int]:
         """Получение количества непрочитанных сообщений по чатам"""
-        # Получаем все чаты пользователя
-        chats = await self.session.execute(
-            select(ChatMember.chat_id).where(ChatMember.user_id == user_id)
-        )
-        chat_ids = [row[0] for row in chats.fetchall()]
-        
-        unread_counts = {}
-        
-        for chat_id in chat_ids:
-            # Получаем последнее прочитанное сообщение
-            last_read = await self.session.execute(
-                select(ChatMember.last_read_at).where(
-                    and_(
-                        ChatMember.chat_id == chat_id,
-                        ChatMember.user_id == user_id
-                    )
-                )
-            )
-            last_read_at = last_read.scalar_one_or_none()
-            
-            # Подсчитываем непрочитанные сообщения
-            query = select(func.count(ChatMessage.id)).where(
+        # Один запрос по всем чатам пользователя: сообщения после last_read_at участника
+        result = await self.session.execute(
+            select(ChatMessage.chat_id, func.count(ChatMessage.id))
+            .join(
+                ChatMember,
                 and_(
-                    ChatMessage.chat_id == chat_id,
-                    ChatMessage.is_deleted == False
+                    ChatMember.chat_id == ChatMessage.chat_id,
+                    ChatMember.user_id == user_id
                 )
             )
-            
-            if last_read_at:
-                query = query.where(ChatMessage.sent_at > last_read_at)
-            
-            count = await self.session.scalar(query)
-            if count > 0:
-                unread_counts[chat_id] = count
-        
-        return unread_counts
+            .where(
+                ChatMessage.is_deleted == False,
+                or_(ChatMember.last_read_at.is_(None), ChatMessage.sent_at > ChatMember.last_read_at)
+            )
+            .group_by(ChatMessage.chat_id)
+        )
+        return {chat_id: count for chat_id, count in result.all() if count > 0}
     
     async def update_user_status(
         self, 
@@ -7,8 +7,11 @@ import logging
 from typing import Dict, Any, AsyncGenerator, Optional
 from pathlib import Path
 import uuid
+import time
 from datetime import datetime
 
+from backend.api.configuration.metrics import observe_code_execution
+
 logger = logging.getLogger(__name__)
 
 class CodeExecutionService:
@@ -48,14 +51,22 @@ class CodeExecutionService:
             "message": f"Starting {language} code execution..."
         }
         
+        # Last non-output status labels the execution duration metric
+        final_status = "cancelled"
+        started = time.perf_counter()
         try:
             if language.lower() == "python":
                 async for result in self._execute_python_code(code, execution_id):
+                    if result["status"] != "output":
+                        final_status = result["status"]
                     yield result
             elif language.lower() in ["javascript", "js", "node"]:
                 async for result in self._execute_javascript_code(code, execution_id):
+                    if result["status"] != "output":
+                        final_status = result["status"]
                     yield result
             else:
+                final_status = "unsupported"
                 yield {
                     "execution_id": execution_id,
                     "status": "error",
@@ -64,6 +75,7 @@ class CodeExecutionService:
                 }
                 
         except Exception as e:
+            final_status = "error"
             logger.error(f"Code execution {execution_id} failed: {str(e)}")
             yield {
                 "execution_id": execution_id,
@@ -71,6 +83,8 @@ class CodeExecutionService:
                 "timestamp": datetime.utcnow().isoformat(),
                 "error": str(e)
             }
+        finally:
+            observe_code_execution(language, final_status, time.perf_counter() - started)
     
     async def _execute_python_code(
         self, 
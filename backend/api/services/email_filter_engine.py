@@ -0,0 +1,389 @@
+"""
+Скомпилированные фильтры почты
+
+Активные фильтры аккаунта компилируются в один набор правил
+(CompiledFilters): значения всех условий contains одного поля (отправитель,
+тема, текст) собираются в одно регулярное выражение-бор и находятся за один
+проход по тексту; starts_with и ends_with - один якорный поиск по тексту и
+по перевернутому тексту, equals и категория - поиск в словаре. Сравнение без
+учета регистра, как и раньше.
+
+Скомпилированный набор хранится в LRU-кэше процесса по аккаунту; ключ -
+сами правила, поэтому изменение фильтра в любом процессе видно при
+следующей загрузке правил без отдельного сброса кэша.
+
+Новые письма из IMAP проходят фильтры при записи (apply_rules): набор
+правил загружается один раз на проход синхронизации аккаунта, действия
+меняют письмо до коммита пачки.
+
+Применение фильтра к уже полученной почте (apply_filter_to_existing) -
+пакетная задача: условие переводится в SQL, письма выбираются по id
+порциями по filter_apply_batch_size и действие выполняется UPDATE'ами по
+порции с коммитом после каждой.
+"""
+
+import logging
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import and_, delete, exists, func, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.database import get_db_helper
+from core.database.models.email_model import (
+    Email, EmailAccount, EmailCategory, EmailFilter, EmailFilterAction, EmailFilterType, EmailFolder,
+    EmailFolderMapping, EmailStatus
+)
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+CONTAINS = "contains"
+EQUALS = "equals"
+STARTS_WITH = "starts_with"
+ENDS_WITH = "ends_with"
+
+# Текстовые поля письма, по которым работают фильтры
+TEXT_FIELDS = {
+    EmailFilterType.SENDER.value: "sender",
+    EmailFilterType.SUBJECT.value: "subject",
+    EmailFilterType.CONTENT.value: "content",
+}
+
+
+@dataclass(frozen=True)
+class FilterRule:
+    """Снимок активного фильтра (без привязки к сессии)"""
+    id: int
+    filter_type: str
+    filter_value: str
+    filter_condition: str
+    action: str
+    action_value: Optional[str]
+    priority: int
+
+    @classmethod
+    def from_row(cls, id, filter_type, filter_value, filter_condition, action, action_value, priority) -> "FilterRule":
+        # Перечисления из незагруженных объектов приводятся к строкам, как после чтения из БД
+        return cls(id, getattr(filter_type, "value", filter_type), filter_value or "", filter_condition or CONTAINS,
+                   getattr(action, "value", action), action_value, priority or 0)
+
+
+def _trie_pattern(literals: Iterable[str]) -> str:
+    """Регулярное выражение-бор: общие префиксы не проверяются повторно, совпадает самая длинная строка"""
+    trie: Dict[str, dict] = {}
+    for value in literals:
+        node = trie
+        for char in value:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Конец строки внутри бора: жадный необязательный хвост - сначала более длинная строка
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class LiteralMatcher:
+    """Поиск набора строк за один проход.
+
+    В каждой позиции выражение находит самую длинную из строк; остальные
+    совпавшие в этой позиции строки - ее префиксы, они известны заранее.
+    """
+
+    def __init__(self, literals: Iterable[str]):
+        values = set(literals)
+        self._prefixes = {value: {other for other in values if value.startswith(other)} for value in values}
+        self._pattern = re.compile(f"(?=({_trie_pattern(values)}))", re.DOTALL) if values else None
+
+    def find_all(self, text: str) -> Set[str]:
+        """Строки, входящие в текст"""
+        found: Set[str] = set()
+        if self._pattern is None:
+            return found
+        for match in self._pattern.finditer(text):
+            found |= self._prefixes[match.group(1)]
+            if len(found) == len(self._prefixes):
+                break
+        return found
+
+    def match_start(self, text: str) -> Set[str]:
+        """Строки, с которых начинается текст"""
+        match = self._pattern.match(text) if self._pattern is not None else None
+        return set(self._prefixes[match.group(1)]) if match else set()
+
+
+class _FieldRules:
+    """Правила одного текстового поля"""
+
+    def __init__(self):
+        self.by_condition: Dict[str, Dict[str, List[int]]] = {
+            CONTAINS: {}, EQUALS: {}, STARTS_WITH: {}, ENDS_WITH: {}
+        }
+        self.contains = self.starts = self.ends = None
+
+    def add(self, condition: str, value: str, index: int):
+        if condition == ENDS_WITH:
+            value = value[::-1]
+        self.by_condition[condition].setdefault(value, []).append(index)
+
+    def compile(self):
+        self.contains = LiteralMatcher(self.by_condition[CONTAINS])
+        self.starts = LiteralMatcher(self.by_condition[STARTS_WITH])
+        self.ends = LiteralMatcher(self.by_condition[ENDS_WITH])
+
+    def match(self, text: str) -> Iterable[int]:
+        conditions = self.by_condition
+        if conditions[CONTAINS]:
+            for value in self.contains.find_all(text):
+                yield from conditions[CONTAINS][value]
+        yield from conditions[EQUALS].get(text, ())
+        if conditions[STARTS_WITH]:
+            for value in self.starts.match_start(text):
+                yield from conditions[STARTS_WITH][value]
+        if conditions[ENDS_WITH]:
+            for value in self.ends.match_start(text[::-1]):
+                yield from conditions[ENDS_WITH][value]
+
+
+class CompiledFilters:
+    """Все активные фильтры аккаунта в виде одного сопоставителя"""
+
+    def __init__(self, rules: Sequence[FilterRule]):
+        self.rules = sorted(rules, key=lambda rule: (rule.priority, rule.id))
+        self._fields = {field: _FieldRules() for field in TEXT_FIELDS.values()}
+        self._categories: Dict[str, List[int]] = {}
+        for index, rule in enumerate(self.rules):
+            field = TEXT_FIELDS.get(rule.filter_type)
+            if field is not None and rule.filter_condition in (CONTAINS, EQUALS, STARTS_WITH, ENDS_WITH):
+                self._fields[field].add(rule.filter_condition, rule.filter_value.lower(), index)
+            elif rule.filter_type == EmailFilterType.CATEGORY.value:
+                self._categories.setdefault(rule.filter_value, []).append(index)
+            # Остальные типы и условия не поддерживаются и ни с чем не совпадают
+        for field_rules in self._fields.values():
+            field_rules.compile()
+
+    def match(self, sender: str, subject: str, content: str, category: Optional[str] = None) -> List[FilterRule]:
+        """Совпавшие правила в порядке приоритета"""
+        texts = {"sender": sender, "subject": subject, "content": content}
+        matched: Set[int] = set()
+        for field, field_rules in self._fields.items():
+            matched.update(field_rules.match((texts[field] or "").lower()))
+        if category is not None:
+            matched.update(self._categories.get(getattr(category, "value", category), ()))
+        return [self.rules[index] for index in sorted(matched)]
+
+
+class FilterRuleCache:
+    """LRU-кэш скомпилированных наборов правил по аккаунту"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries or settings.email.filter_cache_size
+        self.entries: "OrderedDict[int, Tuple[Tuple[FilterRule, ...], CompiledFilters]]" = OrderedDict()
+        self.compilations = 0
+
+    async def load(self, session: AsyncSession, account_id: int) -> CompiledFilters:
+        rules = await load_rules(session, account_id)
+        entry = self.entries.get(account_id)
+        if entry is not None and entry[0] == rules:
+            self.entries.move_to_end(account_id)
+            return entry[1]
+
+        compiled = CompiledFilters(rules)
+        self.compilations += 1
+        self.entries[account_id] = (rules, compiled)
+        self.entries.move_to_end(account_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return compiled
+
+    def clear(self):
+        self.entries.clear()
+
+
+async def load_rules(session: AsyncSession, account_id: int) -> Tuple[FilterRule, ...]:
+    """Активные фильтры аккаунта (только колонки, без объектов ORM)"""
+    result = await session.execute(
+        select(
+            EmailFilter.id, EmailFilter.filter_type, EmailFilter.filter_value, EmailFilter.filter_condition,
+            EmailFilter.action, EmailFilter.action_value, EmailFilter.priority
+        )
+        .where(EmailFilter.email_account_id == account_id, EmailFilter.is_active.is_(True))
+        .order_by(EmailFilter.priority, EmailFilter.id)
+    )
+    return tuple(FilterRule.from_row(*row) for row in result.all())
+
+
+def _condition_clause(column, condition: str, value: str):
+    column = func.lower(column)
+    value = value.lower()
+    if condition == CONTAINS:
+        return column.contains(value, autoescape=True)
+    if condition == EQUALS:
+        return column == value
+    if condition == STARTS_WITH:
+        return column.startswith(value, autoescape=True)
+    if condition == ENDS_WITH:
+        return column.endswith(value, autoescape=True)
+    return None
+
+
+def sender_address(email_obj: Email, account_email: str) -> str:
+    """Адрес отправителя для фильтров: из заголовка From полученного письма, иначе адрес аккаунта"""
+    return (email_obj.external_headers or {}).get("from_address") or account_email
+
+
+def apply_rules(email_obj: Email, rules: Sequence[FilterRule]) -> Optional[str]:
+    """Действия совпавших правил для нового письма (до записи); возвращает имя папки для перемещения.
+
+    Правила применяются по порядку приоритета, при конфликте выигрывает последнее - как в
+    EmailService.apply_email_filters. Пересылка, удаление и автоответ здесь не выполняются.
+    """
+    folder_name = None
+    for rule in rules:
+        if rule.action == EmailFilterAction.MARK_AS_READ.value:
+            email_obj.status = EmailStatus.READ.value
+            email_obj.read_at = email_obj.read_at or datetime.utcnow()
+        elif rule.action == EmailFilterAction.MARK_AS_IMPORTANT.value:
+            email_obj.is_important = True
+        elif rule.action == EmailFilterAction.MARK_AS_SPAM.value:
+            email_obj.status = EmailStatus.SPAM.value
+            email_obj.category = EmailCategory.JUNK.value
+        elif rule.action == EmailFilterAction.MOVE_TO_FOLDER.value and rule.action_value:
+            folder_name = rule.action_value
+    return folder_name
+
+
+def filter_clause(rule: FilterRule, account_email: str):
+    """Условие фильтра в SQL (None - тип или условие не поддерживаются); то же, что CompiledFilters.match"""
+    if rule.filter_type == EmailFilterType.SENDER.value:
+        column = func.coalesce(Email.external_headers["from_address"].as_string(), account_email)
+    elif rule.filter_type == EmailFilterType.SUBJECT.value:
+        column = Email.subject
+    elif rule.filter_type == EmailFilterType.CONTENT.value:
+        column = func.coalesce(func.nullif(Email.body_text, ""), Email.body_html, "")
+    elif rule.filter_type == EmailFilterType.CATEGORY.value:
+        return Email.category == rule.filter_value
+    else:
+        return None
+    return _condition_clause(column, rule.filter_condition, rule.filter_value)
+
+
+async def _apply_action(session: AsyncSession, rule: FilterRule, email_ids: List[int],
+                        target_folder_id: Optional[int]):
+    """Действие фильтра для порции писем"""
+    values = None
+    if rule.action == EmailFilterAction.MARK_AS_READ.value:
+        values = {"status": EmailStatus.READ.value, "read_at": func.coalesce(Email.read_at, datetime.utcnow())}
+    elif rule.action == EmailFilterAction.MARK_AS_IMPORTANT.value:
+        values = {"is_important": True}
+    elif rule.action == EmailFilterAction.MARK_AS_SPAM.value:
+        values = {"status": EmailStatus.SPAM.value, "category": EmailCategory.JUNK.value}
+    elif rule.action == EmailFilterAction.MOVE_TO_FOLDER.value and target_folder_id is not None:
+        await session.execute(
+            delete(EmailFolderMapping)
+            .where(EmailFolderMapping.email_id.in_(email_ids), EmailFolderMapping.folder_id != target_folder_id)
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            insert(EmailFolderMapping).from_select(
+                ["email_id", "folder_id", "created_at"],
+                select(Email.id, literal(target_folder_id), literal(datetime.utcnow()))
+                .where(
+                    Email.id.in_(email_ids),
+                    ~exists().where(EmailFolderMapping.email_id == Email.id,
+                                    EmailFolderMapping.folder_id == target_folder_id)
+                )
+            )
+        )
+    if values is not None:
+        await session.execute(
+            update(Email).where(Email.id.in_(email_ids)).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def apply_filter_to_existing(session: AsyncSession, filter_id: int, batch_size: Optional[int] = None) -> int:
+    """Применение фильтра к уже полученным письмам аккаунта; возвращает число совпавших писем.
+
+    Письма аккаунта - те же, к которым фильтры применяет EmailService.apply_email_filters.
+    Действия без массового варианта (удаление, пересылка, автоответ) не выполняются.
+    """
+    batch_size = batch_size or settings.email.filter_apply_batch_size
+    filter_obj = await session.get(EmailFilter, filter_id)
+    if filter_obj is None:
+        return 0
+    rule = FilterRule.from_row(filter_obj.id, filter_obj.filter_type, filter_obj.filter_value,
+                               filter_obj.filter_condition, filter_obj.action, filter_obj.action_value,
+                               filter_obj.priority)
+    account_id = filter_obj.email_account_id
+    account_email = await session.scalar(select(EmailAccount.email).where(EmailAccount.id == account_id))
+    clause = filter_clause(rule, account_email or "")
+    if clause is None:
+        return 0
+
+    target_folder_id = None
+    if rule.action == EmailFilterAction.MOVE_TO_FOLDER.value:
+        target_folder_id = await session.scalar(
+            select(EmailFolder.id).where(
+                EmailFolder.email_account_id == account_id, EmailFolder.name == rule.action_value
+            )
+        )
+
+    matched = 0
+    last_id = 0
+    while True:
+        email_ids = list((await session.scalars(
+            select(Email.id)
+            .where(and_(Email.sender_id == account_id, clause, Email.id > last_id))
+            .order_by(Email.id)
+            .limit(batch_size)
+        )).all())
+        if not email_ids:
+            break
+        await _apply_action(session, rule, email_ids, target_folder_id)
+        await session.commit()
+        matched += len(email_ids)
+        last_id = email_ids[-1]
+        if len(email_ids) < batch_size:
+            break
+    return matched
+
+
+async def run_filter_job(filter_id: int) -> int:
+    """Фоновая задача применения фильтра (своя сессия)"""
+    async with get_db_helper().get_session() as session:
+        try:
+            matched = await apply_filter_to_existing(session, filter_id)
+        except Exception as e:
+            logger.error(f"Applying email filter {filter_id} to existing mail failed: {e}")
+            return 0
+    logger.info(f"Email filter {filter_id} applied to {matched} existing messages")
+    return matched
+
+
+# Глобальный экземпляр
+filter_rule_cache = FilterRuleCache()
+
+
+__all__ = [
+    "CompiledFilters",
+    "FilterRule",
+    "FilterRuleCache",
+    "LiteralMatcher",
+    "apply_filter_to_existing",
+    "apply_rules",
+    "filter_clause",
+    "filter_rule_cache",
+    "load_rules",
+    "run_filter_job",
+    "sender_address",
+]
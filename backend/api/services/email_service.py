@@ -2,7 +2,6 @@
 Сервис для работы с корпоративной почтой
 """
 import asyncio
-import smtplib
 import imaplib
 import email
 import uuid
@@ -21,11 +20,13 @@ from sqlalchemy import select, and_, or_, desc, asc, func, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from backend.api.configuration.smtp_pool import SMTPTarget, smtp_pool
+from backend.api.services.email_filter_engine import FilterRule, filter_rule_cache, sender_address
 from core.database.models.email_model import (
     EmailAccount, Email, EmailRecipient, EmailAttachment, 
     EmailFolder, EmailFolderMapping, EmailLabel, EmailFilter,
     EmailAutoReply, EmailTemplate, EmailStatus, EmailPriority,
-    EmailCategory, EmailFilterType, EmailFilterAction
+    EmailCategory, EmailFilterType, EmailFilterAction, APP_MESSAGE_ID_DOMAIN
 )
 from core.database.models.main_models import User
 
@@ -157,7 +158,7 @@ class EmailService:
     ) -> Email:
         """Создание нового email сообщения"""
         # Генерируем уникальный message_id
-        message_id = f"<{uuid.uuid4()}@ai-control.local>"
+        message_id = f"<{uuid.uuid4()}@{APP_MESSAGE_ID_DOMAIN}>"
         
         # Создаем email
         email_obj = Email(
@@ -262,64 +263,7 @@ class EmailService:
             return False
         
         try:
-            # Создаем MIME сообщение
-            msg = MIMEMultipart()
-            msg['From'] = email_obj.sender.email
-            msg['Subject'] = email_obj.subject
-            
-            # Добавляем получателей
-            to_emails = []
-            cc_emails = []
-            bcc_emails = []
-            
-            for recipient in email_obj.recipients:
-                email_addr = recipient.email_address
-                if recipient.display_name:
-                    email_addr = f"{recipient.display_name} <{email_addr}>"
-                
-                if recipient.recipient_type == 'to':
-                    to_emails.append(email_addr)
-                elif recipient.recipient_type == 'cc':
-                    cc_emails.append(email_addr)
-                elif recipient.recipient_type == 'bcc':
-                    bcc_emails.append(email_addr)
-            
-            if to_emails:
-                msg['To'] = ', '.join(to_emails)
-            if cc_emails:
-                msg['Cc'] = ', '.join(cc_emails)
-            
-            # Добавляем тело сообщения
-            if email_obj.body_html:
-                msg.attach(MIMEText(email_obj.body_html, 'html'))
-            elif email_obj.body_text:
-                msg.attach(MIMEText(email_obj.body_text, 'plain'))
-            
-            # Добавляем вложения
-            for attachment in email_obj.attachments:
-                with open(attachment.file_path, 'rb') as f:
-                    part = MIMEBase('application', 'octet-stream')
-                    part.set_payload(f.read())
-                    encoders.encode_base64(part)
-                    part.add_header(
-                        'Content-Disposition',
-                        f'attachment; filename= {attachment.filename}'
-                    )
-                    msg.attach(part)
-            
-            # Отправляем через SMTP
-            if email_obj.sender.smtp_host:
-                await self._send_via_smtp(email_obj.sender, msg, to_emails + cc_emails + bcc_emails)
-            
-            # Обновляем статус
-            email_obj.status = EmailStatus.SENT
-            email_obj.sent_at = datetime.utcnow()
-            
-            # Обновляем статус получателей
-            for recipient in email_obj.recipients:
-                recipient.is_delivered = True
-                recipient.delivered_at = datetime.utcnow()
-            
+            await self._deliver_email(email_obj)
             await self.session.commit()
             return True
             
@@ -329,28 +273,118 @@ class EmailService:
             await self.session.commit()
             raise e
     
+    async def send_emails(self, email_ids: List[int]) -> Dict[int, bool]:
+        """Массовая отправка черновиков.
+
+        Письма уходят параллельно через пул SMTP-соединений (не больше
+        smtp_max_connections_per_account одновременно на аккаунт), статусы
+        сохраняются одним коммитом. Возвращает email_id -> отправлено ли.
+        """
+        result = await self.session.execute(
+            select(Email)
+            .options(
+                selectinload(Email.recipients),
+                selectinload(Email.sender),
+                selectinload(Email.attachments)
+            )
+            .where(Email.id.in_(email_ids), Email.status == EmailStatus.DRAFT)
+        )
+        emails = list(result.scalars().all())
+        outcomes = await asyncio.gather(
+            *(self._deliver_email(email_obj) for email_obj in emails), return_exceptions=True
+        )
+        
+        sent = {}
+        for email_obj, outcome in zip(emails, outcomes):
+            if isinstance(outcome, Exception):
+                email_obj.status = EmailStatus.FAILED
+            sent[email_obj.id] = not isinstance(outcome, Exception)
+        await self.session.commit()
+        return {email_id: sent.get(email_id, False) for email_id in email_ids}
+    
+    def _build_message(self, email_obj: Email) -> Tuple[MIMEMultipart, List[str]]:
+        """MIME сообщение и адреса конверта (to, cc, bcc)"""
+        msg = MIMEMultipart()
+        msg['From'] = email_obj.sender.email
+        msg['Subject'] = email_obj.subject
+        
+        # Добавляем получателей
+        to_emails = []
+        cc_emails = []
+        bcc_emails = []
+        
+        for recipient in email_obj.recipients:
+            email_addr = recipient.email_address
+            if recipient.display_name:
+                email_addr = f"{recipient.display_name} <{email_addr}>"
+            
+            if recipient.recipient_type == 'to':
+                to_emails.append(email_addr)
+            elif recipient.recipient_type == 'cc':
+                cc_emails.append(email_addr)
+            elif recipient.recipient_type == 'bcc':
+                bcc_emails.append(email_addr)
+        
+        if to_emails:
+            msg['To'] = ', '.join(to_emails)
+        if cc_emails:
+            msg['Cc'] = ', '.join(cc_emails)
+        
+        # Добавляем тело сообщения
+        if email_obj.body_html:
+            msg.attach(MIMEText(email_obj.body_html, 'html'))
+        elif email_obj.body_text:
+            msg.attach(MIMEText(email_obj.body_text, 'plain'))
+        
+        # Добавляем вложения
+        for attachment in email_obj.attachments:
+            with open(attachment.file_path, 'rb') as f:
+                part = MIMEBase('application', 'octet-stream')
+                part.set_payload(f.read())
+                encoders.encode_base64(part)
+                part.add_header(
+                    'Content-Disposition',
+                    f'attachment; filename= {attachment.filename}'
+                )
+                msg.attach(part)
+        
+        # В конверте - только адреса, без отображаемых имен
+        envelope = [
+            recipient.email_address for recipient in email_obj.recipients
+            if recipient.recipient_type in ('to', 'cc', 'bcc')
+        ]
+        return msg, envelope
+    
+    async def _deliver_email(self, email_obj: Email):
+        """Отправка письма и обновление статусов (без коммита)"""
+        msg, envelope = self._build_message(email_obj)
+        
+        # Отправляем через SMTP
+        refused = {}
+        if email_obj.sender.smtp_host:
+            refused = await self._send_via_smtp(email_obj.sender, msg, envelope) or {}
+        
+        # Обновляем статус
+        email_obj.status = EmailStatus.SENT
+        email_obj.sent_at = datetime.utcnow()
+        
+        # Обновляем статус получателей (отклоненные сервером адреса не доставлены)
+        for recipient in email_obj.recipients:
+            if recipient.email_address in refused:
+                continue
+            recipient.is_delivered = True
+            recipient.delivered_at = datetime.utcnow()
+    
     async def _send_via_smtp(
         self, 
         account: EmailAccount, 
         msg: MIMEMultipart, 
         recipients: List[str]
-    ):
-        """Отправка через SMTP"""
-        # Используем asyncio для неблокирующей отправки
-        loop = asyncio.get_event_loop()
-        
-        def send_smtp():
-            server = smtplib.SMTP(account.smtp_host, account.smtp_port)
-            if account.smtp_use_tls:
-                server.starttls()
-            
-            if account.smtp_username and account.smtp_password:
-                server.login(account.smtp_username, account.smtp_password)
-            
-            server.send_message(msg, from_addr=account.email, to_addrs=recipients)
-            server.quit()
-        
-        await loop.run_in_executor(None, send_smtp)
+    ) -> Dict[str, Tuple[int, str]]:
+        """Отправка через пул SMTP-соединений аккаунта; возвращает отклоненные адреса"""
+        return await smtp_pool.send_message(
+            SMTPTarget.from_account(account), msg, account.email, recipients
+        )
     
     async def get_emails(
         self,
@@ -552,74 +586,24 @@ class EmailService:
     
     async def apply_email_filters(self, email: Email) -> List[EmailFilterAction]:
         """Применение фильтров к email сообщению"""
-        # Получаем активные фильтры для аккаунта отправителя
-        result = await self.session.execute(
-            select(EmailFilter)
-            .where(
-                and_(
-                    EmailFilter.email_account_id == email.sender_id,
-                    EmailFilter.is_active == True
-                )
-            )
-            .order_by(EmailFilter.priority)
+        # Все активные фильтры аккаунта отправителя - один скомпилированный набор правил
+        rules = await filter_rule_cache.load(self.session, email.sender_id)
+        account_email = await self.session.scalar(
+            select(EmailAccount.email).where(EmailAccount.id == email.sender_id)
+        )
+        matched = rules.match(
+            sender=sender_address(email, account_email or ""),
+            subject=email.subject,
+            content=email.body_text or email.body_html or "",
+            category=email.category
         )
-        filters = result.scalars().all()
-        
-        applied_actions = []
-        
-        for filter_obj in filters:
-            if await self._filter_matches(email, filter_obj):
-                applied_actions.append(filter_obj.action)
-                await self._apply_filter_action(email, filter_obj)
-        
-        return applied_actions
-    
-    async def _filter_matches(self, email: Email, filter_obj: EmailFilter) -> bool:
-        """Проверка соответствия email фильтру"""
-        if filter_obj.filter_type == EmailFilterType.SENDER:
-            return self._check_condition(
-                email.sender.email, 
-                filter_obj.filter_value, 
-                filter_obj.filter_condition
-            )
-        
-        elif filter_obj.filter_type == EmailFilterType.SUBJECT:
-            return self._check_condition(
-                email.subject, 
-                filter_obj.filter_value, 
-                filter_obj.filter_condition
-            )
-        
-        elif filter_obj.filter_type == EmailFilterType.CONTENT:
-            content = email.body_text or email.body_html or ""
-            return self._check_condition(
-                content, 
-                filter_obj.filter_value, 
-                filter_obj.filter_condition
-            )
         
-        elif filter_obj.filter_type == EmailFilterType.CATEGORY:
-            return email.category == filter_obj.filter_value
+        for rule in matched:
+            await self._apply_filter_action(email, rule)
         
-        return False
-    
-    def _check_condition(self, value: str, filter_value: str, condition: str) -> bool:
-        """Проверка условия фильтра"""
-        value = value.lower()
-        filter_value = filter_value.lower()
-        
-        if condition == "contains":
-            return filter_value in value
-        elif condition == "equals":
-            return value == filter_value
-        elif condition == "starts_with":
-            return value.startswith(filter_value)
-        elif condition == "ends_with":
-            return value.endswith(filter_value)
-        
-        return False
+        return [EmailFilterAction(rule.action) for rule in matched]
     
-    async def _apply_filter_action(self, email: Email, filter_obj: EmailFilter):
+    async def _apply_filter_action(self, email: Email, filter_obj: FilterRule):
         """Применение действия фильтра"""
         if filter_obj.action == EmailFilterAction.MARK_AS_READ:
             email.status = EmailStatus.READ
@@ -630,7 +614,7 @@ class EmailService:
         
         elif filter_obj.action == EmailFilterAction.MARK_AS_SPAM:
             email.status = EmailStatus.SPAM
-            email.category = EmailCategory.SPAM
+            email.category = EmailCategory.JUNK
         
         elif filter_obj.action == EmailFilterAction.MOVE_TO_FOLDER:
             if filter_obj.action_value:
@@ -0,0 +1,512 @@
+"""
+Синхронизация входящей почты по IMAP
+
+Для каждой папки из imap_sync_folders хранится состояние (EmailFolder):
+UIDVALIDITY, последний полученный UID и HIGHESTMODSEQ. Проход по папке:
+
+- UIDVALIDITY изменился - UID прежних писем недействительны: привязки к
+  UID сбрасываются, папка читается заново (письма с уже известным
+  Message-ID не дублируются, только получают новую привязку);
+- сервер поддерживает CONDSTORE - изменения флагов (\\Seen, \\Flagged)
+  известных писем берутся одним UID FETCH ... (CHANGEDSINCE modseq) и
+  применяются UPDATE'ами по группам флагов;
+- новые письма (UID > last_uid) читаются пачками по imap_fetch_batch_size;
+  после каждой пачки last_uid фиксируется коммитом, прерванная
+  синхронизация продолжается со следующей пачки; новые письма проходят
+  фильтры аккаунта (набор правил загружается один раз на проход) до
+  коммита пачки.
+
+Текст письма больше imap_inline_literal_bytes пишется из сокета в файл по
+частям и переносится в хранилище (raw_storage_dir) без копирования в
+память; разбор MIME и вложения - в потоке, чтобы не блокировать цикл.
+
+Аккаунты синхронизирует EmailSyncWorker (run_email_worker.py): выбирает
+аккаунты с наступившим imap_next_sync_at через FOR UPDATE SKIP LOCKED,
+арендует их на imap_sync_lease_seconds и синхронизирует с ограниченным
+параллелизмом; после ошибки следующий запуск откладывается на
+imap_sync_error_backoff_seconds.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+from email.utils import parseaddr, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import aiofiles
+from sqlalchemy import case, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.api.configuration.imap_client import FetchedMessage, IMAPClient, SpooledLiteral, uid_set
+from backend.api.services.email_filter_engine import CompiledFilters, apply_rules, filter_rule_cache, sender_address
+from core.database import get_db_helper
+from core.database.models.email_model import (
+    APP_MESSAGE_ID_DOMAIN, Email, EmailAccount, EmailAttachment, EmailCategory, EmailFolder, EmailFolderMapping,
+    EmailRecipient, EmailStatus
+)
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+SEEN = "\\Seen"
+FLAGGED = "\\Flagged"
+
+
+@dataclass
+class ParsedAttachment:
+    filename: str
+    content_type: str
+    payload: bytes
+    is_inline: bool = False
+    content_id: Optional[str] = None
+
+
+@dataclass
+class ParsedMessage:
+    """Поля письма, нужные для записи в emails"""
+    message_id: Optional[str]
+    subject: str
+    headers: Dict[str, str]
+    sent_at: Optional[datetime]
+    body_text: Optional[str]
+    body_html: Optional[str]
+    size: int
+    attachments: List[ParsedAttachment] = field(default_factory=list)
+
+
+def _header(message: EmailMessage, name: str) -> Optional[str]:
+    try:
+        value = message.get(name)
+    except Exception:
+        return None
+    return str(value).strip() if value is not None else None
+
+
+def _content(part: Optional[EmailMessage]) -> Optional[str]:
+    if part is None:
+        return None
+    try:
+        return part.get_content()
+    except (LookupError, ValueError):
+        # Неизвестная кодировка
+        payload = part.get_payload(decode=True) or b""
+        return payload.decode("utf-8", errors="replace")
+
+
+def parse_message_file(path: str) -> ParsedMessage:
+    """Разбор сохраненного письма (выполняется в потоке)"""
+    with open(path, "rb") as raw:
+        message = BytesParser(policy=policy.default).parse(raw)
+
+    sent_at = None
+    date = _header(message, "Date")
+    if date:
+        try:
+            sent_at = parsedate_to_datetime(date)
+            if sent_at.tzinfo is not None:
+                sent_at = sent_at.astimezone(timezone.utc).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            sent_at = None
+
+    attachments = []
+    for part in message.iter_attachments():
+        payload = part.get_payload(decode=True)
+        if payload is None:
+            continue  # вложенное письмо message/rfc822 остается только в исходнике
+        attachments.append(ParsedAttachment(
+            filename=part.get_filename() or "attachment",
+            content_type=part.get_content_type(),
+            payload=payload,
+            is_inline=part.get_content_disposition() == "inline",
+            content_id=_header(part, "Content-ID"),
+        ))
+
+    return ParsedMessage(
+        message_id=_header(message, "Message-ID"),
+        subject=_header(message, "Subject") or "",
+        headers={name: value for name in ("From", "To", "Cc", "Date", "In-Reply-To")
+                 if (value := _header(message, name))},
+        sent_at=sent_at,
+        body_text=_content(message.get_body(preferencelist=("plain",))),
+        body_html=_content(message.get_body(preferencelist=("html",))),
+        size=os.path.getsize(path),
+        attachments=attachments,
+    )
+
+
+class MailboxSynchronizer:
+    """Инкрементальная синхронизация папок одного аккаунта"""
+
+    def __init__(self, fetch_batch_size: Optional[int] = None, raw_storage_dir: Optional[str] = None,
+                 attachments_dir: str = "uploads/email_attachments"):
+        config = settings.email
+        self.fetch_batch_size = fetch_batch_size or config.imap_fetch_batch_size
+        self.raw_storage_dir = raw_storage_dir or config.raw_storage_dir
+        self.attachments_dir = Path(attachments_dir)
+
+    @property
+    def spool_dir(self) -> str:
+        # Рядом с хранилищем: перенос письма из спула - переименование в пределах одной ФС
+        return os.path.join(self.raw_storage_dir, ".spool")
+
+    async def sync_account(self, session: AsyncSession, account: EmailAccount, client: IMAPClient,
+                           folders: Optional[List[str]] = None) -> int:
+        """Синхронизация папок аккаунта; возвращает число новых писем"""
+        received = 0
+        # Фильтры аккаунта - один скомпилированный набор на весь проход
+        rules = await filter_rule_cache.load(session, account.id)
+        for remote_name in folders or settings.email.imap_sync_folders:
+            folder = await self._folder(session, account, remote_name)
+            received += await self.sync_folder(session, client, account, folder, rules)
+        return received
+
+    async def _folder(self, session: AsyncSession, account: EmailAccount, remote_name: str) -> EmailFolder:
+        folder = await session.scalar(
+            select(EmailFolder).where(EmailFolder.email_account_id == account.id, EmailFolder.name == remote_name)
+        )
+        if folder is None:
+            folder = EmailFolder(email_account_id=account.id, name=remote_name, display_name=remote_name,
+                                 last_uid=0)
+            session.add(folder)
+            await session.flush()
+        return folder
+
+    async def sync_folder(self, session: AsyncSession, client: IMAPClient, account: EmailAccount,
+                          folder: EmailFolder, rules: Optional[CompiledFilters] = None) -> int:
+        info = await client.select(folder.name)
+        if info.uid_validity != folder.uid_validity:
+            if folder.uid_validity is not None:
+                logger.info(f"UIDVALIDITY of {folder.name} changed for account {account.id}, resyncing folder")
+                await session.execute(
+                    delete(EmailFolderMapping)
+                    .where(EmailFolderMapping.folder_id == folder.id, EmailFolderMapping.imap_uid.isnot(None))
+                    .execution_options(synchronize_session=False)
+                )
+            folder.uid_validity = info.uid_validity
+            folder.last_uid = 0
+            folder.highest_modseq = None
+
+        if client.condstore and folder.highest_modseq and folder.last_uid and \
+                info.highest_modseq != folder.highest_modseq:
+            changes = await client.uid_fetch(f"1:{folder.last_uid}", "(UID FLAGS)",
+                                             changed_since=folder.highest_modseq)
+            await self._apply_flag_changes(session, folder, changes)
+
+        received = 0
+        if info.uid_next is None or info.uid_next > folder.last_uid + 1:
+            listing = await client.uid_fetch(f"{folder.last_uid + 1}:*", "(UID)")
+            # n:* всегда возвращает последнее письмо папки, даже если его UID меньше n
+            new_uids = sorted({message.uid for message in listing if message.uid > folder.last_uid})
+            for start in range(0, len(new_uids), self.fetch_batch_size):
+                batch = new_uids[start:start + self.fetch_batch_size]
+                messages = await client.uid_fetch(uid_set(batch), "(UID FLAGS BODY.PEEK[])")
+                try:
+                    for message in sorted(messages, key=lambda item: item.uid):
+                        if message.body is not None:
+                            await self._store_message(session, account, folder, message, rules)
+                            received += 1
+                finally:
+                    for message in messages:
+                        if isinstance(message.body, SpooledLiteral):
+                            message.body.discard()
+                folder.last_uid = max(batch)
+                folder.last_synced_at = datetime.utcnow()
+                await session.commit()
+
+        if client.condstore and info.highest_modseq:
+            folder.highest_modseq = info.highest_modseq
+        folder.last_synced_at = datetime.utcnow()
+        await session.commit()
+        return received
+
+    async def _apply_flag_changes(self, session: AsyncSession, folder: EmailFolder, changes: List[FetchedMessage]):
+        """Флаги известных писем: одно UPDATE на сочетание (прочитано, помечено)"""
+        groups: Dict[Tuple[bool, bool], List[int]] = {}
+        for change in changes:
+            groups.setdefault((SEEN in change.flags, FLAGGED in change.flags), []).append(change.uid)
+        now = datetime.utcnow()
+        for (seen, flagged), uids in groups.items():
+            email_ids = select(EmailFolderMapping.email_id).where(
+                EmailFolderMapping.folder_id == folder.id, EmailFolderMapping.imap_uid.in_(uids)
+            )
+            if seen:
+                values = {
+                    "read_at": case((Email.read_at.is_(None), now), else_=Email.read_at),
+                    "status": case((Email.status == EmailStatus.DELIVERED.value, EmailStatus.READ.value),
+                                   else_=Email.status),
+                }
+            else:
+                values = {
+                    "read_at": None,
+                    "status": case((Email.status == EmailStatus.READ.value, EmailStatus.DELIVERED.value),
+                                   else_=Email.status),
+                }
+            await session.execute(
+                update(Email).where(Email.id.in_(email_ids)).values(is_flagged=flagged, **values)
+                .execution_options(synchronize_session=False)
+            )
+
+    async def _store_raw(self, message: FetchedMessage, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(message.body, SpooledLiteral):
+            os.replace(message.body.path, path)
+            return
+        async with aiofiles.open(path, "wb") as raw:
+            await raw.write(message.body)
+
+    async def _store_message(self, session: AsyncSession, account: EmailAccount, folder: EmailFolder,
+                             message: FetchedMessage, rules: Optional[CompiledFilters] = None):
+        raw_path = os.path.join(self.raw_storage_dir, str(account.id), str(folder.id),
+                                f"{folder.uid_validity}-{message.uid}.eml")
+        await self._store_raw(message, raw_path)
+        parsed = await asyncio.to_thread(parse_message_file, raw_path)
+        message_id = (parsed.message_id or f"<imap-{account.id}-{folder.uid_validity}-{message.uid}@sync>")[:255]
+
+        # Письмо уже есть в этом аккаунте (лежит в другой папке): только привязка
+        email_id = await session.scalar(
+            select(Email.id).where(Email.sender_id == account.id, Email.message_id == message_id)
+        )
+        if email_id is None and message_id.endswith(f"@{APP_MESSAGE_ID_DOMAIN}>"):
+            # Отправлено из приложения: привязка к исходному письму, только если аккаунт - его получатель
+            email_id = await session.scalar(
+                select(Email.id)
+                .join(EmailRecipient, EmailRecipient.email_id == Email.id)
+                .where(Email.message_id == message_id,
+                       func.lower(EmailRecipient.email_address) == account.email.lower())
+                .limit(1)
+            )
+        target_folder_id = folder.id
+        if email_id is None:
+            seen = SEEN in message.flags
+            email_obj = Email(
+                message_id=message_id,
+                sender_id=account.id,
+                subject=parsed.subject[:500],
+                body_text=parsed.body_text,
+                body_html=parsed.body_html,
+                status=EmailStatus.READ.value if seen else EmailStatus.DELIVERED.value,
+                category=EmailCategory.GENERAL.value,
+                sent_at=parsed.sent_at,
+                delivered_at=datetime.utcnow(),
+                read_at=datetime.utcnow() if seen else None,
+                is_flagged=FLAGGED in message.flags,
+                size_bytes=parsed.size,
+                external_headers={**parsed.headers, "from_address": parseaddr(parsed.headers.get("From", ""))[1],
+                                  "raw_path": raw_path}
+            )
+            if rules is not None:
+                matched = rules.match(
+                    sender=sender_address(email_obj, account.email),
+                    subject=email_obj.subject,
+                    content=email_obj.body_text or email_obj.body_html or "",
+                    category=email_obj.category
+                )
+                folder_name = apply_rules(email_obj, matched)
+                if folder_name and folder_name != folder.name:
+                    # Перемещение - только в приложении: письмо привязывается к папке фильтра без UID
+                    target_folder_id = await session.scalar(
+                        select(EmailFolder.id).where(
+                            EmailFolder.email_account_id == account.id, EmailFolder.name == folder_name
+                        )
+                    ) or folder.id
+            session.add(email_obj)
+            await session.flush()
+            email_id = email_obj.id
+            session.add(EmailRecipient(
+                email_id=email_id,
+                email_account_id=account.id,
+                email_address=account.email,
+                recipient_type="to",
+                is_delivered=True,
+                is_read=email_obj.read_at is not None,
+                delivered_at=email_obj.delivered_at
+            ))
+            for attachment in parsed.attachments:
+                await self._store_attachment(session, email_id, attachment)
+
+        if target_folder_id != folder.id:
+            session.add(EmailFolderMapping(email_id=email_id, folder_id=target_folder_id))
+            return
+
+        mapping = await session.scalar(
+            select(EmailFolderMapping).where(
+                EmailFolderMapping.email_id == email_id, EmailFolderMapping.folder_id == folder.id
+            )
+        )
+        if mapping is None:
+            session.add(EmailFolderMapping(email_id=email_id, folder_id=folder.id, imap_uid=message.uid))
+        else:
+            mapping.imap_uid = message.uid
+
+    async def _store_attachment(self, session: AsyncSession, email_id: int, attachment: ParsedAttachment):
+        self.attachments_dir.mkdir(parents=True, exist_ok=True)
+        file_path = self.attachments_dir / f"{uuid.uuid4().hex}_{Path(attachment.filename).name}"
+        async with aiofiles.open(file_path, "wb") as f:
+            await f.write(attachment.payload)
+        session.add(EmailAttachment(
+            email_id=email_id,
+            filename=file_path.name,
+            original_filename=attachment.filename[:255],
+            content_type=attachment.content_type[:100],
+            size_bytes=len(attachment.payload),
+            file_path=str(file_path),
+            file_hash=hashlib.md5(attachment.payload).hexdigest(),
+            is_inline=attachment.is_inline,
+            content_id=attachment.content_id
+        ))
+
+
+async def request_sync(session: AsyncSession, account_id: int) -> bool:
+    """Синхронизация аккаунта при ближайшем проходе обработчика"""
+    result = await session.execute(
+        update(EmailAccount)
+        .where(EmailAccount.id == account_id, EmailAccount.imap_host.isnot(None))
+        .values(imap_next_sync_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await session.commit()
+    return bool(result.rowcount)
+
+
+class EmailSyncWorker:
+    """Синхронизация аккаунтов по расписанию"""
+
+    def __init__(self, synchronizer: Optional[MailboxSynchronizer] = None, concurrency: Optional[int] = None,
+                 batch_size: Optional[int] = None, poll_interval: Optional[float] = None):
+        config = settings.email
+        self.synchronizer = synchronizer or MailboxSynchronizer()
+        self.concurrency = concurrency or config.imap_sync_concurrency
+        self.batch_size = batch_size or config.imap_sync_claim_batch_size
+        self.poll_interval = config.imap_sync_poll_interval_seconds if poll_interval is None else poll_interval
+        self.is_running = False
+
+    async def claim(self, session: AsyncSession, now: Optional[datetime] = None) -> List[int]:
+        """Аренда аккаунтов с наступившим временем синхронизации"""
+        now = now or datetime.utcnow()
+        account_ids = list((await session.scalars(
+            select(EmailAccount.id)
+            .where(
+                EmailAccount.is_active.is_(True),
+                EmailAccount.imap_host.isnot(None),
+                or_(EmailAccount.imap_next_sync_at.is_(None), EmailAccount.imap_next_sync_at <= now)
+            )
+            .order_by(EmailAccount.imap_next_sync_at.nulls_first(), EmailAccount.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )).all())
+        if account_ids:
+            # Аккаунт не будет выбран снова, пока идет синхронизация (или до истечения аренды после падения)
+            await session.execute(
+                update(EmailAccount)
+                .where(EmailAccount.id.in_(account_ids))
+                .values(imap_next_sync_at=now + timedelta(seconds=settings.email.imap_sync_lease_seconds))
+                .execution_options(synchronize_session=False)
+            )
+        await session.commit()
+        return account_ids
+
+    def _client(self, account: EmailAccount) -> IMAPClient:
+        config = settings.email
+        return IMAPClient(
+            account.imap_host,
+            account.imap_port or (993 if account.imap_use_ssl else 143),
+            use_ssl=bool(account.imap_use_ssl),
+            connect_timeout=config.imap_connect_timeout_seconds,
+            command_timeout=config.imap_command_timeout_seconds,
+            inline_limit=config.imap_inline_literal_bytes,
+            spool_dir=self.synchronizer.spool_dir
+        )
+
+    async def sync_account(self, account_id: int) -> int:
+        """Синхронизация одного аккаунта; возвращает число новых писем"""
+        config = settings.email
+        async with get_db_helper().get_session() as session:
+            account = await session.get(EmailAccount, account_id)
+            if account is None:
+                return 0
+            client = self._client(account)
+            try:
+                await client.connect()
+                await client.login(account.imap_username or account.email, account.imap_password or "")
+                received = await self.synchronizer.sync_account(session, account, client)
+            except Exception as e:
+                logger.warning(f"IMAP sync of account {account_id} failed: {e}")
+                await session.rollback()
+                account = await session.get(EmailAccount, account_id)
+                account.imap_sync_error = str(e)[:1000]
+                account.imap_next_sync_at = datetime.utcnow() + timedelta(seconds=config.imap_sync_error_backoff_seconds)
+                await session.commit()
+                return 0
+            finally:
+                await client.logout()
+
+            now = datetime.utcnow()
+            account.imap_last_sync_at = now
+            account.imap_next_sync_at = now + timedelta(seconds=config.imap_sync_interval_seconds)
+            account.imap_sync_error = None
+            await session.commit()
+            if received:
+                logger.info(f"IMAP sync of account {account_id}: {received} new messages")
+            return received
+
+    async def run_once(self) -> int:
+        async with get_db_helper().get_session() as session:
+            account_ids = await self.claim(session)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def sync(account_id: int) -> int:
+            async with semaphore:
+                return await self.sync_account(account_id)
+
+        await asyncio.gather(*(sync(account_id) for account_id in account_ids))
+        return len(account_ids)
+
+    async def run(self):
+        self.is_running = True
+        logger.info(f"Starting IMAP sync worker (concurrency {self.concurrency})")
+        try:
+            while self.is_running:
+                try:
+                    claimed = await self.run_once()
+                except Exception as e:
+                    logger.error(f"IMAP sync worker error: {e}")
+                    claimed = 0
+                if claimed < self.batch_size:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            self.is_running = False
+
+
+# Глобальный экземпляр
+email_sync_worker = EmailSyncWorker()
+
+
+async def start_email_workers():
+    """Запуск синхронизации входящих из настроек"""
+    if settings.email.imap_sync_enabled:
+        await email_sync_worker.run()
+
+
+async def stop_email_workers():
+    email_sync_worker.is_running = False
+    logger.info("Stopping email workers")
+
+
+__all__ = [
+    "EmailSyncWorker",
+    "MailboxSynchronizer",
+    "ParsedMessage",
+    "email_sync_worker",
+    "parse_message_file",
+    "request_sync",
+    "start_email_workers",
+    "stop_email_workers",
+]
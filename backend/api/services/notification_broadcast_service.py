@@ -0,0 +1,338 @@
+"""
+Рассылки уведомлений отделу или организации
+
+Запрос API сохраняет рассылку (NotificationBroadcast) и список получателей
+одним INSERT ... SELECT из users по department_id или organization_id в той
+же транзакции и не ждет создания тысяч уведомлений. Не администратор может
+адресовать рассылку только своей организации или ее отделу
+(audience_organization_id).
+
+Обработчик (в процессе обработчиков уведомлений) выбирает пачки по
+broadcast_chunk_size получателей через FOR UPDATE SKIP LOCKED, до
+broadcast_concurrency пачек параллельно. Пачка - одна транзакция: уведомления
+одной многострочной вставкой, записи доставки - INSERT ... SELECT по каналу,
+отметка получателей и счетчик processed_recipients. Прерванная пачка
+откатывается целиком и будет выбрана снова. После коммита публикуется одно
+push-событие на пачку.
+
+Каждый получатель получает свою строку notifications с копией заголовка и
+текста: лента, архив и доставка читают их оттуда, а related_entity_id
+ссылается на рассылку.
+
+Настройки пользователей (min_priority, тихие часы, сводки) к рассылке не
+применяются: это объявление для всей аудитории.
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import JSON, exists, insert, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.api.services.notification_push_service import publish_push_event
+from core.database import get_db_helper
+from core.database.models.main_models import Department, User
+from core.database.models.notification_model import (
+    BroadcastAudience, Notification, NotificationBroadcast, NotificationBroadcastRecipient,
+    NotificationChannel, NotificationDelivery, NotificationPriority, NotificationStatus, NotificationType
+)
+from core.database.slow_queries import set_query_origin
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_PENDING = "pending"
+BROADCAST_SENDING = "sending"
+BROADCAST_COMPLETED = "completed"
+
+RECIPIENT_PENDING = "pending"
+RECIPIENT_SENT = "sent"
+
+# Тип связанной сущности у уведомлений рассылки
+BROADCAST_ENTITY_TYPE = "notification_broadcast"
+
+# Колонка users, по которой выбирается аудитория
+AUDIENCE_COLUMNS = {
+    BroadcastAudience.DEPARTMENT.value: User.department_id,
+    BroadcastAudience.ORGANIZATION.value: User.organization_id,
+}
+
+
+def _value(value: Any) -> Any:
+    return value.value if hasattr(value, "value") else value
+
+
+def broadcast_event(broadcast: NotificationBroadcast, recipients: Dict[int, int],
+                    created_at: datetime) -> Dict[str, Any]:
+    """Push-событие пачки рассылки: recipients - id получателя -> id его уведомления"""
+    return {
+        "type": "notification",
+        "recipients": {str(user_id): notification_id for user_id, notification_id in recipients.items()},
+        "unread_delta": 1,
+        "notification": {
+            "notification_type": _value(broadcast.notification_type),
+            "title": broadcast.title,
+            "message": broadcast.message,
+            "priority": _value(broadcast.priority),
+            "status": NotificationStatus.PENDING.value,
+            "related_entity_type": BROADCAST_ENTITY_TYPE,
+            "related_entity_id": broadcast.id,
+            "created_at": created_at.isoformat(),
+        },
+    }
+
+
+async def create_broadcast(
+    session: AsyncSession,
+    audience_type: BroadcastAudience,
+    audience_id: int,
+    notification_type: NotificationType,
+    title: str,
+    message: str,
+    priority: NotificationPriority = NotificationPriority.NORMAL,
+    channels: Optional[List[str]] = None,
+    sender_id: Optional[int] = None,
+    expires_at: Optional[datetime] = None,
+    metadata: Optional[Dict[str, Any]] = None
+) -> NotificationBroadcast:
+    """Создание рассылки и списка получателей (активные пользователи аудитории)"""
+    audience_type = _value(audience_type)
+    if audience_type not in AUDIENCE_COLUMNS:
+        raise ValueError(f"Unknown broadcast audience: {audience_type}")
+    channels = list(dict.fromkeys(_value(channel) for channel in channels or [NotificationChannel.IN_APP]))
+
+    broadcast = NotificationBroadcast(
+        broadcast_uuid=str(uuid.uuid4()),
+        sender_id=sender_id,
+        audience_type=audience_type,
+        audience_id=audience_id,
+        notification_type=_value(notification_type),
+        title=title,
+        message=message,
+        priority=_value(priority),
+        channels=channels,
+        notification_metadata=metadata or {},
+        expires_at=expires_at,
+        status=BROADCAST_PENDING,
+        total_recipients=0,
+        processed_recipients=0
+    )
+    session.add(broadcast)
+    await session.flush()
+
+    result = await session.execute(
+        insert(NotificationBroadcastRecipient).from_select(
+            ["broadcast_id", "user_id", "status"],
+            select(literal(broadcast.id), User.id, literal(RECIPIENT_PENDING))
+            .where(AUDIENCE_COLUMNS[audience_type] == audience_id, User.is_active.is_(True))
+        )
+    )
+    broadcast.total_recipients = result.rowcount
+    if not broadcast.total_recipients:
+        broadcast.status = BROADCAST_COMPLETED
+        broadcast.completed_at = datetime.utcnow()
+    await session.commit()
+    return broadcast
+
+
+async def audience_organization_id(session: AsyncSession, audience_type: BroadcastAudience,
+                                   audience_id: int) -> Optional[int]:
+    """Организация аудитории рассылки (None - отдела нет)"""
+    if _value(audience_type) == BroadcastAudience.ORGANIZATION.value:
+        return audience_id
+    return await session.scalar(select(Department.organization_id).where(Department.id == audience_id))
+
+
+async def get_broadcast(session: AsyncSession, broadcast_uuid: str) -> Optional[NotificationBroadcast]:
+    return await session.scalar(
+        select(NotificationBroadcast).where(NotificationBroadcast.broadcast_uuid == broadcast_uuid)
+    )
+
+
+class BroadcastWorker:
+    """Создание уведомлений рассылок пачками"""
+
+    def __init__(self, chunk_size: Optional[int] = None, concurrency: Optional[int] = None,
+                 poll_interval: Optional[float] = None):
+        config = settings.notifications
+        self.chunk_size = chunk_size or config.broadcast_chunk_size
+        self.concurrency = concurrency or config.broadcast_concurrency
+        self.poll_interval = config.broadcast_poll_interval_seconds if poll_interval is None else poll_interval
+        self.is_running = False
+
+    async def deliver_chunk(self, session: AsyncSession, broadcast_id: int,
+                            now: Optional[datetime] = None) -> int:
+        """Уведомления для очередной пачки получателей одной транзакцией; возвращает размер пачки"""
+        now = now or datetime.utcnow()
+        broadcast = await session.get(NotificationBroadcast, broadcast_id)
+        recipients = (await session.execute(
+            select(NotificationBroadcastRecipient.id, NotificationBroadcastRecipient.user_id)
+            .where(
+                NotificationBroadcastRecipient.broadcast_id == broadcast_id,
+                NotificationBroadcastRecipient.status == RECIPIENT_PENDING
+            )
+            .order_by(NotificationBroadcastRecipient.id)
+            .limit(self.chunk_size)
+            .with_for_update(skip_locked=True)
+        )).all()
+        if not recipients:
+            return 0
+
+        created = (await session.execute(
+            insert(Notification).returning(Notification.id, Notification.recipient_id),
+            [
+                {
+                    "notification_uuid": str(uuid.uuid4()),
+                    "recipient_id": user_id,
+                    "notification_type": broadcast.notification_type,
+                    "title": broadcast.title,
+                    "message": broadcast.message,
+                    "priority": broadcast.priority,
+                    "status": NotificationStatus.PENDING.value,
+                    "channels": broadcast.channels,
+                    "delivered_channels": [],
+                    "related_entity_type": BROADCAST_ENTITY_TYPE,
+                    "related_entity_id": broadcast.id,
+                    "notification_metadata": broadcast.notification_metadata,
+                    "variables": {},
+                    "expires_at": broadcast.expires_at,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for _, user_id in recipients
+            ]
+        )).all()
+        notification_ids = [notification_id for notification_id, _ in created]
+
+        # Записи очереди исходящих: ключ идемпотентности тот же, что у delivery_idempotency_key
+        for channel in broadcast.channels:
+            await session.execute(
+                insert(NotificationDelivery).from_select(
+                    ["notification_id", "channel", "status", "idempotency_key", "next_attempt_at",
+                     "retry_count", "delivery_data", "created_at", "updated_at"],
+                    select(
+                        Notification.id,
+                        literal(channel),
+                        literal(NotificationStatus.PENDING.value),
+                        Notification.notification_uuid + f":{channel}",
+                        literal(now),
+                        literal(0),
+                        literal({}, JSON),
+                        literal(now),
+                        literal(now)
+                    ).where(Notification.id.in_(notification_ids))
+                )
+            )
+
+        await session.execute(
+            update(NotificationBroadcastRecipient)
+            .where(NotificationBroadcastRecipient.id.in_([recipient_id for recipient_id, _ in recipients]))
+            .values(status=RECIPIENT_SENT)
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            update(NotificationBroadcast)
+            .where(NotificationBroadcast.id == broadcast_id)
+            .values(processed_recipients=NotificationBroadcast.processed_recipients + len(recipients))
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        await publish_push_event(broadcast_event(
+            broadcast, {user_id: notification_id for notification_id, user_id in created}, now
+        ))
+        return len(recipients)
+
+    async def complete(self, session: AsyncSession, broadcast_id: int, now: Optional[datetime] = None) -> bool:
+        """Завершение рассылки, если необработанных получателей не осталось"""
+        remaining = exists().where(
+            NotificationBroadcastRecipient.broadcast_id == broadcast_id,
+            NotificationBroadcastRecipient.status == RECIPIENT_PENDING
+        )
+        result = await session.execute(
+            update(NotificationBroadcast)
+            .where(
+                NotificationBroadcast.id == broadcast_id,
+                NotificationBroadcast.status != BROADCAST_COMPLETED,
+                ~remaining
+            )
+            .values(status=BROADCAST_COMPLETED, completed_at=now or datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        return bool(result.rowcount)
+
+    async def deliver(self, broadcast_id: int) -> int:
+        """Все пачки рассылки, до concurrency параллельно; возвращает число обработанных получателей"""
+        async with get_db_helper().get_session() as session:
+            await session.execute(
+                update(NotificationBroadcast)
+                .where(NotificationBroadcast.id == broadcast_id, NotificationBroadcast.status == BROADCAST_PENDING)
+                .values(status=BROADCAST_SENDING, started_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+        async def lane() -> int:
+            processed = 0
+            set_query_origin("notification_broadcast")
+            while True:
+                try:
+                    async with get_db_helper().get_session() as session:
+                        count = await self.deliver_chunk(session, broadcast_id)
+                except Exception as e:
+                    # Пачка откатилась, получатели будут выбраны при следующем проходе
+                    logger.error(f"Notification broadcast {broadcast_id} chunk failed: {e}")
+                    return processed
+                if not count:
+                    return processed
+                processed += count
+
+        processed = sum(await asyncio.gather(*(lane() for _ in range(self.concurrency))))
+        async with get_db_helper().get_session() as session:
+            if await self.complete(session, broadcast_id):
+                logger.info(f"Notification broadcast {broadcast_id} completed")
+        return processed
+
+    async def run_once(self) -> int:
+        async with get_db_helper().get_session() as session:
+            broadcast_ids = list((await session.scalars(
+                select(NotificationBroadcast.id)
+                .where(NotificationBroadcast.status.in_([BROADCAST_PENDING, BROADCAST_SENDING]))
+                .order_by(NotificationBroadcast.id)
+            )).all())
+        processed = 0
+        for broadcast_id in broadcast_ids:
+            processed += await self.deliver(broadcast_id)
+        return processed
+
+    async def run(self):
+        self.is_running = True
+        logger.info(f"Starting notification broadcast worker (concurrency {self.concurrency})")
+        try:
+            while self.is_running:
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    logger.error(f"Notification broadcast worker error: {e}")
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            self.is_running = False
+
+
+# Глобальный экземпляр
+broadcast_worker = BroadcastWorker()
+
+
+__all__ = [
+    "AUDIENCE_COLUMNS",
+    "BROADCAST_ENTITY_TYPE",
+    "BroadcastWorker",
+    "broadcast_event",
+    "audience_organization_id",
+    "broadcast_worker",
+    "create_broadcast",
+    "get_broadcast",
+]
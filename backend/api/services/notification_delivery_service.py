@@ -0,0 +1,449 @@
+"""
+Доставка уведомлений из очереди исходящих
+
+Создание уведомления только записывает его и по одной записи
+NotificationDelivery на канал (очередь исходящих) в той же транзакции -
+вызывающий код не ждет SMTP и webhook'ов. Обработчики каналов
+(run_notification_worker.py) выбирают записи с наступившим next_attempt_at
+через FOR UPDATE SKIP LOCKED, арендуют их на worker_lease_seconds и
+доставляют с ограниченным параллелизмом.
+
+Неудачная попытка откладывает запись с экспоненциальной задержкой и
+случайной составляющей (повторы разных записей не совпадают по времени);
+после max_attempts попыток или при постоянной ошибке запись переходит в
+dead letter и ждет ручного повтора. Получатель видит ключ идемпотентности
+записи (заголовок Idempotency-Key для webhook'ов), поэтому повтор после
+неясного исхода не приводит к двойной обработке.
+"""
+
+import asyncio
+import base64
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+
+from backend.api.configuration.metrics import NOTIFICATION_DELIVERIES
+from backend.api.configuration.webhook_client import CircuitOpenError, WebhookClientOverloaded, webhook_client
+from core.database import get_db_helper
+from core.database.models.notification_model import (
+    Notification, NotificationChannel, NotificationDelivery, NotificationStatus, NotificationWebhook
+)
+from core.database.slow_queries import set_query_origin
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Ответы webhook'а, после которых повтор имеет смысл
+RETRYABLE_HTTP_STATUSES = {408, 425, 429}
+
+DeliverySender = Callable[[AsyncSession, Notification, NotificationDelivery], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class PermanentDeliveryError(Exception):
+    """Ошибка, которую повтор не исправит (неверный адрес, отказ 4xx): запись сразу в dead letter"""
+
+
+def _value(value: Any) -> str:
+    return value.value if hasattr(value, "value") else str(value)
+
+
+def delivery_idempotency_key(notification: Notification, channel: str) -> str:
+    return f"{notification.notification_uuid}:{_value(channel)}"
+
+
+def retry_delay(attempt: int, base: float, cap: float, rng: Callable[[], float] = random.random) -> float:
+    """Задержка перед попыткой attempt + 1: половина экспоненты фиксирована, половина случайна"""
+    delay = min(cap, base * 2 ** max(attempt - 1, 0))
+    return delay / 2 + rng() * delay / 2
+
+
+# ---------------------------------------------------------------- channels
+
+CHANNEL_SENDERS: Dict[str, DeliverySender] = {}
+
+
+def register_channel_sender(channel: str):
+    """Регистрация отправителя канала; возвращенный словарь сохраняется в delivery_data"""
+    def decorator(sender: DeliverySender) -> DeliverySender:
+        CHANNEL_SENDERS[_value(channel)] = sender
+        return sender
+    return decorator
+
+
+@register_channel_sender(NotificationChannel.IN_APP)
+async def _send_in_app(session: AsyncSession, notification: Notification, delivery: NotificationDelivery):
+    # Внутренние уведомления читаются из таблицы notifications
+    return None
+
+
+@register_channel_sender(NotificationChannel.EMAIL)
+async def _send_email(session: AsyncSession, notification: Notification, delivery: NotificationDelivery):
+    # TODO: Интеграция с email сервисом
+    return None
+
+
+@register_channel_sender(NotificationChannel.SMS)
+async def _send_sms(session: AsyncSession, notification: Notification, delivery: NotificationDelivery):
+    # TODO: Интеграция с SMS сервисом
+    return None
+
+
+@register_channel_sender(NotificationChannel.PUSH)
+async def _send_push(session: AsyncSession, notification: Notification, delivery: NotificationDelivery):
+    # TODO: Интеграция с push сервисом
+    return None
+
+
+def _webhook_matches(webhook: NotificationWebhook, notification: Notification) -> bool:
+    types = webhook.notification_types or []
+    priorities = webhook.notification_priorities or []
+    return ((not types or _value(notification.notification_type) in types)
+            and (not priorities or _value(notification.priority) in priorities))
+
+
+def _webhook_payload(notification: Notification) -> Dict[str, Any]:
+    return {
+        "notification_id": notification.notification_uuid,
+        "type": _value(notification.notification_type),
+        "title": notification.title,
+        "message": notification.message,
+        "priority": _value(notification.priority),
+        "recipient_id": notification.recipient_id,
+        "created_at": notification.created_at.isoformat() if notification.created_at else None,
+        "metadata": notification.notification_metadata or {},
+    }
+
+
+def _webhook_headers(webhook: NotificationWebhook, idempotency_key: str) -> Dict[str, str]:
+    headers = dict(webhook.headers or {})
+    headers["Idempotency-Key"] = idempotency_key
+    credentials = webhook.auth_credentials or {}
+    if webhook.auth_type == "bearer" and credentials:
+        headers["Authorization"] = f"Bearer {credentials.get('token', '')}"
+    elif webhook.auth_type == "basic" and credentials:
+        auth_str = f"{credentials.get('username', '')}:{credentials.get('password', '')}"
+        headers["Authorization"] = f"Basic {base64.b64encode(auth_str.encode()).decode()}"
+    return headers
+
+
+@register_channel_sender(NotificationChannel.WEBHOOK)
+async def _send_webhooks(session: AsyncSession, notification: Notification, delivery: NotificationDelivery):
+    """Вызов подходящих webhook'ов; успешно вызванные при повторе пропускаются"""
+    result = await session.execute(select(NotificationWebhook).where(NotificationWebhook.is_active == True))
+    webhooks = [webhook for webhook in result.scalars().all() if _webhook_matches(webhook, notification)]
+
+    data = dict(delivery.delivery_data or {})
+    done = set(data.get("webhooks_delivered", []))
+    payload = _webhook_payload(notification)
+    errors = []
+    permanent = True
+    for webhook in webhooks:
+        if webhook.webhook_uuid in done:
+            continue
+        try:
+            response = await webhook_client.request(
+                webhook.method,
+                webhook.url,
+                json_body=payload,
+                headers=_webhook_headers(webhook, delivery.idempotency_key),
+                secret=webhook.signing_secret,
+                read_timeout=webhook.timeout_seconds
+            )
+            status = response.status_code
+        except (CircuitOpenError, WebhookClientOverloaded) as e:
+            # Вызова не было - повтор позже
+            errors.append(f"{webhook.name}: {str(e) or type(e).__name__}")
+            permanent = False
+            continue
+        except Exception as e:
+            webhook.total_calls += 1
+            webhook.failed_calls += 1
+            webhook.last_called_at = datetime.utcnow()
+            errors.append(f"{webhook.name}: {str(e) or type(e).__name__}")
+            permanent = False
+            continue
+        webhook.total_calls += 1
+        webhook.last_called_at = datetime.utcnow()
+        if status < 400:
+            webhook.successful_calls += 1
+            done.add(webhook.webhook_uuid)
+        else:
+            webhook.failed_calls += 1
+            errors.append(f"{webhook.name}: HTTP {status}")
+            if status >= 500 or status in RETRYABLE_HTTP_STATUSES:
+                permanent = False
+
+    data["webhooks_delivered"] = sorted(done)
+    delivery.delivery_data = data
+    if errors:
+        message = "; ".join(errors)
+        raise PermanentDeliveryError(message) if permanent else RuntimeError(message)
+    return data
+
+
+# ---------------------------------------------------------------- outbox
+
+class NotificationOutbox:
+    """Операции очереди исходящих"""
+
+    def __init__(
+        self,
+        max_attempts: Optional[int] = None,
+        retry_base: Optional[float] = None,
+        retry_max: Optional[float] = None,
+        lease_seconds: Optional[int] = None,
+        senders: Optional[Dict[str, DeliverySender]] = None,
+    ):
+        config = settings.notifications
+        self.max_attempts = max_attempts or config.max_attempts
+        self.retry_base = config.retry_base_seconds if retry_base is None else retry_base
+        self.retry_max = config.retry_max_seconds if retry_max is None else retry_max
+        self.lease_seconds = lease_seconds or config.worker_lease_seconds
+        self.senders = CHANNEL_SENDERS if senders is None else senders
+
+    async def claim(self, session: AsyncSession, channel: str, limit: int,
+                    now: Optional[datetime] = None) -> List[int]:
+        """Аренда записей канала с наступившим временем попытки; другие обработчики их пропустят"""
+        now = now or datetime.utcnow()
+        ids = list((await session.scalars(
+            select(NotificationDelivery.id)
+            .where(
+                NotificationDelivery.channel == _value(channel),
+                NotificationDelivery.status == NotificationStatus.PENDING.value,
+                NotificationDelivery.next_attempt_at <= now,
+                or_(NotificationDelivery.locked_until.is_(None), NotificationDelivery.locked_until < now)
+            )
+            .order_by(NotificationDelivery.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )).all())
+        if ids:
+            await session.execute(
+                update(NotificationDelivery)
+                .where(NotificationDelivery.id.in_(ids))
+                .values(locked_until=now + timedelta(seconds=self.lease_seconds))
+            )
+        await session.commit()
+        return ids
+
+    async def deliver(self, session: AsyncSession, delivery_id: int) -> Optional[str]:
+        """Одна попытка доставки арендованной записи; возвращает итог попытки"""
+        delivery = await session.get(NotificationDelivery, delivery_id)
+        if delivery is None or _value(delivery.status) != NotificationStatus.PENDING.value:
+            return None
+        notification = await self._load_notification(session, delivery.notification_id)
+        channel = _value(delivery.channel)
+        now = datetime.utcnow()
+
+        if notification.expires_at and notification.expires_at <= now:
+            delivery.status = NotificationStatus.EXPIRED.value
+            delivery.locked_until = None
+            await session.commit()
+            return self._count(channel, "expired")
+
+        sender = self.senders.get(channel)
+        delivery.retry_count = (delivery.retry_count or 0) + 1
+        delivery.last_attempt_at = now
+        delivery.locked_until = None
+        try:
+            if sender is None:
+                raise PermanentDeliveryError(f"No sender for channel {channel}")
+            data = await sender(session, notification, delivery)
+        except PermanentDeliveryError as e:
+            outcome = await self._dead_letter(session, delivery, str(e))
+        except Exception as e:
+            if delivery.retry_count >= self.max_attempts:
+                outcome = await self._dead_letter(session, delivery, str(e))
+            else:
+                delay = retry_delay(delivery.retry_count, self.retry_base, self.retry_max)
+                delivery.error_message = str(e)[:2000]
+                delivery.next_attempt_at = now + timedelta(seconds=delay)
+                logger.warning(f"Notification delivery {delivery.idempotency_key} attempt "
+                               f"{delivery.retry_count} failed, retry in {delay:.0f}s: {e}")
+                outcome = "retry"
+        else:
+            if data is not None:
+                delivery.delivery_data = data
+            delivery.status = NotificationStatus.DELIVERED.value
+            delivery.error_message = None
+            delivery.sent_at = delivery.delivered_at = now
+            await self._mark_delivered(session, delivery.notification_id, channel, now)
+            outcome = "delivered"
+        await session.commit()
+        return self._count(channel, outcome)
+
+    async def _load_notification(self, session: AsyncSession, notification_id: int,
+                                 lock: bool = False) -> Notification:
+        # Без связанных объектов: отношения recipient и template загружаются JOIN'ом
+        query = select(Notification).where(Notification.id == notification_id).options(raiseload("*"))
+        if lock:
+            query = query.with_for_update().execution_options(populate_existing=True)
+        return await session.scalar(query)
+
+    async def _mark_delivered(self, session: AsyncSession, notification_id: int, channel: str, now: datetime):
+        # Каналы одного уведомления доставляются параллельно - итог пишется под блокировкой строки
+        notification = await self._load_notification(session, notification_id, lock=True)
+        delivered = list(notification.delivered_channels or [])
+        if channel not in delivered:
+            notification.delivered_channels = delivered + [channel]
+        notification.sent_at = notification.sent_at or now
+        notification.delivered_at = notification.delivered_at or now
+        if _value(notification.status) != NotificationStatus.READ.value:
+            notification.status = NotificationStatus.DELIVERED.value
+
+    async def _dead_letter(self, session: AsyncSession, delivery: NotificationDelivery, error: str) -> str:
+        delivery.status = NotificationStatus.DEAD_LETTER.value
+        delivery.error_message = error[:2000]
+        delivery.dead_lettered_at = datetime.utcnow()
+        notification = await self._load_notification(session, delivery.notification_id, lock=True)
+        if not notification.delivered_channels and _value(notification.status) == NotificationStatus.PENDING.value:
+            notification.status = NotificationStatus.FAILED.value
+        logger.error(f"Notification delivery {delivery.idempotency_key} dead-lettered after "
+                     f"{delivery.retry_count} attempts: {error}")
+        return "dead_letter"
+
+    @staticmethod
+    def _count(channel: str, outcome: str) -> str:
+        NOTIFICATION_DELIVERIES.labels(channel, outcome).inc()
+        return outcome
+
+    async def list_dead_letters(self, session: AsyncSession, channel: Optional[str] = None,
+                                limit: int = 100) -> List[NotificationDelivery]:
+        query = select(NotificationDelivery).where(
+            NotificationDelivery.status == NotificationStatus.DEAD_LETTER.value
+        )
+        if channel:
+            query = query.where(NotificationDelivery.channel == _value(channel))
+        result = await session.execute(query.order_by(NotificationDelivery.dead_lettered_at.desc()).limit(limit))
+        return list(result.scalars().all())
+
+    async def requeue(self, session: AsyncSession, delivery_ids: Optional[List[int]] = None,
+                      channel: Optional[str] = None) -> int:
+        """Повторная постановка записей dead letter в очередь со сбросом счетчика попыток"""
+        conditions = [NotificationDelivery.status == NotificationStatus.DEAD_LETTER.value]
+        if delivery_ids is not None:
+            conditions.append(NotificationDelivery.id.in_(delivery_ids))
+        if channel:
+            conditions.append(NotificationDelivery.channel == _value(channel))
+        result = await session.execute(
+            update(NotificationDelivery)
+            .where(and_(*conditions))
+            .values(
+                status=NotificationStatus.PENDING.value,
+                retry_count=0,
+                next_attempt_at=datetime.utcnow(),
+                locked_until=None,
+                dead_lettered_at=None
+            )
+        )
+        await session.commit()
+        return result.rowcount
+
+
+class NotificationDeliveryWorker:
+    """Обработчик очереди исходящих одного канала"""
+
+    def __init__(self, channel: str, outbox: Optional[NotificationOutbox] = None,
+                 concurrency: Optional[int] = None, batch_size: Optional[int] = None,
+                 poll_interval: Optional[float] = None):
+        config = settings.notifications
+        self.channel = _value(channel)
+        self.outbox = outbox or NotificationOutbox()
+        self.concurrency = concurrency or config.worker_concurrency
+        self.batch_size = batch_size or config.worker_batch_size
+        self.poll_interval = config.worker_poll_interval_seconds if poll_interval is None else poll_interval
+        self.is_running = False
+
+    async def run_once(self) -> int:
+        """Одна выборка: аренда пакета и доставка с ограниченным параллелизмом"""
+        async with get_db_helper().get_session() as session:
+            ids = await self.outbox.claim(session, self.channel, self.batch_size)
+        if not ids:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(delivery_id: int):
+            async with semaphore:
+                set_query_origin(f"notification_delivery:{self.channel}")
+                try:
+                    async with get_db_helper().get_session() as session:
+                        await self.outbox.deliver(session, delivery_id)
+                except Exception as e:
+                    # Аренда истечет, и запись будет выбрана снова
+                    logger.error(f"Notification delivery {delivery_id} crashed: {e}")
+
+        await asyncio.gather(*(deliver(delivery_id) for delivery_id in ids))
+        return len(ids)
+
+    async def run(self):
+        self.is_running = True
+        logger.info(f"Starting notification worker for channel {self.channel} (concurrency {self.concurrency})")
+        try:
+            while self.is_running:
+                try:
+                    processed = await self.run_once()
+                except Exception as e:
+                    logger.error(f"Notification worker {self.channel} error: {e}")
+                    processed = 0
+                # Полный пакет - за очередью есть еще записи, ждать не нужно
+                if processed < self.batch_size:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            self.is_running = False
+
+
+# Глобальные экземпляры
+notification_outbox = NotificationOutbox()
+notification_workers: List[NotificationDeliveryWorker] = []
+
+
+async def start_notification_workers():
+    """Запуск обработчиков всех каналов из настроек, рассылок, планировщика сводок и обслуживания таблицы"""
+    from backend.api.services.notification_broadcast_service import broadcast_worker
+    from backend.api.services.notification_digest_service import digest_scheduler
+    from backend.api.services.notification_retention_service import notification_retention
+
+    notification_workers[:] = [
+        NotificationDeliveryWorker(channel, outbox=notification_outbox)
+        for channel in settings.notifications.channels
+    ]
+    runners = [worker.run() for worker in notification_workers]
+    if settings.notifications.broadcast_enabled:
+        runners.append(broadcast_worker.run())
+    if settings.notifications.digest_enabled:
+        runners.append(digest_scheduler.run())
+    if settings.notifications.retention_enabled:
+        runners.append(notification_retention.run())
+    await asyncio.gather(*runners)
+
+
+async def stop_notification_workers():
+    from backend.api.services.notification_broadcast_service import broadcast_worker
+    from backend.api.services.notification_digest_service import digest_scheduler
+    from backend.api.services.notification_retention_service import notification_retention
+
+    for worker in notification_workers:
+        worker.is_running = False
+    broadcast_worker.is_running = False
+    digest_scheduler.is_running = False
+    notification_retention.is_running = False
+    logger.info("Stopping notification workers")
+
+
+__all__ = [
+    "CHANNEL_SENDERS",
+    "NotificationDeliveryWorker",
+    "NotificationOutbox",
+    "PermanentDeliveryError",
+    "delivery_idempotency_key",
+    "notification_outbox",
+    "register_channel_sender",
+    "retry_delay",
+    "start_notification_workers",
+    "stop_notification_workers",
+]
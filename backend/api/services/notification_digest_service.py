@@ -0,0 +1,252 @@
+"""
+Сводки уведомлений (NotificationBatch)
+
+Если пользователь включил batch_notifications для типа уведомлений,
+уведомления невысокого приоритета по каналам из digest_channels не
+доставляются по одному: запись доставки получает статус batched и ссылку
+на открытую сводку пользователя для этого типа и канала. Сводка
+открывается первым уведомлением и закрывается через batch_interval_minutes
+из настроек пользователя.
+
+Планировщик (в процессе обработчиков уведомлений) выбирает сводки с
+наступившим scheduled_at через FOR UPDATE SKIP LOCKED и в той же
+транзакции ставит в очередь исходящих одно уведомление с объединенным
+текстом. Добавление в сводку увеличивает счетчик условным UPDATE ... WHERE
+status = 'pending': строка сводки заблокирована до конца транзакции
+добавления, поэтому планировщик не закроет сводку, в которую еще пишут,
+а добавление в уже закрытую сводку откроет новую.
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+
+from sqlalchemy import case, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+
+from backend.api.services.notification_delivery_service import delivery_idempotency_key
+from core.database import get_db_helper
+from core.database.models.notification_model import (
+    DIGEST_ENTITY_TYPE, Notification, NotificationBatch, NotificationDelivery, NotificationPriority,
+    NotificationStatus
+)
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+BATCH_PENDING = "pending"
+BATCH_SENT = "sent"
+
+
+def _value(value) -> str:
+    return value.value if hasattr(value, "value") else str(value)
+
+
+async def _open_batch_id(session: AsyncSession, user_id: int, notification_type: str, channel: str,
+                         not_before: Optional[datetime] = None) -> Optional[int]:
+    """Увеличение счетчика открытой сводки; None - открытой сводки нет.
+
+    not_before (тихие часы, отложенное уведомление) сдвигает отправку сводки не раньше этого времени.
+    """
+    batch_id = await session.scalar(
+        select(NotificationBatch.id).where(
+            NotificationBatch.user_id == user_id,
+            NotificationBatch.notification_type == notification_type,
+            NotificationBatch.channel == channel,
+            NotificationBatch.status == BATCH_PENDING
+        )
+    )
+    if batch_id is None:
+        return None
+    values = {"notifications_count": NotificationBatch.notifications_count + 1}
+    if not_before is not None:
+        values["scheduled_at"] = case(
+            (NotificationBatch.scheduled_at < not_before, not_before), else_=NotificationBatch.scheduled_at
+        )
+    result = await session.execute(
+        update(NotificationBatch)
+        .where(NotificationBatch.id == batch_id, NotificationBatch.status == BATCH_PENDING)
+        .values(**values)
+    )
+    return batch_id if result.rowcount else None
+
+
+async def add_to_digest(
+    session: AsyncSession,
+    notification: Notification,
+    channel: str,
+    interval_minutes: int,
+    not_before: Optional[datetime] = None
+) -> int:
+    """Запись доставки канала в открытую сводку (или в новую); возвращает id сводки"""
+    notification_type = _value(notification.notification_type)
+    batch_id = await _open_batch_id(session, notification.recipient_id, notification_type, channel, not_before)
+    if batch_id is None:
+        scheduled_at = notification.created_at + timedelta(minutes=max(interval_minutes, 1))
+        batch = NotificationBatch(
+            batch_uuid=str(uuid.uuid4()),
+            user_id=notification.recipient_id,
+            notification_type=notification_type,
+            channel=channel,
+            status=BATCH_PENDING,
+            notifications_count=1,
+            summary_title="",
+            summary_message="",
+            scheduled_at=max(scheduled_at, not_before or scheduled_at),
+            created_at=notification.created_at
+        )
+        try:
+            async with session.begin_nested():
+                session.add(batch)
+            batch_id = batch.id
+        except IntegrityError:
+            # Параллельное добавление открыло сводку раньше
+            batch_id = await _open_batch_id(session, notification.recipient_id, notification_type, channel,
+                                            not_before)
+            if batch_id is None:
+                raise
+
+    session.add(NotificationDelivery(
+        notification_id=notification.id,
+        channel=channel,
+        status=NotificationStatus.BATCHED.value,
+        idempotency_key=delivery_idempotency_key(notification, channel),
+        next_attempt_at=notification.created_at,
+        retry_count=0,
+        delivery_data={},
+        batch_id=batch_id
+    ))
+    return batch_id
+
+
+def render_digest(items: Sequence[Notification], max_items: int) -> tuple:
+    """Заголовок и текст сводки: новые уведомления сверху, не больше max_items строк"""
+    title = f"Сводка уведомлений: {len(items)}"
+    lines = [f"- {item.title}: {item.message}" for item in list(reversed(items))[:max_items]]
+    if len(items) > max_items:
+        lines.append(f"... и еще {len(items) - max_items}")
+    return title, "\n".join(lines)
+
+
+class DigestScheduler:
+    """Закрытие сводок с наступившим временем отправки"""
+
+    def __init__(self, batch_size: Optional[int] = None, poll_interval: Optional[float] = None,
+                 max_items: Optional[int] = None):
+        config = settings.notifications
+        self.batch_size = batch_size or config.digest_claim_batch_size
+        self.poll_interval = config.digest_poll_interval_seconds if poll_interval is None else poll_interval
+        self.max_items = max_items or config.digest_max_items
+        self.is_running = False
+
+    async def run_once(self, session: AsyncSession, now: Optional[datetime] = None) -> int:
+        """Отправка пакета наступивших сводок одной транзакцией; возвращает число сводок"""
+        now = now or datetime.utcnow()
+        batches = list((await session.scalars(
+            select(NotificationBatch)
+            .where(NotificationBatch.status == BATCH_PENDING, NotificationBatch.scheduled_at <= now)
+            .order_by(NotificationBatch.scheduled_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )).all())
+        # Сводка не публикуется в push: в ленте уже есть входящие в нее уведомления
+        for batch in batches:
+            await self._send(session, batch, now)
+        await session.commit()
+        return len(batches)
+
+    async def _send(self, session: AsyncSession, batch: NotificationBatch, now: datetime) -> Optional[Notification]:
+        items: List[Notification] = list((await session.scalars(
+            select(Notification)
+            .join(NotificationDelivery, NotificationDelivery.notification_id == Notification.id)
+            .where(NotificationDelivery.batch_id == batch.id)
+            .order_by(Notification.created_at, Notification.id)
+            .options(raiseload("*"))
+        )).unique().all())
+        title, message = render_digest(items, self.max_items)
+
+        batch.status = BATCH_SENT
+        batch.sent_at = now
+        batch.notifications_count = len(items)
+        batch.summary_title = title
+        batch.summary_message = message
+        if not items:
+            return None
+
+        digest = Notification(
+            notification_uuid=str(uuid.uuid4()),
+            idempotency_key=f"digest:{batch.batch_uuid}",
+            recipient_id=batch.user_id,
+            notification_type=batch.notification_type,
+            title=title,
+            message=message,
+            priority=NotificationPriority.LOW.value,
+            status=NotificationStatus.PENDING.value,
+            channels=[batch.channel],
+            delivered_channels=[],
+            related_entity_type=DIGEST_ENTITY_TYPE,
+            related_entity_id=batch.id,
+            variables={},
+            notification_metadata={"notification_ids": [item.id for item in items]},
+            created_at=now
+        )
+        session.add(digest)
+        await session.flush()
+        session.add(NotificationDelivery(
+            notification_id=digest.id,
+            channel=batch.channel,
+            status=NotificationStatus.PENDING.value,
+            idempotency_key=delivery_idempotency_key(digest, batch.channel),
+            next_attempt_at=now,
+            retry_count=0,
+            delivery_data={}
+        ))
+        # Отдельные записи переданы в сводку: дальше за доставку отвечает запись сводки
+        await session.execute(
+            update(NotificationDelivery)
+            .where(NotificationDelivery.batch_id == batch.id)
+            .values(status=NotificationStatus.DELIVERED.value, sent_at=now,
+                    delivery_data={"batch_uuid": batch.batch_uuid})
+        )
+        for item in items:
+            if batch.channel not in (item.delivered_channels or []):
+                item.delivered_channels = list(item.delivered_channels or []) + [batch.channel]
+            if _value(item.status) == NotificationStatus.PENDING.value:
+                item.status = NotificationStatus.DELIVERED.value
+                item.delivered_at = now
+        logger.info(f"Digest {batch.batch_uuid} of {len(items)} notifications queued for "
+                    f"user {batch.user_id} via {batch.channel}")
+        return digest
+
+    async def run(self):
+        self.is_running = True
+        logger.info("Starting notification digest scheduler")
+        try:
+            while self.is_running:
+                try:
+                    async with get_db_helper().get_session() as session:
+                        processed = await self.run_once(session)
+                except Exception as e:
+                    logger.error(f"Digest scheduler error: {e}")
+                    processed = 0
+                if processed < self.batch_size:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            self.is_running = False
+
+
+# Глобальный экземпляр
+digest_scheduler = DigestScheduler()
+
+
+__all__ = [
+    "DIGEST_ENTITY_TYPE",
+    "DigestScheduler",
+    "add_to_digest",
+    "digest_scheduler",
+    "render_digest",
+]
@@ -0,0 +1,230 @@
+"""
+Push уведомлений в реальном времени (WebSocket)
+
+Изменения ленты пользователя (новое уведомление, изменение числа
+непрочитанных) публикуются в fanout-обменник RabbitMQ после коммита. Один
+подписчик на процесс API раскладывает события по локальным очередям
+WebSocket-соединений получателя, поэтому клиент получает событие
+независимо от того, какой воркер или обработчик его породил. Рассылка
+публикует одно событие на пачку получателей (recipients: id пользователя ->
+id уведомления), а не по событию на пользователя.
+
+Событие уведомления несет его id (event id). После переподключения клиент
+передает last_event_id и получает пропущенные уведомления из таблицы;
+затем - снимок числа непрочитанных, дальше - только приращения. События
+живого потока для уведомлений, уже учтенных при подключении, отбрасываются
+по множеству их id: id выдаются при вставке, а коммиты идут в другом
+порядке, поэтому сравнение с максимальным id теряло бы уведомления.
+
+Запросы API публикуют события после коммита фоновой задачей
+(schedule_push_event) и не ждут брокер.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, or_, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import raiseload
+
+from backend.api.configuration.rabbitmq_server import rabbit
+from core.database.models.notification_model import DIGEST_ENTITY_TYPE, Notification
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Очередь клиента переполнена или пропущено больше push_replay_limit: клиент перечитывает ленту
+RESYNC_EVENT = {"type": "resync"}
+
+
+def _value(value: Any) -> Any:
+    if hasattr(value, "value"):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def in_feed():
+    """Условие ленты пользователя: без уведомлений-сводок"""
+    return or_(Notification.related_entity_type.is_(None), Notification.related_entity_type != DIGEST_ENTITY_TYPE)
+
+
+def notification_event(notification: Notification) -> Dict[str, Any]:
+    """Событие нового уведомления (уже сериализуемое в JSON)"""
+    return {
+        "type": "notification",
+        "user_id": notification.recipient_id,
+        "id": notification.id,
+        "unread_delta": 1,
+        "notification": {
+            field: _value(getattr(notification, field))
+            for field in ("id", "notification_uuid", "notification_type", "title", "message", "priority",
+                          "status", "related_entity_type", "related_entity_id", "created_at")
+        },
+    }
+
+
+def unread_event(user_id: int, delta: int) -> Dict[str, Any]:
+    return {"type": "unread", "user_id": user_id, "delta": delta}
+
+
+class NotificationPushHub:
+    """Доставка событий подписчикам (WebSocket) текущего процесса"""
+
+    def __init__(self, queue_size: Optional[int] = None):
+        self.queue_size = queue_size or settings.notifications.push_queue_size
+        self.subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self.is_running = False
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self.subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[user_id]
+
+    async def dispatch(self, event: Dict[str, Any]):
+        recipients = event.get("recipients")
+        if recipients is None:
+            self._put(event.get("user_id"), event)
+            return
+        # Событие рассылки: одно на пачку получателей, раскладывается по подключенным к процессу
+        for user_id in [user_id for user_id in self.subscribers if str(user_id) in recipients]:
+            notification_id = recipients[str(user_id)]
+            self._put(user_id, {
+                "type": event["type"],
+                "user_id": user_id,
+                "id": notification_id,
+                "unread_delta": event["unread_delta"],
+                "notification": {**event["notification"], "id": notification_id},
+            })
+
+    def _put(self, user_id: Optional[int], event: Dict[str, Any]):
+        for queue in list(self.subscribers.get(user_id, ())):
+            if queue.full():
+                # Медленный клиент: пропущенное он перечитает по resync, а не получит с дырами
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_EVENT)
+                continue
+            queue.put_nowait(event)
+
+    async def start(self):
+        """Подписка процесса на события уведомлений (выполняется до остановки)"""
+        self.is_running = True
+        try:
+            await rabbit.subscribe_events(settings.notifications.push_events_exchange, self.dispatch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Клиенты получат изменения при следующем переподключении (replay по last_event_id)
+            logger.error(f"Notification push subscription failed: {e}")
+        finally:
+            self.is_running = False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self.subscribers),
+            "connections": sum(len(queues) for queues in self.subscribers.values()),
+        }
+
+
+async def publish_push_event(event: Dict[str, Any]):
+    """Рассылка события во все процессы API"""
+    try:
+        await rabbit.publish_event(settings.notifications.push_events_exchange, event)
+    except Exception as e:
+        logger.warning(f"Failed to publish notification push event for user {event.get('user_id')}: {e}")
+        # Без брокера доставляем хотя бы подписчикам этого процесса
+        await notification_push_hub.dispatch(event)
+
+
+_pending_events: Set[asyncio.Task] = set()
+
+
+def schedule_push_event(event: Dict[str, Any]):
+    """Публикация после коммита без ожидания брокера в запросе"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    task = loop.create_task(publish_push_event(event))
+    _pending_events.add(task)
+    task.add_done_callback(_pending_events.discard)
+
+
+async def flush_push_events():
+    """Ожидание событий, публикуемых фоном (остановка процесса)"""
+    if _pending_events:
+        await asyncio.gather(*list(_pending_events), return_exceptions=True)
+
+
+async def resume_state(
+    session: AsyncSession,
+    user_id: int,
+    last_event_id: Optional[int] = None,
+    limit: Optional[int] = None
+) -> Tuple[Set[int], List[Dict[str, Any]], bool, int]:
+    """Состояние для нового соединения: (учтенные id, пропущенные события, полнота, непрочитанные).
+
+    Последние limit + 1 уведомлений ленты (после last_event_id, если он
+    передан) и снимок непрочитанных читаются одним запросом, то есть из
+    одного снимка БД: уведомление либо учтено в обоих, либо ни в одном.
+    Учтенные id - те, что клиент уже видит (пропущенные отдаются, без
+    last_event_id клиент читает ленту сам); их события из живого потока
+    отбрасываются. Если пропущено больше limit, события не отдаются
+    (complete=False): клиент перечитывает ленту.
+    """
+    limit = limit or settings.notifications.push_replay_limit
+    recent = (
+        select(Notification.id)
+        .where(Notification.recipient_id == user_id, Notification.id > (last_event_id or 0), in_feed())
+        .order_by(Notification.id.desc())
+        .limit(limit + 1)
+        .subquery()
+    )
+    unread = (
+        select(func.count(Notification.id).label("unread"))
+        .where(Notification.recipient_id == user_id, Notification.read_at.is_(None), in_feed())
+        .subquery()
+    )
+    rows = (await session.execute(
+        select(unread.c.unread, recent.c.id).select_from(unread.outerjoin(recent, true()))
+    )).all()
+    unread_count = rows[0].unread if rows else 0
+    seen = {row.id for row in rows if row.id is not None}
+
+    missed: List[Dict[str, Any]] = []
+    complete = last_event_id is None or len(seen) <= limit
+    if last_event_id is not None and seen and complete:
+        missed = [notification_event(row) for row in (await session.scalars(
+            select(Notification).where(Notification.id.in_(seen)).order_by(Notification.id).options(raiseload("*"))
+        )).all()]
+    return seen, missed, complete, unread_count
+
+
+# Глобальный экземпляр
+notification_push_hub = NotificationPushHub()
+
+
+__all__ = [
+    "NotificationPushHub",
+    "RESYNC_EVENT",
+    "flush_push_events",
+    "in_feed",
+    "notification_event",
+    "notification_push_hub",
+    "publish_push_event",
+    "resume_state",
+    "schedule_push_event",
+    "unread_event",
+]
@@ -0,0 +1,136 @@
+"""
+Обслуживание таблицы уведомлений
+
+Истекшие уведомления (expires_at в прошлом) удаляются, обработанные
+уведомления старше archive_after_days переносятся в notifications_archive
+(INSERT ... SELECT) и удаляются из рабочей таблицы. Все операции идут
+пачками по retention_chunk_size id, каждая пачка - отдельной короткой
+транзакцией: блокировки не держатся на всю таблицу, а прерванный проход
+продолжается со следующего запуска.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, exists, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.database import get_db_helper
+from core.database.models.notification_model import (
+    Notification, NotificationArchive, NotificationDelivery, NotificationStatus
+)
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_COLUMNS = (
+    "id", "notification_uuid", "recipient_id", "notification_type", "title", "message", "priority", "status",
+    "channels", "delivered_channels", "related_entity_type", "related_entity_id", "notification_metadata",
+    "delivered_at", "read_at", "created_at",
+)
+
+
+async def _delete_chunk(session: AsyncSession, ids: List[int]):
+    await session.execute(
+        delete(NotificationDelivery).where(NotificationDelivery.notification_id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    await session.execute(
+        delete(Notification).where(Notification.id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+
+
+class NotificationRetention:
+    """Удаление истекших и архивирование старых уведомлений"""
+
+    def __init__(self, chunk_size: Optional[int] = None, archive_after_days: Optional[int] = None,
+                 interval: Optional[float] = None):
+        config = settings.notifications
+        self.chunk_size = chunk_size or config.retention_chunk_size
+        self.archive_after_days = archive_after_days or config.archive_after_days
+        self.interval = config.retention_interval_seconds if interval is None else interval
+        self.is_running = False
+
+    async def cleanup_expired(self, session: AsyncSession, now: Optional[datetime] = None) -> int:
+        """Удаление истекших уведомлений; возвращает число удаленных"""
+        now = now or datetime.utcnow()
+        removed = 0
+        while True:
+            ids = list((await session.scalars(
+                select(Notification.id)
+                .where(Notification.expires_at < now)
+                .order_by(Notification.id)
+                .limit(self.chunk_size)
+            )).all())
+            if not ids:
+                return removed
+            await _delete_chunk(session, ids)
+            await session.commit()
+            removed += len(ids)
+
+    async def archive_old(self, session: AsyncSession, now: Optional[datetime] = None) -> int:
+        """Перенос обработанных уведомлений старше archive_after_days в архив"""
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(days=self.archive_after_days)
+        in_queue = exists().where(
+            NotificationDelivery.notification_id == Notification.id,
+            NotificationDelivery.status.in_([NotificationStatus.PENDING.value, NotificationStatus.BATCHED.value])
+        )
+        archived = 0
+        while True:
+            ids = list((await session.scalars(
+                select(Notification.id)
+                .where(
+                    Notification.created_at < cutoff,
+                    Notification.status != NotificationStatus.PENDING.value,
+                    ~in_queue
+                )
+                .order_by(Notification.id)
+                .limit(self.chunk_size)
+            )).all())
+            if not ids:
+                return archived
+            await session.execute(
+                insert(NotificationArchive).from_select(
+                    [*ARCHIVED_COLUMNS, "archived_at"],
+                    select(*(getattr(Notification, name) for name in ARCHIVED_COLUMNS), literal(now))
+                    .where(Notification.id.in_(ids))
+                )
+            )
+            await _delete_chunk(session, ids)
+            await session.commit()
+            archived += len(ids)
+
+    async def run_once(self, session: AsyncSession, now: Optional[datetime] = None) -> tuple:
+        removed = await self.cleanup_expired(session, now)
+        archived = await self.archive_old(session, now)
+        if removed or archived:
+            logger.info(f"Notification retention: {removed} expired removed, {archived} archived")
+        return removed, archived
+
+    async def run(self):
+        self.is_running = True
+        logger.info("Starting notification retention job")
+        try:
+            while self.is_running:
+                try:
+                    async with get_db_helper().get_session() as session:
+                        await self.run_once(session)
+                except Exception as e:
+                    logger.error(f"Notification retention error: {e}")
+                await asyncio.sleep(self.interval)
+        finally:
+            self.is_running = False
+
+
+# Глобальный экземпляр
+notification_retention = NotificationRetention()
+
+
+__all__ = [
+    "NotificationRetention",
+    "notification_retention",
+]
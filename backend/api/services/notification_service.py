@@ -1,15 +1,15 @@
 """
 Сервис для единой системы уведомлений
 """
-import asyncio
-import json
 import uuid
-import aiohttp
-from datetime import datetime, timedelta
+import zlib
+from datetime import datetime, time, timedelta
 from typing import List, Optional, Dict, Any, Tuple
-from sqlalchemy import select, and_, or_, func, desc
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import select, update, delete, and_, or_, func, desc
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import raiseload
 
 from core.database.models.notification_model import (
     Notification, NotificationTemplate, NotificationDelivery, 
@@ -17,6 +17,67 @@ from core.database.models.notification_model import (
     NotificationType, NotificationPriority, NotificationStatus, NotificationChannel
 )
 from core.database.models.main_models import User
+from backend.api.services.notification_delivery_service import delivery_idempotency_key
+from backend.api.services.notification_digest_service import add_to_digest
+from backend.api.services.notification_push_service import (
+    in_feed, notification_event, schedule_push_event, unread_event
+)
+from core.settings import settings
+
+PRIORITY_RANK = {
+    NotificationPriority.LOW: 0,
+    NotificationPriority.NORMAL: 1,
+    NotificationPriority.HIGH: 2,
+    NotificationPriority.URGENT: 3,
+}
+
+
+def _parse_hh_mm(value: Optional[str]) -> Optional[time]:
+    try:
+        hours, minutes = (value or "").split(":")
+        return time(int(hours), int(minutes))
+    except ValueError:
+        return None
+
+
+def quiet_hours_end(start: Optional[str], end: Optional[str], tz_name: Optional[str],
+                    now: datetime) -> Optional[datetime]:
+    """Конец текущего окна тихих часов (UTC, без tzinfo); None - сейчас не тихие часы.
+
+    Окно задается локальным временем пользователя HH:MM и может переходить
+    через полночь (22:00-07:00).
+    """
+    start_time, end_time = _parse_hh_mm(start), _parse_hh_mm(end)
+    if start_time is None or end_time is None or start_time == end_time:
+        return None
+    utc = ZoneInfo("UTC")
+    try:
+        tz = ZoneInfo(tz_name) if tz_name else utc
+    except (ZoneInfoNotFoundError, ValueError):
+        tz = utc
+
+    local = now.replace(tzinfo=utc).astimezone(tz)
+    local_time = local.time().replace(tzinfo=None)
+    end_date = local.date()
+    if start_time < end_time:
+        if not start_time <= local_time < end_time:
+            return None
+    elif local_time >= start_time:
+        end_date += timedelta(days=1)
+    elif local_time >= end_time:
+        return None
+    return datetime.combine(end_date, end_time, tzinfo=tz).astimezone(utc).replace(tzinfo=None)
+
+
+def release_offset(recipient_id: int, spread_seconds: int) -> timedelta:
+    """Постоянный для получателя сдвиг выпуска после тихих часов.
+
+    Очередь отложенных записей после конца окна (обычно утро) выпускается
+    не одним всплеском, а равномерно по spread_seconds.
+    """
+    if spread_seconds <= 0:
+        return timedelta(0)
+    return timedelta(seconds=zlib.crc32(str(recipient_id).encode()) % spread_seconds)
 
 
 class NotificationService:
@@ -39,54 +100,86 @@ class NotificationService:
         scheduled_at: Optional[datetime] = None,
         expires_at: Optional[datetime] = None,
         variables: Optional[Dict[str, Any]] = None,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None
     ) -> Notification:
-        """Создание нового уведомления"""
+        """Создание нового уведомления.
+
+        Уведомление и записи доставки по каналам пишутся одной транзакцией;
+        доставляют их обработчики очереди исходящих (notification_delivery_service).
+        """
+        if idempotency_key:
+            existing = await self._get_by_idempotency_key(idempotency_key, recipient_id)
+            if existing is not None:
+                return existing
+        
         # Получаем настройки пользователя
         user_preferences = await self._get_user_preferences(recipient_id, notification_type)
         
         # Определяем каналы доставки
         if channels is None:
             channels = user_preferences.enabled_channels if user_preferences else [NotificationChannel.IN_APP]
+        channels = list(dict.fromkeys(getattr(channel, "value", channel) for channel in channels))
         
         # Проверяем приоритет
-        if user_preferences and priority.value < user_preferences.min_priority.value:
+        if user_preferences and PRIORITY_RANK[NotificationPriority(priority)] < \
+                PRIORITY_RANK[NotificationPriority(user_preferences.min_priority)]:
             return None  # Пользователь не хочет получать уведомления такого приоритета
         
-        # Проверяем тихие часы
-        if user_preferences and await self._is_quiet_hours(user_preferences):
-            # Откладываем уведомление до окончания тихих часов
-            scheduled_at = await self._get_next_available_time(user_preferences)
+        # Проверяем тихие часы (на момент отправки): доставку по каналам из quiet_hours_channels
+        # откладываем до их окончания
+        created_at = datetime.utcnow()
+        send_at = max(scheduled_at or created_at, created_at)
+        quiet_until = None
+        if user_preferences and PRIORITY_RANK[NotificationPriority(priority)] < \
+                PRIORITY_RANK[NotificationPriority(settings.notifications.quiet_hours_bypass_priority)] and \
+                await self._is_quiet_hours(user_preferences, send_at):
+            quiet_until = await self._get_next_available_time(user_preferences, send_at)
         
         # Создаем уведомление
         notification = Notification(
             notification_uuid=str(uuid.uuid4()),
+            idempotency_key=idempotency_key,
             recipient_id=recipient_id,
             template_id=template_id,
             notification_type=notification_type,
             title=title,
             message=message,
             priority=priority,
+            status=NotificationStatus.PENDING,
             channels=channels,
+            delivered_channels=[],
             related_entity_type=related_entity_type,
             related_entity_id=related_entity_id,
             scheduled_at=scheduled_at,
             expires_at=expires_at,
             variables=variables or {},
-            metadata=metadata or {}
+            notification_metadata=metadata or {},
+            created_at=created_at
         )
         
         self.session.add(notification)
-        await self.session.flush()
-        
-        # Создаем записи доставки для каждого канала
-        await self._create_delivery_records(notification, channels)
-        
-        # Если уведомление не отложено, отправляем сразу
-        if not scheduled_at or scheduled_at <= datetime.utcnow():
-            await self._send_notification(notification)
-        
-        await self.session.commit()
+        try:
+            await self.session.flush()
+            # Записи очереди исходящих; отложенное уведомление ждет в очереди до scheduled_at
+            # (и до конца тихих часов для каналов из quiet_hours_channels)
+            digest_channels = self._digest_channels(user_preferences, priority, channels)
+            for channel in digest_channels:
+                await add_to_digest(self.session, notification, channel, user_preferences.batch_interval_minutes,
+                                    not_before=self._not_before(channel, scheduled_at, quiet_until))
+            self._create_delivery_records(
+                notification, [channel for channel in channels if channel not in digest_channels],
+                scheduled_at, quiet_until
+            )
+            await self.session.commit()
+        except IntegrityError:
+            # Параллельный запрос с тем же ключом идемпотентности успел раньше
+            await self.session.rollback()
+            existing = await self._get_by_idempotency_key(idempotency_key, recipient_id) if idempotency_key else None
+            if existing is None:
+                raise
+            return existing
+        schedule_push_event(notification_event(notification))
         return notification
     
     async def create_notification_template(
@@ -178,7 +271,7 @@ class NotificationService:
     ) -> Tuple[List[Notification], int]:
         """Получение уведомлений пользователя"""
         # Базовый запрос
-        query = select(Notification).where(Notification.recipient_id == user_id)
+        query = select(Notification).where(Notification.recipient_id == user_id, in_feed())
         
         # Фильтры
         if status:
@@ -209,52 +302,60 @@ class NotificationService:
         user_id: int
     ) -> bool:
         """Отметить уведомление как прочитанное"""
-        notification = await self.session.execute(
-            select(Notification).where(
+        now = datetime.utcnow()
+        result = await self.session.execute(
+            update(Notification).where(
                 and_(
                     Notification.id == notification_id,
-                    Notification.recipient_id == user_id
+                    Notification.recipient_id == user_id,
+                    Notification.read_at.is_(None),
+                    in_feed()
                 )
-            )
+            ).values(status=NotificationStatus.READ.value, read_at=now, updated_at=now)
+            .execution_options(synchronize_session=False)
         )
-        notification_obj = notification.scalar_one_or_none()
-        
-        if not notification_obj:
-            return False
-        
-        notification_obj.status = NotificationStatus.READ
-        notification_obj.read_at = datetime.utcnow()
-        
         await self.session.commit()
-        return True
+        if result.rowcount:
+            schedule_push_event(unread_event(user_id, -1))
+            return True
+        
+        # Уже прочитано или не найдено
+        return await self.session.scalar(
+            select(Notification.id).where(
+                and_(
+                    Notification.id == notification_id,
+                    Notification.recipient_id == user_id,
+                    in_feed()
+                )
+            )
+        ) is not None
     
     async def mark_all_notifications_as_read(
         self,
         user_id: int,
         notification_type: Optional[NotificationType] = None
     ) -> int:
-        """Отметить все уведомления пользователя как прочитанные"""
-        query = select(Notification).where(
+        """Отметить все уведомления пользователя как прочитанные (один UPDATE)"""
+        query = update(Notification).where(
             and_(
                 Notification.recipient_id == user_id,
-                Notification.read_at.is_(None)
+                Notification.read_at.is_(None),
+                in_feed()
             )
         )
         
         if notification_type:
             query = query.where(Notification.notification_type == notification_type)
         
-        result = await self.session.execute(query)
-        notifications = result.scalars().all()
-        
-        count = 0
-        for notification in notifications:
-            notification.status = NotificationStatus.READ
-            notification.read_at = datetime.utcnow()
-            count += 1
-        
+        now = datetime.utcnow()
+        result = await self.session.execute(
+            query.values(status=NotificationStatus.READ.value, read_at=now, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
         await self.session.commit()
-        return count
+        if result.rowcount:
+            schedule_push_event(unread_event(user_id, -result.rowcount))
+        return result.rowcount
     
     async def delete_notification(
         self,
@@ -262,22 +363,40 @@ class NotificationService:
         user_id: int
     ) -> bool:
         """Удаление уведомления"""
-        notification = await self.session.execute(
-            select(Notification).where(
-                and_(
-                    Notification.id == notification_id,
-                    Notification.recipient_id == user_id
+        return await self.delete_notifications(user_id, notification_ids=[notification_id]) > 0
+    
+    async def delete_notifications(
+        self,
+        user_id: int,
+        notification_ids: Optional[List[int]] = None,
+        read_only: bool = False
+    ) -> int:
+        """Массовое удаление уведомлений пользователя вместе с записями доставки"""
+        query = select(Notification.id).where(Notification.recipient_id == user_id, in_feed())
+        if notification_ids is not None:
+            query = query.where(Notification.id.in_(notification_ids))
+        if read_only:
+            query = query.where(Notification.read_at.is_not(None))
+            unread = 0
+        else:
+            unread = await self.session.scalar(
+                select(func.count()).select_from(Notification).where(
+                    Notification.id.in_(query), Notification.read_at.is_(None)
                 )
             )
-        )
-        notification_obj = notification.scalar_one_or_none()
         
-        if not notification_obj:
-            return False
-        
-        await self.session.delete(notification_obj)
+        await self.session.execute(
+            delete(NotificationDelivery).where(NotificationDelivery.notification_id.in_(query))
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.session.execute(
+            delete(Notification).where(Notification.id.in_(query))
+            .execution_options(synchronize_session=False)
+        )
         await self.session.commit()
-        return True
+        if unread:
+            schedule_push_event(unread_event(user_id, -unread))
+        return result.rowcount
     
     async def get_notification_stats(
         self,
@@ -286,7 +405,7 @@ class NotificationService:
         """Получение статистики уведомлений пользователя"""
         # Общее количество уведомлений
         total_count = await self.session.scalar(
-            select(func.count(Notification.id)).where(Notification.recipient_id == user_id)
+            select(func.count(Notification.id)).where(Notification.recipient_id == user_id, in_feed())
         )
         
         # Непрочитанные уведомления
@@ -294,7 +413,8 @@ class NotificationService:
             select(func.count(Notification.id)).where(
                 and_(
                     Notification.recipient_id == user_id,
-                    Notification.read_at.is_(None)
+                    Notification.read_at.is_(None),
+                    in_feed()
                 )
             )
         )
@@ -304,7 +424,7 @@ class NotificationService:
             select(
                 Notification.notification_type,
                 func.count(Notification.id)
-            ).where(Notification.recipient_id == user_id).group_by(Notification.notification_type)
+            ).where(Notification.recipient_id == user_id, in_feed()).group_by(Notification.notification_type)
         )
         type_counts = dict(type_stats.fetchall())
         
@@ -313,7 +433,7 @@ class NotificationService:
             select(
                 Notification.priority,
                 func.count(Notification.id)
-            ).where(Notification.recipient_id == user_id).group_by(Notification.priority)
+            ).where(Notification.recipient_id == user_id, in_feed()).group_by(Notification.priority)
         )
         priority_counts = dict(priority_stats.fetchall())
         
@@ -397,7 +517,8 @@ class NotificationService:
         auth_type: Optional[str] = None,
         auth_credentials: Optional[Dict[str, str]] = None,
         retry_count: int = 3,
-        timeout_seconds: int = 30
+        timeout_seconds: int = 30,
+        signing_secret: Optional[str] = None
     ) -> NotificationWebhook:
         """Создание webhook'а для уведомлений"""
         webhook = NotificationWebhook(
@@ -411,7 +532,8 @@ class NotificationService:
             auth_type=auth_type,
             auth_credentials=auth_credentials or {},
             retry_count=retry_count,
-            timeout_seconds=timeout_seconds
+            timeout_seconds=timeout_seconds,
+            signing_secret=signing_secret
         )
         
         self.session.add(webhook)
@@ -434,180 +556,78 @@ class NotificationService:
         )
         return result.scalar_one_or_none()
     
-    async def _is_quiet_hours(self, preferences: UserNotificationPreference) -> bool:
+    async def _is_quiet_hours(self, preferences: UserNotificationPreference, now: Optional[datetime] = None) -> bool:
         """Проверка тихих часов"""
         if not preferences.quiet_hours_start or not preferences.quiet_hours_end:
             return False
-        
-        # TODO: Реализовать проверку тихих часов с учетом часового пояса
-        return False
+        now = now or datetime.utcnow()
+        return quiet_hours_end(preferences.quiet_hours_start, preferences.quiet_hours_end,
+                               preferences.timezone, now) is not None
     
-    async def _get_next_available_time(self, preferences: UserNotificationPreference) -> datetime:
+    async def _get_next_available_time(self, preferences: UserNotificationPreference,
+                                       now: Optional[datetime] = None) -> datetime:
         """Получение следующего доступного времени"""
-        # TODO: Реализовать расчет следующего доступного времени
-        return datetime.utcnow() + timedelta(hours=1)
+        now = now or datetime.utcnow()
+        end = quiet_hours_end(preferences.quiet_hours_start, preferences.quiet_hours_end,
+                              preferences.timezone, now)
+        if end is None:
+            return now
+        return end + release_offset(preferences.user_id, settings.notifications.quiet_hours_release_spread_seconds)
     
-    async def _create_delivery_records(
+    @staticmethod
+    def _not_before(channel: str, scheduled_at: Optional[datetime],
+                    quiet_until: Optional[datetime]) -> Optional[datetime]:
+        """Раньше какого времени канал не доставляется"""
+        if quiet_until is None or channel not in settings.notifications.quiet_hours_channels:
+            return scheduled_at
+        return max(scheduled_at or quiet_until, quiet_until)
+    
+    async def _get_by_idempotency_key(self, idempotency_key: str, recipient_id: int) -> Optional[Notification]:
+        return await self.session.scalar(
+            select(Notification).where(
+                Notification.idempotency_key == idempotency_key,
+                Notification.recipient_id == recipient_id
+            ).options(raiseload("*"))
+        )
+    
+    def _digest_channels(
         self,
-        notification: Notification,
+        preferences: Optional[UserNotificationPreference],
+        priority: NotificationPriority,
         channels: List[str]
+    ) -> List[str]:
+        """Каналы, по которым уведомление уходит в сводку, а не отдельным сообщением"""
+        config = settings.notifications
+        if not config.digest_enabled:
+            return []
+        if not preferences or not preferences.batch_notifications:
+            return []
+        if PRIORITY_RANK[NotificationPriority(priority)] > PRIORITY_RANK[NotificationPriority(config.digest_max_priority)]:
+            return []
+        return [channel for channel in channels if channel in config.digest_channels]
+    
+    def _create_delivery_records(
+        self,
+        notification: Notification,
+        channels: List[str],
+        scheduled_at: Optional[datetime] = None,
+        quiet_until: Optional[datetime] = None
     ):
         """Создание записей доставки для каналов"""
         for channel in channels:
+            not_before = self._not_before(channel, scheduled_at, quiet_until)
+            next_attempt_at = max(not_before or notification.created_at, notification.created_at)
             delivery = NotificationDelivery(
                 notification_id=notification.id,
                 channel=channel,
-                status=NotificationStatus.PENDING
+                status=NotificationStatus.PENDING,
+                idempotency_key=delivery_idempotency_key(notification, channel),
+                next_attempt_at=next_attempt_at,
+                retry_count=0,
+                delivery_data={}
             )
             self.session.add(delivery)
     
-    async def _send_notification(self, notification: Notification):
-        """Отправка уведомления по всем каналам"""
-        for delivery in notification.deliveries:
-            if delivery.status == NotificationStatus.PENDING:
-                await self._send_to_channel(notification, delivery)
-    
-    async def _send_to_channel(
-        self,
-        notification: Notification,
-        delivery: NotificationDelivery
-    ):
-        """Отправка уведомления по конкретному каналу"""
-        try:
-            if delivery.channel == NotificationChannel.IN_APP:
-                # Внутренние уведомления обрабатываются отдельно
-                delivery.status = NotificationStatus.DELIVERED
-                delivery.delivered_at = datetime.utcnow()
-            
-            elif delivery.channel == NotificationChannel.EMAIL:
-                await self._send_email_notification(notification, delivery)
-            
-            elif delivery.channel == NotificationChannel.SMS:
-                await self._send_sms_notification(notification, delivery)
-            
-            elif delivery.channel == NotificationChannel.PUSH:
-                await self._send_push_notification(notification, delivery)
-            
-            elif delivery.channel == NotificationChannel.WEBHOOK:
-                await self._send_webhook_notification(notification, delivery)
-            
-            # Обновляем статус уведомления
-            if delivery.status == NotificationStatus.DELIVERED:
-                notification.delivered_channels.append(delivery.channel)
-                if not notification.delivered_at:
-                    notification.delivered_at = datetime.utcnow()
-                notification.status = NotificationStatus.DELIVERED
-            
-        except Exception as e:
-            delivery.status = NotificationStatus.FAILED
-            delivery.error_message = str(e)
-            delivery.retry_count += 1
-    
-    async def _send_email_notification(
-        self,
-        notification: Notification,
-        delivery: NotificationDelivery
-    ):
-        """Отправка email уведомления"""
-        # TODO: Интеграция с email сервисом
-        delivery.status = NotificationStatus.DELIVERED
-        delivery.delivered_at = datetime.utcnow()
-    
-    async def _send_sms_notification(
-        self,
-        notification: Notification,
-        delivery: NotificationDelivery
-    ):
-        """Отправка SMS уведомления"""
-        # TODO: Интеграция с SMS сервисом
-        delivery.status = NotificationStatus.DELIVERED
-        delivery.delivered_at = datetime.utcnow()
-    
-    async def _send_push_notification(
-        self,
-        notification: Notification,
-        delivery: NotificationDelivery
-    ):
-        """Отправка push уведомления"""
-        # TODO: Интеграция с push сервисом
-        delivery.status = NotificationStatus.DELIVERED
-        delivery.delivered_at = datetime.utcnow()
-    
-    async def _send_webhook_notification(
-        self,
-        notification: Notification,
-        delivery: NotificationDelivery
-    ):
-        """Отправка webhook уведомления"""
-        # Получаем активные webhook'и
-        webhooks = await self.session.execute(
-            select(NotificationWebhook).where(
-                and_(
-                    NotificationWebhook.is_active == True,
-                    or_(
-                        NotificationWebhook.notification_types == [],
-                        notification.notification_type.value.in_(NotificationWebhook.notification_types)
-                    ),
-                    or_(
-                        NotificationWebhook.notification_priorities == [],
-                        notification.priority.value.in_(NotificationWebhook.notification_priorities)
-                    )
-                )
-            )
-        )
-        
-        for webhook in webhooks.scalars().all():
-            await self._call_webhook(webhook, notification)
-    
-    async def _call_webhook(
-        self,
-        webhook: NotificationWebhook,
-        notification: Notification
-    ):
-        """Вызов webhook'а"""
-        try:
-            payload = {
-                "notification_id": notification.notification_uuid,
-                "type": notification.notification_type.value,
-                "title": notification.title,
-                "message": notification.message,
-                "priority": notification.priority.value,
-                "recipient_id": notification.recipient_id,
-                "created_at": notification.created_at.isoformat(),
-                "metadata": notification.metadata
-            }
-            
-            headers = webhook.headers.copy()
-            if webhook.auth_type == "bearer" and webhook.auth_credentials:
-                headers["Authorization"] = f"Bearer {webhook.auth_credentials.get('token', '')}"
-            elif webhook.auth_type == "basic" and webhook.auth_credentials:
-                import base64
-                auth_str = f"{webhook.auth_credentials.get('username', '')}:{webhook.auth_credentials.get('password', '')}"
-                headers["Authorization"] = f"Basic {base64.b64encode(auth_str.encode()).decode()}"
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.request(
-                    method=webhook.method,
-                    url=webhook.url,
-                    json=payload,
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=webhook.timeout_seconds)
-                ) as response:
-                    webhook.total_calls += 1
-                    webhook.last_called_at = datetime.utcnow()
-                    
-                    if response.status < 400:
-                        webhook.successful_calls += 1
-                    else:
-                        webhook.failed_calls += 1
-                        raise Exception(f"HTTP {response.status}")
-            
-        except Exception as e:
-            webhook.total_calls += 1
-            webhook.failed_calls += 1
-            webhook.last_called_at = datetime.utcnow()
-            raise e
-    
     def _render_template(self, template: str, variables: Dict[str, Any]) -> str:
         """Рендеринг шаблона с переменными"""
         try:
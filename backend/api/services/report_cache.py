@@ -0,0 +1,443 @@
+"""
+Кэш отчетов: локальный LRU, необязательный общий уровень (Redis),
+инвалидация по тегам и объединение одинаковых конкурентных запросов
+
+Ключ кэша - sha256 канонического JSON параметров отчета, поэтому он
+одинаков во всех воркерах. Каждая запись хранит версии своих тегов
+("global", "department:3", "user:7", ...). Запись в задачу или учет
+времени увеличивает версии затронутых тегов, и записи с устаревшими
+версиями считаются промахом. При настроенном Redis версии тегов и сами
+отчеты общие для всех воркеров.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+import logging
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from core.database.models.task_model import Task, TaskTimeLog
+
+logger = logging.getLogger(__name__)
+
+TAG_ALL = "all"
+TAG_GLOBAL = "global"
+
+_SESSION_TAGS_KEY = "report_cache_tags"
+_FAILED = object()
+
+
+def _plain(value: Any) -> Any:
+    return value.value if isinstance(value, Enum) else value
+
+
+def canonical_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Канонический вид параметров: без None, enum -> значение, списки отсортированы"""
+    canonical = {}
+    for name, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(str(_plain(item)) for item in value)
+        elif isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        else:
+            value = _plain(value)
+        canonical[name] = value
+    return canonical
+
+
+def make_cache_key(report_type: Any, params: Dict[str, Any]) -> str:
+    """Стабильный между процессами ключ отчета"""
+    payload = json.dumps(
+        {"report_type": _plain(report_type), "params": canonical_params(params)},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return f"report:{_plain(report_type)}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+
+def report_tags(params: Dict[str, Any]) -> List[str]:
+    """Теги отчета по его фильтрам (самая узкая область)"""
+    if params.get("task_id"):
+        return [f"task:{params['task_id']}"]
+    if params.get("user_id"):
+        return [f"user:{params['user_id']}"]
+    if params.get("department_id"):
+        return [f"department:{params['department_id']}"]
+    if params.get("organization_id"):
+        return [f"organization:{params['organization_id']}"]
+    return [TAG_GLOBAL]
+
+
+def task_tags(values: Dict[str, Any]) -> Set[str]:
+    """Теги, затрагиваемые изменением задачи"""
+    tags = {TAG_GLOBAL}
+    if values.get("id"):
+        tags.add(f"task:{values['id']}")
+    for name, prefix in (
+        ("owner_id", "user"), ("executor_id", "user"),
+        ("department_id", "department"), ("organization_id", "organization")
+    ):
+        if values.get(name):
+            tags.add(f"{prefix}:{values[name]}")
+    return tags
+
+
+def time_log_tags(values: Dict[str, Any]) -> Set[str]:
+    """Теги, затрагиваемые изменением записи времени"""
+    tags = {TAG_GLOBAL}
+    if values.get("task_id"):
+        tags.add(f"task:{values['task_id']}")
+    if values.get("user_id"):
+        tags.add(f"user:{values['user_id']}")
+    return tags
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json_object_hook(value: Dict[str, Any]) -> Any:
+    if len(value) == 1:
+        if "__datetime__" in value:
+            return datetime.fromisoformat(value["__datetime__"])
+        if "__date__" in value:
+            return date.fromisoformat(value["__date__"])
+    return value
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, default=_json_default)
+
+
+def loads(raw: Any) -> Any:
+    return json.loads(raw, object_hook=_json_object_hook)
+
+
+@dataclass
+class CacheEntry:
+    """Запись кэша"""
+    value: Any
+    stored_at: float
+    tags: Dict[str, int] = field(default_factory=dict)  # тег -> версия на момент расчета
+
+
+class ReportCache:
+    """Кэш отчетов с LRU-вытеснением, TTL и инвалидацией по тегам"""
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: int = 300,
+        redis_url: Optional[str] = None,
+        namespace: str = "reports",
+        lock_timeout: float = 30.0,
+        wait_timeout: float = 10.0
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.namespace = namespace
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.stats: Counter = Counter()
+        self._redis_url = redis_url or None
+        self._redis = None
+        self._tag_versions: Dict[str, int] = defaultdict(int)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Фоновые инвалидации: ссылка держит задачу до завершения
+        self._tasks: Set[asyncio.Task] = set()
+
+    # ---------------------------------------------------------------- shared tier
+
+    @property
+    def shared_enabled(self) -> bool:
+        return bool(self._redis_url)
+
+    def _get_redis(self):
+        if self._redis is None and self._redis_url:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self._redis_url, decode_responses=True)
+        return self._redis
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.namespace}:tag:{tag}"
+
+    def _value_key(self, key: str) -> str:
+        return f"{self.namespace}:value:{key}"
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.namespace}:lock:{key}"
+
+    async def _versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        """Текущие версии тегов (общие, если доступен Redis)"""
+        tags = sorted(set(tags))
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                values = await redis.mget([self._tag_key(tag) for tag in tags])
+                return {tag: int(value or 0) for tag, value in zip(tags, values)}
+            except Exception as e:
+                logger.warning(f"Report cache shared tier unavailable: {e}")
+        return {tag: self._tag_versions[tag] for tag in tags}
+
+    # ---------------------------------------------------------------- entries
+
+    def _store_local(self, key: str, entry: CacheEntry) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _is_fresh(self, entry: CacheEntry, versions: Dict[str, int]) -> bool:
+        if time.time() - entry.stored_at >= self.ttl:
+            return False
+        return all(versions.get(tag, 0) == version for tag, version in entry.tags.items())
+
+    async def get(self, key: str) -> Any:
+        """Значение из кэша или None"""
+        entry = self.entries.get(key)
+        if isinstance(entry, CacheEntry):
+            if self._is_fresh(entry, await self._versions(entry.tags)):
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry.value
+            self.entries.pop(key, None)
+
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                raw = await redis.get(self._value_key(key))
+            except Exception as e:
+                logger.warning(f"Report cache shared tier unavailable: {e}")
+                raw = None
+            if raw:
+                payload = loads(raw)
+                entry = CacheEntry(payload["value"], payload["stored_at"], payload["tags"])
+                if self._is_fresh(entry, await self._versions(entry.tags)):
+                    self._store_local(key, entry)
+                    self.stats["shared_hits"] += 1
+                    return entry.value
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any, tags: Dict[str, int]) -> None:
+        """Сохранение значения с версиями тегов на момент расчета"""
+        entry = CacheEntry(value=value, stored_at=time.time(), tags=dict(tags))
+        self._store_local(key, entry)
+
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                payload = dumps({"value": value, "stored_at": entry.stored_at, "tags": entry.tags})
+                await redis.set(self._value_key(key), payload, ex=max(int(self.ttl), 1))
+            except Exception as e:
+                logger.warning(f"Report cache shared tier unavailable: {e}")
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        tags: Iterable[str] = (),
+        result_tags: Optional[Callable[[Any], Iterable[str]]] = None
+    ) -> Any:
+        """Значение из кэша или результат compute() с объединением конкурентных запросов.
+
+        Версии тегов из параметров фиксируются до расчета, поэтому запись,
+        случившаяся во время расчета, сделает сохраненный результат устаревшим.
+        Теги, известные только по результату (result_tags), читаются после.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["coalesced"] += 1
+            value = await asyncio.shield(inflight)
+            if value is not _FAILED:
+                return value
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._compute_shared(key, compute, tags, result_tags)
+            future.set_result(value)
+            return value
+        except BaseException:
+            future.set_result(_FAILED)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _compute_shared(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        tags: Iterable[str],
+        result_tags: Optional[Callable[[Any], Iterable[str]]]
+    ) -> Any:
+        """Расчет с межпроцессной блокировкой: остальные воркеры ждут результат в Redis"""
+        redis = self._get_redis()
+        lock_key = self._lock_key(key)
+        locked = False
+        if redis is not None:
+            try:
+                locked = bool(await redis.set(lock_key, "1", nx=True, px=int(self.lock_timeout * 1000)))
+                if not locked:
+                    deadline = time.monotonic() + self.wait_timeout
+                    while time.monotonic() < deadline:
+                        await asyncio.sleep(0.1)
+                        value = await self.get(key)
+                        if value is not None:
+                            self.stats["coalesced"] += 1
+                            return value
+                        if not await redis.exists(lock_key):
+                            break
+            except Exception as e:
+                logger.warning(f"Report cache shared tier unavailable: {e}")
+
+        try:
+            tags = set(tags) | {TAG_ALL}
+            versions = await self._versions(tags)
+            value = await compute()
+            if result_tags is not None:
+                versions.update(await self._versions(set(result_tags(value)) - tags))
+            await self.set(key, value, versions)
+            return value
+        finally:
+            if locked:
+                try:
+                    await redis.delete(lock_key)
+                except Exception as e:
+                    logger.warning(f"Report cache shared tier unavailable: {e}")
+
+    # ---------------------------------------------------------------- invalidation
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> None:
+        """Увеличение версий тегов: зависящие от них записи становятся устаревшими"""
+        tags = sorted(set(tags))
+        if not tags:
+            return
+        for tag in tags:
+            self._tag_versions[tag] += 1
+        self.stats["invalidations"] += len(tags)
+
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                async with redis.pipeline(transaction=False) as pipe:
+                    for tag in tags:
+                        pipe.incr(self._tag_key(tag))
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"Report cache shared tier unavailable: {e}")
+
+    def invalidate_tags_nowait(self, tags: Iterable[str]) -> None:
+        """Инвалидация из синхронного кода (события сессии)"""
+        tags = set(tags)
+        if not tags:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None and self.shared_enabled:
+            task = loop.create_task(self.invalidate_tags(tags))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            for tag in tags:
+                self._tag_versions[tag] += 1
+            self.stats["invalidations"] += len(tags)
+
+    def clear(self) -> None:
+        """Очистка локального уровня и инвалидация всех записей общего"""
+        self.entries.clear()
+        self.invalidate_tags_nowait({TAG_ALL})
+
+    def hit_ratio(self) -> float:
+        hits = self.stats["hits"] + self.stats["shared_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+class ReportCacheInvalidator:
+    """Инвалидация тегов кэша отчетов после коммита изменений задач и учета времени"""
+
+    def __init__(self, cache: ReportCache):
+        self.cache = cache
+        self._registered = False
+
+    def register(self) -> None:
+        """Подключение обработчиков событий сессии (идемпотентно)"""
+        if self._registered:
+            return
+        event.listen(Session, "before_flush", self._before_flush)
+        event.listen(Session, "after_flush", self._after_flush)
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_rollback", self._after_rollback)
+        self._registered = True
+
+    def unregister(self) -> None:
+        if not self._registered:
+            return
+        event.remove(Session, "before_flush", self._before_flush)
+        event.remove(Session, "after_flush", self._after_flush)
+        event.remove(Session, "after_commit", self._after_commit)
+        event.remove(Session, "after_rollback", self._after_rollback)
+        self._registered = False
+
+    @staticmethod
+    def _tags_for(obj: Any, committed: bool) -> Set[str]:
+        if isinstance(obj, Task):
+            fields = ("id", "owner_id", "executor_id", "department_id", "organization_id")
+            builder = task_tags
+        else:
+            fields = ("id", "task_id", "user_id")
+            builder = time_log_tags
+        state = inspect(obj)
+        values = {}
+        for name in fields:
+            if committed and name in state.committed_state:
+                values[name] = state.committed_state[name]
+            else:
+                values[name] = state.dict.get(name)
+        return builder({name: value for name, value in values.items() if isinstance(value, int)})
+
+    def _before_flush(self, session: Session, flush_context, instances) -> None:
+        tags = session.info.setdefault(_SESSION_TAGS_KEY, set())
+        for obj in list(session.dirty) + list(session.deleted):
+            if isinstance(obj, (Task, TaskTimeLog)):
+                tags |= self._tags_for(obj, committed=True)
+                tags |= self._tags_for(obj, committed=False)
+
+    def _after_flush(self, session: Session, flush_context) -> None:
+        tags = session.info.setdefault(_SESSION_TAGS_KEY, set())
+        for obj in session.new:
+            if isinstance(obj, (Task, TaskTimeLog)):
+                tags |= self._tags_for(obj, committed=False)
+
+    def _after_commit(self, session: Session) -> None:
+        tags = session.info.pop(_SESSION_TAGS_KEY, None)
+        if tags:
+            self.cache.invalidate_tags_nowait(tags)
+
+    def _after_rollback(self, session: Session) -> None:
+        session.info.pop(_SESSION_TAGS_KEY, None)
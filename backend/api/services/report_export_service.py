@@ -0,0 +1,734 @@
+"""
+Потоковый экспорт данных отчетов (CSV, XLSX, PDF, JSON)
+
+Строки читаются из БД серверным курсором пачками (yield_per), каждая
+пачка сразу кодируется в выбранный формат и отдается клиенту, поэтому
+память не зависит от объема выгрузки, а первые байты уходят сразу.
+"""
+
+import csv
+import io
+import json
+import os
+import struct
+import zipfile
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from functools import lru_cache
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence
+from xml.sax.saxutils import escape
+import logging
+
+from sqlalchemy import Select, and_, func, or_, select
+from sqlalchemy.orm import aliased
+
+from core.database import get_db_helper
+from core.settings import settings
+from core.database.models.main_models import User
+from core.database.models.task_model import Task, TaskTimeLog
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def format_cell(value: Any) -> Any:
+    """Приведение значения ячейки к выгружаемому виду"""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "value"):  # Enum
+        return value.value
+    return value
+
+
+class StreamWriter(ABC):
+    """Базовый потоковый писатель: begin -> write_rows* -> finish"""
+
+    media_type = "application/octet-stream"
+    extension = "bin"
+
+    @abstractmethod
+    def begin(self, columns: Sequence[str]) -> bytes:
+        ...
+
+    @abstractmethod
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> bytes:
+        ...
+
+    @abstractmethod
+    def finish(self) -> bytes:
+        ...
+
+
+class CSVStreamWriter(StreamWriter):
+    """CSV с переиспользуемым буфером"""
+
+    media_type = "text/csv"
+    extension = "csv"
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate(0)
+        return data
+
+    def begin(self, columns: Sequence[str]) -> bytes:
+        self._writer.writerow(columns)
+        return self._drain()
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> bytes:
+        self._writer.writerows([format_cell(value) for value in row] for row in rows)
+        return self._drain()
+
+    def finish(self) -> bytes:
+        return self._drain()
+
+
+class JSONStreamWriter(StreamWriter):
+    """JSON-массив объектов, записываемый по частям"""
+
+    media_type = "application/json"
+    extension = "json"
+
+    def __init__(self):
+        self._columns: Sequence[str] = ()
+        self._first = True
+
+    def begin(self, columns: Sequence[str]) -> bytes:
+        self._columns = list(columns)
+        return b"["
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> bytes:
+        parts = []
+        for row in rows:
+            item = json.dumps(
+                {column: format_cell(value) for column, value in zip(self._columns, row)},
+                ensure_ascii=False
+            )
+            parts.append(item if self._first else "," + item)
+            self._first = False
+        return "".join(parts).encode("utf-8")
+
+    def finish(self) -> bytes:
+        return b"]"
+
+
+class _ChunkSink:
+    """Несмещаемый поток для zipfile: накапливает байты до выгрузки"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _xlsx_column_name(index: int) -> str:
+    name = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+
+class XLSXStreamWriter(StreamWriter):
+    """Минимальный XLSX (один лист, строки inlineStr) в потоковом ZIP.
+
+    ZIP пишется в несмещаемый поток, поэтому размеры записей передаются
+    дескрипторами данных после содержимого, а лист сжимается по мере записи.
+    """
+
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    extension = "xlsx"
+
+    _CONTENT_TYPES = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    )
+    _ROOT_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    )
+    _WORKBOOK_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    )
+
+    def __init__(self, sheet_name: str = "Report"):
+        self._sheet_name = sheet_name
+        self._sink = _ChunkSink()
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._sheet = None
+        self._row_index = 0
+
+    def _workbook(self) -> str:
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(self._sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        )
+
+    def _row_xml(self, values: Sequence[Any]) -> str:
+        self._row_index += 1
+        cells = []
+        for column, value in enumerate(values):
+            reference = f"{_xlsx_column_name(column)}{self._row_index}"
+            value = format_cell(value)
+            if isinstance(value, bool):
+                cells.append(f'<c r="{reference}" t="b"><v>{int(value)}</v></c>')
+            elif isinstance(value, (int, float)):
+                cells.append(f'<c r="{reference}"><v>{value}</v></c>')
+            elif value != "":
+                cells.append(f'<c r="{reference}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+        return f'<row r="{self._row_index}">{"".join(cells)}</row>'
+
+    def begin(self, columns: Sequence[str]) -> bytes:
+        self._zip = zipfile.ZipFile(self._sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+        self._zip.writestr("[Content_Types].xml", self._CONTENT_TYPES)
+        self._zip.writestr("_rels/.rels", self._ROOT_RELS)
+        self._zip.writestr("xl/workbook.xml", self._workbook())
+        self._zip.writestr("xl/_rels/workbook.xml.rels", self._WORKBOOK_RELS)
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True)
+        self._sheet.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        )
+        self._sheet.write(self._row_xml(columns).encode("utf-8"))
+        return self._sink.drain()
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> bytes:
+        self._sheet.write("".join(self._row_xml(row) for row in rows).encode("utf-8"))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._sheet.write(b"</sheetData></worksheet>")
+        self._sheet.close()
+        self._zip.close()
+        return self._sink.drain()
+
+
+# Шрифты с кириллицей: путь из настроек, затем стандартные пути пакетов fonts-dejavu
+PDF_FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+    "/usr/share/fonts/TTF/DejaVuSansMono.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSansMono.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+)
+
+
+@dataclass(frozen=True)
+class TrueTypeFont:
+    """Метрики TrueType-шрифта, нужные для встраивания в PDF (CIDFontType2)"""
+    name: str
+    data: bytes
+    units_per_em: int
+    bbox: tuple
+    ascent: int
+    descent: int
+    advances: tuple
+    cmap: Dict[int, int]
+
+    @classmethod
+    def parse(cls, data: bytes, name: str) -> "TrueTypeFont":
+        num_tables = struct.unpack_from(">H", data, 4)[0]
+        tables = {}
+        for index in range(num_tables):
+            tag, _, offset, _ = struct.unpack_from(">4sIII", data, 12 + 16 * index)
+            tables[tag.decode("latin-1")] = offset
+
+        head, hhea = tables["head"], tables["hhea"]
+        units_per_em = struct.unpack_from(">H", data, head + 18)[0]
+        bbox = struct.unpack_from(">4h", data, head + 36)
+        ascent, descent = struct.unpack_from(">hh", data, hhea + 4)
+        metrics_count = struct.unpack_from(">H", data, hhea + 34)[0]
+        glyph_count = struct.unpack_from(">H", data, tables["maxp"] + 4)[0]
+        advances = [struct.unpack_from(">H", data, tables["hmtx"] + 4 * i)[0] for i in range(metrics_count)]
+        advances += [advances[-1]] * (glyph_count - metrics_count)
+        return cls(
+            name=name, data=data, units_per_em=units_per_em, bbox=bbox, ascent=ascent, descent=descent,
+            advances=tuple(advances), cmap=cls._parse_cmap(data, tables["cmap"]),
+        )
+
+    @staticmethod
+    def _parse_cmap(data: bytes, cmap: int) -> Dict[int, int]:
+        """Таблица символ -> глиф из подтаблицы Unicode BMP (формат 4)"""
+        count = struct.unpack_from(">H", data, cmap + 2)[0]
+        subtable = None
+        for index in range(count):
+            platform, encoding, offset = struct.unpack_from(">HHI", data, cmap + 4 + 8 * index)
+            if (platform, encoding) in ((3, 1), (0, 3)) and struct.unpack_from(">H", data, cmap + offset)[0] == 4:
+                subtable = cmap + offset
+                break
+        if subtable is None:
+            raise ValueError("Font has no Unicode BMP cmap")
+
+        segments = struct.unpack_from(">H", data, subtable + 6)[0] // 2
+        ends_at = subtable + 14
+        starts_at = ends_at + 2 * segments + 2
+        deltas_at = starts_at + 2 * segments
+        range_offsets_at = deltas_at + 2 * segments
+        mapping: Dict[int, int] = {}
+        for segment in range(segments):
+            end = struct.unpack_from(">H", data, ends_at + 2 * segment)[0]
+            start = struct.unpack_from(">H", data, starts_at + 2 * segment)[0]
+            delta = struct.unpack_from(">h", data, deltas_at + 2 * segment)[0]
+            range_offset_at = range_offsets_at + 2 * segment
+            range_offset = struct.unpack_from(">H", data, range_offset_at)[0]
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset == 0:
+                    glyph = (code + delta) & 0xFFFF
+                else:
+                    glyph = struct.unpack_from(">H", data, range_offset_at + range_offset + 2 * (code - start))[0]
+                    glyph = (glyph + delta) & 0xFFFF if glyph else 0
+                if glyph:
+                    mapping[code] = glyph
+        return mapping
+
+    def scale(self, value: int) -> int:
+        """Единицы шрифта -> единицы PDF (1/1000 кегля)"""
+        return round(value * 1000 / self.units_per_em)
+
+
+@lru_cache(maxsize=4)
+def _load_font(path: str) -> TrueTypeFont:
+    with open(path, "rb") as font_file:
+        data = font_file.read()
+    return TrueTypeFont.parse(data, os.path.splitext(os.path.basename(path))[0].replace(" ", ""))
+
+
+def load_pdf_font() -> Optional[TrueTypeFont]:
+    """Шрифт с кириллицей для PDF; None - шрифт не найден (останется Helvetica)"""
+    configured = settings.reports.pdf_font_path
+    for path in ((configured,) if configured else ()) + PDF_FONT_CANDIDATES:
+        if not os.path.isfile(path):
+            continue
+        try:
+            return _load_font(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Cannot load PDF font {path}: {e}")
+    logger.warning("No TrueType font with Cyrillic glyphs found, PDF export falls back to Helvetica")
+    return None
+
+
+class PDFStreamWriter(StreamWriter):
+    """Простой табличный PDF (A4 альбомная), страницы пишутся по мере заполнения.
+
+    Текст набирается встроенным TrueType-шрифтом с кириллицей (DejaVu, см.
+    settings.reports.pdf_font_path): строки кодируются номерами глифов
+    (Identity-H), шрифт с шириной использованных глифов и таблицей ToUnicode
+    записывается в конце. Если шрифт не найден, используется Helvetica, и
+    символы вне Latin-1 заменяются на "?".
+    Объекты каталога и дерева страниц записываются в конце вместе с таблицей xref.
+    """
+
+    media_type = "application/pdf"
+    extension = "pdf"
+
+    PAGE_WIDTH = 842
+    PAGE_HEIGHT = 595
+    MARGIN = 30
+    FONT_SIZE = 7
+    LINE_HEIGHT = 10
+
+    _CATALOG_ID = 1
+    _PAGES_ID = 2
+    _FONT_ID = 3
+
+    def __init__(self, title: str = "Report", font: Optional[TrueTypeFont] = None):
+        self._title = title
+        self._font = font if font is not None else load_pdf_font()
+        self._used_glyphs: Dict[int, int] = {}
+        self._offset = 0
+        self._offsets: Dict[int, int] = {}
+        self._next_id = 4
+        self._page_ids: List[int] = []
+        self._lines: List[str] = []
+        self._columns: Sequence[str] = ()
+        self._widths: List[int] = []
+        self._lines_per_page = (self.PAGE_HEIGHT - 2 * self.MARGIN) // self.LINE_HEIGHT - 2
+
+    def _show_text(self, text: str) -> str:
+        """Операнд оператора Tj для строки"""
+        if self._font is None:
+            text = text.encode("latin-1", "replace").decode("latin-1")
+            return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+        glyphs = []
+        for char in text:
+            glyph = self._font.cmap.get(ord(char), 0)
+            self._used_glyphs.setdefault(glyph, ord(char))
+            glyphs.append(f"{glyph:04X}")
+        return "<" + "".join(glyphs) + ">"
+
+    def _char_width(self) -> float:
+        """Ширина символа в долях кегля (раскладка моноширинная)"""
+        if self._font is None:
+            return 0.5
+        glyph = self._font.cmap.get(ord("0"), 0)
+        return self._font.advances[glyph] / self._font.units_per_em
+
+    def _object(self, object_id: int, body: bytes) -> bytes:
+        data = f"{object_id} 0 obj\n".encode("latin-1") + body + b"\nendobj\n"
+        self._offsets[object_id] = self._offset
+        self._offset += len(data)
+        return data
+
+    def _stream_object(self, object_id: int, content: bytes, extra: str = "") -> bytes:
+        packed = zlib.compress(content)
+        return self._object(
+            object_id,
+            f"<< /Length {len(packed)} /Filter /FlateDecode{extra} >>\nstream\n".encode("latin-1")
+            + packed + b"\nendstream"
+        )
+
+    def _allocate(self) -> int:
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def _emit(self, data: bytes) -> bytes:
+        self._offset += len(data)
+        return data
+
+    def _format_line(self, values: Sequence[Any]) -> str:
+        cells = []
+        for value, width in zip(values, self._widths):
+            text = str(format_cell(value)).replace("\n", " ")
+            if len(text) > width:
+                text = text[:max(width - 1, 1)] + "~"
+            cells.append(text.ljust(width))
+        return " ".join(cells)
+
+    def _page(self) -> bytes:
+        if not self._lines:
+            return b""
+        header = [self._title, self._format_line(self._columns)]
+        text_lines = "".join(f"{self._show_text(line)} Tj T*\n" for line in header + self._lines)
+        stream = (
+            f"BT /F1 {self.FONT_SIZE} Tf {self.LINE_HEIGHT} TL "
+            f"{self.MARGIN} {self.PAGE_HEIGHT - self.MARGIN} Td\n{text_lines}ET"
+        ).encode("latin-1")
+        content_id, page_id = self._allocate(), self._allocate()
+        self._page_ids.append(page_id)
+        self._lines = []
+
+        data = self._object(
+            content_id,
+            f"<< /Length {len(stream)} >>\nstream\n".encode("latin-1") + stream + b"\nendstream"
+        )
+        data += self._object(
+            page_id,
+            (
+                f"<< /Type /Page /Parent {self._PAGES_ID} 0 R "
+                f"/MediaBox [0 0 {self.PAGE_WIDTH} {self.PAGE_HEIGHT}] "
+                f"/Resources << /Font << /F1 {self._FONT_ID} 0 R >> >> "
+                f"/Contents {content_id} 0 R >>"
+            ).encode("latin-1")
+        )
+        return data
+
+    def _font_objects(self) -> bytes:
+        """Встроенный шрифт: Type0 -> CIDFontType2 -> дескриптор, файл шрифта и ToUnicode"""
+        font = self._font
+        cid_id, descriptor_id, file_id, to_unicode_id = (self._allocate() for _ in range(4))
+        name = font.name
+        widths = " ".join(
+            f"{glyph} [{font.scale(font.advances[glyph])}]" for glyph in sorted(self._used_glyphs)
+        )
+        bbox = " ".join(str(font.scale(value)) for value in font.bbox)
+        mappings = [f"<{glyph:04X}> <{code:04X}>" for glyph, code in sorted(self._used_glyphs.items()) if glyph]
+        to_unicode = [
+            "/CIDInit /ProcSet findresource begin 12 dict begin begincmap",
+            "/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def",
+            "/CMapName /Adobe-Identity-UCS def /CMapType 2 def",
+            "1 begincodespacerange <0000> <FFFF> endcodespacerange",
+        ]
+        # В одном блоке bfchar допускается не более 100 записей
+        for index in range(0, len(mappings), 100):
+            chunk = mappings[index:index + 100]
+            to_unicode.append(f"{len(chunk)} beginbfchar\n" + "\n".join(chunk) + "\nendbfchar")
+        to_unicode.append("endcmap CMapName currentdict /CMap defineresource pop end end")
+
+        data = self._object(
+            self._FONT_ID,
+            (
+                f"<< /Type /Font /Subtype /Type0 /BaseFont /{name} /Encoding /Identity-H "
+                f"/DescendantFonts [{cid_id} 0 R] /ToUnicode {to_unicode_id} 0 R >>"
+            ).encode("latin-1")
+        )
+        data += self._object(
+            cid_id,
+            (
+                f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{name} "
+                f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+                f"/FontDescriptor {descriptor_id} 0 R /CIDToGIDMap /Identity "
+                f"/DW {font.scale(font.advances[0])} /W [{widths}] >>"
+            ).encode("latin-1")
+        )
+        data += self._object(
+            descriptor_id,
+            (
+                f"<< /Type /FontDescriptor /FontName /{name} /Flags 32 /FontBBox [{bbox}] "
+                f"/ItalicAngle 0 /Ascent {font.scale(font.ascent)} /Descent {font.scale(font.descent)} "
+                f"/CapHeight {font.scale(font.ascent)} /StemV 80 /FontFile2 {file_id} 0 R >>"
+            ).encode("latin-1")
+        )
+        data += self._stream_object(file_id, font.data, f" /Length1 {len(font.data)}")
+        data += self._stream_object(to_unicode_id, "\n".join(to_unicode).encode("latin-1"))
+        return data
+
+    def begin(self, columns: Sequence[str]) -> bytes:
+        self._columns = list(columns)
+        # Моноширинная раскладка: ширина колонки поровну от доступных символов
+        available = int((self.PAGE_WIDTH - 2 * self.MARGIN) / (self.FONT_SIZE * self._char_width()))
+        width = max(available // max(len(self._columns), 1) - 1, 4)
+        self._widths = [width] * len(self._columns)
+        data = self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        if self._font is None:
+            data += self._object(
+                self._FONT_ID,
+                b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+            )
+        return data
+
+    def write_rows(self, rows: Iterable[Sequence[Any]]) -> bytes:
+        data = b""
+        for row in rows:
+            self._lines.append(self._format_line(row))
+            if len(self._lines) >= self._lines_per_page:
+                data += self._page()
+        return data
+
+    def finish(self) -> bytes:
+        data = self._page()
+        if not self._page_ids:
+            self._lines = [""]
+            data += self._page()
+        if self._font is not None:
+            # Ширины и ToUnicode известны только после всех страниц
+            data += self._font_objects()
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        data += self._object(
+            self._PAGES_ID,
+            f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode("latin-1")
+        )
+        data += self._object(
+            self._CATALOG_ID,
+            f"<< /Type /Catalog /Pages {self._PAGES_ID} 0 R >>".encode("latin-1")
+        )
+        xref_offset = self._offset
+        size = self._next_id
+        xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for object_id in range(1, size):
+            xref.append(f"{self._offsets.get(object_id, 0):010d} 00000 n \n")
+        xref.append(f"trailer\n<< /Size {size} /Root {self._CATALOG_ID} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        data += self._emit("".join(xref).encode("latin-1"))
+        return data
+
+
+STREAM_WRITERS: Dict[str, Callable[..., StreamWriter]] = {
+    "csv": CSVStreamWriter,
+    "json": JSONStreamWriter,
+    "excel": XLSXStreamWriter,
+    "pdf": PDFStreamWriter,
+}
+
+
+def get_stream_writer(format_type: Any, title: str = "Report") -> StreamWriter:
+    """Писатель для формата экспорта (значение ExportFormat)"""
+    format_value = getattr(format_type, "value", format_type)
+    if format_value not in STREAM_WRITERS:
+        raise ValueError(f"Unsupported export format: {format_value}")
+    if format_value == "excel":
+        return XLSXStreamWriter(sheet_name=title)
+    if format_value == "pdf":
+        return PDFStreamWriter(title=title)
+    return STREAM_WRITERS[format_value]()
+
+
+def render_rows(writer: StreamWriter, columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> bytes:
+    """Полный документ из уже готовых строк (небольшие отчеты)"""
+    return writer.begin(columns) + writer.write_rows(rows) + writer.finish()
+
+
+##################### Наборы данных для выгрузки #####################
+
+@dataclass
+class ExportDataset:
+    """Выгружаемый набор строк"""
+    name: str
+    title: str
+    columns: List[str]
+    build_query: Callable[..., Select]
+
+
+def _time_logs_query(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    task_id: Optional[int] = None,
+    **_
+) -> Select:
+    query = select(
+        TaskTimeLog.id,
+        TaskTimeLog.start_time,
+        TaskTimeLog.end_time,
+        TaskTimeLog.hours,
+        TaskTimeLog.user_id,
+        User.login,
+        TaskTimeLog.task_id,
+        Task.title,
+        TaskTimeLog.description,
+    ).join(User, User.id == TaskTimeLog.user_id).join(Task, Task.id == TaskTimeLog.task_id)
+
+    filters = []
+    if start_date:
+        filters.append(TaskTimeLog.start_time >= start_date)
+    if end_date:
+        filters.append(TaskTimeLog.start_time <= end_date)
+    if user_id:
+        filters.append(TaskTimeLog.user_id == user_id)
+    if task_id:
+        filters.append(TaskTimeLog.task_id == task_id)
+    if filters:
+        query = query.where(and_(*filters))
+    return query.order_by(TaskTimeLog.start_time, TaskTimeLog.id)
+
+
+def _tasks_query(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    department_id: Optional[int] = None,
+    organization_id: Optional[int] = None,
+    **_
+) -> Select:
+    owner = aliased(User)
+    executor = aliased(User)
+    query = select(
+        Task.id,
+        Task.title,
+        Task.status,
+        Task.priority,
+        Task.task_type,
+        Task.created_at,
+        Task.due_date,
+        Task.completed_at,
+        owner.login,
+        executor.login,
+        Task.department_id,
+        Task.organization_id,
+        Task.estimated_hours,
+        Task.actual_hours,
+    ).outerjoin(owner, owner.id == Task.owner_id).outerjoin(executor, executor.id == Task.executor_id)
+
+    filters = []
+    if start_date:
+        filters.append(Task.created_at >= start_date)
+    if end_date:
+        filters.append(Task.created_at <= end_date)
+    if user_id:
+        filters.append(or_(Task.owner_id == user_id, Task.executor_id == user_id))
+    if department_id:
+        filters.append(Task.department_id == department_id)
+    if organization_id:
+        filters.append(Task.organization_id == organization_id)
+    if filters:
+        query = query.where(and_(*filters))
+    return query.order_by(Task.created_at, Task.id)
+
+
+EXPORT_DATASETS: Dict[str, ExportDataset] = {
+    "time_logs": ExportDataset(
+        name="time_logs",
+        title="Time tracking",
+        columns=["Log ID", "Start", "End", "Hours", "User ID", "Username", "Task ID", "Task", "Description"],
+        build_query=_time_logs_query,
+    ),
+    "tasks": ExportDataset(
+        name="tasks",
+        title="Tasks",
+        columns=[
+            "Task ID", "Title", "Status", "Priority", "Type", "Created", "Due", "Completed",
+            "Owner", "Executor", "Department ID", "Organization ID", "Estimated Hours", "Actual Hours"
+        ],
+        build_query=_tasks_query,
+    ),
+}
+
+
+async def stream_dataset(
+    dataset: ExportDataset,
+    writer: StreamWriter,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    on_batch: Optional[Callable[[int], Awaitable[None]]] = None,
+    **filters
+) -> AsyncIterator[bytes]:
+    """Потоковая выгрузка набора данных через серверный курсор.
+
+    Сессия открывается внутри генератора: он выполняется уже после выхода
+    из обработчика запроса, когда сессия из зависимостей закрыта.
+    on_batch получает число выгруженных строк после каждой пачки.
+    """
+    query = dataset.build_query(**filters).execution_options(yield_per=batch_size)
+    yield writer.begin(dataset.columns)
+    rows_total = 0
+    async with get_db_helper().read_session() as session:
+        result = await session.stream(query)
+        async for partition in result.partitions(batch_size):
+            chunk = writer.write_rows(partition)
+            rows_total += len(partition)
+            if chunk:
+                yield chunk
+            if on_batch is not None:
+                await on_batch(rows_total)
+    yield writer.finish()
+    logger.info(f"Streamed export {dataset.name}: {rows_total} rows")
+
+
+async def count_dataset_rows(dataset: ExportDataset, **filters) -> int:
+    """Число строк выгрузки (для оценки прогресса фоновых заданий)"""
+    query = select(func.count()).select_from(dataset.build_query(**filters).subquery())
+    async with get_db_helper().read_session() as session:
+        return (await session.execute(query)).scalar_one()
@@ -0,0 +1,545 @@
+"""
+Фоновые задания построения отчетов
+
+HTTP-обработчик только создает запись ReportJob и публикует job_uuid в
+очередь RabbitMQ. Отдельный процесс-обработчик (run_report_worker.py)
+забирает задания с ограниченным параллелизмом, строит файл в хранилище
+артефактов и сообщает прогресс: в таблицу (для опроса) и в fanout-обменник
+(для подписчиков во всех воркерах API). Тяжелые отчеты не занимают воркеры
+uvicorn и не упираются в таймауты прокси.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+import aiofiles
+import aiofiles.os
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.api.configuration.rabbitmq_server import rabbit
+from backend.api.services.report_export_service import (
+    EXPORT_DATASETS, count_dataset_rows, get_stream_writer, stream_dataset
+)
+from backend.api.services.reports_service import ReportsService, ReportType, ExportFormat, report_generator
+from core.database import get_db_helper
+from core.database.models.report_model import ReportJob, ReportJobStatus
+from core.database.slow_queries import set_query_origin
+from core.database.models.task_model import TaskStatus, TaskPriority
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Очередь заданий без TTL сообщений: задание может ждать свободного обработчика дольше 30 секунд
+REPORT_JOB_QUEUE_ARGUMENTS = {
+    "x-dead-letter-exchange": "dlx",
+    "x-max-priority": 10
+}
+
+ACTIVE_STATUSES = (ReportJobStatus.QUEUED.value, ReportJobStatus.RUNNING.value)
+TERMINAL_STATUSES = (ReportJobStatus.COMPLETED.value, ReportJobStatus.FAILED.value, ReportJobStatus.CANCELLED.value)
+
+# Сколько раз задание может быть выдано повторно (обработчик упал посреди построения)
+MAX_JOB_ATTEMPTS = 3
+
+
+class ReportJobLimitError(Exception):
+    """Превышено число активных заданий пользователя"""
+
+
+class ReportJobCancelled(Exception):
+    """Задание отменено во время построения"""
+
+
+def _status_value(status: Any) -> str:
+    return status.value if isinstance(status, ReportJobStatus) else str(status)
+
+
+def job_to_dict(job: ReportJob) -> Dict[str, Any]:
+    """Представление задания для API и событий прогресса"""
+    status = _status_value(job.status)
+    return {
+        "job_id": job.job_uuid,
+        "status": status,
+        "report_type": job.report_type,
+        "dataset": job.dataset,
+        "format_type": job.format_type,
+        "params": job.params or {},
+        "progress": job.progress or 0,
+        "progress_message": job.progress_message,
+        "error_message": job.error_message,
+        "artifact_name": job.artifact_name,
+        "artifact_size": job.artifact_size,
+        "download_ready": status == ReportJobStatus.COMPLETED.value and bool(job.artifact_path),
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "expires_at": job.expires_at.isoformat() if job.expires_at else None,
+    }
+
+
+def decode_job_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Восстановление типов фильтров, сохраненных в JSON"""
+    decoded = dict(params or {})
+    for key in ("start_date", "end_date"):
+        if isinstance(decoded.get(key), str):
+            decoded[key] = datetime.fromisoformat(decoded[key])
+    if decoded.get("status_filter"):
+        decoded["status_filter"] = [TaskStatus(value) for value in decoded["status_filter"]]
+    if decoded.get("priority_filter"):
+        decoded["priority_filter"] = [TaskPriority(value) for value in decoded["priority_filter"]]
+    return decoded
+
+
+def artifacts_dir() -> Path:
+    return Path(settings.reports.jobs_artifacts_dir)
+
+
+async def remove_artifact(path: Any):
+    """Удаление файла артефакта без блокировки цикла событий"""
+    with contextlib.suppress(FileNotFoundError):
+        await aiofiles.os.remove(path)
+
+
+class ReportJobEventHub:
+    """Доставка событий прогресса подписчикам текущего процесса.
+
+    Один подписчик RabbitMQ на процесс получает все события заданий и
+    раскладывает их по локальным очередям подписанных клиентов (SSE), поэтому
+    клиент видит прогресс независимо от того, какой воркер строит отчет.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.is_running = False
+
+    def subscribe(self, job_uuid: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault(job_uuid, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_uuid: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(job_uuid)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[job_uuid]
+
+    async def dispatch(self, event: Dict[str, Any]):
+        for queue in list(self.subscribers.get(event.get("job_id"), ())):
+            if queue.full():
+                # Медленный клиент: важно только последнее состояние
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def start(self):
+        """Подписка процесса на события заданий (выполняется до остановки)"""
+        self.is_running = True
+        try:
+            await rabbit.subscribe_events(settings.reports.jobs_events_exchange, self.dispatch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Подписчики все равно получат состояние опросом БД
+            logger.error(f"Report job event subscription failed: {e}")
+        finally:
+            self.is_running = False
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def job_event_stream(job_uuid: str, poll_timeout: float = 15.0) -> AsyncIterator[str]:
+    """События SSE задания до его завершения.
+
+    Сначала отдается состояние на момент подписки, дальше - события хаба, а при
+    их отсутствии - опрос БД. Поток всегда заканчивается событием end; если
+    задание исчезло (удалено), перед ним отдается событие error.
+    """
+    queue = report_job_events.subscribe(job_uuid)
+    try:
+        async with get_db_helper().get_session() as session:
+            service = ReportJobService(session)
+            job = await service.get_job(job_uuid)
+            state = job_to_dict(job) if job is not None else None
+            while state is not None:
+                yield _sse("progress", state)
+                if state["status"] in TERMINAL_STATUSES:
+                    break
+                try:
+                    state = await asyncio.wait_for(queue.get(), timeout=poll_timeout)
+                except asyncio.TimeoutError:
+                    session.expire_all()
+                    job = await service.get_job(job_uuid)
+                    state = job_to_dict(job) if job is not None else None
+        if state is None:
+            yield _sse("error", {"job_id": job_uuid, "detail": "Задание отчета не найдено"})
+        yield _sse("end", {"job_id": job_uuid, "status": state["status"] if state else None})
+    finally:
+        report_job_events.unsubscribe(job_uuid, queue)
+
+
+async def publish_job_event(job: ReportJob):
+    """Рассылка текущего состояния задания во все процессы"""
+    event = job_to_dict(job)
+    try:
+        await rabbit.publish_event(settings.reports.jobs_events_exchange, event)
+    except Exception as e:
+        logger.warning(f"Failed to publish report job event {job.job_uuid}: {e}")
+        # Без брокера доставляем хотя бы подписчикам этого процесса
+        await report_job_events.dispatch(event)
+
+
+class ReportJobService:
+    """Создание, просмотр и отмена фоновых заданий отчетов"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def submit_job(
+        self,
+        user_id: int,
+        format_type: ExportFormat,
+        report_type: Optional[ReportType] = None,
+        dataset: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> ReportJob:
+        """Создание задания и постановка в очередь обработчиков"""
+        if (report_type is None) == (dataset is None):
+            raise ValueError("Specify either report_type or dataset")
+        if dataset is not None and dataset not in EXPORT_DATASETS:
+            raise ValueError(f"Unknown export dataset: {dataset}")
+        if report_type is not None and report_type not in (
+            ReportType.TASK_SUMMARY, ReportType.PERFORMANCE, ReportType.TIME_TRACKING
+        ):
+            raise ValueError(f"Unsupported report type: {report_type}")
+        get_stream_writer(format_type)  # ValueError для неподдерживаемого формата
+
+        active = await self.session.scalar(
+            select(func.count(ReportJob.id)).where(
+                ReportJob.user_id == user_id,
+                ReportJob.status.in_(ACTIVE_STATUSES)
+            )
+        )
+        if active >= settings.reports.jobs_max_active_per_user:
+            raise ReportJobLimitError(f"User {user_id} already has {active} active report jobs")
+
+        job = ReportJob(
+            job_uuid=str(uuid.uuid4()),
+            user_id=user_id,
+            report_type=report_type.value if report_type is not None else None,
+            dataset=dataset,
+            format_type=ExportFormat(format_type).value,
+            params=params or {},
+            status=ReportJobStatus.QUEUED.value,
+            progress=0,
+            progress_message="Queued",
+            created_at=datetime.utcnow()
+        )
+        self.session.add(job)
+        await self.session.commit()
+
+        try:
+            await rabbit.send_message(
+                settings.reports.jobs_queue,
+                {"job_uuid": job.job_uuid},
+                arguments=REPORT_JOB_QUEUE_ARGUMENTS
+            )
+        except Exception as e:
+            logger.error(f"Failed to enqueue report job {job.job_uuid}: {e}")
+            job.status = ReportJobStatus.FAILED.value
+            job.error_message = "Report queue is unavailable"
+            job.finished_at = datetime.utcnow()
+            await self.session.commit()
+            raise
+
+        logger.info(f"Queued report job {job.job_uuid} for user {user_id}")
+        return job
+
+    async def get_job(self, job_uuid: str) -> Optional[ReportJob]:
+        return await self.session.scalar(select(ReportJob).where(ReportJob.job_uuid == job_uuid))
+
+    async def list_jobs(self, user_id: int, limit: int = 20) -> List[ReportJob]:
+        result = await self.session.execute(
+            select(ReportJob)
+            .where(ReportJob.user_id == user_id)
+            .order_by(ReportJob.created_at.desc())
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+    async def cancel_job(self, job: ReportJob) -> ReportJob:
+        """Отмена задания; обработчик прервет построение при следующем обновлении прогресса"""
+        if _status_value(job.status) in ACTIVE_STATUSES:
+            job.status = ReportJobStatus.CANCELLED.value
+            job.progress_message = "Cancelled"
+            job.finished_at = datetime.utcnow()
+            await self.session.commit()
+            await publish_job_event(job)
+        return job
+
+
+class ReportJobProgress:
+    """Обновление прогресса задания с ограничением частоты записи в БД"""
+
+    def __init__(self, session: AsyncSession, job: ReportJob, interval: Optional[float] = None):
+        self.session = session
+        self.job = job
+        self.interval = settings.reports.jobs_progress_interval_seconds if interval is None else interval
+        self._last_update = 0.0
+
+    async def update(self, progress: int, message: Optional[str] = None, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_update < self.interval:
+            return
+        self._last_update = now
+
+        # Отмена из API видна только в БД: перечитываем статус
+        status = await self.session.scalar(
+            select(ReportJob.status).where(ReportJob.id == self.job.id)
+        )
+        if _status_value(status) == ReportJobStatus.CANCELLED.value:
+            raise ReportJobCancelled(self.job.job_uuid)
+
+        self.job.progress = max(0, min(100, int(progress)))
+        if message is not None:
+            self.job.progress_message = message
+        await self.session.commit()
+        await publish_job_event(self.job)
+
+
+class ReportJobWorker:
+    """RabbitMQ consumer for report jobs"""
+
+    def __init__(self, concurrency: Optional[int] = None):
+        self.queue_name = settings.reports.jobs_queue
+        self.concurrency = concurrency or settings.reports.jobs_concurrency
+        self.is_running = False
+        self.cleanup_interval_seconds = 3600
+
+    async def start_consuming(self):
+        """Start consuming report jobs with bounded concurrency"""
+        if self.is_running:
+            logger.warning("Report job worker is already running")
+            return
+
+        self.is_running = True
+        logger.info(f"Starting report job worker for queue {self.queue_name} (concurrency {self.concurrency})")
+
+        try:
+            await rabbit.setup_dlx()
+            await rabbit.consume_concurrently(
+                queue=self.queue_name,
+                callback=self.process_job_message,
+                concurrency=self.concurrency,
+                arguments=REPORT_JOB_QUEUE_ARGUMENTS
+            )
+        finally:
+            self.is_running = False
+
+    async def stop_consuming(self):
+        self.is_running = False
+        logger.info("Stopping report job worker")
+
+    async def run_cleanup(self):
+        """Периодическое удаление просроченных артефактов"""
+        while True:
+            try:
+                await self.cleanup_expired()
+            except Exception as e:
+                logger.error(f"Error cleaning up report artifacts: {e}")
+            await asyncio.sleep(self.cleanup_interval_seconds)
+
+    async def process_job_message(self, message_data: Dict[str, Any]):
+        job_uuid = message_data.get("job_uuid")
+        if not job_uuid:
+            logger.error("No job_uuid provided in report job message")
+            return
+        # Каждое сообщение обрабатывается в своей задаче - источник медленных запросов задания
+        set_query_origin(f"report_job:{job_uuid}")
+        await self.run_job(job_uuid)
+
+    async def run_job(self, job_uuid: str):
+        """Построение отчета задания в файл хранилища артефактов"""
+        async with get_db_helper().get_session() as session:
+            job = await session.scalar(select(ReportJob).where(ReportJob.job_uuid == job_uuid))
+            if job is None:
+                logger.warning(f"Report job {job_uuid} not found")
+                return
+            if _status_value(job.status) in TERMINAL_STATUSES:
+                # Отменено до начала или повторная доставка уже выполненного
+                return
+
+            job.attempts = (job.attempts or 0) + 1
+            if job.attempts > MAX_JOB_ATTEMPTS:
+                await self._finish_failed(session, job, "Превышено число попыток построения отчета")
+                return
+
+            job.status = ReportJobStatus.RUNNING.value
+            job.started_at = datetime.utcnow()
+            job.progress = 0
+            job.progress_message = "Started"
+            await session.commit()
+            await publish_job_event(job)
+
+            writer = get_stream_writer(job.format_type, title=self._title(job))
+            directory = artifacts_dir()
+            await aiofiles.os.makedirs(directory, exist_ok=True)
+            final_path = directory / f"{job.job_uuid}.{writer.extension}"
+            part_path = final_path.with_name(final_path.name + ".part")
+            progress = ReportJobProgress(session, job)
+
+            try:
+                async with aiofiles.open(part_path, "wb") as artifact:
+                    if job.dataset:
+                        await self._write_dataset(job, writer, artifact, progress)
+                    else:
+                        await self._write_report(session, job, writer, artifact, progress)
+                await aiofiles.os.replace(part_path, final_path)
+            except ReportJobCancelled:
+                await remove_artifact(part_path)
+                logger.info(f"Report job {job_uuid} cancelled")
+                return
+            except Exception as e:
+                await remove_artifact(part_path)
+                logger.error(f"Report job {job_uuid} failed: {e}")
+                await session.rollback()
+                await self._finish_failed(session, job, "Ошибка при построении отчета")
+                return
+
+            # Прогресс проверяет отмену не на каждой пачке: перечитываем статус под блокировкой строки,
+            # иначе отмена после последней проверки была бы перезаписана завершением
+            status = await session.scalar(
+                select(ReportJob.status).where(ReportJob.id == job.id).with_for_update()
+            )
+            if _status_value(status) == ReportJobStatus.CANCELLED.value:
+                await session.rollback()
+                await remove_artifact(final_path)
+                logger.info(f"Report job {job_uuid} cancelled")
+                return
+
+            now = datetime.utcnow()
+            job.status = ReportJobStatus.COMPLETED.value
+            job.progress = 100
+            job.progress_message = "Completed"
+            job.artifact_path = str(final_path)
+            job.artifact_name = f"{job.dataset or job.report_type}_{now.strftime('%Y%m%d_%H%M%S')}.{writer.extension}"
+            job.artifact_size = (await aiofiles.os.stat(final_path)).st_size
+            job.content_type = writer.media_type
+            job.finished_at = now
+            job.expires_at = now + timedelta(hours=settings.reports.jobs_artifact_ttl_hours)
+            await session.commit()
+            await publish_job_event(job)
+            logger.info(f"Report job {job_uuid} completed: {job.artifact_size} bytes")
+
+    @staticmethod
+    def _title(job: ReportJob) -> str:
+        if job.dataset:
+            return EXPORT_DATASETS[job.dataset].title
+        return job.report_type.replace("_", " ").title()
+
+    async def _write_dataset(self, job: ReportJob, writer, artifact, progress: ReportJobProgress):
+        dataset = EXPORT_DATASETS[job.dataset]
+        filters = decode_job_params(job.params)
+        total = await count_dataset_rows(dataset, **filters)
+        await progress.update(1, f"Exporting {total} rows", force=True)
+
+        async def on_batch(rows_done: int):
+            await progress.update(rows_done * 99 // max(total, 1), f"Exported {rows_done} of {total} rows")
+
+        async for chunk in stream_dataset(dataset, writer, on_batch=on_batch, **filters):
+            await artifact.write(chunk)
+
+    async def _write_report(self, session: AsyncSession, job: ReportJob, writer, artifact, progress: ReportJobProgress):
+        await progress.update(10, "Generating report", force=True)
+        report_data = await report_generator.get_or_generate_report(
+            session=session,
+            report_type=ReportType(job.report_type),
+            **decode_job_params(job.params)
+        )
+        await progress.update(70, "Rendering file", force=True)
+
+        exported = await ReportsService(session).export_report_data(report_data, ExportFormat(job.format_type))
+        if isinstance(exported, dict):
+            exported = json.dumps(exported, default=str, ensure_ascii=False, indent=2)
+        if isinstance(exported, str):
+            exported = exported.encode("utf-8")
+        await artifact.write(exported)
+
+    async def _finish_failed(self, session: AsyncSession, job: ReportJob, message: str):
+        job.status = ReportJobStatus.FAILED.value
+        job.error_message = message
+        job.progress_message = "Failed"
+        job.finished_at = datetime.utcnow()
+        await session.commit()
+        await publish_job_event(job)
+
+    async def cleanup_expired(self, now: Optional[datetime] = None) -> int:
+        """Удаление файлов просроченных заданий (записи остаются для истории)"""
+        now = now or datetime.utcnow()
+        removed = 0
+        async with get_db_helper().get_session() as session:
+            result = await session.execute(
+                select(ReportJob).where(
+                    ReportJob.status == ReportJobStatus.COMPLETED.value,
+                    ReportJob.expires_at < now,
+                    ReportJob.artifact_path.is_not(None)
+                )
+            )
+            for job in result.scalars():
+                await remove_artifact(job.artifact_path)
+                job.artifact_path = None
+                job.progress_message = "Expired"
+                removed += 1
+            await session.commit()
+        if removed:
+            logger.info(f"Removed {removed} expired report artifacts")
+        return removed
+
+
+# Глобальные экземпляры
+report_job_events = ReportJobEventHub()
+report_job_worker = ReportJobWorker()
+
+
+async def start_report_job_worker():
+    """Запуск обработчика заданий и очистки артефактов"""
+    cleanup_task = asyncio.create_task(report_job_worker.run_cleanup())
+    try:
+        await report_job_worker.start_consuming()
+    finally:
+        cleanup_task.cancel()
+
+
+async def stop_report_job_worker():
+    await report_job_worker.stop_consuming()
+
+
+__all__ = [
+    "ReportJobService",
+    "ReportJobWorker",
+    "ReportJobEventHub",
+    "ReportJobProgress",
+    "ReportJobLimitError",
+    "ReportJobCancelled",
+    "REPORT_JOB_QUEUE_ARGUMENTS",
+    "job_to_dict",
+    "decode_job_params",
+    "publish_job_event",
+    "job_event_stream",
+    "remove_artifact",
+    "report_job_events",
+    "report_job_worker",
+    "start_report_job_worker",
+    "stop_report_job_worker",
+]
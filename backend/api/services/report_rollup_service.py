@@ -0,0 +1,944 @@
+"""
+Сервис предагрегированных дневных показателей для отчетов (report_rollups)
+
+Задачи учитываются по дню создания, записи времени - по дню начала работы.
+Агрегаты обновляются инкрементально в той же транзакции, что и изменение
+задачи/записи времени (события flush сессии SQLAlchemy), и периодически
+сверяются с исходными таблицами фоновым процессом.
+"""
+
+import asyncio
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, date, time, timedelta
+from enum import Enum
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+
+from sqlalchemy import and_, case, delete, event, func, insert, inspect, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.base import NEVER_SET, NO_VALUE
+
+from core.database import get_db_helper
+from core.database.models.report_model import ReportRollup, ReportRollupScope
+from core.database.models.task_model import Task, TaskTimeLog, TaskStatus
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Метрики и их корзины (bucket)
+METRIC_TASKS = "tasks"  # total
+METRIC_STATUS = "status"  # значение TaskStatus
+METRIC_PRIORITY = "priority"  # значение TaskPriority
+METRIC_TYPE = "type"  # значение TaskType
+METRIC_COMPLETED = "completed"  # total
+METRIC_OVERDUE = "overdue"  # total
+METRIC_COMPLETION_HOURS = "completion_hours"  # sum / count
+METRIC_HOURS = "hours"  # total
+METRIC_TIME_ENTRIES = "time_entries"  # total
+
+TASK_METRICS = (
+    METRIC_TASKS, METRIC_STATUS, METRIC_PRIORITY, METRIC_TYPE,
+    METRIC_COMPLETED, METRIC_OVERDUE, METRIC_COMPLETION_HOURS
+)
+TIME_LOG_METRICS = (METRIC_HOURS, METRIC_TIME_ENTRIES)
+
+TASK_SNAPSHOT_FIELDS = (
+    "created_at", "status", "priority", "task_type", "due_date", "completed_at",
+    "owner_id", "executor_id", "department_id", "organization_id"
+)
+TIME_LOG_SNAPSHOT_FIELDS = ("user_id", "hours", "start_time")
+
+CLOSED_STATUSES = (TaskStatus.COMPLETED.value, TaskStatus.CANCELLED.value)
+
+# (scope_type, scope_id, day, metric, bucket)
+RollupKey = Tuple[str, int, date, str, str]
+# (metric, bucket) -> value
+MetricTotals = Counter
+
+_ADVISORY_LOCK_KEY = 7_026_001  # pg_try_advisory_lock: одна сверка на все воркеры
+# pg_advisory_xact_lock(класс, номер дня): пересчет дня берет исключительную
+# блокировку, запись разницы трекером - разделяемую на каждый затронутый день
+_DAY_LOCK_CLASS = 7026
+# Служебная строка агрегатов: время (POSIX) последнего полного пересчета
+_REBUILT_METRIC = "_rebuilt"
+_REBUILT_DAY = date(1970, 1, 1)
+_FULL_REBUILD_INTERVAL = timedelta(days=1)
+_UPSERT_CHUNK_SIZE = 500
+_PENDING_KEY = "report_rollups_pending"
+
+
+def _plain(value: Any) -> Any:
+    """Значение enum -> строка"""
+    return value.value if isinstance(value, Enum) else value
+
+
+def _as_day(value: Any) -> date:
+    """Нормализация результата func.date() (в SQLite возвращается строка)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def is_task_overdue(due_date: Optional[datetime], status: Any, now: datetime) -> bool:
+    """Просрочена ли задача на момент now"""
+    return bool(due_date and due_date < now and _plain(status) not in CLOSED_STATUSES)
+
+
+def task_scopes(
+    owner_id: Optional[int],
+    executor_id: Optional[int],
+    department_id: Optional[int],
+    organization_id: Optional[int]
+) -> List[Tuple[str, int]]:
+    """Области, в которые попадает задача"""
+    scopes = [(ReportRollupScope.GLOBAL.value, 0)]
+    if organization_id:
+        scopes.append((ReportRollupScope.ORGANIZATION.value, organization_id))
+    if department_id:
+        scopes.append((ReportRollupScope.DEPARTMENT.value, department_id))
+    if executor_id:
+        scopes.append((ReportRollupScope.USER.value, executor_id))
+    for participant_id in sorted({owner_id, executor_id} - {None}):
+        scopes.append((ReportRollupScope.PARTICIPANT.value, participant_id))
+    return scopes
+
+
+def task_metrics(snapshot: Dict[str, Any], now: datetime) -> List[Tuple[str, str, float]]:
+    """Вклад одной задачи в метрики дня ее создания"""
+    status = _plain(snapshot.get("status"))
+    metrics = [
+        (METRIC_TASKS, "total", 1),
+        (METRIC_STATUS, status, 1),
+        (METRIC_PRIORITY, _plain(snapshot.get("priority")), 1),
+        (METRIC_TYPE, _plain(snapshot.get("task_type")), 1),
+    ]
+    if status == TaskStatus.COMPLETED.value:
+        metrics.append((METRIC_COMPLETED, "total", 1))
+        completed_at = snapshot.get("completed_at")
+        if completed_at:
+            hours = (completed_at - snapshot["created_at"]).total_seconds() / 3600
+            metrics.append((METRIC_COMPLETION_HOURS, "sum", hours))
+            metrics.append((METRIC_COMPLETION_HOURS, "count", 1))
+    if is_task_overdue(snapshot.get("due_date"), status, now):
+        metrics.append((METRIC_OVERDUE, "total", 1))
+    return metrics
+
+
+def task_contribution(snapshot: Optional[Dict[str, Any]], now: datetime) -> Dict[RollupKey, float]:
+    """Вклад задачи во все агрегаты"""
+    if not snapshot or not snapshot.get("created_at"):
+        return {}
+    day = snapshot["created_at"].date()
+    contribution: Dict[RollupKey, float] = defaultdict(float)
+    scopes = task_scopes(
+        snapshot.get("owner_id"), snapshot.get("executor_id"),
+        snapshot.get("department_id"), snapshot.get("organization_id")
+    )
+    for metric, bucket, value in task_metrics(snapshot, now):
+        for scope_type, scope_id in scopes:
+            contribution[(scope_type, scope_id, day, metric, bucket or "")] += value
+    return dict(contribution)
+
+
+def time_log_contribution(snapshot: Optional[Dict[str, Any]]) -> Dict[RollupKey, float]:
+    """Вклад записи времени во все агрегаты"""
+    if not snapshot or not snapshot.get("start_time"):
+        return {}
+    day = snapshot["start_time"].date()
+    scopes = [(ReportRollupScope.GLOBAL.value, 0)]
+    if snapshot.get("user_id"):
+        scopes.append((ReportRollupScope.USER.value, snapshot["user_id"]))
+    contribution: Dict[RollupKey, float] = {}
+    for scope_type, scope_id in scopes:
+        contribution[(scope_type, scope_id, day, METRIC_HOURS, "total")] = float(snapshot.get("hours") or 0)
+        contribution[(scope_type, scope_id, day, METRIC_TIME_ENTRIES, "total")] = 1
+    return contribution
+
+
+def diff_contributions(old: Dict[RollupKey, float], new: Dict[RollupKey, float]) -> Dict[RollupKey, float]:
+    """Разница нового и старого вклада без нулевых изменений"""
+    delta: Dict[RollupKey, float] = {}
+    for key in set(old) | set(new):
+        value = new.get(key, 0) - old.get(key, 0)
+        if abs(value) > 1e-9:
+            delta[key] = value
+    return delta
+
+
+@dataclass
+class RollupWindow:
+    """Разбиение периода отчета на полные дни (из агрегатов) и неполные края"""
+    head: Optional[Tuple[datetime, datetime]] = None  # [start, end) по исходным данным
+    days: Optional[Tuple[Optional[date], Optional[date]]] = None  # полные дни включительно
+    tail: Optional[Tuple[datetime, datetime]] = None  # [start, end] по исходным данным
+
+
+def split_report_range(start: Optional[datetime], end: Optional[datetime]) -> RollupWindow:
+    """Разбиение [start, end] на неполный первый день, полные дни и неполный последний день"""
+    if start and end:
+        if start > end:
+            return RollupWindow()
+        if start.date() == end.date():
+            return RollupWindow(tail=(start, end))
+
+    window = RollupWindow()
+    first_day: Optional[date] = None
+    last_day: Optional[date] = None
+
+    if start:
+        first_day = start.date()
+        if start.time() != time.min:
+            first_day += timedelta(days=1)
+            window.head = (start, datetime.combine(first_day, time.min))
+    if end:
+        last_day = end.date() - timedelta(days=1)
+        window.tail = (datetime.combine(end.date(), time.min), end)
+
+    if first_day is None or last_day is None or first_day <= last_day:
+        window.days = (first_day, last_day)
+    return window
+
+
+def _hours_between(dialect_name: str, start_col, end_col):
+    """SQL-выражение разницы во времени в часах"""
+    if dialect_name == "sqlite":
+        return (func.julianday(end_col) - func.julianday(start_col)) * 24
+    return func.extract("epoch", end_col - start_col) / 3600
+
+
+def _dialect_name(session) -> str:
+    return session.get_bind().dialect.name
+
+
+def _task_scope_columns(scope_type: str) -> List[Any]:
+    """Колонки Task, по которым задача попадает в область"""
+    if scope_type == ReportRollupScope.ORGANIZATION.value:
+        return [Task.organization_id]
+    if scope_type == ReportRollupScope.DEPARTMENT.value:
+        return [Task.department_id]
+    if scope_type == ReportRollupScope.USER.value:
+        return [Task.executor_id]
+    if scope_type == ReportRollupScope.PARTICIPANT.value:
+        return [Task.owner_id, Task.executor_id]
+    return []
+
+
+def task_scope_condition(scope_type: str, scope_ids: Optional[Sequence[int]]):
+    """Условие WHERE для задач области (None - без ограничений)"""
+    columns = _task_scope_columns(scope_type)
+    if not columns or scope_ids is None:
+        return None
+    return or_(*[column.in_(list(scope_ids)) for column in columns])
+
+
+async def aggregate_task_facts(
+    session: AsyncSession,
+    scope_type: str,
+    scope_ids: Optional[Sequence[int]] = None,
+    conditions: Optional[List[Any]] = None,
+    by_day: bool = False,
+    now: Optional[datetime] = None
+) -> Dict[Tuple[int, Optional[date]], MetricTotals]:
+    """Агрегация метрик задач напрямую по таблице tasks (GROUP BY в БД)"""
+    now = now or datetime.now()
+    dialect_name = _dialect_name(session)
+    completion_hours = _hours_between(dialect_name, Task.created_at, Task.completed_at)
+    is_completed = and_(Task.status == TaskStatus.COMPLETED.value, Task.completed_at.isnot(None))
+    is_overdue = and_(Task.due_date.isnot(None), Task.due_date < now, Task.status.notin_(CLOSED_STATUSES))
+    day_column = func.date(Task.created_at)
+
+    columns = _task_scope_columns(scope_type)
+    # Участник: задачи владельца + задачи исполнителя, если он не владелец
+    variants: List[Tuple[Any, List[Any]]] = []
+    if scope_type == ReportRollupScope.PARTICIPANT.value:
+        variants.append((Task.owner_id, []))
+        variants.append((Task.executor_id, [Task.executor_id.isnot(None), Task.executor_id != Task.owner_id]))
+    elif columns:
+        variants.append((columns[0], [columns[0].isnot(None)]))
+    else:
+        variants.append((None, []))
+
+    totals: Dict[Tuple[int, Optional[date]], MetricTotals] = defaultdict(Counter)
+    for scope_column, scope_filters in variants:
+        group_columns = []
+        if scope_column is not None:
+            group_columns.append(scope_column)
+        if by_day:
+            group_columns.append(day_column)
+
+        query = select(
+            *group_columns,
+            Task.status,
+            Task.priority,
+            Task.task_type,
+            func.count(Task.id),
+            func.sum(case((is_overdue, 1), else_=0)),
+            func.sum(case((is_completed, completion_hours), else_=0)),
+            func.sum(case((is_completed, 1), else_=0)),
+        ).group_by(*group_columns, Task.status, Task.priority, Task.task_type)
+
+        where = list(scope_filters) + list(conditions or [])
+        if scope_column is not None and scope_ids is not None:
+            where.append(scope_column.in_(list(scope_ids)))
+        if where:
+            query = query.where(and_(*where))
+
+        result = await session.execute(query)
+        for row in result.all():
+            offset = 0
+            scope_id = 0
+            day = None
+            if scope_column is not None:
+                scope_id = row[0]
+                offset += 1
+            if by_day:
+                day = _as_day(row[offset])
+                offset += 1
+            status, priority, task_type, count, overdue, hours_sum, hours_count = row[offset:]
+            metrics = totals[(scope_id, day)]
+            metrics[(METRIC_TASKS, "total")] += count
+            metrics[(METRIC_STATUS, _plain(status))] += count
+            metrics[(METRIC_PRIORITY, _plain(priority))] += count
+            metrics[(METRIC_TYPE, _plain(task_type))] += count
+            if _plain(status) == TaskStatus.COMPLETED.value:
+                metrics[(METRIC_COMPLETED, "total")] += count
+            if overdue:
+                metrics[(METRIC_OVERDUE, "total")] += overdue
+            if hours_count:
+                metrics[(METRIC_COMPLETION_HOURS, "sum")] += float(hours_sum or 0)
+                metrics[(METRIC_COMPLETION_HOURS, "count")] += hours_count
+    return totals
+
+
+async def aggregate_time_log_facts(
+    session: AsyncSession,
+    scope_type: str,
+    scope_ids: Optional[Sequence[int]] = None,
+    conditions: Optional[List[Any]] = None,
+    by_day: bool = False
+) -> Dict[Tuple[int, Optional[date]], MetricTotals]:
+    """Агрегация часов напрямую по таблице task_time_logs"""
+    group_columns = []
+    scope_column = TaskTimeLog.user_id if scope_type == ReportRollupScope.USER.value else None
+    if scope_column is not None:
+        group_columns.append(scope_column)
+    if by_day:
+        group_columns.append(func.date(TaskTimeLog.start_time))
+
+    query = select(*group_columns, func.sum(TaskTimeLog.hours), func.count(TaskTimeLog.id))
+    if group_columns:
+        query = query.group_by(*group_columns)
+    where = list(conditions or [])
+    if scope_column is not None and scope_ids is not None:
+        where.append(scope_column.in_(list(scope_ids)))
+    if where:
+        query = query.where(and_(*where))
+
+    totals: Dict[Tuple[int, Optional[date]], MetricTotals] = defaultdict(Counter)
+    result = await session.execute(query)
+    for row in result.all():
+        offset = 0
+        scope_id = 0
+        day = None
+        if scope_column is not None:
+            scope_id = row[0]
+            offset += 1
+        if by_day:
+            day = _as_day(row[offset])
+            offset += 1
+        hours, entries = row[offset:]
+        if not entries:
+            continue
+        metrics = totals[(scope_id, day)]
+        metrics[(METRIC_HOURS, "total")] += float(hours or 0)
+        metrics[(METRIC_TIME_ENTRIES, "total")] += entries
+    return totals
+
+
+async def sum_rollups(
+    session: AsyncSession,
+    scope_type: str,
+    scope_ids: Optional[Sequence[int]],
+    first_day: Optional[date],
+    last_day: Optional[date],
+    metrics: Iterable[str]
+) -> Dict[int, MetricTotals]:
+    """Сумма дневных агрегатов за период по областям"""
+    query = select(
+        ReportRollup.scope_id, ReportRollup.metric, ReportRollup.bucket, func.sum(ReportRollup.value)
+    ).where(
+        ReportRollup.scope_type == scope_type,
+        ReportRollup.metric.in_(list(metrics))
+    ).group_by(ReportRollup.scope_id, ReportRollup.metric, ReportRollup.bucket)
+
+    if scope_ids is not None:
+        query = query.where(ReportRollup.scope_id.in_(list(scope_ids)))
+    if first_day:
+        query = query.where(ReportRollup.day >= first_day)
+    if last_day:
+        query = query.where(ReportRollup.day <= last_day)
+
+    totals: Dict[int, MetricTotals] = defaultdict(Counter)
+    result = await session.execute(query)
+    for scope_id, metric, bucket, value in result.all():
+        totals[scope_id][(metric, bucket)] += value or 0
+    return totals
+
+
+def _merge(target: Dict[int, MetricTotals], source: Dict[Tuple[int, Optional[date]], MetricTotals]) -> None:
+    for (scope_id, _day), metrics in source.items():
+        target[scope_id].update(metrics)
+
+
+async def collect_task_metrics(
+    session: AsyncSession,
+    scope_type: str,
+    scope_ids: Optional[Sequence[int]] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    conditions: Optional[List[Any]] = None,
+    use_rollups: Optional[bool] = None
+) -> Dict[int, MetricTotals]:
+    """Метрики задач за период: полные дни из агрегатов, края периода - из исходной таблицы.
+
+    При дополнительных условиях (фильтры по статусу, приоритету и т.п.)
+    агрегаты неприменимы, и весь период считается запросом с GROUP BY.
+    """
+    if use_rollups is None:
+        use_rollups = settings.reports.use_rollups
+
+    totals: Dict[int, MetricTotals] = defaultdict(Counter)
+    if not use_rollups or conditions:
+        where = list(conditions or [])
+        if start_date:
+            where.append(Task.created_at >= start_date)
+        if end_date:
+            where.append(Task.created_at <= end_date)
+        _merge(totals, await aggregate_task_facts(session, scope_type, scope_ids, where))
+        return totals
+
+    window = split_report_range(start_date, end_date)
+    if window.days:
+        rollups = await sum_rollups(session, scope_type, scope_ids, *window.days, TASK_METRICS)
+        for scope_id, metrics in rollups.items():
+            totals[scope_id].update(metrics)
+    if window.head:
+        head_where = [Task.created_at >= window.head[0], Task.created_at < window.head[1]]
+        _merge(totals, await aggregate_task_facts(session, scope_type, scope_ids, head_where))
+    if window.tail:
+        tail_where = [Task.created_at >= window.tail[0], Task.created_at <= window.tail[1]]
+        _merge(totals, await aggregate_task_facts(session, scope_type, scope_ids, tail_where))
+    return totals
+
+
+def _time_log_period(start_date: Optional[datetime], end_date: Optional[datetime],
+                     conditions: Optional[List[Any]]) -> List[Any]:
+    where = list(conditions or [])
+    if start_date:
+        where.append(TaskTimeLog.start_time >= start_date)
+    if end_date:
+        where.append(TaskTimeLog.start_time <= end_date)
+    return where
+
+
+async def collect_time_log_metrics(
+    session: AsyncSession,
+    scope_type: str,
+    scope_ids: Optional[Sequence[int]] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    conditions: Optional[List[Any]] = None,
+    use_rollups: Optional[bool] = None
+) -> Dict[int, MetricTotals]:
+    """Часы и количество записей времени за период (аналогично collect_task_metrics)"""
+    if use_rollups is None:
+        use_rollups = settings.reports.use_rollups
+
+    totals: Dict[int, MetricTotals] = defaultdict(Counter)
+    if not use_rollups or conditions:
+        where = _time_log_period(start_date, end_date, conditions)
+        _merge(totals, await aggregate_time_log_facts(session, scope_type, scope_ids, where))
+        return totals
+
+    window = split_report_range(start_date, end_date)
+    if window.days:
+        rollups = await sum_rollups(session, scope_type, scope_ids, *window.days, TIME_LOG_METRICS)
+        for scope_id, metrics in rollups.items():
+            totals[scope_id].update(metrics)
+    if window.head:
+        head_where = [TaskTimeLog.start_time >= window.head[0], TaskTimeLog.start_time < window.head[1]]
+        _merge(totals, await aggregate_time_log_facts(session, scope_type, scope_ids, head_where))
+    if window.tail:
+        tail_where = [TaskTimeLog.start_time >= window.tail[0], TaskTimeLog.start_time <= window.tail[1]]
+        _merge(totals, await aggregate_time_log_facts(session, scope_type, scope_ids, tail_where))
+    return totals
+
+
+async def collect_time_log_metrics_by_day(
+    session: AsyncSession,
+    scope_type: str,
+    scope_ids: Optional[Sequence[int]] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    conditions: Optional[List[Any]] = None,
+    use_rollups: Optional[bool] = None
+) -> Dict[date, MetricTotals]:
+    """Часы и количество записей времени по дням периода (сумма по областям)"""
+    if use_rollups is None:
+        use_rollups = settings.reports.use_rollups
+
+    totals: Dict[date, MetricTotals] = defaultdict(Counter)
+
+    def merge(source: Dict[Tuple[int, Optional[date]], MetricTotals]) -> None:
+        for (_scope_id, day), metrics in source.items():
+            totals[day].update(metrics)
+
+    if not use_rollups or conditions:
+        where = _time_log_period(start_date, end_date, conditions)
+        merge(await aggregate_time_log_facts(session, scope_type, scope_ids, where, by_day=True))
+        return totals
+
+    window = split_report_range(start_date, end_date)
+    if window.days:
+        first_day, last_day = window.days
+        query = select(ReportRollup.day, ReportRollup.metric, func.sum(ReportRollup.value)).where(
+            ReportRollup.scope_type == scope_type,
+            ReportRollup.metric.in_(TIME_LOG_METRICS),
+            ReportRollup.bucket == "total"
+        ).group_by(ReportRollup.day, ReportRollup.metric)
+        if scope_ids is not None:
+            query = query.where(ReportRollup.scope_id.in_(list(scope_ids)))
+        if first_day:
+            query = query.where(ReportRollup.day >= first_day)
+        if last_day:
+            query = query.where(ReportRollup.day <= last_day)
+        for day, metric, value in (await session.execute(query)).all():
+            totals[_as_day(day)][(metric, "total")] += value or 0
+    if window.head:
+        head_where = [TaskTimeLog.start_time >= window.head[0], TaskTimeLog.start_time < window.head[1]]
+        merge(await aggregate_time_log_facts(session, scope_type, scope_ids, head_where, by_day=True))
+    if window.tail:
+        tail_where = [TaskTimeLog.start_time >= window.tail[0], TaskTimeLog.start_time <= window.tail[1]]
+        merge(await aggregate_time_log_facts(session, scope_type, scope_ids, tail_where, by_day=True))
+    return totals
+
+
+##################### Инкрементальное обновление #####################
+
+def _upsert_statement(dialect_name: str, rows: List[Dict[str, Any]]):
+    """INSERT ... ON CONFLICT DO UPDATE value = value + excluded.value (None - диалект без ON CONFLICT)"""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+
+    stmt = dialect_insert(ReportRollup).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["scope_type", "scope_id", "day", "metric", "bucket"],
+        set_={
+            "value": ReportRollup.value + stmt.excluded.value,
+            "updated_at": stmt.excluded.updated_at,
+        }
+    )
+
+
+def _add_row(session: Session, row: Dict[str, Any]) -> None:
+    """Переносимый upsert одной строки: SELECT, затем UPDATE или INSERT"""
+    table = ReportRollup.__table__
+    row_id = session.execute(
+        select(table.c.id).where(
+            table.c.scope_type == row["scope_type"], table.c.scope_id == row["scope_id"],
+            table.c.day == row["day"], table.c.metric == row["metric"], table.c.bucket == row["bucket"]
+        ).with_for_update()
+    ).scalar()
+    if row_id is None:
+        session.execute(insert(table).values(**row))
+    else:
+        session.execute(
+            update(table).where(table.c.id == row_id)
+            .values(value=table.c.value + row["value"], updated_at=row["updated_at"])
+        )
+
+
+def write_rollup_rows(session: Session, rows: List[Dict[str, Any]], dialect_name: Optional[str] = None) -> None:
+    """Прибавление значений к агрегатам (синхронная сессия: событие flush или run_sync)"""
+    dialect_name = dialect_name or session.get_bind().dialect.name
+    for index in range(0, len(rows), _UPSERT_CHUNK_SIZE):
+        chunk = rows[index:index + _UPSERT_CHUNK_SIZE]
+        stmt = _upsert_statement(dialect_name, chunk)
+        if stmt is not None:
+            session.execute(stmt)
+            continue
+        for row in chunk:
+            _add_row(session, row)
+
+
+def _lock_days_shared(session: Session, days: Iterable[date]) -> None:
+    """Запись разницы ждет завершения пересчета этих дней (только PostgreSQL)"""
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    for day in sorted(set(days)):
+        session.execute(
+            text("SELECT pg_advisory_xact_lock_shared(:lock_class, :day)"),
+            {"lock_class": _DAY_LOCK_CLASS, "day": day.toordinal()}
+        )
+
+
+def _delta_rows(delta: Dict[RollupKey, float]) -> List[Dict[str, Any]]:
+    # Сортировка задает одинаковый порядок блокировок строк в конкурентных транзакциях
+    updated_at = datetime.utcnow()
+    return [
+        {
+            "scope_type": scope_type, "scope_id": scope_id, "day": day,
+            "metric": metric, "bucket": bucket, "value": value, "updated_at": updated_at,
+        }
+        for (scope_type, scope_id, day, metric, bucket), value in sorted(delta.items(), key=lambda item: item[0])
+    ]
+
+
+class ReportRollupTracker:
+    """Отслеживание изменений Task/TaskTimeLog и применение разницы к агрегатам.
+
+    В before_flush запоминается вклад объектов до изменения (по
+    committed_state), в after_flush вычисляется новый вклад и разница
+    записывается одним upsert в рамках той же транзакции. Массовые
+    UPDATE/DELETE в обход ORM не отслеживаются - их исправляет сверка.
+    """
+
+    def __init__(self):
+        self._registered = False
+
+    def register(self) -> None:
+        """Подключение обработчиков событий сессии (идемпотентно)"""
+        if self._registered:
+            return
+        event.listen(Session, "before_flush", self._before_flush)
+        event.listen(Session, "after_flush", self._after_flush)
+        self._registered = True
+        logger.info("Report rollup tracker registered")
+
+    def unregister(self) -> None:
+        if not self._registered:
+            return
+        event.remove(Session, "before_flush", self._before_flush)
+        event.remove(Session, "after_flush", self._after_flush)
+        self._registered = False
+
+    @property
+    def is_registered(self) -> bool:
+        return self._registered
+
+    @staticmethod
+    def _snapshot(obj: Any, fields: Sequence[str]) -> Dict[str, Any]:
+        return {field: getattr(obj, field) for field in fields}
+
+    @staticmethod
+    def _committed_snapshot(session: Session, obj: Any, fields: Sequence[str]) -> Dict[str, Any]:
+        """Состояние объекта на момент последнего flush"""
+        state = inspect(obj)
+        snapshot = {}
+        missing = []
+        for field in fields:
+            if field in state.committed_state:
+                value = state.committed_state[field]
+                if value is NO_VALUE or value is NEVER_SET:
+                    missing.append(field)
+                    continue
+                snapshot[field] = value
+            else:
+                snapshot[field] = getattr(obj, field)
+
+        if missing:
+            # Атрибут изменен без предварительной загрузки - читаем из БД
+            model = type(obj)
+            columns = [getattr(model, field) for field in missing]
+            with session.no_autoflush:
+                row = session.execute(select(*columns).where(model.id == obj.id)).first()
+            for field, value in zip(missing, row or [None] * len(missing)):
+                snapshot[field] = value
+        return snapshot
+
+    def _before_flush(self, session: Session, flush_context, instances) -> None:
+        pending = session.info[_PENDING_KEY] = []
+        for obj in session.new:
+            if isinstance(obj, (Task, TaskTimeLog)):
+                pending.append((obj, None, False))
+        for obj in session.dirty:
+            if isinstance(obj, (Task, TaskTimeLog)) and session.is_modified(obj, include_collections=False):
+                fields = TASK_SNAPSHOT_FIELDS if isinstance(obj, Task) else TIME_LOG_SNAPSHOT_FIELDS
+                pending.append((obj, self._committed_snapshot(session, obj, fields), False))
+        for obj in session.deleted:
+            if isinstance(obj, (Task, TaskTimeLog)):
+                fields = TASK_SNAPSHOT_FIELDS if isinstance(obj, Task) else TIME_LOG_SNAPSHOT_FIELDS
+                pending.append((obj, self._committed_snapshot(session, obj, fields), True))
+
+    def _after_flush(self, session: Session, flush_context) -> None:
+        pending = session.info.pop(_PENDING_KEY, None)
+        if not pending:
+            return
+
+        now = datetime.now()
+        delta: Dict[RollupKey, float] = defaultdict(float)
+        for obj, old_snapshot, is_deleted in pending:
+            is_task = isinstance(obj, Task)
+            fields = TASK_SNAPSHOT_FIELDS if is_task else TIME_LOG_SNAPSHOT_FIELDS
+            new_snapshot = None if is_deleted else self._snapshot(obj, fields)
+            if is_task:
+                changes = diff_contributions(task_contribution(old_snapshot, now), task_contribution(new_snapshot, now))
+            else:
+                changes = diff_contributions(time_log_contribution(old_snapshot), time_log_contribution(new_snapshot))
+            for key, value in changes.items():
+                delta[key] += value
+
+        delta = {key: value for key, value in delta.items() if abs(value) > 1e-9}
+        if not delta:
+            return
+
+        _lock_days_shared(session, (key[2] for key in delta))
+        write_rollup_rows(session, _delta_rows(delta))
+
+
+##################### Сверка с исходными таблицами #####################
+
+@asynccontextmanager
+async def _reconcile_lock(session: AsyncSession) -> AsyncIterator[bool]:
+    """Одна сверка одновременно на все воркеры.
+
+    Сверка коммитит после каждого дня, поэтому в PostgreSQL берется
+    сессионная advisory-блокировка на отдельном соединении на все время
+    сверки.
+    """
+    if _dialect_name(session) != "postgresql":
+        yield True
+        return
+    async with session.bind.connect() as connection:
+        acquired = bool((await connection.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY}
+        )).scalar())
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                await connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+
+
+async def _lock_day(session: AsyncSession, day: date) -> None:
+    """Исключительная блокировка дня до конца транзакции: трекер не пишет разницу за этот день"""
+    if _dialect_name(session) != "postgresql":
+        return
+    await session.execute(
+        text("SELECT pg_advisory_xact_lock(:lock_class, :day)"),
+        {"lock_class": _DAY_LOCK_CLASS, "day": day.toordinal()}
+    )
+
+
+async def rebuild_rollup_days(
+    session: AsyncSession,
+    first_day: date,
+    last_day: date,
+    now: Optional[datetime] = None
+) -> int:
+    """Пересчет агрегатов за дни [first_day, last_day] по исходным таблицам.
+
+    Дни блокируются для трекера до конца транзакции: разница, записанная
+    параллельно с пересчетом, иначе была бы учтена дважды. Возвращает
+    количество записанных строк. Коммит выполняет вызывающий код; при
+    пересчете большого периода лучше вызывать по одному дню с коммитом.
+    """
+    now = now or datetime.now()
+    for offset in range((last_day - first_day).days + 1):
+        await _lock_day(session, first_day + timedelta(days=offset))
+
+    period_start = datetime.combine(first_day, time.min)
+    period_end = datetime.combine(last_day + timedelta(days=1), time.min)
+    task_where = [Task.created_at >= period_start, Task.created_at < period_end]
+    log_where = [TaskTimeLog.start_time >= period_start, TaskTimeLog.start_time < period_end]
+
+    await session.execute(
+        delete(ReportRollup).where(
+            ReportRollup.day >= first_day, ReportRollup.day <= last_day, ReportRollup.metric != _REBUILT_METRIC
+        )
+    )
+
+    values: Dict[RollupKey, float] = {}
+    for scope in ReportRollupScope:
+        facts = await aggregate_task_facts(session, scope.value, conditions=task_where, by_day=True, now=now)
+        for (scope_id, day), metrics in facts.items():
+            for (metric, bucket), value in metrics.items():
+                if value:
+                    values[(scope.value, scope_id, day, metric, bucket or "")] = value
+
+    for scope in (ReportRollupScope.GLOBAL, ReportRollupScope.USER):
+        facts = await aggregate_time_log_facts(session, scope.value, conditions=log_where, by_day=True)
+        for (scope_id, day), metrics in facts.items():
+            for (metric, bucket), value in metrics.items():
+                if value:
+                    values[(scope.value, scope_id, day, metric, bucket)] = value
+
+    rows = _delta_rows(values)
+    await session.run_sync(write_rollup_rows, rows)
+    return len(rows)
+
+
+async def _last_full_rebuild(session: AsyncSession) -> Optional[datetime]:
+    value = (await session.execute(
+        select(ReportRollup.value).where(ReportRollup.metric == _REBUILT_METRIC)
+    )).scalar()
+    return datetime.fromtimestamp(value) if value is not None else None
+
+
+async def _mark_full_rebuild(session: AsyncSession, now: datetime) -> None:
+    await session.execute(delete(ReportRollup).where(ReportRollup.metric == _REBUILT_METRIC))
+    session.add(ReportRollup(
+        scope_type=ReportRollupScope.GLOBAL.value, scope_id=0, day=_REBUILT_DAY,
+        metric=_REBUILT_METRIC, bucket="", value=now.timestamp()
+    ))
+
+
+async def overdue_transition_days(session: AsyncSession, since: datetime, now: datetime) -> List[date]:
+    """Дни создания задач, ставших просроченными в интервале (since, now]"""
+    result = await session.execute(
+        select(func.date(Task.created_at)).where(
+            Task.due_date > since,
+            Task.due_date <= now,
+            Task.status.notin_(CLOSED_STATUSES),
+            Task.created_at.isnot(None)
+        ).distinct()
+    )
+    return sorted({_as_day(value) for value in result.scalars().all() if value is not None})
+
+
+class ReportRollupReconciler:
+    """Фоновая сверка агрегатов.
+
+    Каждый цикл пересчитывает дни задач, у которых наступил срок (переход
+    в "просрочено" не сопровождается записью в БД), раз в сутки - все окно
+    последних rollup_reconcile_window_days дней.
+    """
+
+    def __init__(self):
+        self.is_running = False
+        self._last_sweep: Optional[datetime] = None
+
+    async def reconcile_once(self, full: bool = False) -> Dict[str, Any]:
+        """Проход сверки.
+
+        Полный пересчет окна (и достройка истории) - только если агрегатов
+        еще нет или с прошлого полного пересчета (в любом воркере) прошли
+        сутки; иначе пересчитываются только дни задач, ставших
+        просроченными. Каждый день пересчитывается и коммитится отдельно.
+        """
+        now = datetime.now()
+        window_days = settings.reports.rollup_reconcile_window_days
+
+        async with get_db_helper().get_session() as session:
+            async with _reconcile_lock(session) as acquired:
+                if not acquired:
+                    logger.info("Rollup reconciliation is running in another worker, skipping")
+                    self._last_sweep = now
+                    return {"skipped": True}
+
+                history_start = await _unrolled_history_start(session)
+                last_full = await _last_full_rebuild(session)
+                full = full or history_start is not None or last_full is None or \
+                    now - last_full >= _FULL_REBUILD_INTERVAL
+
+                if full:
+                    first_day = now.date() - timedelta(days=window_days)
+                    if history_start and history_start < first_day:
+                        logger.info(f"Backfilling report rollups since {history_start}")
+                        first_day = history_start
+                    days = [first_day + timedelta(days=offset) for offset in range((now.date() - first_day).days + 1)]
+                else:
+                    since = self._last_sweep or now - timedelta(seconds=settings.reports.rollup_reconcile_interval_seconds)
+                    days = await overdue_transition_days(session, since, now)
+                await session.commit()
+
+                rows = 0
+                for day in days:
+                    rows += await rebuild_rollup_days(session, day, day, now=now)
+                    await session.commit()
+                if full:
+                    await _mark_full_rebuild(session, now)
+                    await session.commit()
+
+        self._last_sweep = now
+        logger.info(f"Report rollups reconciled: {len(days)} days, {rows} rows (full={full})")
+        return {"skipped": False, "full": full, "days": len(days), "rows": rows}
+
+    async def run_forever(self) -> None:
+        self.is_running = True
+        logger.info("Report rollup reconciler started")
+        while self.is_running:
+            try:
+                await self.reconcile_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reconciling report rollups: {e}")
+            await asyncio.sleep(settings.reports.rollup_reconcile_interval_seconds)
+
+    def stop(self) -> None:
+        self.is_running = False
+
+
+async def _unrolled_history_start(session: AsyncSession) -> Optional[date]:
+    """Первый день исходных данных, если агрегаты за него еще не построены"""
+    rollup_start = (await session.execute(
+        select(func.min(ReportRollup.day)).where(ReportRollup.metric != _REBUILT_METRIC)
+    )).scalar()
+    facts_start = None
+    for column in (Task.created_at, TaskTimeLog.start_time):
+        value = (await session.execute(select(func.min(column)))).scalar()
+        if value is not None:
+            value = _as_day(value)
+            facts_start = value if facts_start is None else min(facts_start, value)
+    if facts_start is None:
+        return None
+    if rollup_start is None or _as_day(rollup_start) > facts_start:
+        return facts_start
+    return None
+
+
+# Глобальные экземпляры
+report_rollup_tracker = ReportRollupTracker()
+report_rollup_reconciler = ReportRollupReconciler()
+
+
+async def start_report_rollups():
+    """Подключение инкрементального обновления и запуск сверки"""
+    report_rollup_tracker.register()
+    await report_rollup_reconciler.run_forever()
+
+
+async def stop_report_rollups():
+    """Остановка сверки"""
+    report_rollup_reconciler.stop()
+
+
+__all__ = [
+    "ReportRollupTracker",
+    "ReportRollupReconciler",
+    "RollupWindow",
+    "split_report_range",
+    "task_contribution",
+    "time_log_contribution",
+    "diff_contributions",
+    "collect_task_metrics",
+    "collect_time_log_metrics",
+    "collect_time_log_metrics_by_day",
+    "rebuild_rollup_days",
+    "write_rollup_rows",
+    "report_rollup_tracker",
+    "report_rollup_reconciler",
+    "start_report_rollups",
+    "stop_report_rollups",
+]
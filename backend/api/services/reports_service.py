@@ -3,7 +3,8 @@
 """
 
 import uuid
-from typing import List, Optional, Dict, Any, Union
+from collections import Counter
+from typing import List, Optional, Dict, Any, Tuple, Union
 from datetime import datetime, timedelta, date
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_, desc, asc
@@ -16,6 +17,17 @@ from core.database.models.task_model import (
     TaskStatus, TaskPriority, TaskType, TaskVisibility
 )
 from core.database.models.main_models import User, Organization, Department
+from core.database.models.report_model import ReportRollupScope
+from core.settings import settings
+from backend.api.services.report_export_service import (
+    CSVStreamWriter, XLSXStreamWriter, PDFStreamWriter, render_rows
+)
+from backend.api.services.report_cache import ReportCache, ReportCacheInvalidator, make_cache_key, report_tags
+from backend.api.services.report_rollup_service import (
+    METRIC_TASKS, METRIC_STATUS, METRIC_PRIORITY, METRIC_TYPE, METRIC_OVERDUE,
+    METRIC_COMPLETION_HOURS, METRIC_HOURS, METRIC_TIME_ENTRIES,
+    collect_task_metrics, collect_time_log_metrics, collect_time_log_metrics_by_day, task_scope_condition
+)
 
 logger = logging.getLogger(__name__)
 
@@ -57,85 +69,61 @@ class ReportsService:
     ) -> Dict[str, Any]:
         """Генерация сводного отчета по задачам"""
         
-        # Базовый запрос
-        query = select(Task).options(
-            selectinload(Task.owner),
-            selectinload(Task.executor),
-            selectinload(Task.department),
-            selectinload(Task.organization)
+        scope_type, scope_ids, conditions = self._task_summary_scope(
+            user_id, department_id, organization_id, status_filter, priority_filter
         )
         
-        # Применяем фильтры
-        filters = []
+        # Счетчики по полным дням берутся из report_rollups, края периода и
+        # отчеты с фильтрами по статусу/приоритету - GROUP BY по таблице задач
+        totals = await collect_task_metrics(
+            self.session, scope_type, scope_ids,
+            start_date=start_date, end_date=end_date, conditions=conditions
+        )
+        metrics = totals.get(scope_ids[0] if scope_ids else 0, Counter())
         
-        if start_date:
-            filters.append(Task.created_at >= start_date)
-        if end_date:
-            filters.append(Task.created_at <= end_date)
-        if user_id:
-            filters.append(or_(Task.owner_id == user_id, Task.executor_id == user_id))
-        if department_id:
-            filters.append(Task.department_id == department_id)
-        if organization_id:
-            filters.append(Task.organization_id == organization_id)
-        if status_filter:
-            filters.append(Task.status.in_([s.value for s in status_filter]))
-        if priority_filter:
-            filters.append(Task.priority.in_([p.value for p in priority_filter]))
+        total_tasks = int(metrics[(METRIC_TASKS, "total")])
         
-        if filters:
-            query = query.where(and_(*filters))
+        def breakdown(metric: str, values) -> Dict[str, Dict[str, Any]]:
+            stats = {}
+            for value in values:
+                count = int(metrics[(metric, value.value)])
+                stats[value.value] = {
+                    "count": count,
+                    "percentage": round((count / total_tasks * 100) if total_tasks > 0 else 0, 2)
+                }
+            return stats
         
-        result = await self.session.execute(query)
-        tasks = result.scalars().all()
-        
-        # Собираем статистику
-        total_tasks = len(tasks)
-        
-        # Группировка по статусам
-        status_stats = {}
-        for status in TaskStatus:
-            count = len([t for t in tasks if t.status == status])
-            status_stats[status.value] = {
-                "count": count,
-                "percentage": round((count / total_tasks * 100) if total_tasks > 0 else 0, 2)
-            }
-        
-        # Группировка по приоритетам
-        priority_stats = {}
-        for priority in TaskPriority:
-            count = len([t for t in tasks if t.priority == priority])
-            priority_stats[priority.value] = {
-                "count": count,
-                "percentage": round((count / total_tasks * 100) if total_tasks > 0 else 0, 2)
-            }
-        
-        # Группировка по типам
-        type_stats = {}
-        for task_type in TaskType:
-            count = len([t for t in tasks if t.task_type == task_type])
-            type_stats[task_type.value] = {
-                "count": count,
-                "percentage": round((count / total_tasks * 100) if total_tasks > 0 else 0, 2)
-            }
-        
-        # Задачи с просроченными дедлайнами
-        now = datetime.now()
-        overdue_tasks = [
-            t for t in tasks 
-            if t.due_date and t.due_date < now and t.status not in [TaskStatus.COMPLETED, TaskStatus.CANCELLED]
-        ]
+        status_stats = breakdown(METRIC_STATUS, TaskStatus)
+        priority_stats = breakdown(METRIC_PRIORITY, TaskPriority)
+        type_stats = breakdown(METRIC_TYPE, TaskType)
         
         # Средние метрики
-        completed_tasks = [t for t in tasks if t.status == TaskStatus.COMPLETED]
         avg_completion_time = None
-        if completed_tasks:
-            completion_times = [
-                (t.completed_at - t.created_at).total_seconds() / 3600  # часы
-                for t in completed_tasks if t.completed_at
-            ]
-            if completion_times:
-                avg_completion_time = round(sum(completion_times) / len(completion_times), 2)
+        completion_count = metrics[(METRIC_COMPLETION_HOURS, "count")]
+        if completion_count:
+            avg_completion_time = round(metrics[(METRIC_COMPLETION_HOURS, "sum")] / completion_count, 2)
+        
+        # Задачи с просроченными дедлайнами: первые 10 для детализации
+        now = datetime.now()
+        overdue_filters = list(conditions or [])
+        scope_condition = task_scope_condition(scope_type, scope_ids)
+        if scope_condition is not None:
+            overdue_filters.append(scope_condition)
+        if start_date:
+            overdue_filters.append(Task.created_at >= start_date)
+        if end_date:
+            overdue_filters.append(Task.created_at <= end_date)
+        overdue_filters.extend([
+            Task.due_date.isnot(None),
+            Task.due_date < now,
+            Task.status.notin_([TaskStatus.COMPLETED.value, TaskStatus.CANCELLED.value])
+        ])
+        overdue_query = select(Task).options(
+            selectinload(Task.owner),
+            selectinload(Task.executor)
+        ).where(and_(*overdue_filters)).order_by(asc(Task.due_date)).limit(10)
+        result = await self.session.execute(overdue_query)
+        overdue_tasks = result.scalars().all()
         
         return {
             "report_type": ReportType.TASK_SUMMARY,
@@ -151,7 +139,7 @@ class ReportsService:
             },
             "summary": {
                 "total_tasks": total_tasks,
-                "overdue_tasks": len(overdue_tasks),
+                "overdue_tasks": int(metrics[(METRIC_OVERDUE, "total")]),
                 "avg_completion_time_hours": avg_completion_time
             },
             "status_breakdown": status_stats,
@@ -166,10 +154,50 @@ class ReportsService:
                     "owner": t.owner.login if t.owner else None,
                     "executor": t.executor.login if t.executor else None
                 }
-                for t in overdue_tasks[:10]  # Показываем первые 10
+                for t in overdue_tasks
             ]
         }
     
+    @staticmethod
+    def _task_summary_scope(
+        user_id: Optional[int],
+        department_id: Optional[int],
+        organization_id: Optional[int],
+        status_filter: Optional[List[TaskStatus]],
+        priority_filter: Optional[List[TaskPriority]]
+    ):
+        """Выбор области агрегатов для сводного отчета.
+        
+        Один фильтр по пользователю/департаменту/организации соответствует
+        одной области report_rollups. Остальные комбинации считаются по
+        таблице задач с дополнительными условиями в общей области.
+        """
+        scoped = [
+            (ReportRollupScope.PARTICIPANT.value, user_id),
+            (ReportRollupScope.DEPARTMENT.value, department_id),
+            (ReportRollupScope.ORGANIZATION.value, organization_id),
+        ]
+        scoped = [(scope_type, scope_id) for scope_type, scope_id in scoped if scope_id]
+        
+        if not status_filter and not priority_filter and len(scoped) <= 1:
+            if scoped:
+                scope_type, scope_id = scoped[0]
+                return scope_type, [scope_id], None
+            return ReportRollupScope.GLOBAL.value, None, None
+        
+        conditions = []
+        if user_id:
+            conditions.append(or_(Task.owner_id == user_id, Task.executor_id == user_id))
+        if department_id:
+            conditions.append(Task.department_id == department_id)
+        if organization_id:
+            conditions.append(Task.organization_id == organization_id)
+        if status_filter:
+            conditions.append(Task.status.in_([s.value for s in status_filter]))
+        if priority_filter:
+            conditions.append(Task.priority.in_([p.value for p in priority_filter]))
+        return ReportRollupScope.GLOBAL.value, None, conditions
+    
     async def generate_performance_report(
         self,
         start_date: Optional[datetime] = None,
@@ -179,11 +207,10 @@ class ReportsService:
     ) -> Dict[str, Any]:
         """Генерация отчета по производительности"""
         
-        # Запрос для получения пользователей с их задачами
-        query = select(User).options(
-            selectinload(User.executed_tasks),
-            selectinload(User.task_time_logs)
-        )
+        # Пользователи выбранного департамента/организации
+        query = select(
+            User.id, User.login, User.username, Department.name
+        ).outerjoin(Department, User.department_id == Department.id)
         
         filters = []
         if department_id:
@@ -195,55 +222,41 @@ class ReportsService:
             query = query.where(and_(*filters))
         
         result = await self.session.execute(query)
-        users = result.scalars().all()
+        users = result.all()
+        
+        # Без фильтров берем все области пользователей без списка IN (...)
+        user_ids = [row[0] for row in users] if filters else None
+        task_totals = await collect_task_metrics(
+            self.session, ReportRollupScope.USER.value, user_ids,
+            start_date=start_date, end_date=end_date
+        )
+        time_totals = await collect_time_log_metrics(
+            self.session, ReportRollupScope.USER.value, user_ids,
+            start_date=start_date, end_date=end_date
+        )
         
         user_stats = []
         
-        for user in users:
-            # Фильтруем задачи по датам
-            user_tasks = user.executed_tasks
-            if start_date or end_date:
-                filtered_tasks = []
-                for task in user_tasks:
-                    if start_date and task.created_at < start_date:
-                        continue
-                    if end_date and task.created_at > end_date:
-                        continue
-                    filtered_tasks.append(task)
-                user_tasks = filtered_tasks
+        for user_id, login, username, department_name in users:
+            task_metrics = task_totals.get(user_id, Counter())
+            time_metrics = time_totals.get(user_id, Counter())
             
             # Статистика по пользователю
-            total_tasks = len(user_tasks)
-            completed_tasks = len([t for t in user_tasks if t.status == TaskStatus.COMPLETED])
-            in_progress_tasks = len([t for t in user_tasks if t.status == TaskStatus.IN_PROGRESS])
-            overdue_tasks = len([
-                t for t in user_tasks 
-                if t.due_date and t.due_date < datetime.now() and t.status not in [TaskStatus.COMPLETED, TaskStatus.CANCELLED]
-            ])
-            
-            # Учет времени
-            time_logs = user.task_time_logs
-            if start_date or end_date:
-                filtered_logs = []
-                for log in time_logs:
-                    if start_date and log.start_time < start_date:
-                        continue
-                    if end_date and log.start_time > end_date:
-                        continue
-                    filtered_logs.append(log)
-                time_logs = filtered_logs
-            
-            total_hours = sum(log.hours for log in time_logs)
+            total_tasks = int(task_metrics[(METRIC_TASKS, "total")])
+            completed_tasks = int(task_metrics[(METRIC_STATUS, TaskStatus.COMPLETED.value)])
+            in_progress_tasks = int(task_metrics[(METRIC_STATUS, TaskStatus.IN_PROGRESS.value)])
+            overdue_tasks = int(task_metrics[(METRIC_OVERDUE, "total")])
+            total_hours = time_metrics[(METRIC_HOURS, "total")]
             
             # Вычисляем производительность
             completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
             avg_hours_per_task = (total_hours / total_tasks) if total_tasks > 0 else 0
             
             user_stats.append({
-                "user_id": user.id,
-                "username": user.login,
-                "full_name": f"{user.first_name} {user.last_name}",
-                "department": user.department.name if user.department else None,
+                "user_id": user_id,
+                "username": login,
+                "full_name": username,
+                "department": department_name,
                 "total_tasks": total_tasks,
                 "completed_tasks": completed_tasks,
                 "in_progress_tasks": in_progress_tasks,
@@ -289,11 +302,37 @@ class ReportsService:
     ) -> Dict[str, Any]:
         """Генерация отчета по учету времени"""
         
-        query = select(TaskTimeLog).options(
-            selectinload(TaskTimeLog.user),
-            selectinload(TaskTimeLog.task)
+        # Итоги по пользователям и по дням - из агрегатов; задачи в агрегатах нет, поэтому
+        # фильтр по задаче считается по исходной таблице
+        conditions = [TaskTimeLog.task_id == task_id] if task_id else None
+        if user_id:
+            scope_type, scope_ids = ReportRollupScope.USER.value, [user_id]
+        else:
+            scope_type, scope_ids = ReportRollupScope.GLOBAL.value, None
+        user_totals = await collect_time_log_metrics(
+            self.session, ReportRollupScope.USER.value, [user_id] if user_id else None,
+            start_date=start_date, end_date=end_date, conditions=conditions
+        )
+        daily_totals = await collect_time_log_metrics_by_day(
+            self.session, scope_type, scope_ids,
+            start_date=start_date, end_date=end_date, conditions=conditions
         )
         
+        user_time_sorted = sorted(
+            (
+                (uid, metrics[(METRIC_HOURS, "total")], int(metrics[(METRIC_TIME_ENTRIES, "total")]))
+                for uid, metrics in user_totals.items()
+                if metrics[(METRIC_TIME_ENTRIES, "total")]
+            ),
+            key=lambda item: item[1], reverse=True
+        )[:20]  # Топ 20
+        logins = {}
+        if user_time_sorted:
+            logins = dict((await self.session.execute(
+                select(User.id, User.login).where(User.id.in_([uid for uid, _, _ in user_time_sorted]))
+            )).all())
+        
+        # По задачам - один запрос с GROUP BY
         filters = []
         if start_date:
             filters.append(TaskTimeLog.start_time >= start_date)
@@ -304,50 +343,18 @@ class ReportsService:
         if task_id:
             filters.append(TaskTimeLog.task_id == task_id)
         
+        task_hours = func.sum(TaskTimeLog.hours)
+        query = select(
+            TaskTimeLog.task_id, Task.title, task_hours, func.count(TaskTimeLog.id)
+        ).join(Task, Task.id == TaskTimeLog.task_id).group_by(
+            TaskTimeLog.task_id, Task.title
+        ).order_by(desc(task_hours)).limit(20)  # Топ 20
         if filters:
             query = query.where(and_(*filters))
+        task_time_sorted = (await self.session.execute(query)).all()
         
-        result = await self.session.execute(query)
-        time_logs = result.scalars().all()
-        
-        # Группировка по пользователям
-        user_time = {}
-        task_time = {}
-        daily_time = {}
-        
-        for log in time_logs:
-            # По пользователям
-            if log.user_id not in user_time:
-                user_time[log.user_id] = {
-                    "username": log.user.login,
-                    "total_hours": 0,
-                    "entries_count": 0
-                }
-            user_time[log.user_id]["total_hours"] += log.hours
-            user_time[log.user_id]["entries_count"] += 1
-            
-            # По задачам
-            if log.task_id not in task_time:
-                task_time[log.task_id] = {
-                    "task_title": log.task.title,
-                    "total_hours": 0,
-                    "entries_count": 0
-                }
-            task_time[log.task_id]["total_hours"] += log.hours
-            task_time[log.task_id]["entries_count"] += 1
-            
-            # По дням
-            day_key = log.start_time.date().isoformat()
-            if day_key not in daily_time:
-                daily_time[day_key] = 0
-            daily_time[day_key] += log.hours
-        
-        # Сортируем по времени
-        user_time_sorted = sorted(user_time.items(), key=lambda x: x[1]["total_hours"], reverse=True)
-        task_time_sorted = sorted(task_time.items(), key=lambda x: x[1]["total_hours"], reverse=True)
-        
-        total_hours = sum(log.hours for log in time_logs)
-        total_entries = len(time_logs)
+        total_hours = sum(metrics[(METRIC_HOURS, "total")] for metrics in daily_totals.values())
+        total_entries = int(sum(metrics[(METRIC_TIME_ENTRIES, "total")] for metrics in daily_totals.values()))
         
         return {
             "report_type": ReportType.TIME_TRACKING,
@@ -365,29 +372,30 @@ class ReportsService:
             },
             "time_by_user": [
                 {
-                    "user_id": user_id,
-                    "username": data["username"],
-                    "total_hours": round(data["total_hours"], 2),
-                    "entries_count": data["entries_count"],
-                    "avg_hours_per_entry": round(data["total_hours"] / data["entries_count"], 2)
+                    "user_id": uid,
+                    "username": logins.get(uid),
+                    "total_hours": round(hours, 2),
+                    "entries_count": entries,
+                    "avg_hours_per_entry": round(hours / entries, 2)
                 }
-                for user_id, data in user_time_sorted[:20]  # Топ 20
+                for uid, hours, entries in user_time_sorted
             ],
             "time_by_task": [
                 {
-                    "task_id": task_id,
-                    "task_title": data["task_title"],
-                    "total_hours": round(data["total_hours"], 2),
-                    "entries_count": data["entries_count"]
+                    "task_id": tid,
+                    "task_title": title,
+                    "total_hours": round(hours or 0, 2),
+                    "entries_count": entries
                 }
-                for task_id, data in task_time_sorted[:20]  # Топ 20
+                for tid, title, hours, entries in task_time_sorted
             ],
             "daily_breakdown": [
                 {
-                    "date": day,
-                    "hours": round(hours, 2)
+                    "date": day.isoformat(),
+                    "hours": round(metrics[(METRIC_HOURS, "total")], 2)
                 }
-                for day, hours in sorted(daily_time.items())
+                for day, metrics in sorted(daily_totals.items())
+                if metrics[(METRIC_TIME_ENTRIES, "total")]
             ]
         }
     
@@ -415,69 +423,93 @@ class ReportsService:
     
     async def _export_to_csv(self, report_data: Dict[str, Any]) -> str:
         """Экспорт в CSV формат"""
-        import csv
-        import io
-        
-        output = io.StringIO()
+        columns, rows = self._report_table(report_data)
+        if not columns:
+            return ""
+        return render_rows(CSVStreamWriter(), columns, rows).decode("utf-8")
+    
+    async def _export_to_excel(self, report_data: Dict[str, Any]) -> bytes:
+        """Экспорт в Excel формат"""
+        columns, rows = self._report_table(report_data)
+        report_type = report_data.get("report_type")
+        writer = XLSXStreamWriter(sheet_name=str(getattr(report_type, "value", report_type) or "report"))
+        return render_rows(writer, columns, rows)
+    
+    async def _export_to_pdf(self, report_data: Dict[str, Any]) -> bytes:
+        """Экспорт в PDF формат"""
+        columns, rows = self._report_table(report_data)
+        report_type = report_data.get("report_type")
+        writer = PDFStreamWriter(title=f"Report: {getattr(report_type, 'value', report_type) or ''}")
+        return render_rows(writer, columns, rows)
+    
+    @staticmethod
+    def _report_table(report_data: Dict[str, Any]) -> Tuple[List[str], List[List[Any]]]:
+        """Табличное представление отчета для экспорта"""
         
         # Определяем структуру данных в зависимости от типа отчета
         report_type = report_data.get("report_type")
         
         if report_type == ReportType.TASK_SUMMARY:
-            writer = csv.writer(output)
-            writer.writerow(["Metric", "Value", "Percentage"])
+            columns = ["Metric", "Value", "Percentage"]
             
             # Записываем статистику по статусам
-            for status, data in report_data["status_breakdown"].items():
-                writer.writerow([f"Status: {status}", data["count"], f"{data['percentage']}%"])
+            rows = [
+                [f"Status: {status}", data["count"], f"{data['percentage']}%"]
+                for status, data in report_data["status_breakdown"].items()
+            ]
+            return columns, rows
                 
         elif report_type == ReportType.PERFORMANCE:
-            writer = csv.writer(output)
-            writer.writerow([
+            columns = [
                 "User ID", "Username", "Full Name", "Department",
                 "Total Tasks", "Completed Tasks", "In Progress",
                 "Overdue", "Completion Rate %", "Total Hours"
-            ])
-            
-            for user in report_data["user_performance"]:
-                writer.writerow([
+            ]
+            rows = [
+                [
                     user["user_id"], user["username"], user["full_name"],
                     user["department"], user["total_tasks"], user["completed_tasks"],
                     user["in_progress_tasks"], user["overdue_tasks"],
                     user["completion_rate"], user["total_hours"]
-                ])
+                ]
+                for user in report_data["user_performance"]
+            ]
+            return columns, rows
         
         elif report_type == ReportType.TIME_TRACKING:
-            writer = csv.writer(output)
-            writer.writerow(["User ID", "Username", "Total Hours", "Entries", "Avg Hours per Entry"])
-            
-            for user in report_data["time_by_user"]:
-                writer.writerow([
+            columns = ["User ID", "Username", "Total Hours", "Entries", "Avg Hours per Entry"]
+            rows = [
+                [
                     user["user_id"], user["username"], user["total_hours"],
                     user["entries_count"], user["avg_hours_per_entry"]
-                ])
+                ]
+                for user in report_data["time_by_user"]
+            ]
+            return columns, rows
         
-        return output.getvalue()
-    
-    async def _export_to_excel(self, report_data: Dict[str, Any]) -> bytes:
-        """Экспорт в Excel формат"""
-        # Здесь должна быть реализация с openpyxl
-        # Для упрощения возвращаем заглушку
-        return b"Excel data would be generated here"
-    
-    async def _export_to_pdf(self, report_data: Dict[str, Any]) -> bytes:
-        """Экспорт в PDF формат"""
-        # Здесь должна быть реализация с reportlab
-        # Для упрощения возвращаем заглушку
-        return b"PDF data would be generated here"
+        return [], []
 
 
 class ReportGenerator:
     """Генератор отчетов с кэшированием"""
     
-    def __init__(self):
-        self._cache = {}
-        self._cache_ttl = 300  # 5 минут
+    def __init__(self, cache: Optional[ReportCache] = None):
+        self.cache = cache or ReportCache(
+            max_entries=settings.reports.cache_max_entries,
+            ttl=settings.reports.cache_ttl_seconds,
+            redis_url=settings.reports.cache_redis_url,
+            lock_timeout=settings.reports.cache_lock_timeout_seconds,
+            wait_timeout=settings.reports.cache_wait_timeout_seconds
+        )
+    
+    @property
+    def _cache(self):
+        """Локальный уровень кэша (LRU)"""
+        return self.cache.entries
+    
+    @property
+    def _cache_ttl(self) -> int:
+        return self.cache.ttl
     
     async def get_or_generate_report(
         self,
@@ -487,39 +519,44 @@ class ReportGenerator:
     ) -> Dict[str, Any]:
         """Получение отчета из кэша или генерация нового"""
         
-        # Создаем ключ кэша
-        cache_key = f"{report_type}:{hash(str(sorted(kwargs.items())))}"
-        
-        # Проверяем кэш
-        if cache_key in self._cache:
-            cached_data, timestamp = self._cache[cache_key]
-            if datetime.now().timestamp() - timestamp < self._cache_ttl:
-                logger.info(f"Returning cached report: {cache_key}")
-                return cached_data
-        
-        # Генерируем новый отчет
-        service = ReportsService(session)
+        # Создаем ключ кэша (одинаковый во всех воркерах)
+        cache_key = make_cache_key(report_type, kwargs)
         
-        if report_type == ReportType.TASK_SUMMARY:
-            report_data = await service.generate_task_summary_report(**kwargs)
-        elif report_type == ReportType.PERFORMANCE:
-            report_data = await service.generate_performance_report(**kwargs)
-        elif report_type == ReportType.TIME_TRACKING:
-            report_data = await service.generate_time_tracking_report(**kwargs)
-        else:
-            raise ValueError(f"Unsupported report type: {report_type}")
-        
-        # Сохраняем в кэш
-        self._cache[cache_key] = (report_data, datetime.now().timestamp())
-        logger.info(f"Generated and cached new report: {cache_key}")
+        async def generate() -> Dict[str, Any]:
+            service = ReportsService(session)
+            
+            if report_type == ReportType.TASK_SUMMARY:
+                report_data = await service.generate_task_summary_report(**kwargs)
+            elif report_type == ReportType.PERFORMANCE:
+                report_data = await service.generate_performance_report(**kwargs)
+            elif report_type == ReportType.TIME_TRACKING:
+                report_data = await service.generate_time_tracking_report(**kwargs)
+            else:
+                raise ValueError(f"Unsupported report type: {report_type}")
+            
+            logger.info(f"Generated new report: {cache_key}")
+            return report_data
         
-        return report_data
+        return await self.cache.get_or_compute(
+            cache_key,
+            generate,
+            tags=report_tags(kwargs),
+            result_tags=self._result_tags
+        )
+    
+    @staticmethod
+    def _result_tags(report_data: Dict[str, Any]) -> List[str]:
+        """Теги пользователей, попавших в отчет по производительности"""
+        return [f"user:{row['user_id']}" for row in report_data.get("user_performance", [])]
     
     def clear_cache(self):
         """Очистка кэша"""
-        self._cache.clear()
+        self.cache.clear()
         logger.info("Report cache cleared")
 
 
 # Глобальный экземпляр генератора отчетов
 report_generator = ReportGenerator()
+
+# Инвалидация кэша отчетов после коммита изменений задач и учета времени
+report_cache_invalidator = ReportCacheInvalidator(report_generator.cache)
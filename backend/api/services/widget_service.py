@@ -255,6 +255,11 @@ class WidgetService:
         if not widget:
             return None
         
+        return await self.load_widget_data(widget)
+    
+    async def load_widget_data(self, widget: PersonalWidget, commit: bool = True) -> Dict[str, Any]:
+        """Данные уже загруженного виджета (кэш или свежие); commit=False - коммит за вызывающим"""
+        
         # Проверяем кэш
         if widget.cache_enabled and widget.cached_data:
             cache_age = datetime.now() - widget.last_data_update
@@ -268,7 +273,8 @@ class WidgetService:
         if widget.cache_enabled:
             widget.cached_data = data
             widget.last_data_update = datetime.now()
-            await self.session.commit()
+            if commit:
+                await self.session.commit()
         
         return data
     
@@ -672,15 +678,19 @@ class PersonalDashboardService:
                     "is_pinned": widget.is_pinned
                 }
                 
-                # Получаем данные виджета
+                # Данные виджета без повторной загрузки по id; кэш сохраняется одним коммитом
                 try:
-                    widget_data["data"] = await self.widget_service.get_widget_data(widget.id)
+                    widget_data["data"] = await self.widget_service.load_widget_data(widget, commit=False)
                 except Exception as e:
                     logger.error(f"Error getting widget data: {e}")
                     widget_data["data"] = {"error": "Failed to load data"}
                 
                 widgets_data.append(widget_data)
         
+        # Обновленный кэш виджетов - одним коммитом на весь макет
+        if self.session.dirty:
+            await self.session.commit()
+        
         # Получаем быстрые действия
         quick_actions = await self.widget_service.get_user_quick_actions(user_id)
         actions_data = [
@@ -7,10 +7,13 @@ import subprocess
 import tempfile
 import json
 import logging
+import time
 from pathlib import Path
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 
+from backend.api.configuration.metrics import observe_datacode
+
 logger = logging.getLogger(__name__)
 
 class DataCodeService:
@@ -104,6 +107,7 @@ class DataCodeService:
     
     async def _run_command(self, cmd: List[str]) -> Dict[str, Any]:
         """Выполнение команды"""
+        started = time.perf_counter()
         try:
             # Запускаем процесс
             process = await asyncio.create_subprocess_exec(
@@ -114,6 +118,7 @@ class DataCodeService:
             
             # Ждем завершения
             stdout, stderr = await process.communicate()
+            observe_datacode("success" if process.returncode == 0 else "failed", time.perf_counter() - started)
             
             # Проверяем результат
             if process.returncode != 0:
@@ -1,7 +1,10 @@
 import asyncio
+import itertools
 import sys
+import time
+from collections import Counter
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Dict, List, Optional, Sequence
 from sqlalchemy.exc import OperationalError, TimeoutError
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import (
@@ -12,6 +15,10 @@ from sqlalchemy.ext.asyncio import (
 )
 
 from core.database.models.main_models import Base
+from core.database.pool_telemetry import InstrumentedAsyncQueuePool, PoolTelemetry
+from core.database import slow_queries  # noqa: F401  журнал медленных запросов всех движков
+from core.database.replicas import (LagProbe, PrimarySession, RedisStickyStore, ReplicaState, RoutingSession,
+                                    StickyWindows, postgres_replica_lag, read_your_writes_key)
 from core.settings import settings
 
 import logging
@@ -61,45 +68,115 @@ class Database:
                 echo_pool: bool = False,
                 pool_size: int = 5,
                 max_overflow: int = 10,
+                replica_urls: Sequence[str] = (),
+                max_replica_lag: float = 5.0,
+                replica_check_interval: float = 5.0,
+                read_your_writes_seconds: float = 10.0,
+                read_your_writes_redis_url: str = "",
+                lag_probe: Optional[LagProbe] = None,
+                pool_timeout: float = 30,
+                pool_long_held_seconds: float = 30.0,
+                pool_capture_stacks: bool = True,
+                pool_monitor_interval: float = 10.0,
     ) -> None:
         self._url = url
         self._echo = echo
         self._echo_pool = echo_pool
         self._pool_size = pool_size
         self._max_overflow = max_overflow
+        self._pool_timeout = pool_timeout
         self._engine = None
         self._async_session = None
+        self._read_session = None
+
+        # Реплики для чтения
+        self._replica_urls = list(replica_urls)
+        self._replicas: Optional[List[ReplicaState]] = None
+        self._replica_cycle = None
+        self.max_replica_lag = max_replica_lag
+        self.replica_check_interval = replica_check_interval
+        self.lag_probe = lag_probe or postgres_replica_lag
+        # Без Redis окна read-your-writes видны только этому процессу
+        self.sticky = StickyWindows(
+            read_your_writes_seconds,
+            shared_store=RedisStickyStore(read_your_writes_redis_url) if read_your_writes_redis_url else None
+        )
+        self.read_stats: Counter = Counter()
+
+        # Телеметрия пулов по имени движка ("primary", "replica:<host>")
+        self.pool_telemetry: Dict[str, PoolTelemetry] = {}
+        self.pool_long_held_seconds = pool_long_held_seconds
+        self.pool_capture_stacks = pool_capture_stacks
+        self.pool_monitor_interval = pool_monitor_interval
+
+    def _create_engine(self, url: str, name: str) -> AsyncEngine:
+        engine = create_async_engine(
+            url=url,
+            echo=self._echo,
+            echo_pool=self._echo_pool,
+            pool_size=self._pool_size,
+            max_overflow=self._max_overflow,
+            pool_timeout=self._pool_timeout,
+            poolclass=InstrumentedAsyncQueuePool,
+            future=True
+        )
+        self.pool_telemetry[name] = PoolTelemetry(
+            name,
+            long_held_seconds=self.pool_long_held_seconds,
+            capture_stacks=self.pool_capture_stacks
+        ).attach(engine)
+        return engine
 
     @property
     def engine(self) -> AsyncEngine:
         if self._engine is None:
-            self._engine = create_async_engine(
-                url=self._url,
-                echo=self._echo,
-                echo_pool=self._echo_pool,
-                pool_size=self._pool_size,
-                max_overflow=self._max_overflow,
-                future=True
-            )
+            self._engine = self._create_engine(self._url, "primary")
         return self._engine
 
+    @property
+    def replicas(self) -> List[ReplicaState]:
+        if self._replicas is None:
+            self._replicas = []
+            for index, url in enumerate(self._replica_urls):
+                engine = self._create_engine(url, f"replica:{index}")
+                self._replicas.append(ReplicaState(url, engine))
+        return self._replicas
+
     @property
     def async_session(self) -> AsyncSession:
         if self._async_session is None:
             self._async_session = async_sessionmaker(
                 bind=self.engine,
                 class_=AsyncSession,
+                sync_session_class=PrimarySession,
+                info={"database": self},
                 autoflush=False,
                 autocommit=False,
                 expire_on_commit=False
             )
         return self._async_session
 
+    @property
+    def read_session_factory(self) -> AsyncSession:
+        """Фабрика сессий только для чтения (реплика или основная БД)"""
+        if self._read_session is None:
+            self._read_session = async_sessionmaker(
+                class_=AsyncSession,
+                sync_session_class=RoutingSession,
+                info={"database": self},
+                autoflush=False,
+                autocommit=False,
+                expire_on_commit=False
+            )
+        return self._read_session
+
     def get_url(self) -> str:
         return self._url
 
     async def dispose(self) -> None:
         await self.engine.dispose()
+        for replica in self._replicas or ():
+            await replica.engine.dispose()
 
     async def init_db(self):
         await self._create_tables()
@@ -112,22 +189,129 @@ class Database:
             finally:
                 await session.close()
 
+    @asynccontextmanager
+    async def read_session(self) -> AsyncGenerator[AsyncSession, None]:
+        """Сессия для чтения: реплика с допустимым отставанием или основная БД"""
+        async with self.read_session_factory() as session:
+            try:
+                yield session
+            finally:
+                await session.close()
+
+    # ------------------------------------------------------------ replicas
+
+    def mark_write(self, key=None) -> None:
+        """Открыть окно read-your-writes для ключа (по умолчанию - ключ текущего запроса)"""
+        key = read_your_writes_key.get() if key is None else key
+        if key is not None:
+            self.sticky.mark(key)
+
+    async def start_read_your_writes(self, key) -> None:
+        """Ключ read-your-writes текущего запроса; окно подгружается из общего хранилища"""
+        read_your_writes_key.set(key)
+        if self._replica_urls:
+            await self.sticky.load(key)
+
+    def _is_fresh(self, replica: ReplicaState, now: float) -> bool:
+        # Без свежей проверки (монитор остановлен) отставание неизвестно
+        return (
+            replica.healthy
+            and replica.checked_at is not None
+            and now - replica.checked_at <= self.replica_check_interval * 3
+        )
+
+    def choose_read_engine(self) -> AsyncEngine:
+        """Движок для чтения текущего запроса"""
+        if not self._replica_urls:
+            return self.engine
+
+        key = read_your_writes_key.get()
+        if key is not None and self.sticky.is_sticky(key):
+            self.read_stats["sticky_primary"] += 1
+            return self.engine
+
+        if self._replica_cycle is None:
+            self._replica_cycle = itertools.cycle(self.replicas)
+        now = time.monotonic()
+        for _ in range(len(self.replicas)):
+            replica = next(self._replica_cycle)
+            if self._is_fresh(replica, now):
+                self.read_stats["replica"] += 1
+                return replica.engine
+
+        self.read_stats["fallback_primary"] += 1
+        return self.engine
+
+    async def check_replicas(self) -> List[dict]:
+        """Проверка отставания всех реплик"""
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as conn:
+                    replica.lag = await asyncio.wait_for(self.lag_probe(conn), timeout=self.replica_check_interval)
+                replica.healthy = replica.lag <= self.max_replica_lag
+                replica.error = None
+                if not replica.healthy:
+                    logger.warning(f"Replica {replica.engine.url.host} lags {replica.lag:.1f}s, reads go to primary")
+            except Exception as e:
+                replica.healthy = False
+                replica.error = str(e)
+                logger.warning(f"Replica {replica.engine.url.host} check failed: {e}")
+            replica.checked_at = time.monotonic()
+        return [replica.to_dict() for replica in self.replicas]
+
+    # ------------------------------------------------------------ pools
+
+    def pool_stats(self) -> List[dict]:
+        """Состояние и гистограммы пулов всех созданных движков"""
+        return [telemetry.snapshot() for telemetry in self.pool_telemetry.values()]
+
+    async def run_pool_monitor(self) -> None:
+        """Периодический поиск долго удерживаемых соединений (выполняется до отмены)"""
+        while True:
+            await asyncio.sleep(self.pool_monitor_interval)
+            for telemetry in list(self.pool_telemetry.values()):
+                telemetry.report_long_held()
+
+    async def run_replica_monitor(self) -> None:
+        """Периодическая проверка реплик (выполняется до отмены)"""
+        if not self._replica_urls:
+            return
+        while True:
+            await self.check_replicas()
+            await asyncio.sleep(self.replica_check_interval)
+
     async def _create_tables(self):
 
         async with self.engine.begin() as conn:
             logger.info("Creating tables")
             await conn.run_sync(Base.metadata.create_all)
 
+def _database_options() -> dict:
+    """Параметры Database из настроек; размер пула - из общего лимита соединений"""
+    pool_size, max_overflow = settings.db.get_pool_sizing(settings.run.workers)
+    return dict(
+        echo=settings.db.echo,
+        echo_pool=settings.db.echo_pool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.db.pool_timeout,
+        replica_urls=settings.db.get_replica_urls(),
+        max_replica_lag=settings.db.replica_max_lag_seconds,
+        replica_check_interval=settings.db.replica_check_interval_seconds,
+        read_your_writes_seconds=settings.db.read_your_writes_seconds,
+        read_your_writes_redis_url=settings.db.read_your_writes_redis_url,
+        pool_long_held_seconds=settings.db.pool_long_held_seconds,
+        pool_capture_stacks=settings.db.pool_capture_stacks,
+        pool_monitor_interval=settings.db.pool_monitor_interval_seconds,
+    )
+
 # Асинхронная инициализация db_helper
 async def initialize_db_helper():
     working_url = await select_working_url()
 
     return Database(
         url=working_url,
-        echo=settings.db.echo,
-        echo_pool=settings.db.echo_pool,
-        pool_size=settings.db.pool_size,
-        max_overflow=settings.db.max_overflow
+        **_database_options()
     )
 
 # Ленивая инициализация db_helper
@@ -139,9 +323,6 @@ def get_db_helper():
         # Отложенная инициализация - создаем простой объект без подключения к БД
         db_helper = Database(
             url=settings.db.get_url(),
-            echo=settings.db.echo,
-            echo_pool=settings.db.echo_pool,
-            pool_size=settings.db.pool_size,
-            max_overflow=settings.db.max_overflow
+            **_database_options()
         )
     return db_helper
\ No newline at end of file
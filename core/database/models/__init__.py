@@ -12,7 +12,9 @@ __all__ = ('User', 'Task', 'TaskComment', 'TaskTimeLog', 'TaskDependency', 'Task
            'PersonalDashboard', 'PersonalWidget', 'PersonalDashboardSettings', 'WidgetPermission',
            'WidgetPlugin', 'WidgetInstallation', 'QuickAction', 'UserPreference',
            'WidgetCategory', 'WidgetType',
-           'NotificationTemplate', 'Notification', 'NotificationDelivery', 'UserNotificationPreference', 'NotificationBatch', 'NotificationWebhook')
+           'NotificationTemplate', 'Notification', 'NotificationDelivery', 'UserNotificationPreference', 'NotificationBatch', 'NotificationWebhook', 'NotificationArchive',
+           'BroadcastAudience', 'NotificationBroadcast', 'NotificationBroadcastRecipient',
+           'ReportRollup', 'ReportRollupScope', 'ReportJob', 'ReportJobStatus')
 
 from .main_models import (User, Organization, Department, Permission, RolePermission)
 from .task_model import (
@@ -41,7 +43,8 @@ from .personal_dashboard_model import (
 
 from .notification_model import (
     NotificationTemplate, Notification, NotificationDelivery, 
-    UserNotificationPreference, NotificationBatch, NotificationWebhook
+    UserNotificationPreference, NotificationBatch, NotificationWebhook, NotificationArchive,
+    BroadcastAudience, NotificationBroadcast, NotificationBroadcastRecipient
 )
 
 from .email_model import (
@@ -49,3 +52,5 @@ from .email_model import (
     EmailFolder, EmailRecipient, EmailLabel, EmailFilter,
     EmailAutoReply, EmailFolderMapping
 )
+
+from .report_model import (ReportRollup, ReportRollupScope, ReportJob, ReportJobStatus)
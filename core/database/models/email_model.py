@@ -14,6 +14,10 @@ import uuid
 
 from core.database.base import Base
 
+# Домен Message-ID писем, созданных в приложении: такое письмо может прийти при синхронизации
+# в ящик получателя и привязывается к исходной записи, а не копируется
+APP_MESSAGE_ID_DOMAIN = "ai-control.local"
+
 
 class EmailStatus(str, Enum):
     """Статусы email сообщений"""
@@ -93,6 +97,10 @@ class EmailAccount(Base):
     imap_username: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     imap_password: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     imap_use_ssl: Mapped[bool] = mapped_column(Boolean, default=True)
+    # Расписание синхронизации входящих (email_sync_service): следующий запуск, последний успешный и ошибка
+    imap_next_sync_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    imap_last_sync_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    imap_sync_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     
     # Дополнительные настройки
     signature: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
@@ -112,6 +120,7 @@ class EmailAccount(Base):
     __table_args__ = (
         Index("idx_email_accounts_user_id", "user_id"),
         Index("idx_email_accounts_email", "email"),
+        Index("idx_email_accounts_imap_next_sync", "imap_next_sync_at"),
     )
 
 
@@ -129,6 +138,12 @@ class EmailFolder(Base):
     color: Mapped[Optional[str]] = mapped_column(String(7), nullable=True)  # HEX color
     position: Mapped[int] = mapped_column(Integer, default=0)
     
+    # Состояние синхронизации с папкой IMAP: при смене UIDVALIDITY UID прежних писем недействительны
+    uid_validity: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    last_uid: Mapped[int] = mapped_column(BigInteger, default=0)
+    highest_modseq: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    last_synced_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -150,7 +165,7 @@ class Email(Base):
     __tablename__ = "emails"
     
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
-    message_id: Mapped[str] = mapped_column(String(255), nullable=False, unique=True)
+    message_id: Mapped[str] = mapped_column(String(255), nullable=False)
     sender_id: Mapped[int] = mapped_column(ForeignKey("email_accounts.id"), nullable=False)
     
     # Основная информация
@@ -194,6 +209,8 @@ class Email(Base):
         Index("idx_emails_sent_at", "sent_at"),
         Index("idx_emails_category", "category"),
         Index("idx_emails_priority", "priority"),
+        # Message-ID уникален в пределах аккаунта: одно письмо может лежать в нескольких ящиках
+        UniqueConstraint("sender_id", "message_id", name="uq_emails_sender_message_id"),
     )
 
 
@@ -272,6 +289,8 @@ class EmailFolderMapping(Base):
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
     email_id: Mapped[int] = mapped_column(ForeignKey("emails.id"), nullable=False)
     folder_id: Mapped[int] = mapped_column(ForeignKey("email_folders.id"), nullable=False)
+    # UID письма в папке IMAP (только для писем, полученных синхронизацией)
+    imap_uid: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
     
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     
@@ -282,6 +301,8 @@ class EmailFolderMapping(Base):
     __table_args__ = (
         Index("idx_email_folder_mappings_email_id", "email_id"),
         Index("idx_email_folder_mappings_folder_id", "folder_id"),
+        # Изменения флагов по UID из ответа CHANGEDSINCE
+        Index("idx_email_folder_mappings_folder_uid", "folder_id", "imap_uid"),
         UniqueConstraint("email_id", "folder_id", name="uq_email_folder_mapping"),
     )
 
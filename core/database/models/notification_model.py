@@ -6,7 +6,7 @@ from typing import Optional, Dict, Any, List
 from enum import Enum
 from sqlalchemy import (
     Column, Integer, String, Text, Boolean, DateTime, JSON, 
-    ForeignKey, Index, UniqueConstraint, BigInteger
+    ForeignKey, Index, UniqueConstraint, BigInteger, text
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -43,6 +43,8 @@ class NotificationStatus(str, Enum):
     READ = "read"
     FAILED = "failed"
     EXPIRED = "expired"
+    DEAD_LETTER = "dead_letter"
+    BATCHED = "batched"
 
 
 class NotificationChannel(str, Enum):
@@ -99,6 +101,8 @@ class Notification(Base):
     
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
     notification_uuid: Mapped[str] = mapped_column(String(36), unique=True, nullable=False)
+    # Ключ идемпотентности создания: повторный запрос получателя с тем же ключом вернет то же уведомление
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
     
     # Получатель
     recipient_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"), nullable=False)
@@ -141,6 +145,13 @@ class Notification(Base):
     
     __table_args__ = (
         Index("idx_notifications_recipient", "recipient_id"),
+        # Лента пользователя и массовые операции по непрочитанным
+        Index("idx_notifications_recipient_created", "recipient_id", "created_at"),
+        Index(
+            "idx_notifications_recipient_unread", "recipient_id",
+            postgresql_where=text("read_at IS NULL"), sqlite_where=text("read_at IS NULL")
+        ),
+        Index("idx_notifications_created", "created_at"),
         Index("idx_notifications_type", "notification_type"),
         Index("idx_notifications_status", "status"),
         Index("idx_notifications_priority", "priority"),
@@ -148,11 +159,13 @@ class Notification(Base):
         Index("idx_notifications_expires", "expires_at"),
         Index("idx_notifications_related", "related_entity_type", "related_entity_id"),
         Index("idx_notifications_uuid", "notification_uuid"),
+        # Ключ идемпотентности уникален в пределах получателя (как и поиск в _get_by_idempotency_key)
+        UniqueConstraint("recipient_id", "idempotency_key", name="uq_notifications_recipient_idempotency"),
     )
 
 
 class NotificationDelivery(Base):
-    """Доставка уведомлений по каналам"""
+    """Доставка уведомлений по каналам (очередь исходящих: одна запись на канал)"""
     __tablename__ = "notification_deliveries"
     
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
@@ -168,11 +181,20 @@ class NotificationDelivery(Base):
     recipient_address: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)  # email, phone, etc.
     delivery_data: Mapped[Dict[str, Any]] = mapped_column(JSON, default=dict)
     error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
-    retry_count: Mapped[int] = mapped_column(Integer, default=0)
+    retry_count: Mapped[int] = mapped_column(Integer, default=0)  # выполненные попытки
+    
+    # Очередь: ключ идемпотентности для получателя, время следующей попытки и аренда обработчиком
+    idempotency_key: Mapped[str] = mapped_column(String(100), nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # Сводка, в которую попала запись (статус batched: отправляется одним сообщением)
+    batch_id: Mapped[Optional[int]] = mapped_column(BigInteger, ForeignKey("notification_batches.id"), nullable=True)
     
     # Временные метки
     sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     delivered_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_attempt_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    dead_lettered_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -183,7 +205,11 @@ class NotificationDelivery(Base):
         Index("idx_notification_deliveries_notification", "notification_id"),
         Index("idx_notification_deliveries_channel", "channel"),
         Index("idx_notification_deliveries_status", "status"),
+        # Выборка обработчиком канала: ожидающие доставки с наступившим временем попытки
+        Index("idx_notification_deliveries_due", "channel", "status", "next_attempt_at"),
+        Index("idx_notification_deliveries_batch", "batch_id"),
         UniqueConstraint("notification_id", "channel", name="uq_notification_delivery"),
+        UniqueConstraint("idempotency_key", name="uq_notification_deliveries_idempotency_key"),
     )
 
 
@@ -229,8 +255,13 @@ class UserNotificationPreference(Base):
     )
 
 
+# Тип связанной сущности у уведомления-сводки: сводка доставляется только по своему каналу
+# и не входит в ленту, счетчики непрочитанных и push (отдельные уведомления там уже есть)
+DIGEST_ENTITY_TYPE = "notification_batch"
+
+
 class NotificationBatch(Base):
-    """Пакетные уведомления"""
+    """Пакетные уведомления (сводка по пользователю, типу и каналу за окно)"""
     __tablename__ = "notification_batches"
     
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
@@ -261,6 +292,13 @@ class NotificationBatch(Base):
         Index("idx_notification_batches_scheduled", "scheduled_at"),
         Index("idx_notification_batches_status", "status"),
         Index("idx_notification_batches_uuid", "batch_uuid"),
+        # Выборка планировщиком: открытые сводки с наступившим временем отправки
+        Index("idx_notification_batches_due", "status", "scheduled_at"),
+        # Не больше одной открытой сводки на пользователя, тип и канал
+        Index(
+            "uq_notification_batches_open", "user_id", "notification_type", "channel", unique=True,
+            postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'")
+        ),
     )
 
 
@@ -284,6 +322,8 @@ class NotificationWebhook(Base):
     headers: Mapped[Dict[str, str]] = mapped_column(JSON, default=dict)
     auth_type: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)  # basic, bearer, none
     auth_credentials: Mapped[Optional[Dict[str, str]]] = mapped_column(JSON, nullable=True)
+    # Секрет подписи HMAC-SHA256 тела запроса (заголовок X-Webhook-Signature)
+    signing_secret: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     
     # Настройки
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
@@ -304,3 +344,94 @@ class NotificationWebhook(Base):
         Index("idx_notification_webhooks_active", "is_active"),
         Index("idx_notification_webhooks_uuid", "webhook_uuid"),
     )
+
+
+class NotificationArchive(Base):
+    """Архив старых уведомлений (переносятся из notifications пачками, без записей доставки)"""
+    __tablename__ = "notifications_archive"
+    
+    # id исходного уведомления
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    notification_uuid: Mapped[str] = mapped_column(String(36), nullable=False)
+    recipient_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    
+    # Основная информация
+    notification_type: Mapped[NotificationType] = mapped_column(String(50), nullable=False)
+    title: Mapped[str] = mapped_column(String(255), nullable=False)
+    message: Mapped[str] = mapped_column(Text, nullable=False)
+    priority: Mapped[NotificationPriority] = mapped_column(String(20), nullable=False)
+    status: Mapped[NotificationStatus] = mapped_column(String(20), nullable=False)
+    channels: Mapped[List[str]] = mapped_column(JSON, default=list)
+    delivered_channels: Mapped[List[str]] = mapped_column(JSON, default=list)
+    related_entity_type: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    related_entity_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    notification_metadata: Mapped[Dict[str, Any]] = mapped_column(JSON, default=dict)
+    
+    # Временные метки
+    delivered_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    read_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("idx_notifications_archive_recipient", "recipient_id", "created_at"),
+    )
+
+
+class BroadcastAudience(str, Enum):
+    """Аудитории рассылок"""
+    DEPARTMENT = "department"
+    ORGANIZATION = "organization"
+
+
+class NotificationBroadcast(Base):
+    """Рассылка одного уведомления аудитории (уведомления получателей создаются пачками)"""
+    __tablename__ = "notification_broadcasts"
+    
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    broadcast_uuid: Mapped[str] = mapped_column(String(36), unique=True, nullable=False)
+    sender_id: Mapped[Optional[int]] = mapped_column(BigInteger, ForeignKey("users.id"), nullable=True)
+    
+    # Аудитория
+    audience_type: Mapped[BroadcastAudience] = mapped_column(String(20), nullable=False)
+    audience_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    
+    # Содержимое
+    notification_type: Mapped[NotificationType] = mapped_column(String(50), nullable=False)
+    title: Mapped[str] = mapped_column(String(255), nullable=False)
+    message: Mapped[str] = mapped_column(Text, nullable=False)
+    priority: Mapped[NotificationPriority] = mapped_column(String(20), default=NotificationPriority.NORMAL)
+    channels: Mapped[List[str]] = mapped_column(JSON, default=list)
+    notification_metadata: Mapped[Dict[str, Any]] = mapped_column(JSON, default=dict)
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    
+    # Ход рассылки
+    status: Mapped[str] = mapped_column(String(20), default="pending")  # pending, sending, completed
+    total_recipients: Mapped[int] = mapped_column(Integer, default=0)
+    processed_recipients: Mapped[int] = mapped_column(Integer, default=0)
+    
+    # Временные метки
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("idx_notification_broadcasts_status", "status"),
+        Index("idx_notification_broadcasts_uuid", "broadcast_uuid"),
+    )
+
+
+class NotificationBroadcastRecipient(Base):
+    """Получатель рассылки (pending - уведомление еще не создано, sent - создано)"""
+    __tablename__ = "notification_broadcast_recipients"
+    
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    broadcast_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("notification_broadcasts.id"), nullable=False)
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id"), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), default="pending")
+    
+    __table_args__ = (
+        # Выборка очередной пачки обработчиком рассылки
+        Index("idx_notification_broadcast_recipients_due", "broadcast_id", "status", "id"),
+        UniqueConstraint("broadcast_id", "user_id", name="uq_notification_broadcast_recipient"),
+    )
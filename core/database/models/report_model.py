@@ -0,0 +1,99 @@
+# модели для БД
+from datetime import datetime, date
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from sqlalchemy import (
+    BigInteger, Date, DateTime, Float, ForeignKey, Index, Integer, JSON, String, Text, UniqueConstraint
+)
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.database.base import Base
+
+
+class ReportRollupScope(str, Enum):
+    """Области агрегации дневных показателей"""
+    GLOBAL = "global"  # Все задачи системы
+    ORGANIZATION = "organization"  # Task.organization_id
+    DEPARTMENT = "department"  # Task.department_id
+    USER = "user"  # Исполнитель задачи / автор записи времени
+    PARTICIPANT = "participant"  # Владелец или исполнитель задачи
+
+
+class ReportRollup(Base):
+    """Дневной агрегат показателя отчета.
+
+    Одна строка - значение метрики (metric, bucket) за день для области
+    (scope_type, scope_id). Задачи учитываются по дню создания, записи
+    времени - по дню начала работы. Строки поддерживаются инкрементально
+    при изменении задач и записей времени и периодически сверяются с
+    исходными таблицами.
+    """
+    __tablename__ = "report_rollups"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    scope_type: Mapped[ReportRollupScope] = mapped_column(String(20), nullable=False)
+    scope_id: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)  # 0 для global
+    day: Mapped[date] = mapped_column(Date, nullable=False)
+    metric: Mapped[str] = mapped_column(String(50), nullable=False)
+    bucket: Mapped[str] = mapped_column(String(50), nullable=False, default="")
+    value: Mapped[float] = mapped_column(Float, nullable=False, default=0)
+
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("scope_type", "scope_id", "day", "metric", "bucket", name="uq_report_rollups_key"),
+        Index("idx_report_rollups_scope_day", "scope_type", "scope_id", "day"),
+        Index("idx_report_rollups_day", "day"),
+    )
+
+
+class ReportJobStatus(str, Enum):
+    """Статусы фонового задания отчета"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class ReportJob(Base):
+    """Фоновое задание на построение отчета.
+
+    Задание создается HTTP-обработчиком и публикуется в очередь RabbitMQ,
+    обработчик отчетов строит файл в хранилище артефактов и обновляет
+    прогресс. Готовый файл скачивается по job_uuid до истечения expires_at.
+    """
+    __tablename__ = "report_jobs"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    job_uuid: Mapped[str] = mapped_column(String(36), unique=True, nullable=False, index=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    # Что строим: отчет (report_type) или построчная выгрузка набора данных (dataset)
+    report_type: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    dataset: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    format_type: Mapped[str] = mapped_column(String(20), nullable=False)
+    params: Mapped[Dict[str, Any]] = mapped_column(JSON, nullable=False, default=dict)
+
+    status: Mapped[ReportJobStatus] = mapped_column(String(20), nullable=False, default=ReportJobStatus.QUEUED)
+    progress: Mapped[int] = mapped_column(Integer, nullable=False, default=0)  # 0-100
+    progress_message: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    # Готовый файл
+    artifact_path: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    artifact_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    artifact_size: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    content_type: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("idx_report_jobs_user_created", "user_id", "created_at"),
+        Index("idx_report_jobs_status_expires", "status", "expires_at"),
+    )
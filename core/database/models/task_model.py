@@ -63,7 +63,7 @@ class Task(Base):
     epic_id: Mapped[Optional[int]] = mapped_column(ForeignKey("tasks.id"), nullable=True)
     
     # Временные рамки
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), index=True)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
     due_date: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
     start_date: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
@@ -140,7 +140,7 @@ class TaskTimeLog(Base):
     hours: Mapped[float] = mapped_column(Float, nullable=False)
     description: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     
-    start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    start_time: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
     end_time: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
@@ -255,28 +255,6 @@ async def orm_add_role_permission(
     await session.refresh(role_perm)
     return role_perm
 
-async def orm_check_user_permission(
-    session: AsyncSession,
-    user_id: int,
-    resource: str,
-    action: str
-) -> bool:
-    """Проверить разрешение пользователя"""
-    user = await orm_get_user_by_id(session, user_id)
-    if not user:
-        return False
-    
-    # Получаем разрешения для роли пользователя
-    permissions = await orm_get_permissions_by_role(session, user.role)
-    
-    # Проверяем наличие нужного разрешения
-    for permission in permissions:
-        if permission.resource == resource and permission.action == action:
-            return True
-    
-    return False
-
-
 # ##################### Добавляем Feature в БД #####################################
 
 # async def orm_add_feature(session: AsyncSession, feature_name: str):
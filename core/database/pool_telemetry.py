@@ -0,0 +1,271 @@
+"""
+Телеметрия пула соединений и расчет его размера
+
+InstrumentedAsyncQueuePool измеряет время ожидания соединения из пула
+(гистограмма), считает таймауты ожидания и время удержания соединений.
+Для каждого выданного соединения запоминается момент выдачи и, если
+включено, стек вызова, поэтому соединения, удерживаемые дольше порога
+(забытая сессия, долгий запрос внутри транзакции), видны вместе с местом,
+где их взяли.
+
+size_pool_from_budget делит общий лимит соединений сервера БД между
+процессами, чтобы pool_size + max_overflow всех воркеров не превышали его.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+logger = logging.getLogger("Database")
+
+# Кадры, не помогающие найти место выдачи соединения
+_SKIPPED_FRAMES = ("/sqlalchemy/", "/asyncio/", "/greenlet/")
+
+# Границы корзин гистограмм, секунды
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами (накопительные счетчики считаются при выгрузке)"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля по верхней границе корзины"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> dict:
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = total
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": cumulative}
+
+
+class PoolTelemetry:
+    """Счетчики и гистограммы одного пула"""
+
+    def __init__(self, name: str, long_held_seconds: float = 30.0, capture_stacks: bool = True, stack_limit: int = 25):
+        self.name = name
+        self.long_held_seconds = long_held_seconds
+        self.capture_stacks = capture_stacks
+        self.stack_limit = stack_limit
+        self.checkout_wait = Histogram()
+        self.hold_time = Histogram()
+        self.stats: Counter = Counter()
+        self.pool: Optional["InstrumentedAsyncQueuePool"] = None
+        # id записи соединения -> (момент выдачи, стек или None)
+        self._held: Dict[int, Tuple[float, Optional[List[str]]]] = {}
+        self._reported: set = set()
+        self._lock = threading.Lock()
+
+    def attach(self, engine) -> "PoolTelemetry":
+        """Подключение к пулу движка (AsyncEngine или Engine)"""
+        pool = getattr(engine, "sync_engine", engine).pool
+        if not isinstance(pool, InstrumentedAsyncQueuePool):
+            logger.warning(f"Pool {self.name} is {type(pool).__name__}, checkout wait is not measured")
+        pool.telemetry = self
+        self.pool = pool
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+        event.listen(pool, "invalidate", self._on_invalidate)
+        return self
+
+    # ------------------------------------------------------------ events
+
+    def observe_wait(self, seconds: float):
+        self.checkout_wait.observe(seconds)
+
+    def observe_timeout(self, seconds: float):
+        self.stats["timeouts"] += 1
+        logger.warning(f"Pool {self.name}: checkout timed out after {seconds:.1f}s ({self.describe()})")
+
+    def _capture_stack(self) -> List[str]:
+        """Стек места выдачи соединения.
+
+        Асинхронный движок выдает соединение внутри greenlet, стек которого
+        не содержит кода приложения, поэтому берется стек текущей задачи
+        asyncio. Кадры цикла событий и SQLAlchemy отбрасываются.
+        """
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            frames = traceback.StackSummary.extract(
+                (frame, frame.f_lineno) for frame in task.get_stack(limit=self.stack_limit)
+            )
+        else:
+            frames = traceback.extract_stack(limit=self.stack_limit)
+        return traceback.format_list([
+            frame for frame in frames
+            if not any(part in frame.filename for part in _SKIPPED_FRAMES) and frame.filename != __file__
+        ])
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        stack = self._capture_stack() if self.capture_stacks else None
+        with self._lock:
+            self._held[id(connection_record)] = (time.monotonic(), stack)
+        self.stats["checkouts"] += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            held = self._held.pop(id(connection_record), None)
+            self._reported.discard(id(connection_record))
+        if held is not None:
+            self.hold_time.observe(time.monotonic() - held[0])
+        self.stats["checkins"] += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.stats["invalidated"] += 1
+
+    # ------------------------------------------------------------ state
+
+    def gauges(self) -> dict:
+        pool = self.pool
+        if pool is None:
+            return {}
+        size = pool.size()
+        checked_out = pool.checkedout()
+        return {
+            "size": size,
+            "max_overflow": getattr(pool, "_max_overflow", 0),
+            "checked_out": checked_out,
+            "idle": pool.checkedin(),
+            # Соединения сверх pool_size (отрицательное значение у QueuePool - еще не открытые)
+            "overflow": max(pool.overflow(), 0),
+        }
+
+    def describe(self) -> str:
+        gauges = self.gauges()
+        return f"in use {gauges.get('checked_out')}/{gauges.get('size')}+{gauges.get('max_overflow')}"
+
+    def long_held(self, threshold: Optional[float] = None) -> List[dict]:
+        """Соединения, удерживаемые дольше порога, со стеком места выдачи"""
+        threshold = self.long_held_seconds if threshold is None else threshold
+        now = time.monotonic()
+        with self._lock:
+            held = list(self._held.items())
+        result = []
+        for record_id, (started, stack) in held:
+            age = now - started
+            if age >= threshold:
+                result.append({"record_id": record_id, "held_seconds": round(age, 3), "stack": stack})
+        return sorted(result, key=lambda item: -item["held_seconds"])
+
+    def report_long_held(self) -> int:
+        """Записать в лог новые долго удерживаемые соединения (каждое один раз)"""
+        reported = 0
+        for item in self.long_held():
+            if item["record_id"] in self._reported:
+                continue
+            self._reported.add(item["record_id"])
+            self.stats["long_held"] += 1
+            reported += 1
+            where = "".join(item["stack"] or ["<stack capture disabled>\n"])
+            logger.warning(
+                f"Pool {self.name}: connection held for {item['held_seconds']:.1f}s, checked out at:\n{where}"
+            )
+        return reported
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            **self.gauges(),
+            "checkouts": self.stats["checkouts"],
+            "timeouts": self.stats["timeouts"],
+            "invalidated": self.stats["invalidated"],
+            "long_held_total": self.stats["long_held"],
+            "checkout_wait_p50": self.checkout_wait.quantile(0.5),
+            "checkout_wait_p99": self.checkout_wait.quantile(0.99),
+            "checkout_wait": self.checkout_wait.to_dict(),
+            "hold_time": self.hold_time.to_dict(),
+            "long_held": [
+                {"held_seconds": item["held_seconds"], "stack": item["stack"]} for item in self.long_held()
+            ],
+        }
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool с измерением ожидания соединения"""
+
+    telemetry: Optional[PoolTelemetry] = None
+
+    def _do_get(self):
+        telemetry = self.telemetry
+        if telemetry is None:
+            return super()._do_get()
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            telemetry.observe_timeout(time.perf_counter() - started)
+            raise
+        telemetry.observe_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() пересоздает пул - телеметрия переходит к новому
+        pool = super().recreate()
+        pool.telemetry = self.telemetry
+        if self.telemetry is not None:
+            self.telemetry.pool = pool
+        return pool
+
+
+def size_pool_from_budget(
+    budget: int,
+    processes: int,
+    reserved: int = 0,
+    overflow_ratio: float = 0.25
+) -> Tuple[int, int]:
+    """(pool_size, max_overflow) движка одного процесса при общем лимите соединений.
+
+    budget - лимит соединений, выделенный приложению на сервере БД; reserved
+    из него не распределяется (миграции, ручные подключения, обработчики
+    фоновых задач); остаток делится поровну между процессами API.
+    """
+    if processes < 1:
+        raise ValueError("processes must be positive")
+    per_process = (budget - reserved) // processes
+    if per_process < 1:
+        raise ValueError(
+            f"Connection budget {budget} (reserved {reserved}) is too small for {processes} processes"
+        )
+    max_overflow = int(per_process * overflow_ratio)
+    pool_size = max(per_process - max_overflow, 1)
+    return pool_size, per_process - pool_size
+
+
+__all__ = [
+    "DEFAULT_BUCKETS",
+    "Histogram",
+    "InstrumentedAsyncQueuePool",
+    "PoolTelemetry",
+    "size_pool_from_budget",
+]
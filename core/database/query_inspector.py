@@ -0,0 +1,152 @@
+"""
+Учет SQL-запросов блока кода: бюджет запросов и поиск N+1
+
+record_queries() включает запись всех SQL-запросов, выполненных внутри
+блока (включая выполняемые в greenlet асинхронного движка), с разбивкой по
+отпечатку - тексту запроса без литералов и значений параметров. Один и тот
+же отпечаток, выполненный много раз за запрос, - признак N+1 (загрузка
+связей в цикле вместо selectinload/joinedload или одного запроса с IN).
+
+Время запроса берется из общего замера (query_timing); вне record_queries
+подписчик ничего не делает, поэтому запись включается только там, где она
+нужна: middleware в режиме разработки/CI и тесты (assert_max_queries).
+"""
+
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from core.database.query_timing import add_query_observer
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_PARAMS = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+|\?")
+_NUMBERS = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_IN_LISTS = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+_VALUES_ROWS = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+# Число повторов одного отпечатка за запрос, начиная с которого он считается N+1
+DEFAULT_REPEAT_THRESHOLD = 5
+
+
+def fingerprint(statement: str) -> str:
+    """Форма запроса: литералы и параметры заменены на ?, списки IN (...) и строки VALUES свернуты"""
+    statement = _COMMENTS.sub(" ", statement)
+    statement = _STRINGS.sub("?", statement)
+    statement = _PARAMS.sub("?", statement)
+    statement = _NUMBERS.sub("?", statement)
+    statement = _IN_LISTS.sub("IN (...)", statement)
+    statement = _VALUES_ROWS.sub(r"\1, ...", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+class QueryRecorder:
+    """SQL-запросы, выполненные внутри record_queries"""
+
+    def __init__(self, parent: Optional["QueryRecorder"] = None):
+        self.parent = parent
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints: Counter = Counter()
+        self.fingerprint_seconds: Dict[str, float] = {}
+
+    def record(self, statement: str, seconds: float):
+        shape = fingerprint(statement)
+        recorder = self
+        # Вложенный блок учитывается и во внешнем (тест внутри запроса, запрос внутри задачи)
+        while recorder is not None:
+            recorder.count += 1
+            recorder.seconds += seconds
+            recorder.fingerprints[shape] += 1
+            recorder.fingerprint_seconds[shape] = recorder.fingerprint_seconds.get(shape, 0.0) + seconds
+            recorder = recorder.parent
+
+    def repeated(self, threshold: int = DEFAULT_REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+        """Отпечатки, выполненные не меньше threshold раз (кандидаты N+1), по убыванию"""
+        return [(shape, count) for shape, count in self.fingerprints.most_common() if count >= threshold]
+
+    def report(self, limit: int = 10) -> str:
+        lines = [f"{self.count} SQL statements in {self.seconds * 1000:.1f} ms"]
+        for shape, count in self.fingerprints.most_common(limit):
+            lines.append(f"  {count:>4} x {shape}")
+        return "\n".join(lines)
+
+
+_recorder: ContextVar[Optional[QueryRecorder]] = ContextVar("query_recorder", default=None)
+
+
+def current_recorder() -> Optional[QueryRecorder]:
+    return _recorder.get()
+
+
+def _observe_query(conn, statement, parameters, context, executemany, seconds):
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.record(statement, seconds)
+
+
+add_query_observer(_observe_query)
+
+
+@contextmanager
+def record_queries():
+    """Записывать SQL-запросы, выполненные внутри блока"""
+    recorder = QueryRecorder(parent=_recorder.get())
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Блок выполнил больше запросов, чем позволяет бюджет, или повторяет запрос в цикле"""
+
+    def __init__(self, message: str, recorder: QueryRecorder):
+        super().__init__(f"{message}\n{recorder.report()}")
+        self.recorder = recorder
+
+
+def check_budget(
+    recorder: QueryRecorder,
+    max_queries: Optional[int] = None,
+    max_repeats: Optional[int] = None
+) -> List[str]:
+    """Нарушения бюджета: превышение числа запросов и отпечатки с повторами больше max_repeats"""
+    violations = []
+    if max_queries is not None and recorder.count > max_queries:
+        violations.append(f"{recorder.count} SQL statements, budget is {max_queries}")
+    if max_repeats is not None:
+        for shape, count in recorder.repeated(max_repeats + 1):
+            violations.append(f"statement repeated {count} times (N+1?): {shape}")
+    return violations
+
+
+@contextmanager
+def assert_max_queries(max_queries: Optional[int] = None, max_repeats: Optional[int] = None):
+    """Проверка в тестах: блок выполняет не больше max_queries запросов
+    и ни один отпечаток не повторяется больше max_repeats раз.
+
+        with assert_max_queries(3, max_repeats=1):
+            await client.get("/api/chats/unread")
+    """
+    with record_queries() as recorder:
+        yield recorder
+    violations = check_budget(recorder, max_queries, max_repeats)
+    if violations:
+        raise QueryBudgetExceeded("; ".join(violations), recorder)
+
+
+__all__ = [
+    "DEFAULT_REPEAT_THRESHOLD",
+    "QueryBudgetExceeded",
+    "QueryRecorder",
+    "assert_max_queries",
+    "check_budget",
+    "current_recorder",
+    "fingerprint",
+    "record_queries",
+]
@@ -0,0 +1,81 @@
+"""
+Общий замер времени SQL-запросов
+
+Одна пара обработчиков before/after_cursor_execute на все движки замеряет
+время запроса один раз и передает его подписчикам: метрикам Prometheus,
+учету бюджета запросов (query_inspector) и журналу медленных запросов
+(slow_queries). Пока подписчиков нет, обработчики к движкам не подключены.
+
+Подписчик - функция (conn, statement, parameters, context, executemany, seconds),
+вызывается после каждого запроса, поэтому должен быть дешевым и сам
+решать, нужна ли ему запись (например, только внутри record_queries).
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+QueryObserver = Callable[[Any, str, Any, Any, bool, float], None]
+
+# Снимок подписчиков заменяется целиком: обработчик читает его без блокировки
+_observers: Tuple[QueryObserver, ...] = ()
+_lock = threading.Lock()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_started", None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    for observer in _observers:
+        try:
+            observer(conn, statement, parameters, context, executemany, seconds)
+        except Exception as e:
+            logger.error(f"Query observer {getattr(observer, '__name__', observer)} failed: {e}")
+
+
+def add_query_observer(observer: QueryObserver) -> None:
+    """Подписка на время запросов; обработчики движков подключаются с первым подписчиком"""
+    global _observers
+    with _lock:
+        if observer in _observers:
+            return
+        if not _observers:
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _observers = _observers + (observer,)
+
+
+def remove_query_observer(observer: QueryObserver) -> None:
+    """Отписка; с последним подписчиком обработчики движков отключаются"""
+    global _observers
+    with _lock:
+        if observer not in _observers:
+            return
+        _observers = tuple(item for item in _observers if item is not observer)
+        if not _observers:
+            event.remove(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.remove(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def query_observers() -> Tuple[QueryObserver, ...]:
+    return _observers
+
+
+__all__ = [
+    "QueryObserver",
+    "add_query_observer",
+    "query_observers",
+    "remove_query_observer",
+]
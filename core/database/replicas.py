@@ -0,0 +1,221 @@
+"""
+Маршрутизация чтения на реплики
+
+Сессии чтения (Database.read_session) выбирают движок при первом запросе:
+реплику с допустимым отставанием по кругу, иначе основную БД. Отставание
+реплик проверяет фоновый монитор; реплика без свежей проверки считается
+недоступной.
+
+Read-your-writes: после коммита с изменениями в основной БД ключ текущего
+запроса (обычно id пользователя, его выставляет verify_authorization)
+получает окно, в течение которого его чтения идут в основную БД, чтобы
+пользователь видел свои изменения, даже если реплика еще не догнала.
+
+Окна хранятся в памяти процесса. При нескольких воркерах (RUN__WORKERS > 1)
+или хостах следующий запрос пользователя может попасть в другой процесс,
+который о записи не знает, поэтому окна нужно разделять через Redis
+(DB__READ_YOUR_WRITES_REDIS_URL): запись окна публикуется в Redis после
+коммита, а при аутентификации запроса процесс подгружает оставшееся окно
+ключа. Без Redis гарантия read-your-writes действует только в пределах
+одного процесса.
+"""
+
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Ключ read-your-writes текущего запроса
+read_your_writes_key: ContextVar[Optional[Any]] = ContextVar("read_your_writes_key", default=None)
+
+_WRITES_KEY = "has_writes"
+
+# Отставание реплики PostgreSQL в секундах; 0, если все полученное WAL уже применено
+POSTGRES_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+async def postgres_replica_lag(conn: AsyncConnection) -> float:
+    return float((await conn.execute(POSTGRES_LAG_QUERY)).scalar() or 0.0)
+
+
+LagProbe = Callable[[AsyncConnection], Awaitable[float]]
+
+
+class ReplicaState:
+    """Движок реплики и результат последней проверки отставания"""
+
+    __slots__ = ("url", "engine", "lag", "healthy", "checked_at", "error")
+
+    def __init__(self, url: str, engine: AsyncEngine):
+        self.url = url
+        self.engine = engine
+        self.lag: Optional[float] = None
+        self.healthy = False
+        self.checked_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.engine.url.render_as_string(hide_password=True),
+            "lag_seconds": self.lag,
+            "healthy": self.healthy,
+            "checked_at": self.checked_at,
+            "error": self.error,
+        }
+
+
+class RoutingSession(Session):
+    """Сессия чтения: движок выбирается при первом запросе и закрепляется до закрытия"""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        database = self.info.get("database")
+        if database is None:
+            return super().get_bind(mapper=mapper, clause=clause, **kw)
+        if self._flushing:
+            raise RuntimeError("Read session is read-only, use get_session() for writes")
+        bind = self.info.get("bind")
+        if bind is None:
+            bind = database.choose_read_engine().sync_engine
+            self.info["bind"] = bind
+        return bind
+
+    def close(self):
+        # Следующая транзакция снова выбирает движок по текущему состоянию реплик
+        self.info.pop("bind", None)
+        super().close()
+
+
+class PrimarySession(Session):
+    """Сессия основной БД: коммит с изменениями открывает окно read-your-writes"""
+
+
+@event.listens_for(PrimarySession, "after_flush")
+def _mark_flush_writes(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info[_WRITES_KEY] = True
+
+
+@event.listens_for(PrimarySession, "do_orm_execute")
+def _mark_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[_WRITES_KEY] = True
+
+
+@event.listens_for(PrimarySession, "after_commit")
+def _open_sticky_window(session):
+    if not session.info.pop(_WRITES_KEY, False):
+        return
+    database = session.info.get("database")
+    if database is not None:
+        database.mark_write()
+
+
+@event.listens_for(PrimarySession, "after_rollback")
+def _discard_writes(session):
+    session.info.pop(_WRITES_KEY, None)
+
+
+class RedisStickyStore:
+    """Окна read-your-writes в Redis: общие для всех воркеров и хостов"""
+
+    def __init__(self, redis_url: str, namespace: str = "read_your_writes"):
+        self.redis_url = redis_url
+        self.namespace = namespace
+        self._redis = None
+
+    def _client(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        return self._redis
+
+    async def mark(self, key: Any, seconds: float):
+        await self._client().set(f"{self.namespace}:{key}", 1, px=max(int(seconds * 1000), 1))
+
+    async def remaining(self, key: Any) -> float:
+        """Остаток окна в секундах; 0 - окна нет"""
+        ttl = await self._client().pttl(f"{self.namespace}:{key}")
+        return ttl / 1000 if ttl and ttl > 0 else 0.0
+
+
+class StickyWindows:
+    """Ключи с недавними записями и моменты окончания их окна.
+
+    Без shared_store окна видны только текущему процессу (см. описание модуля).
+    """
+
+    def __init__(self, seconds: float, max_keys: int = 100000, shared_store: Optional[RedisStickyStore] = None):
+        self.seconds = seconds
+        self.max_keys = max_keys
+        self.shared_store = shared_store
+        self.until: dict = {}
+        self._tasks: set = set()
+
+    def mark(self, key: Any):
+        self._set(key, self.seconds)
+        if self.shared_store is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # after_commit синхронный: публикация в Redis уходит фоновой задачей
+        task = loop.create_task(self._publish(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _publish(self, key: Any):
+        try:
+            await self.shared_store.mark(key, self.seconds)
+        except Exception as e:
+            logger.warning(f"Failed to share read-your-writes window: {e}")
+
+    def _set(self, key: Any, seconds: float):
+        now = time.monotonic()
+        if len(self.until) >= self.max_keys:
+            self.until = {k: t for k, t in self.until.items() if t > now}
+        self.until[key] = now + seconds
+
+    async def load(self, key: Any):
+        """Подгрузка окна ключа из общего хранилища (записи в других процессах)"""
+        if self.shared_store is None or self.is_sticky(key):
+            return
+        try:
+            remaining = await self.shared_store.remaining(key)
+        except Exception as e:
+            logger.warning(f"Failed to load read-your-writes window: {e}")
+            return
+        if remaining > 0:
+            self._set(key, remaining)
+
+    def is_sticky(self, key: Any) -> bool:
+        until = self.until.get(key)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            self.until.pop(key, None)
+            return False
+        return True
+
+
+__all__ = [
+    "LagProbe",
+    "PrimarySession",
+    "RedisStickyStore",
+    "ReplicaState",
+    "RoutingSession",
+    "StickyWindows",
+    "postgres_replica_lag",
+    "read_your_writes_key",
+]
@@ -0,0 +1,271 @@
+"""
+Журнал медленных SQL-запросов
+
+Запросы дольше порога записываются в ограниченное хранилище процесса:
+отпечаток (нормализованный SQL), исходный текст, параметры со скрытыми
+значениями, источник (маршрут HTTP-запроса или фоновая задача) и, если
+включено, план выполнения. План запрашивается через EXPLAIN без ANALYZE
+(запрос повторно не выполняется) на том же соединении через курсор DBAPI,
+минуя события движка, и не чаще одного раза за explain_cooldown для
+одного отпечатка.
+
+Источник задается set_query_origin: строкой или функцией, которая
+вызывается только при записи медленного запроса (маршрут становится
+известен после маршрутизации, позже начала запроса).
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from core.database.query_inspector import fingerprint
+from core.database.query_timing import add_query_observer
+from core.settings import settings
+
+logger = logging.getLogger("Database.slow_queries")
+
+# Префикс EXPLAIN по диалекту (без ANALYZE - запрос не выполняется)
+EXPLAIN_PREFIXES = {
+    "postgresql": "EXPLAIN ",
+    "sqlite": "EXPLAIN QUERY PLAN ",
+}
+_EXPLAINABLE = ("SELECT", "WITH")
+
+Origin = Union[str, Callable[[], Optional[str]], None]
+
+query_origin: ContextVar[Origin] = ContextVar("query_origin", default=None)
+
+
+def set_query_origin(origin: Origin):
+    """Источник запросов текущего контекста; возвращает токен для query_origin.reset"""
+    return query_origin.set(origin)
+
+
+def _resolve_origin() -> Optional[str]:
+    origin = query_origin.get()
+    if callable(origin):
+        try:
+            return origin()
+        except Exception:
+            return None
+    return origin
+
+
+def redact_value(value: Any) -> Any:
+    """Значение параметра без персональных данных.
+
+    Числа, даты и логические значения сохраняются - они объясняют план
+    (OFFSET, диапазоны дат). Строки заменяются длиной; ведущий и конечный %
+    шаблонов LIKE сохраняются, потому что ведущий % исключает индекс.
+    """
+    if value is None or isinstance(value, (bool, int, float, Decimal)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, str):
+        prefix = "%" if value.startswith("%") else ""
+        suffix = "%" if len(value) > 1 and value.endswith("%") else ""
+        return f"{prefix}<str:{len(value)}>{suffix}"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<bytes:{len(value)}>"
+    if isinstance(value, (list, tuple, set)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def redact_parameters(parameters: Any, executemany: bool = False, max_rows: int = 3) -> Any:
+    if parameters is None:
+        return None
+    if executemany:
+        rows = list(parameters)
+        redacted = [redact_parameters(row, max_rows=max_rows) for row in rows[:max_rows]]
+        if len(rows) > max_rows:
+            redacted.append(f"<{len(rows) - max_rows} more rows>")
+        return redacted
+    if isinstance(parameters, dict):
+        return {key: redact_value(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact_value(value) for value in parameters]
+    return redact_value(parameters)
+
+
+class SlowQueryLog:
+    """Ограниченное хранилище медленных запросов процесса"""
+
+    def __init__(
+        self,
+        threshold_ms: float = 500.0,
+        max_entries: int = 500,
+        max_fingerprints: int = 1000,
+        max_sql_length: int = 4000,
+        explain: bool = False,
+        explain_cooldown: float = 300.0,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.threshold_ms = threshold_ms
+        self.max_sql_length = max_sql_length
+        self.explain = explain
+        self.explain_cooldown = explain_cooldown
+        self.max_fingerprints = max_fingerprints
+        self.entries: deque = deque(maxlen=max_entries)
+        # Отпечаток -> сводка (число, суммарное и максимальное время, источники)
+        self.summary: "OrderedDict[str, dict]" = OrderedDict()
+        self._explained_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, **options):
+        max_entries = options.pop("max_entries", None)
+        if max_entries is not None:
+            self.entries = deque(self.entries, maxlen=max_entries)
+        for name, value in options.items():
+            if not hasattr(self, name):
+                raise AttributeError(name)
+            setattr(self, name, value)
+
+    # ------------------------------------------------------------ recording
+
+    def record(self, conn, statement: str, parameters: Any, executemany: bool, elapsed_ms: float):
+        shape = fingerprint(statement)
+        plan = self._explain(conn, shape, statement, parameters) if self.explain and not executemany else None
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(elapsed_ms, 2),
+            "fingerprint": shape,
+            "sql": statement[:self.max_sql_length],
+            "parameters": redact_parameters(parameters, executemany),
+            "executemany": executemany,
+            "origin": _resolve_origin(),
+            "engine": conn.engine.url.render_as_string(hide_password=True),
+            "plan": plan,
+        }
+        with self._lock:
+            self.entries.append(entry)
+            stats = self.summary.pop(shape, None) or {
+                "fingerprint": shape, "count": 0, "total_ms": 0.0, "max_ms": 0.0, "origins": {}
+            }
+            stats["count"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["last_at"] = entry["at"]
+            origin = entry["origin"] or "<unknown>"
+            stats["origins"][origin] = stats["origins"].get(origin, 0) + 1
+            self.summary[shape] = stats
+            while len(self.summary) > self.max_fingerprints:
+                self.summary.popitem(last=False)
+        logger.warning(f"Slow query {elapsed_ms:.0f}ms from {entry['origin'] or 'unknown origin'}: {shape[:500]}")
+
+    def _explain(self, conn, shape: str, statement: str, parameters: Any) -> Optional[List[str]]:
+        prefix = EXPLAIN_PREFIXES.get(conn.dialect.name)
+        if prefix is None or not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        now = time.monotonic()
+        explained_at = self._explained_at.get(shape)
+        if explained_at is not None and now - explained_at < self.explain_cooldown:
+            return None
+        self._explained_at[shape] = now
+        if len(self._explained_at) > self.max_fingerprints:
+            self._explained_at = {key: value for key, value in self._explained_at.items()
+                                  if now - value < self.explain_cooldown}
+        # Ошибка в транзакции PostgreSQL прерывает ее - EXPLAIN выполняется в точке сохранения
+        savepoint = conn.dialect.name == "postgresql" and conn.in_transaction()
+        # Курсор DBAPI: EXPLAIN не проходит через события движка и не попадает в журнал
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            if savepoint:
+                cursor.execute("SAVEPOINT slow_query_explain")
+            cursor.execute(prefix + statement, parameters or ())
+            plan = [" | ".join(str(column) for column in row) for row in cursor.fetchall()]
+            if savepoint:
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        except Exception as e:
+            if savepoint:
+                try:
+                    cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                except Exception:
+                    pass
+            return [f"EXPLAIN failed: {e}"]
+        finally:
+            cursor.close()
+
+    # ------------------------------------------------------------ queries
+
+    def recent(
+        self,
+        limit: int = 50,
+        min_ms: Optional[float] = None,
+        origin: Optional[str] = None,
+        contains: Optional[str] = None,
+    ) -> List[dict]:
+        """Последние медленные запросы (новые первыми) с фильтрами"""
+        with self._lock:
+            entries = list(self.entries)
+        result = []
+        for entry in reversed(entries):
+            if min_ms is not None and entry["duration_ms"] < min_ms:
+                continue
+            if origin and origin not in (entry["origin"] or ""):
+                continue
+            if contains and contains.lower() not in entry["fingerprint"].lower():
+                continue
+            result.append(entry)
+            if len(result) >= limit:
+                break
+        return result
+
+    def top(self, limit: int = 20, order_by: str = "total_ms") -> List[dict]:
+        """Отпечатки с наибольшим суммарным (или максимальным, числом) временем"""
+        if order_by not in ("total_ms", "max_ms", "count"):
+            raise ValueError(f"Unknown order: {order_by}")
+        with self._lock:
+            summary = [dict(stats, origins=dict(stats["origins"])) for stats in self.summary.values()]
+        for stats in summary:
+            stats["avg_ms"] = round(stats["total_ms"] / stats["count"], 2)
+            stats["total_ms"] = round(stats["total_ms"], 2)
+            stats["max_ms"] = round(stats["max_ms"], 2)
+        return sorted(summary, key=lambda stats: -stats[order_by])[:limit]
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.summary.clear()
+            self._explained_at.clear()
+
+
+slow_query_log = SlowQueryLog(
+    enabled=settings.db.slow_query_enabled,
+    threshold_ms=settings.db.slow_query_threshold_ms,
+    max_entries=settings.db.slow_query_max_entries,
+    explain=settings.db.slow_query_explain,
+    explain_cooldown=settings.db.slow_query_explain_cooldown_seconds,
+)
+
+
+def _observe_query(conn, statement, parameters, context, executemany, seconds):
+    elapsed_ms = seconds * 1000
+    if not slow_query_log.enabled or elapsed_ms < slow_query_log.threshold_ms:
+        return
+    try:
+        slow_query_log.record(conn, statement, parameters, executemany, elapsed_ms)
+    except Exception as e:
+        logger.error(f"Slow query log failed: {e}")
+
+
+add_query_observer(_observe_query)
+
+
+__all__ = [
+    "EXPLAIN_PREFIXES",
+    "SlowQueryLog",
+    "query_origin",
+    "redact_parameters",
+    "redact_value",
+    "set_query_origin",
+    "slow_query_log",
+]
@@ -1,3 +1,5 @@
+import os
+import shutil
 
 import uvicorn
 
@@ -7,14 +9,25 @@ from backend.api import create_app
 
 main_app = create_app(create_custom_static_urls=False,)
 
+
+def prepare_metrics_dir():
+    """Общий каталог метрик воркеров: очищается до их запуска, переменная наследуется воркерами"""
+    if not settings.metrics.enabled or settings.run.workers <= 1:
+        return
+    path = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.metrics.multiproc_dir)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
 if __name__ == "__main__":
     # setup_logging()
+    prepare_metrics_dir()
 
     uvicorn.run(
         "run_backend:main_app",
         host=settings.run.host,
         port=settings.run.port,
-        workers=4,
+        workers=settings.run.workers,
         reload=True,
         # ssl_keyfile=settings.security.private_key_path,
         # ssl_certfile=settings.security.certificate_path
@@ -0,0 +1,20 @@
+import asyncio
+import logging
+
+from backend.api.services.email_sync_service import start_email_workers, stop_email_workers
+from core.database import get_db_helper
+
+
+async def main():
+    await get_db_helper().init_db()
+    try:
+        await start_email_workers()
+    finally:
+        await stop_email_workers()
+        await get_db_helper().dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    asyncio.run(main())
@@ -0,0 +1,23 @@
+import asyncio
+import logging
+
+from backend.api.configuration.webhook_client import webhook_client
+from backend.api.services.notification_delivery_service import start_notification_workers, stop_notification_workers
+from core.database import get_db_helper
+
+
+async def main():
+    await get_db_helper().init_db()
+    await webhook_client.start()
+    try:
+        await start_notification_workers()
+    finally:
+        await stop_notification_workers()
+        await webhook_client.close()
+        await get_db_helper().dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    asyncio.run(main())
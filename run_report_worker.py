@@ -0,0 +1,22 @@
+import asyncio
+import logging
+
+from backend.api.configuration.rabbitmq_server import rabbit
+from backend.api.services.report_job_service import start_report_job_worker, stop_report_job_worker
+from core.database import get_db_helper
+
+
+async def main():
+    await get_db_helper().init_db()
+    try:
+        await start_report_job_worker()
+    finally:
+        await stop_report_job_worker()
+        await get_db_helper().dispose()
+        await rabbit.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    asyncio.run(main())
@@ -9,10 +9,19 @@ import os
 import sys
 from unittest.mock import AsyncMock, MagicMock
 
+from sqlalchemy import BigInteger
+from sqlalchemy.ext.compiler import compiles
+
 # Add the project root to Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 
+@compiles(BigInteger, "sqlite")
+def _sqlite_bigint(type_, compiler, **kw):
+    """SQLite автоинкрементирует только INTEGER PRIMARY KEY: BigInteger-ключи моделей создаются как INTEGER"""
+    return "INTEGER"
+
+
 @pytest.fixture(scope="session")
 def event_loop():
     """Create an instance of the default event loop for the test session."""
@@ -21,6 +30,55 @@ def event_loop():
     loop.close()
 
 
+@pytest.fixture(autouse=True)
+def _reset_rate_limits():
+    """Каждый тест начинает с полными корзинами ограничения частоты входа"""
+    from backend.api.configuration.rate_limiter import rate_limiter
+
+    rate_limiter.local_store.clear()
+    yield
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def _flush_push_events():
+    """Push-события, опубликованные фоном, завершаются в цикле теста (как при остановке приложения)"""
+    yield
+    push_service = sys.modules.get("backend.api.services.notification_push_service")
+    if push_service is not None:
+        await push_service.flush_push_events()
+
+
+@pytest.fixture
+def related_models():
+    """Модели, на которые ссылаются отношения User (как при запуске приложения)"""
+    import core.database.models  # noqa: F401
+    import core.database.models.calendar_model  # noqa: F401
+    import core.database.models.chat_model  # noqa: F401
+    import core.database.models.search_model  # noqa: F401
+    import core.database.models.video_call_model  # noqa: F401
+
+
+@pytest_asyncio.fixture
+async def sqlite_session_factory(tmp_path, related_models):
+    """Фабрика сессий SQLite-базы с таблицами моделей: await sqlite_session_factory("users", ...)"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from core.database.base import Base
+
+    engines = []
+
+    async def create(*names):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / f'test_{len(engines)}.db'}")
+        engines.append(engine)
+        tables = [Base.metadata.tables[name] for name in names]
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda sync_conn: Base.metadata.create_all(sync_conn, tables=tables))
+        return async_sessionmaker(engine, expire_on_commit=False)
+
+    yield create
+    for engine in engines:
+        await engine.dispose()
+
+
 @pytest_asyncio.fixture
 async def session():
     """Create a database session for testing"""
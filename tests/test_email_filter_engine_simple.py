@@ -0,0 +1,221 @@
+"""
+Простые тесты скомпилированных фильтров почты
+"""
+import random
+
+import pytest
+import pytest_asyncio
+
+
+def _rule(id, filter_type, value, condition="contains", action="mark_as_read", action_value=None, priority=0):
+    from backend.api.services.email_filter_engine import FilterRule
+    return FilterRule.from_row(id, filter_type, value, condition, action, action_value, priority)
+
+
+def _reference(value, filter_value, condition):
+    """Прежняя проверка условия фильтра (по одному фильтру)"""
+    value, filter_value = value.lower(), filter_value.lower()
+    return {
+        "contains": filter_value in value,
+        "equals": value == filter_value,
+        "starts_with": value.startswith(filter_value),
+        "ends_with": value.endswith(filter_value),
+    }[condition]
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_session_factory):
+    return await sqlite_session_factory(
+        "users", "email_accounts", "email_folders", "emails", "email_folder_mappings", "email_filters"
+    )
+
+
+async def _seed(session_factory, subjects, folder_names=("INBOX", "Invoices")):
+    """Аккаунт, папки и письма с заданными темами (все в INBOX)"""
+    from core.database.models.email_model import Email, EmailAccount, EmailFolder, EmailFolderMapping
+
+    async with session_factory() as session:
+        account = EmailAccount(user_id=1, email="owner@example.com")
+        session.add(account)
+        await session.flush()
+        folders = {name: EmailFolder(email_account_id=account.id, name=name) for name in folder_names}
+        session.add_all(folders.values())
+        await session.flush()
+        for n, subject in enumerate(subjects):
+            email_obj = Email(message_id=f"<m{n}@example.com>", sender_id=account.id, subject=subject,
+                              body_text=f"Body {n}", status="delivered",
+                              external_headers={"from_address": "billing@vendor.com" if n % 2 else "boss@corp.com"})
+            session.add(email_obj)
+            await session.flush()
+            session.add(EmailFolderMapping(email_id=email_obj.id, folder_id=folders["INBOX"].id))
+        await session.commit()
+        return account.id, {name: folder.id for name, folder in folders.items()}
+
+
+async def _add_filter(session_factory, account_id, **kwargs):
+    from core.database.models.email_model import EmailFilter
+
+    async with session_factory() as session:
+        filter_obj = EmailFilter(email_account_id=account_id, name="rule", **kwargs)
+        session.add(filter_obj)
+        await session.commit()
+        return filter_obj.id
+
+
+class TestLiteralMatcher:
+    """Тесты поиска набора строк"""
+
+    def test_overlapping_and_nested_literals(self):
+        """Тест: за один проход находятся и вложенные, и перекрывающиеся строки"""
+        from backend.api.services.email_filter_engine import LiteralMatcher
+
+        matcher = LiteralMatcher(["inv", "invoice", "voice", "ice", "nothing", "a.b"])
+        assert matcher.find_all("your invoice is ready") == {"inv", "invoice", "voice", "ice"}
+        assert matcher.find_all("a.b axb") == {"a.b"}
+        assert matcher.match_start("invoice 42") == {"inv", "invoice"}
+        assert matcher.match_start("the invoice") == set()
+
+    def test_empty_set(self):
+        """Тест: пустой набор ни с чем не совпадает"""
+        from backend.api.services.email_filter_engine import LiteralMatcher
+
+        assert LiteralMatcher([]).find_all("text") == set()
+        assert LiteralMatcher([]).match_start("text") == set()
+
+
+class TestCompiledFilters:
+    """Тесты скомпилированного набора правил"""
+
+    def test_conditions_fields_and_order(self):
+        """Тест: условия по полям, регистр не важен, порядок - по приоритету"""
+        from backend.api.services.email_filter_engine import CompiledFilters
+
+        rules = CompiledFilters([
+            _rule(1, "subject", "Invoice", priority=5),
+            _rule(2, "sender", "billing@vendor.com", "equals", priority=1),
+            _rule(3, "subject", "re:", "starts_with"),
+            _rule(4, "content", "unsubscribe", "ends_with"),
+            _rule(5, "category", "report"),
+            _rule(6, "size", "100"),
+            _rule(7, "subject", "invoice", "regex"),
+        ])
+        matched = rules.match(sender="Billing@Vendor.com", subject="RE: your INVOICE", content="click to Unsubscribe",
+                              category="report")
+        assert [rule.id for rule in matched] == [3, 4, 5, 2, 1]
+        assert rules.match(sender="x@y.z", subject="hello", content="", category=None) == []
+
+    def test_matches_reference_checks(self):
+        """Тест: результат совпадает с проверкой каждого фильтра по отдельности"""
+        from backend.api.services.email_filter_engine import CompiledFilters
+
+        rng = random.Random(7)
+        alphabet = "abcАБ "
+        conditions = ["contains", "equals", "starts_with", "ends_with"]
+        fields = ["sender", "subject", "content"]
+        for _ in range(50):
+            rules = [
+                _rule(i, rng.choice(fields), "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 3))),
+                      rng.choice(conditions))
+                for i in range(30)
+            ]
+            compiled = CompiledFilters(rules)
+            for _ in range(20):
+                texts = {field: "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12))) for field in fields}
+                expected = [rule.id for rule in rules
+                            if _reference(texts[rule.filter_type], rule.filter_value, rule.filter_condition)]
+                assert [rule.id for rule in compiled.match(**texts)] == expected
+
+
+class TestFilterRuleCache:
+    """Тесты кэша скомпилированных правил"""
+
+    @pytest.mark.asyncio
+    async def test_recompiles_only_on_change(self, session_factory):
+        """Тест: одинаковые правила компилируются один раз; изменение фильтра видно сразу"""
+        from sqlalchemy import update
+        from core.database.models.email_model import EmailFilter
+        from backend.api.services.email_filter_engine import FilterRuleCache
+
+        account_id, _ = await _seed(session_factory, [])
+        filter_id = await _add_filter(session_factory, account_id, filter_type="subject", filter_value="invoice",
+                                      action="mark_as_read")
+        cache = FilterRuleCache(max_entries=1)
+        async with session_factory() as session:
+            first = await cache.load(session, account_id)
+            assert await cache.load(session, account_id) is first
+            assert cache.compilations == 1
+
+            await session.execute(update(EmailFilter).where(EmailFilter.id == filter_id).values(filter_value="bill"))
+            await session.commit()
+            second = await cache.load(session, account_id)
+            assert cache.compilations == 2
+            assert [rule.id for rule in second.match("", "Bill for May", "")] == [filter_id]
+
+            await cache.load(session, account_id + 1)
+            assert list(cache.entries) == [account_id + 1]
+
+
+class TestApplyFilters:
+    """Тесты применения фильтров"""
+
+    @pytest.mark.asyncio
+    async def test_apply_email_filters(self, session_factory):
+        """Тест: фильтры применяются к новому письму через скомпилированный набор"""
+        from sqlalchemy import select
+        from core.database.models.email_model import Email, EmailCategory, EmailFilterAction, EmailStatus
+        from backend.api.services.email_service import EmailService
+
+        account_id, _ = await _seed(session_factory, ["Your invoice", "Lunch"])
+        await _add_filter(session_factory, account_id, filter_type="sender", filter_value="@vendor.com",
+                          filter_condition="ends_with", action="mark_as_spam", priority=2)
+        await _add_filter(session_factory, account_id, filter_type="subject", filter_value="INVOICE",
+                          action="mark_as_important", priority=1)
+
+        async with session_factory() as session:
+            emails = (await session.scalars(select(Email).order_by(Email.id))).all()
+            service = EmailService(session)
+            assert await service.apply_email_filters(emails[0]) == [EmailFilterAction.MARK_AS_IMPORTANT]
+            assert await service.apply_email_filters(emails[1]) == [EmailFilterAction.MARK_AS_SPAM]
+        assert emails[0].is_important
+        assert (emails[1].status, emails[1].category) == (EmailStatus.SPAM, EmailCategory.JUNK)
+
+    @pytest.mark.asyncio
+    async def test_apply_to_existing_in_batches(self, session_factory):
+        """Тест: применение к полученной почте порциями - меняются только совпавшие письма"""
+        from sqlalchemy import select
+        from core.database.models.email_model import Email
+        from backend.api.services.email_filter_engine import apply_filter_to_existing
+
+        subjects = ["Invoice 1", "hello", "INVOICE 2", "news", "invoice 3", "Re: invoice 4", "misc"]
+        account_id, _ = await _seed(session_factory, subjects)
+        filter_id = await _add_filter(session_factory, account_id, filter_type="subject", filter_value="invoice",
+                                      action="mark_as_read")
+
+        async with session_factory() as session:
+            assert await apply_filter_to_existing(session, filter_id, batch_size=2) == 4
+        async with session_factory() as session:
+            rows = (await session.execute(select(Email.subject, Email.status, Email.read_at).order_by(Email.id))).all()
+        assert [subject for subject, status, read_at in rows if status == "read" and read_at] == \
+            ["Invoice 1", "INVOICE 2", "invoice 3", "Re: invoice 4"]
+
+    @pytest.mark.asyncio
+    async def test_apply_to_existing_moves_to_folder(self, session_factory):
+        """Тест: перемещение в папку - привязки меняются без дублей, повторный запуск ничего не ломает"""
+        from sqlalchemy import select
+        from core.database.models.email_model import EmailFolderMapping
+        from backend.api.services.email_filter_engine import apply_filter_to_existing
+
+        account_id, folders = await _seed(session_factory, [f"Letter {n}" for n in range(5)])
+        filter_id = await _add_filter(session_factory, account_id, filter_type="sender",
+                                      filter_value="billing@vendor.com", filter_condition="equals",
+                                      action="move_to_folder", action_value="Invoices")
+
+        for _ in range(2):
+            async with session_factory() as session:
+                assert await apply_filter_to_existing(session, filter_id, batch_size=10) == 2
+        async with session_factory() as session:
+            mappings = (await session.execute(
+                select(EmailFolderMapping.email_id, EmailFolderMapping.folder_id).order_by(EmailFolderMapping.email_id)
+            )).all()
+        inbox, invoices = folders["INBOX"], folders["Invoices"]
+        assert [folder_id for _, folder_id in mappings] == [inbox, invoices, inbox, invoices, inbox]
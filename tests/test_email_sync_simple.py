@@ -0,0 +1,413 @@
+"""
+Простые тесты синхронизации входящей почты по IMAP (с локальным IMAP-сервером)
+"""
+import asyncio
+import os
+import re
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+
+
+class StubIMAPServer:
+    """Минимальный IMAP-сервер с одной папкой INBOX: CAPABILITY, LOGIN, SELECT, UID FETCH, LOGOUT"""
+
+    def __init__(self, condstore=True):
+        self.condstore = condstore
+        self.uid_validity = 1000
+        self.modseq = 1
+        self.messages = {}  # uid -> {"raw", "flags", "modseq"}
+        self.commands = []
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def add(self, raw, flags=()):
+        self.modseq += 1
+        uid = max(self.messages, default=0) + 1
+        self.messages[uid] = {"raw": raw, "flags": set(flags), "modseq": self.modseq}
+        return uid
+
+    def set_flags(self, uid, *flags):
+        self.modseq += 1
+        self.messages[uid].update(flags=set(flags), modseq=self.modseq)
+
+    def renumber(self, start):
+        """Папка пересоздана: новый UIDVALIDITY и новые UID"""
+        self.uid_validity += 1
+        self.messages = {start + i: message for i, (_, message) in enumerate(sorted(self.messages.items()))}
+
+    def _uids(self, spec):
+        top = max(self.messages, default=0)
+        uids = set()
+        for part in spec.split(","):
+            bounds = [top if bound == "*" else int(bound) for bound in part.split(":")]
+            low, high = min(bounds), max(bounds)
+            uids.update(uid for uid in self.messages if low <= uid <= high)
+        return sorted(uids)
+
+    async def _handle(self, reader, writer):
+        writer.write(b"* OK stub IMAP4rev1 ready\r\n")
+        try:
+            while line := await reader.readline():
+                tag, _, command = line.decode().rstrip("\r\n").partition(" ")
+                self.commands.append(command)
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "CAPABILITY":
+                    writer.write(f"* CAPABILITY IMAP4rev1{' CONDSTORE' if self.condstore else ''}\r\n".encode())
+                    writer.write(f"{tag} OK done\r\n".encode())
+                elif verb == "LOGIN":
+                    ok = command == 'LOGIN "reader@example.com" "secret"'
+                    writer.write(f"{tag} {'OK logged in' if ok else 'NO bad credentials'}\r\n".encode())
+                elif verb == "SELECT":
+                    writer.write(f"* {len(self.messages)} EXISTS\r\n".encode())
+                    writer.write(f"* OK [UIDVALIDITY {self.uid_validity}] ok\r\n".encode())
+                    writer.write(f"* OK [UIDNEXT {max(self.messages, default=0) + 1}] ok\r\n".encode())
+                    if self.condstore:
+                        writer.write(f"* OK [HIGHESTMODSEQ {self.modseq}] ok\r\n".encode())
+                    writer.write(f"{tag} OK [READ-WRITE] selected\r\n".encode())
+                elif command.upper().startswith("UID FETCH"):
+                    _, _, spec, items = command.split(" ", 3)
+                    changed = re.search(r"CHANGEDSINCE (\d+)", items)
+                    for seq, uid in enumerate(self._uids(spec), start=1):
+                        message = self.messages[uid]
+                        if changed and message["modseq"] <= int(changed.group(1)):
+                            continue
+                        head = f"* {seq} FETCH (UID {uid} FLAGS ({' '.join(sorted(message['flags']))})"
+                        if "BODY.PEEK[]" in items:
+                            writer.write(f"{head} BODY[] {{{len(message['raw'])}}}\r\n".encode())
+                            writer.write(message["raw"] + b")\r\n")
+                        else:
+                            writer.write(f"{head} MODSEQ ({message['modseq']}))\r\n".encode())
+                    writer.write(f"{tag} OK fetched\r\n".encode())
+                elif verb == "LOGOUT":
+                    writer.write(f"* BYE\r\n{tag} OK bye\r\n".encode())
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(f"{tag} BAD unknown command\r\n".encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def body_fetches(self):
+        return [command.split(" ")[2] for command in self.commands if "BODY.PEEK[]" in command]
+
+
+def _raw(n, body="Текст письма", attachment=None, message_id=True):
+    message = EmailMessage()
+    message["From"] = "Отправитель <from@example.com>"
+    message["To"] = "reader@example.com"
+    message["Subject"] = f"Письмо {n}"
+    message["Date"] = "Mon, 19 Oct 2026 10:00:00 +0300"
+    if message_id:
+        message["Message-ID"] = message_id if isinstance(message_id, str) else f"<msg-{n}@example.com>"
+    message.set_content(body)
+    if attachment:
+        message.add_attachment(attachment, maintype="application", subtype="octet-stream", filename="data.bin")
+    return message.as_bytes()
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_session_factory):
+    return await sqlite_session_factory(
+        "users", "email_accounts", "email_folders", "emails", "email_recipients", "email_attachments",
+        "email_folder_mappings", "email_filters"
+    )
+
+
+@pytest_asyncio.fixture
+async def server():
+    stub = StubIMAPServer()
+    stub.port = await stub.start()
+    yield stub
+    await stub.stop()
+
+
+async def _account(session_factory, port, password="secret"):
+    from core.database.models.email_model import EmailAccount
+
+    async with session_factory() as session:
+        account = EmailAccount(user_id=1, email="reader@example.com", imap_host="127.0.0.1", imap_port=port,
+                               imap_password=password, imap_use_ssl=False)
+        session.add(account)
+        await session.commit()
+        return account.id
+
+
+def _synchronizer(tmp_path, **kwargs):
+    from backend.api.services.email_sync_service import MailboxSynchronizer
+    return MailboxSynchronizer(raw_storage_dir=str(tmp_path / "raw"), attachments_dir=str(tmp_path / "attachments"),
+                               **kwargs)
+
+
+async def _sync(session_factory, synchronizer, port, account_id):
+    from backend.api.configuration.imap_client import IMAPClient
+    from core.database.models.email_model import EmailAccount
+
+    client = IMAPClient("127.0.0.1", port, use_ssl=False, command_timeout=5, inline_limit=1024,
+                        spool_dir=synchronizer.spool_dir)
+    await client.connect()
+    await client.login("reader@example.com", "secret")
+    try:
+        async with session_factory() as session:
+            account = await session.get(EmailAccount, account_id)
+            return await synchronizer.sync_account(session, account, client, folders=["INBOX"])
+    finally:
+        await client.logout()
+
+
+async def _state(session_factory):
+    from sqlalchemy import select
+    from core.database.models.email_model import Email, EmailFolder, EmailFolderMapping
+
+    async with session_factory() as session:
+        emails = {e.message_id: e for e in (await session.scalars(select(Email))).all()}
+        folder = await session.scalar(select(EmailFolder).where(EmailFolder.name == "INBOX"))
+        mappings = (await session.execute(
+            select(Email.message_id, EmailFolderMapping.imap_uid).join(Email, Email.id == EmailFolderMapping.email_id)
+        )).all()
+        return emails, folder, dict(mappings)
+
+
+class TestMailboxSync:
+    """Тесты синхронизации папки"""
+
+    @pytest.mark.asyncio
+    async def test_initial_sync_in_batches(self, session_factory, server, tmp_path):
+        """Тест: первая синхронизация пачками; большое письмо идет через файл, вложение сохраняется"""
+        for n in range(1, 5):
+            server.add(_raw(n))
+        server.add(_raw(5, body="x" * 5000, attachment=b"\x00" * 3000))
+        account_id = await _account(session_factory, server.port)
+        synchronizer = _synchronizer(tmp_path, fetch_batch_size=2)
+
+        assert await _sync(session_factory, synchronizer, server.port, account_id) == 5
+
+        emails, folder, mappings = await _state(session_factory)
+        assert server.body_fetches() == ["1:2", "3:4", "5"]
+        assert (folder.uid_validity, folder.last_uid, folder.highest_modseq) == (1000, 5, server.modseq)
+        assert mappings == {f"<msg-{n}@example.com>": n for n in range(1, 6)}
+
+        large = emails["<msg-5@example.com>"]
+        assert large.subject == "Письмо 5"
+        assert large.body_text.strip() == "x" * 5000
+        assert large.external_headers["From"] == "Отправитель <from@example.com>"
+        assert large.sent_at == datetime(2026, 10, 19, 7, 0)
+        assert os.path.exists(large.external_headers["raw_path"])
+        assert os.listdir(synchronizer.spool_dir) == []
+        assert len(os.listdir(tmp_path / "attachments")) == 1
+
+    @pytest.mark.asyncio
+    async def test_incremental_sync_fetches_only_new(self, session_factory, server, tmp_path):
+        """Тест: повторная синхронизация читает только новые UID; без новых писем FETCH не выполняется"""
+        for n in range(1, 4):
+            server.add(_raw(n))
+        account_id = await _account(session_factory, server.port)
+        synchronizer = _synchronizer(tmp_path)
+        await _sync(session_factory, synchronizer, server.port, account_id)
+
+        server.add(_raw(4))
+        server.add(_raw(5, message_id=False))
+        server.commands.clear()
+        assert await _sync(session_factory, synchronizer, server.port, account_id) == 2
+        assert server.body_fetches() == ["4:5"]
+
+        server.commands.clear()
+        assert await _sync(session_factory, synchronizer, server.port, account_id) == 0
+        assert not [command for command in server.commands if command.startswith("UID FETCH")]
+
+        emails, folder, _ = await _state(session_factory)
+        assert len(emails) == 5 and folder.last_uid == 5
+        assert "<imap-1-1000-5@sync>" in emails
+
+    @pytest.mark.asyncio
+    async def test_condstore_flag_changes(self, session_factory, server, tmp_path):
+        """Тест: изменения флагов известных писем берутся через CHANGEDSINCE"""
+        from core.database.models.email_model import EmailStatus
+
+        for n in range(1, 4):
+            server.add(_raw(n), flags=["\\Seen"] if n == 1 else [])
+        account_id = await _account(session_factory, server.port)
+        synchronizer = _synchronizer(tmp_path)
+        await _sync(session_factory, synchronizer, server.port, account_id)
+        emails, _, _ = await _state(session_factory)
+        assert emails["<msg-1@example.com>"].status == EmailStatus.READ.value
+
+        modseq = server.modseq
+        server.set_flags(1)
+        server.set_flags(2, "\\Seen")
+        server.set_flags(3, "\\Flagged")
+        server.commands.clear()
+        await _sync(session_factory, synchronizer, server.port, account_id)
+
+        assert f"UID FETCH 1:3 (UID FLAGS) (CHANGEDSINCE {modseq})" in server.commands
+        emails, folder, _ = await _state(session_factory)
+        first, second, third = (emails[f"<msg-{n}@example.com>"] for n in range(1, 4))
+        assert (first.status, first.read_at) == (EmailStatus.DELIVERED.value, None)
+        assert second.status == EmailStatus.READ.value and second.read_at is not None
+        assert third.is_flagged and third.status == EmailStatus.DELIVERED.value
+        assert folder.highest_modseq == server.modseq
+
+    @pytest.mark.asyncio
+    async def test_uidvalidity_change_resyncs_without_duplicates(self, session_factory, server, tmp_path):
+        """Тест: смена UIDVALIDITY - папка читается заново, письма не дублируются"""
+        for n in range(1, 4):
+            server.add(_raw(n))
+        account_id = await _account(session_factory, server.port)
+        synchronizer = _synchronizer(tmp_path)
+        await _sync(session_factory, synchronizer, server.port, account_id)
+
+        server.renumber(start=10)
+        server.commands.clear()
+        await _sync(session_factory, synchronizer, server.port, account_id)
+
+        emails, folder, mappings = await _state(session_factory)
+        assert server.body_fetches() == ["10:12"]
+        assert len(emails) == 3
+        assert mappings == {f"<msg-{n}@example.com>": 9 + n for n in range(1, 4)}
+        assert (folder.uid_validity, folder.last_uid) == (1001, 12)
+
+    @pytest.mark.asyncio
+    async def test_message_id_scoped_to_account(self, session_factory, server, tmp_path):
+        """Тест: письма другого аккаунта с тем же Message-ID не переиспользуются, кроме отправленных ему из приложения"""
+        from sqlalchemy import select
+        from core.database.models.email_model import Email, EmailAccount, EmailFolderMapping, EmailRecipient
+
+        async with session_factory() as session:
+            other = EmailAccount(user_id=2, email="other@example.com")
+            session.add(other)
+            await session.flush()
+            for message_id, recipient in (("<msg-1@example.com>", "reader@example.com"),
+                                          ("<to-reader@ai-control.local>", "Reader@Example.com"),
+                                          ("<to-someone@ai-control.local>", "someone@example.com")):
+                email_obj = Email(message_id=message_id, sender_id=other.id, subject="Чужое письмо", status="sent")
+                session.add(email_obj)
+                await session.flush()
+                session.add(EmailRecipient(email_id=email_obj.id, email_address=recipient))
+            await session.commit()
+            other_id = other.id
+
+        server.add(_raw(1))
+        server.add(_raw(2, message_id="<to-reader@ai-control.local>"))
+        server.add(_raw(3, message_id="<to-someone@ai-control.local>"))
+        account_id = await _account(session_factory, server.port)
+        await _sync(session_factory, _synchronizer(tmp_path), server.port, account_id)
+
+        async with session_factory() as session:
+            owners = (await session.execute(
+                select(Email.message_id, Email.sender_id)
+                .join(EmailFolderMapping, EmailFolderMapping.email_id == Email.id)
+                .order_by(EmailFolderMapping.imap_uid)
+            )).all()
+        assert owners == [("<msg-1@example.com>", account_id), ("<to-reader@ai-control.local>", other_id),
+                          ("<to-someone@ai-control.local>", account_id)]
+
+    @pytest.mark.asyncio
+    async def test_incoming_mail_filtered(self, session_factory, server, tmp_path):
+        """Тест: новые письма проходят фильтры аккаунта при синхронизации"""
+        from sqlalchemy import select
+        from core.database.models.email_model import Email, EmailFilter, EmailFolder, EmailFolderMapping
+
+        for n in range(1, 4):
+            server.add(_raw(n))
+        account_id = await _account(session_factory, server.port)
+        async with session_factory() as session:
+            archive = EmailFolder(email_account_id=account_id, name="Archive")
+            session.add(archive)
+            session.add_all([
+                EmailFilter(email_account_id=account_id, name="spam", filter_type="subject",
+                            filter_value="письмо 1", filter_condition="equals", action="mark_as_spam"),
+                EmailFilter(email_account_id=account_id, name="boss", filter_type="sender",
+                            filter_value="from@example.com", filter_condition="equals", action="mark_as_important"),
+                EmailFilter(email_account_id=account_id, name="archive", filter_type="subject",
+                            filter_value="3", filter_condition="ends_with", action="move_to_folder",
+                            action_value="Archive"),
+            ])
+            await session.commit()
+            archive_id = archive.id
+
+        await _sync(session_factory, _synchronizer(tmp_path), server.port, account_id)
+
+        async with session_factory() as session:
+            rows = (await session.execute(
+                select(Email.subject, Email.status, Email.category, Email.is_important, EmailFolderMapping.folder_id)
+                .join(EmailFolderMapping, EmailFolderMapping.email_id == Email.id)
+                .order_by(Email.id)
+            )).all()
+        inbox_id = (await _state(session_factory))[1].id
+        assert rows == [
+            ("Письмо 1", "spam", "junk", True, inbox_id),
+            ("Письмо 2", "delivered", "general", True, inbox_id),
+            ("Письмо 3", "delivered", "general", True, archive_id),
+        ]
+
+
+class TestEmailSyncWorker:
+    """Тесты обработчика синхронизации"""
+
+    def _worker(self, tmp_path):
+        from backend.api.services.email_sync_service import EmailSyncWorker
+        return EmailSyncWorker(synchronizer=_synchronizer(tmp_path), concurrency=2, poll_interval=0)
+
+    @pytest.mark.asyncio
+    async def test_claim_leases_due_accounts(self, session_factory, server, tmp_path):
+        """Тест: выбираются только аккаунты с наступившим сроком; выбранный аккаунт арендован"""
+        from core.database.models.email_model import EmailAccount
+
+        due = await _account(session_factory, server.port)
+        async with session_factory() as session:
+            session.add(EmailAccount(user_id=1, email="later@example.com", imap_host="127.0.0.1",
+                                     imap_next_sync_at=datetime.utcnow() + timedelta(hours=1)))
+            session.add(EmailAccount(user_id=1, email="smtp-only@example.com"))
+            await session.commit()
+
+        worker = self._worker(tmp_path)
+        async with session_factory() as session:
+            assert await worker.claim(session) == [due]
+        async with session_factory() as session:
+            assert await worker.claim(session) == []
+
+    @pytest.mark.asyncio
+    async def test_schedule_after_success_and_error(self, session_factory, server, tmp_path):
+        """Тест: после успеха - следующий запуск через интервал, после ошибки - отсрочка и текст ошибки"""
+        from core.database.models.email_model import EmailAccount
+        from core.settings import settings
+
+        server.add(_raw(1))
+        good = await _account(session_factory, server.port)
+        async with session_factory() as session:
+            account = EmailAccount(user_id=1, email="broken@example.com", imap_host="127.0.0.1",
+                                   imap_port=server.port, imap_password="wrong", imap_use_ssl=False)
+            session.add(account)
+            await session.commit()
+            bad = account.id
+
+        started = datetime.utcnow()
+        with patch("backend.api.services.email_sync_service.get_db_helper",
+                   return_value=SimpleNamespace(get_session=session_factory)):
+            assert await self._worker(tmp_path).run_once() == 2
+
+        async with session_factory() as session:
+            good_account = await session.get(EmailAccount, good)
+            bad_account = await session.get(EmailAccount, bad)
+        config = settings.email
+        assert good_account.imap_sync_error is None and good_account.imap_last_sync_at >= started
+        assert good_account.imap_next_sync_at >= started + timedelta(seconds=config.imap_sync_interval_seconds)
+        assert "bad credentials" in bad_account.imap_sync_error
+        assert bad_account.imap_last_sync_at is None
+        assert bad_account.imap_next_sync_at >= started + timedelta(seconds=config.imap_sync_error_backoff_seconds)
+        emails, _, _ = await _state(session_factory)
+        assert list(emails) == ["<msg-1@example.com>"]
@@ -0,0 +1,205 @@
+"""
+Простые тесты метрик Prometheus
+"""
+import os
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI, WebSocket
+from httpx import ASGITransport, AsyncClient
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'metrics.db'}")
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def app(engine):
+    from backend.api.middleware.metrics_middleware import setup_metrics_middleware
+
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            await conn.execute(text("SELECT 2"))
+        return {"id": item_id}
+
+    @app.websocket("/ws/{room}")
+    async def room(websocket: WebSocket, room: str):
+        await websocket.accept()
+        await websocket.receive_text()
+        await websocket.send_text(str(_value("aic_websocket_connections", route="/ws/{room}")))
+
+    setup_metrics_middleware(app)
+    return app
+
+
+class TestHttpMetrics:
+    """Тесты метрик HTTP-запросов"""
+
+    @pytest.mark.asyncio
+    async def test_route_template_and_db_queries(self, app):
+        """Тест: метка - шаблон маршрута, SQL-запросы считаются на запрос"""
+        labels = dict(method="GET", route="/items/{item_id}")
+        requests_before = _value("aic_http_requests_total", status="200", **labels)
+        latency_before = _value("aic_http_request_duration_seconds_count", **labels)
+        queries_before = _value("aic_http_request_db_queries_sum", route="/items/{item_id}")
+
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            for item_id in (1, 2):
+                assert (await client.get(f"/items/{item_id}")).status_code == 200
+
+        assert _value("aic_http_requests_total", status="200", **labels) - requests_before == 2
+        assert _value("aic_http_request_duration_seconds_count", **labels) - latency_before == 2
+        assert _value("aic_http_request_db_queries_sum", route="/items/{item_id}") - queries_before == 4
+        assert _value("aic_http_requests_in_progress", method="GET") == 0
+
+    @pytest.mark.asyncio
+    async def test_unmatched_route(self, app):
+        """Тест: несуществующие пути сводятся к одной метке"""
+        from backend.api.configuration.metrics import UNMATCHED_ROUTE
+
+        before = _value("aic_http_requests_total", method="GET", route=UNMATCHED_ROUTE, status="404")
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            await client.get("/random/1")
+            await client.get("/random/2")
+
+        assert _value("aic_http_requests_total", method="GET", route=UNMATCHED_ROUTE, status="404") - before == 2
+
+    def test_websocket_gauge(self, app):
+        """Тест: открытое WebSocket-соединение учитывается до закрытия"""
+        from fastapi.testclient import TestClient
+
+        opened_before = _value("aic_websocket_connections_opened_total", route="/ws/{room}")
+        with TestClient(app) as client, client.websocket_connect("/ws/general") as websocket:
+            websocket.send_text("gauge?")
+            assert float(websocket.receive_text()) == 1
+
+        assert _value("aic_websocket_connections", route="/ws/{room}") == 0
+        assert _value("aic_websocket_connections_opened_total", route="/ws/{room}") - opened_before == 1
+
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self):
+        """Тест: /metrics отдает текстовый формат Prometheus"""
+        from backend.api.routers.metrics.router import metrics
+
+        response = await metrics()
+
+        assert response.media_type.startswith("text/plain")
+        assert b"aic_http_requests_total" in response.body
+
+    def test_db_queries_counted_only_with_metrics(self):
+        """Тест: учет SQL-запросов в метриках подключается вместе с middleware метрик"""
+        from backend.api.configuration import metrics
+        from backend.api.middleware.metrics_middleware import setup_metrics_middleware
+        from core.database.query_timing import query_observers, remove_query_observer
+
+        remove_query_observer(metrics._observe_query)
+        assert metrics._observe_query not in query_observers()
+        setup_metrics_middleware(FastAPI())
+        assert metrics._observe_query in query_observers()
+
+
+class TestStatsExport:
+    """Тесты переноса счетчиков компонентов"""
+
+    def test_counters_exported_by_delta(self):
+        """Тест: в метрику добавляется только прирост счетчика"""
+        from backend.api.configuration.metrics import StatsExporter
+
+        exporter = StatsExporter()
+        stats = Counter(hits=3, misses=1)
+        before = _value("aic_cache_requests_total", cache="unit", result="hit")
+
+        exporter.export_cache("unit", stats)
+        stats["hits"] += 2
+        exporter.export_cache("unit", stats)
+        exporter.export_cache("unit", stats)
+
+        assert _value("aic_cache_requests_total", cache="unit", result="hit") - before == 5
+
+    def test_rate_limiter_rejections(self):
+        """Тест: отказы лимитера экспортируются по маршруту и политике"""
+        from backend.api.configuration.metrics import StatsExporter
+
+        before = _value("aic_rate_limit_rejected_total", route="unit", scope="ip")
+        StatsExporter().export_rate_limiter(Counter({"rejected:unit:ip": 3, "allowed:unit": 10}))
+
+        assert _value("aic_rate_limit_rejected_total", route="unit", scope="ip") - before == 3
+
+    @pytest.mark.asyncio
+    async def test_code_execution_duration(self):
+        """Тест: длительность выполнения кода учитывается с итоговым статусом"""
+        from backend.api.services.code_execution_service import CodeExecutionService
+
+        labels = dict(language="python", status="compilation_error")
+        before = _value("aic_code_execution_duration_seconds_count", **labels)
+        statuses = [item["status"] async for item in CodeExecutionService().execute_code("print(")]
+
+        assert statuses[-1] == "compilation_error"
+        assert _value("aic_code_execution_duration_seconds_count", **labels) - before == 1
+
+
+WORKER_SCRIPT = """
+import sys
+from backend.api.configuration.metrics import HTTP_REQUESTS, WEBSOCKET_CONNECTIONS
+HTTP_REQUESTS.labels("GET", "/api/tasks", "200").inc(int(sys.argv[1]))
+WEBSOCKET_CONNECTIONS.labels("/ws").inc()
+"""
+
+
+class TestMultiprocess:
+    """Тесты сложения метрик нескольких воркеров"""
+
+    def test_workers_aggregated(self, tmp_path, monkeypatch):
+        """Тест: /metrics любого воркера отдает сумму; остановленный воркер не входит в live-показатели"""
+        from prometheus_client.parser import text_string_to_metric_families
+        from backend.api.configuration import metrics
+
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path), PYTHONPATH=str(ROOT))
+        pids = []
+        for count in (2, 3):
+            process = subprocess.run(
+                [sys.executable, "-c", WORKER_SCRIPT + "print(__import__('os').getpid())", str(count)],
+                env=env, cwd=ROOT, capture_output=True, text=True, check=True
+            )
+            pids.append(int(process.stdout.strip().splitlines()[-1]))
+
+        def samples():
+            body, _ = metrics.render()
+            return {
+                (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+                for family in text_string_to_metric_families(body.decode())
+                for sample in family.samples
+            }
+
+        monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+        values = samples()
+        requests_key = ("aic_http_requests_total",
+                        (("method", "GET"), ("route", "/api/tasks"), ("status", "200")))
+        websocket_key = ("aic_websocket_connections", (("route", "/ws"),))
+        assert values[requests_key] == 5
+        assert values[websocket_key] == 2
+
+        metrics.mark_process_dead(pids[0])
+        values = samples()
+        assert values[requests_key] == 5
+        assert values[websocket_key] == 1
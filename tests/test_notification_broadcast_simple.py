@@ -0,0 +1,229 @@
+"""
+Простые тесты рассылок уведомлений
+"""
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_session_factory):
+    return await sqlite_session_factory(
+        "organizations", "departments", "users", "notification_templates", "notifications", "notification_batches",
+        "notification_deliveries", "notification_broadcasts", "notification_broadcast_recipients"
+    )
+
+
+@pytest.fixture
+def published():
+    """События, опубликованные в обменник"""
+    events = []
+    rabbit = SimpleNamespace(publish_event=AsyncMock(side_effect=lambda exchange, event: events.append(event)))
+    with patch("backend.api.services.notification_push_service.rabbit", rabbit):
+        yield events
+
+
+async def _seed_users(session_factory):
+    """Организация 1: отдел 10 - три пользователя (один неактивен), отдел 20 - два; организация 2 - один"""
+    from sqlalchemy import insert
+    from core.database.models.main_models import User
+
+    users = [(10, 1, True), (10, 1, True), (10, 1, False), (20, 1, True), (20, 1, True), (30, 2, True)]
+    async with session_factory() as session:
+        await session.execute(insert(User.__table__), [
+            {"login": f"user{i}", "username": f"user{i}", "email": f"user{i}@example.com", "password_hash": "x",
+             "role": "employee", "is_active": active, "department_id": department_id, "organization_id": org_id}
+            for i, (department_id, org_id, active) in enumerate(users, start=1)
+        ])
+        await session.commit()
+
+
+async def _broadcast(session_factory, audience_type="organization", audience_id=1, channels=None):
+    from core.database.models.notification_model import NotificationType
+    from backend.api.services.notification_broadcast_service import create_broadcast
+
+    async with session_factory() as session:
+        return await create_broadcast(
+            session, audience_type=audience_type, audience_id=audience_id, notification_type=NotificationType.SYSTEM,
+            title="Плановые работы", message="Сервис будет недоступен ночью", channels=channels
+        )
+
+
+class TestCreateBroadcast:
+    """Тесты создания рассылки"""
+
+    @pytest.mark.asyncio
+    async def test_recipients_by_audience(self, session_factory):
+        """Тест: получатели - активные пользователи аудитории, одним INSERT ... SELECT"""
+        from sqlalchemy import select
+        from core.database.models.notification_model import Notification, NotificationBroadcastRecipient
+        from core.database.query_inspector import record_queries
+
+        await _seed_users(session_factory)
+        with record_queries() as recorder:
+            organization = await _broadcast(session_factory)
+        department = await _broadcast(session_factory, audience_type="department", audience_id=20)
+
+        assert (organization.total_recipients, organization.status) == (4, "pending")
+        assert department.total_recipients == 2
+        inserts = [shape for shape in recorder.fingerprints
+                   if shape.startswith("INSERT INTO notification_broadcast_recipients")]
+        assert [recorder.fingerprints[shape] for shape in inserts] == [1]
+
+        async with session_factory() as session:
+            user_ids = (await session.scalars(
+                select(NotificationBroadcastRecipient.user_id)
+                .where(NotificationBroadcastRecipient.broadcast_id == organization.id)
+                .order_by(NotificationBroadcastRecipient.user_id)
+            )).all()
+            assert user_ids == [1, 2, 4, 5]
+            # Уведомления создает обработчик, не запрос
+            assert await session.scalar(select(Notification.id)) is None
+
+    @pytest.mark.asyncio
+    async def test_empty_audience(self, session_factory):
+        """Тест: рассылка без получателей сразу завершена"""
+        await _seed_users(session_factory)
+        broadcast = await _broadcast(session_factory, audience_type="department", audience_id=99)
+        assert (broadcast.total_recipients, broadcast.status) == (0, "completed")
+
+    @pytest.mark.asyncio
+    async def test_unknown_audience(self, session_factory):
+        """Тест: неизвестная аудитория отклоняется"""
+        with pytest.raises(ValueError):
+            await _broadcast(session_factory, audience_type="team")
+
+
+class TestBroadcastEndpoint:
+    """Тесты прав на рассылку"""
+
+    @pytest.mark.asyncio
+    async def test_audience_limited_to_own_organization(self, session_factory):
+        """Тест: CEO адресует только свою организацию и ее отделы, администратор - любую аудиторию"""
+        import httpx
+        from fastapi import FastAPI
+        from sqlalchemy import insert
+        from core.database import get_session
+        from core.database.models.main_models import Department, Organization
+        from backend.api.configuration.auth import verify_authorization
+        from backend.api.routers.notification.router import router
+
+        await _seed_users(session_factory)
+        async with session_factory() as session:
+            await session.execute(insert(Organization.__table__), [{"id": 1, "name": "A"}, {"id": 2, "name": "B"}])
+            await session.execute(insert(Department.__table__), [
+                {"id": 10, "name": "A1", "organization_id": 1}, {"id": 20, "name": "A2", "organization_id": 1},
+                {"id": 30, "name": "B1", "organization_id": 2},
+            ])
+            await session.commit()
+
+        async def _session():
+            async with session_factory() as session:
+                yield session
+
+        principal = {"user": SimpleNamespace(id=1, role="CEO", organization_id=1)}
+        app = FastAPI()
+        app.include_router(router)
+        app.dependency_overrides[verify_authorization] = lambda: principal["user"]
+        app.dependency_overrides[get_session] = _session
+        body = {"title": "Плановые работы", "message": "Сервис будет недоступен ночью"}
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            async def _post(audience_type, audience_id):
+                response = await client.post("/notifications/broadcasts", json={
+                    **body, "audience_type": audience_type, "audience_id": audience_id
+                })
+                return response.status_code
+
+            assert await _post("organization", 2) == 403
+            assert await _post("department", 30) == 403
+            assert await _post("department", 99) == 404
+            assert await _post("department", 20) == 202
+            assert await _post("organization", 1) == 202
+
+            principal["user"] = SimpleNamespace(id=2, role="admin", organization_id=1)
+            response = await client.post("/notifications/broadcasts", json={
+                **body, "audience_type": "organization", "audience_id": 2
+            })
+            assert response.status_code == 202
+            # Ход чужой рассылки не виден CEO
+            principal["user"] = SimpleNamespace(id=1, role="CEO", organization_id=1)
+            progress = await client.get(f"/notifications/broadcasts/{response.json()['broadcast_uuid']}")
+            assert progress.status_code == 404
+
+
+class TestBroadcastWorker:
+    """Тесты создания уведомлений рассылки"""
+
+    @pytest.mark.asyncio
+    async def test_chunks_and_progress(self, session_factory, published):
+        """Тест: уведомления и записи доставки пачками, счетчик прогресса, одно событие на пачку"""
+        from sqlalchemy import func, select
+        from core.database.models.notification_model import (
+            Notification, NotificationBroadcast, NotificationDelivery
+        )
+        from backend.api.services.notification_broadcast_service import BroadcastWorker
+
+        await _seed_users(session_factory)
+        broadcast = await _broadcast(session_factory, channels=["in_app", "email"])
+        worker = BroadcastWorker(chunk_size=3, concurrency=1)
+
+        async with session_factory() as session:
+            assert await worker.deliver_chunk(session, broadcast.id) == 3
+            progress = await session.get(NotificationBroadcast, broadcast.id, populate_existing=True)
+            assert (progress.processed_recipients, progress.total_recipients) == (3, 4)
+
+        with patch("backend.api.services.notification_broadcast_service.get_db_helper",
+                   return_value=SimpleNamespace(get_session=session_factory)):
+            assert await worker.run_once() == 1
+            assert await worker.run_once() == 0
+
+        async with session_factory() as session:
+            done = await session.get(NotificationBroadcast, broadcast.id)
+            assert (done.status, done.processed_recipients) == ("completed", 4)
+            assert done.completed_at is not None
+
+            notifications = (await session.execute(
+                select(Notification.id, Notification.recipient_id, Notification.notification_uuid, Notification.title)
+                .order_by(Notification.recipient_id)
+            )).all()
+            assert [row.recipient_id for row in notifications] == [1, 2, 4, 5]
+            assert {row.title for row in notifications} == {"Плановые работы"}
+
+            deliveries = (await session.execute(
+                select(NotificationDelivery.notification_id, NotificationDelivery.channel,
+                       NotificationDelivery.status, NotificationDelivery.idempotency_key)
+            )).all()
+            assert len(deliveries) == 8
+            uuids = {row.id: row.notification_uuid for row in notifications}
+            assert all(d.idempotency_key == f"{uuids[d.notification_id]}:{d.channel}" for d in deliveries)
+            assert {d.status for d in deliveries} == {"pending"}
+            assert await session.scalar(select(func.count()).select_from(Notification)) == 4
+
+        assert [len(event["recipients"]) for event in published] == [3, 1]
+        assert published[0]["recipients"] == {str(row.recipient_id): row.id for row in notifications[:3]}
+
+
+class TestBroadcastPush:
+    """Тесты раздачи событий рассылки"""
+
+    @pytest.mark.asyncio
+    async def test_expanded_for_connected(self):
+        """Тест: событие пачки раскладывается по подключенным получателям с их id уведомлений"""
+        from datetime import datetime
+        from backend.api.services.notification_broadcast_service import broadcast_event
+        from backend.api.services.notification_push_service import NotificationPushHub
+
+        hub = NotificationPushHub(queue_size=10)
+        first, other = hub.subscribe(1), hub.subscribe(3)
+        broadcast = SimpleNamespace(id=7, notification_type="system", title="Плановые работы",
+                                    message="Сервис будет недоступен ночью", priority="normal")
+        await hub.dispatch(broadcast_event(broadcast, {1: 101, 2: 102}, datetime(2024, 1, 1)))
+
+        event = first.get_nowait()
+        assert (event["user_id"], event["id"], event["unread_delta"]) == (1, 101, 1)
+        assert event["notification"]["id"] == 101
+        assert event["notification"]["related_entity_type"] == "notification_broadcast"
+        assert other.empty()
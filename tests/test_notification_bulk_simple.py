@@ -0,0 +1,196 @@
+"""
+Простые тесты массовых операций и обслуживания таблицы уведомлений
+"""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_session_factory):
+    return await sqlite_session_factory(
+        "notification_templates", "notifications", "notification_batches", "notification_deliveries",
+        "user_notification_preferences", "notification_webhooks", "notifications_archive"
+    )
+
+
+async def _seed(session_factory, count, recipient_id=1, status="delivered", delivery_status="delivered",
+                created_at=None, read=False, expires_at=None):
+    """Уведомления с записью доставки in_app; возвращает их id"""
+    from core.database.models.notification_model import Notification, NotificationDelivery
+
+    created_at = created_at or datetime.utcnow()
+    async with session_factory() as session:
+        notifications = [
+            Notification(
+                notification_uuid=str(uuid.uuid4()), recipient_id=recipient_id,
+                notification_type="task", title=f"Задача {i}", message="Вам назначена задача", priority="normal",
+                status="read" if read else status, channels=["in_app"], delivered_channels=["in_app"],
+                read_at=created_at if read else None, expires_at=expires_at, created_at=created_at
+            )
+            for i in range(count)
+        ]
+        session.add_all(notifications)
+        await session.flush()
+        session.add_all(
+            NotificationDelivery(notification_id=n.id, channel="in_app", status=delivery_status,
+                                 idempotency_key=f"{n.notification_uuid}:in_app", delivery_data={})
+            for n in notifications
+        )
+        await session.commit()
+        return [n.id for n in notifications]
+
+
+async def _count(session_factory, model, *conditions):
+    from sqlalchemy import func, select
+
+    async with session_factory() as session:
+        return await session.scalar(select(func.count()).select_from(model).where(*conditions))
+
+
+class TestMarkAllRead:
+    """Тесты массовой отметки прочтения"""
+
+    @pytest.mark.asyncio
+    async def test_single_update(self, session_factory):
+        """Тест: одно UPDATE без загрузки строк; число отмеченных - только непрочитанные получателя"""
+        from core.database.models.notification_model import Notification
+        from core.database.query_inspector import assert_max_queries
+        from backend.api.services.notification_service import NotificationService
+
+        await _seed(session_factory, 30)
+        await _seed(session_factory, 5, read=True)
+        await _seed(session_factory, 7, recipient_id=2)
+
+        async with session_factory() as session:
+            with assert_max_queries(1):
+                assert await NotificationService(session).mark_all_notifications_as_read(user_id=1) == 30
+
+        assert await _count(session_factory, Notification, Notification.read_at.is_(None)) == 7
+        assert await _count(session_factory, Notification, Notification.status == "read") == 35
+
+
+class TestBulkDelete:
+    """Тесты массового удаления"""
+
+    @pytest.mark.asyncio
+    async def test_read_only(self, session_factory):
+        """Тест: удаляются только прочитанные уведомления получателя вместе с записями доставки"""
+        from core.database.models.notification_model import Notification, NotificationDelivery
+        from backend.api.services.notification_service import NotificationService
+
+        await _seed(session_factory, 3)
+        await _seed(session_factory, 4, read=True)
+        await _seed(session_factory, 2, recipient_id=2, read=True)
+
+        async with session_factory() as session:
+            assert await NotificationService(session).delete_notifications(user_id=1, read_only=True) == 4
+
+        assert await _count(session_factory, Notification) == 5
+        assert await _count(session_factory, NotificationDelivery) == 5
+
+    @pytest.mark.asyncio
+    async def test_single_foreign(self, session_factory):
+        """Тест: чужое уведомление не удаляется"""
+        from backend.api.services.notification_service import NotificationService
+
+        foreign_id = (await _seed(session_factory, 1, recipient_id=2))[0]
+        own_id = (await _seed(session_factory, 1))[0]
+
+        async with session_factory() as session:
+            service = NotificationService(session)
+            assert not await service.delete_notification(foreign_id, user_id=1)
+            assert await service.delete_notification(own_id, user_id=1)
+
+    @pytest.mark.asyncio
+    async def test_endpoint_requires_scope(self, session_factory):
+        """Тест: эндпоинт удаляет уведомления текущего пользователя и требует notification_ids или all=true"""
+        from types import SimpleNamespace
+        from unittest.mock import AsyncMock, patch
+        import httpx
+        from fastapi import FastAPI
+        from core.database.models.notification_model import Notification
+        from backend.api.configuration.auth import get_current_user
+        from backend.api.routers.notification.router import get_notification_service, router
+        from backend.api.services.notification_push_service import flush_push_events
+        from backend.api.services.notification_service import NotificationService
+
+        own_ids = await _seed(session_factory, 3, recipient_id=7)
+        await _seed(session_factory, 2, recipient_id=1)
+
+        async def _service():
+            async with session_factory() as session:
+                yield NotificationService(session)
+
+        app = FastAPI()
+        app.include_router(router)
+        app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=7)
+        app.dependency_overrides[get_notification_service] = _service
+        rabbit = SimpleNamespace(publish_event=AsyncMock())
+        with patch("backend.api.services.notification_push_service.rabbit", rabbit):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                assert (await client.post("/notifications/bulk-delete", json={})).status_code == 400
+                assert (await client.post("/notifications/bulk-delete",
+                                          json={"notification_ids": own_ids, "all": True})).status_code == 400
+
+                response = await client.post("/notifications/bulk-delete", json={"notification_ids": own_ids[:1]})
+                assert response.json()["deleted"] == 1
+                response = await client.post("/notifications/bulk-delete", json={"all": True})
+                assert response.json()["deleted"] == 2
+            await flush_push_events()
+
+        assert rabbit.publish_event.await_count == 2
+        assert await _count(session_factory, Notification, Notification.recipient_id == 7) == 0
+        assert await _count(session_factory, Notification, Notification.recipient_id == 1) == 2
+
+
+class TestRetention:
+    """Тесты обслуживания таблицы"""
+
+    @pytest.mark.asyncio
+    async def test_cleanup_expired_in_chunks(self, session_factory):
+        """Тест: истекшие уведомления удаляются пачками, действующие остаются"""
+        from core.database.models.notification_model import Notification
+        from core.database.query_inspector import record_queries
+        from backend.api.services.notification_retention_service import NotificationRetention
+
+        now = datetime.utcnow()
+        await _seed(session_factory, 5, expires_at=now - timedelta(minutes=1))
+        await _seed(session_factory, 2, expires_at=now + timedelta(days=1))
+
+        async with session_factory() as session:
+            with record_queries() as recorder:
+                assert await NotificationRetention(chunk_size=2).cleanup_expired(session, now) == 5
+
+        assert await _count(session_factory, Notification) == 2
+        deletes = [shape for shape in recorder.fingerprints if shape.startswith("DELETE FROM notifications ")]
+        assert recorder.fingerprints[deletes[0]] == 3
+
+    @pytest.mark.asyncio
+    async def test_archive_old(self, session_factory):
+        """Тест: старые обработанные уведомления переносятся в архив, ожидающие доставки - остаются"""
+        from core.database.models.notification_model import (
+            Notification, NotificationArchive, NotificationDelivery
+        )
+        from backend.api.services.notification_retention_service import NotificationRetention
+
+        now = datetime.utcnow()
+        old = now - timedelta(days=120)
+        archived_ids = await _seed(session_factory, 3, created_at=old, read=True)
+        await _seed(session_factory, 1, created_at=old, status="delivered", delivery_status="pending")
+        await _seed(session_factory, 2, created_at=now - timedelta(days=10))
+
+        async with session_factory() as session:
+            assert await NotificationRetention(chunk_size=2, archive_after_days=90).archive_old(session, now) == 3
+
+        assert await _count(session_factory, Notification) == 3
+        assert await _count(session_factory, NotificationDelivery) == 3
+
+        from sqlalchemy import select
+        async with session_factory() as session:
+            rows = (await session.scalars(select(NotificationArchive).order_by(NotificationArchive.id))).all()
+        assert [row.id for row in rows] == archived_ids
+        assert (rows[0].title, rows[0].status, rows[0].archived_at) == ("Задача 0", "read", now)
+        assert rows[0].delivered_channels == ["in_app"]
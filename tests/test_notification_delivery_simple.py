@@ -0,0 +1,276 @@
+"""
+Простые тесты очереди доставки уведомлений
+"""
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import httpx
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_session_factory):
+    return await sqlite_session_factory(
+        "notification_templates", "notifications", "notification_deliveries", "user_notification_preferences",
+        "notification_webhooks"
+    )
+
+
+def _db_helper(session_factory):
+    @asynccontextmanager
+    async def get_session():
+        async with session_factory() as session:
+            yield session
+
+    return SimpleNamespace(get_session=get_session)
+
+
+async def _create(session_factory, **kwargs):
+    from core.database.models.notification_model import NotificationType
+    from backend.api.services.notification_service import NotificationService
+
+    async with session_factory() as session:
+        return await NotificationService(session).create_notification(
+            recipient_id=kwargs.pop("recipient_id", 1),
+            notification_type=NotificationType.TASK,
+            title="Задача назначена",
+            message="Вам назначена задача",
+            **kwargs
+        )
+
+
+async def _deliveries(session_factory):
+    from sqlalchemy import select
+    from core.database.models.notification_model import NotificationDelivery
+
+    async with session_factory() as session:
+        return {d.channel: d for d in (await session.scalars(select(NotificationDelivery))).all()}
+
+
+async def _notification(session_factory, notification_id):
+    from sqlalchemy import select
+    from sqlalchemy.orm import raiseload
+    from core.database.models.notification_model import Notification
+
+    async with session_factory() as session:
+        return await session.scalar(
+            select(Notification).where(Notification.id == notification_id).options(raiseload("*"))
+        )
+
+
+def _outbox(**senders):
+    from backend.api.services.notification_delivery_service import CHANNEL_SENDERS, NotificationOutbox
+
+    return NotificationOutbox(max_attempts=3, retry_base=10, retry_max=60, lease_seconds=60,
+                              senders=dict(CHANNEL_SENDERS, **senders))
+
+
+class TestCreate:
+    """Тесты создания уведомления"""
+
+    @pytest.mark.asyncio
+    async def test_enqueued_not_delivered(self, session_factory):
+        """Тест: создание только пишет уведомление и записи очереди по каналам"""
+        from core.database.query_inspector import record_queries
+
+        with record_queries() as recorder:
+            notification = await _create(session_factory, channels=["in_app", "webhook", "in_app"])
+
+        deliveries = await _deliveries(session_factory)
+        assert set(deliveries) == {"in_app", "webhook"}
+        assert all(d.status == "pending" and d.retry_count == 0 for d in deliveries.values())
+        assert deliveries["webhook"].idempotency_key == f"{notification.notification_uuid}:webhook"
+        assert notification.status == "pending"
+        assert not any("notification_webhooks" in sql for sql in recorder.fingerprints)
+
+    @pytest.mark.asyncio
+    async def test_idempotency_key(self, session_factory):
+        """Тест: повтор с тем же ключом возвращает то же уведомление без новых записей"""
+        first = await _create(session_factory, channels=["in_app"], idempotency_key="task-7-assigned")
+        second = await _create(session_factory, channels=["in_app"], idempotency_key="task-7-assigned")
+
+        assert first.id == second.id
+        assert len(await _deliveries(session_factory)) == 1
+
+    @pytest.mark.asyncio
+    async def test_idempotency_key_per_recipient(self, session_factory):
+        """Тест: ключ уникален в пределах получателя - у другого получателя свое уведомление"""
+        from sqlalchemy.exc import IntegrityError
+        from core.database.models.notification_model import Notification
+
+        first = await _create(session_factory, channels=["in_app"], idempotency_key="weekly-report")
+        other = await _create(session_factory, channels=["in_app"], idempotency_key="weekly-report", recipient_id=2)
+        assert first.id != other.id
+
+        async with session_factory() as session:
+            session.add(Notification(notification_uuid="duplicate", recipient_id=1, idempotency_key="weekly-report",
+                                     notification_type="task", title="t", message="m"))
+            with pytest.raises(IntegrityError):
+                await session.commit()
+
+    @pytest.mark.asyncio
+    async def test_scheduled_waits_in_queue(self, session_factory):
+        """Тест: отложенное уведомление не выбирается до scheduled_at"""
+        scheduled_at = datetime.utcnow() + timedelta(hours=2)
+        await _create(session_factory, channels=["in_app"], scheduled_at=scheduled_at)
+
+        async with session_factory() as session:
+            assert await _outbox().claim(session, "in_app", 10) == []
+            assert len(await _outbox().claim(session, "in_app", 10, now=scheduled_at)) == 1
+
+
+class TestBackoff:
+    """Тесты задержки повторов"""
+
+    def test_exponential_with_jitter(self):
+        """Тест: задержка растет вдвое, случайна в верхней половине и ограничена сверху"""
+        from backend.api.services.notification_delivery_service import retry_delay
+
+        assert retry_delay(1, 10, 3600, rng=lambda: 0.0) == 5
+        assert retry_delay(1, 10, 3600, rng=lambda: 1.0) == 10
+        assert retry_delay(4, 10, 3600, rng=lambda: 1.0) == 80
+        assert retry_delay(20, 10, 3600, rng=lambda: 0.5) == 2700
+
+
+class TestOutbox:
+    """Тесты доставки из очереди"""
+
+    @pytest.mark.asyncio
+    async def test_claim_leases(self, session_factory):
+        """Тест: арендованные записи не выдаются повторно до истечения аренды"""
+        await _create(session_factory, channels=["in_app"])
+        outbox = _outbox()
+
+        async with session_factory() as session:
+            assert len(await outbox.claim(session, "in_app", 10)) == 1
+            assert await outbox.claim(session, "in_app", 10) == []
+            later = datetime.utcnow() + timedelta(seconds=61)
+            assert len(await outbox.claim(session, "in_app", 10, now=later)) == 1
+
+    @pytest.mark.asyncio
+    async def test_delivered(self, session_factory):
+        """Тест: успешная доставка отмечает запись и уведомление"""
+        notification = await _create(session_factory, channels=["in_app"])
+        delivery = (await _deliveries(session_factory))["in_app"]
+
+        async with session_factory() as session:
+            assert await _outbox().deliver(session, delivery.id) == "delivered"
+            # Повторная выдача уже доставленной записи ничего не делает
+            assert await _outbox().deliver(session, delivery.id) is None
+
+        stored = await _notification(session_factory, notification.id)
+        assert stored.status == "delivered"
+        assert stored.delivered_channels == ["in_app"]
+        assert (await _deliveries(session_factory))["in_app"].retry_count == 1
+
+    @pytest.mark.asyncio
+    async def test_retry_then_dead_letter(self, session_factory):
+        """Тест: ошибки откладывают запись с растущей задержкой, после лимита - dead letter"""
+        async def failing(session, notification, delivery):
+            raise ConnectionError("smtp unavailable")
+
+        notification = await _create(session_factory, channels=["email"])
+        delivery_id = (await _deliveries(session_factory))["email"].id
+        outbox = _outbox(email=failing)
+
+        outcomes = []
+        for _ in range(3):
+            async with session_factory() as session:
+                outcomes.append(await outbox.deliver(session, delivery_id))
+                delivery = (await _deliveries(session_factory))["email"]
+                if outcomes[-1] == "retry":
+                    assert delivery.next_attempt_at > datetime.utcnow() + timedelta(seconds=4)
+
+        assert outcomes == ["retry", "retry", "dead_letter"]
+        delivery = (await _deliveries(session_factory))["email"]
+        assert delivery.status == "dead_letter"
+        assert delivery.error_message == "smtp unavailable"
+        assert (await _notification(session_factory, notification.id)).status == "failed"
+
+        async with session_factory() as session:
+            assert [d.id for d in await outbox.list_dead_letters(session)] == [delivery_id]
+            assert await outbox.requeue(session, channel="email") == 1
+        delivery = (await _deliveries(session_factory))["email"]
+        assert (delivery.status, delivery.retry_count, delivery.dead_lettered_at) == ("pending", 0, None)
+
+    @pytest.mark.asyncio
+    async def test_permanent_error(self, session_factory):
+        """Тест: постоянная ошибка сразу переводит запись в dead letter"""
+        from backend.api.services.notification_delivery_service import PermanentDeliveryError
+
+        async def rejecting(session, notification, delivery):
+            raise PermanentDeliveryError("no address")
+
+        await _create(session_factory, channels=["sms"])
+        delivery_id = (await _deliveries(session_factory))["sms"].id
+        async with session_factory() as session:
+            assert await _outbox(sms=rejecting).deliver(session, delivery_id) == "dead_letter"
+
+
+class TestWebhooks:
+    """Тесты канала webhook"""
+
+    @pytest.mark.asyncio
+    async def test_retry_skips_delivered_webhooks(self, session_factory):
+        """Тест: ключ идемпотентности в заголовке, 5xx - повтор только для неответившего webhook'а"""
+        from core.database.models.notification_model import NotificationWebhook
+
+        async with session_factory() as session:
+            for name in ("ok", "flaky"):
+                session.add(NotificationWebhook(webhook_uuid=name, name=name, url=f"http://hooks.test/{name}",
+                                                notification_types=["task"], headers={}))
+            session.add(NotificationWebhook(webhook_uuid="other", name="other", url="http://hooks.test/other",
+                                            notification_types=["kpi"], headers={}))
+            await session.commit()
+
+        calls = []
+        flaky_status = [503, 200]
+
+        def handler(request):
+            name = request.url.path.strip("/")
+            calls.append((name, request.headers["idempotency-key"]))
+            return httpx.Response(flaky_status.pop(0) if name == "flaky" else 200)
+
+        from backend.api.configuration.webhook_client import WebhookHttpClient
+
+        client = WebhookHttpClient(transport=httpx.MockTransport(handler))
+        notification = await _create(session_factory, channels=["webhook"])
+        delivery_id = (await _deliveries(session_factory))["webhook"].id
+        with patch("backend.api.services.notification_delivery_service.webhook_client", client):
+            for expected in ("retry", "delivered"):
+                async with session_factory() as session:
+                    assert await _outbox().deliver(session, delivery_id) == expected
+        await client.close()
+
+        key = f"{notification.notification_uuid}:webhook"
+        assert calls == [("ok", key), ("flaky", key), ("flaky", key)]
+        assert (await _deliveries(session_factory))["webhook"].delivery_data == {"webhooks_delivered": ["flaky", "ok"]}
+
+
+class TestWorker:
+    """Тесты обработчика канала"""
+
+    @pytest.mark.asyncio
+    async def test_run_once(self, session_factory):
+        """Тест: обработчик доставляет только записи своего канала"""
+        from backend.api.services.notification_delivery_service import NotificationDeliveryWorker
+
+        for _ in range(3):
+            await _create(session_factory, channels=["in_app", "push"])
+
+        worker = NotificationDeliveryWorker("in_app", outbox=_outbox(), concurrency=2, batch_size=10)
+        with patch("backend.api.services.notification_delivery_service.get_db_helper",
+                   return_value=_db_helper(session_factory)):
+            assert await worker.run_once() == 3
+            assert await worker.run_once() == 0
+
+        from sqlalchemy import select
+        from core.database.models.notification_model import NotificationDelivery
+        async with session_factory() as session:
+            statuses = (await session.execute(
+                select(NotificationDelivery.channel, NotificationDelivery.status)
+            )).all()
+        assert sorted(set(statuses)) == [("in_app", "delivered"), ("push", "pending")]
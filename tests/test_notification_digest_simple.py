@@ -0,0 +1,173 @@
+"""
+Простые тесты сводок уведомлений
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_session_factory):
+    return await sqlite_session_factory(
+        "notification_templates", "notifications", "notification_batches", "notification_deliveries",
+        "user_notification_preferences", "notification_webhooks"
+    )
+
+
+async def _prefer_digest(session_factory, user_id=1, interval_minutes=60):
+    from core.database.models.notification_model import NotificationType, UserNotificationPreference
+
+    async with session_factory() as session:
+        session.add(UserNotificationPreference(
+            user_id=user_id, notification_type=NotificationType.TASK.value, enabled_channels=["in_app", "email"],
+            min_priority="low", batch_notifications=True, batch_interval_minutes=interval_minutes
+        ))
+        await session.commit()
+
+
+async def _create(session_factory, title="Задача назначена", **kwargs):
+    from core.database.models.notification_model import NotificationPriority, NotificationType
+    from backend.api.services.notification_service import NotificationService
+
+    async with session_factory() as session:
+        return await NotificationService(session).create_notification(
+            recipient_id=kwargs.pop("recipient_id", 1),
+            notification_type=NotificationType.TASK,
+            title=title,
+            message="Вам назначена задача",
+            priority=kwargs.pop("priority", NotificationPriority.LOW),
+            **kwargs
+        )
+
+
+async def _rows(session_factory, model):
+    from sqlalchemy import select
+    from sqlalchemy.orm import raiseload
+
+    async with session_factory() as session:
+        return list((await session.scalars(select(model).options(raiseload("*")).order_by(model.id))).all())
+
+
+class TestAddToDigest:
+    """Тесты накопления уведомлений в сводке"""
+
+    @pytest.mark.asyncio
+    async def test_low_priority_batched(self, session_factory):
+        """Тест: email уходит в сводку, in_app доставляется как обычно; второе уведомление - в ту же сводку"""
+        from core.database.models.notification_model import NotificationBatch, NotificationDelivery
+
+        await _prefer_digest(session_factory)
+        first = await _create(session_factory)
+        await _create(session_factory, title="Вторая задача")
+
+        batches = await _rows(session_factory, NotificationBatch)
+        assert len(batches) == 1
+        assert (batches[0].channel, batches[0].status, batches[0].notifications_count) == ("email", "pending", 2)
+        assert batches[0].scheduled_at == first.created_at + timedelta(minutes=60)
+
+        deliveries = await _rows(session_factory, NotificationDelivery)
+        assert sorted((d.channel, d.status, d.batch_id) for d in deliveries) == [
+            ("email", "batched", batches[0].id), ("email", "batched", batches[0].id),
+            ("in_app", "pending", None), ("in_app", "pending", None),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_high_priority_bypasses(self, session_factory):
+        """Тест: уведомление выше digest_max_priority доставляется сразу"""
+        from core.database.models.notification_model import (
+            NotificationBatch, NotificationDelivery, NotificationPriority
+        )
+
+        await _prefer_digest(session_factory)
+        await _create(session_factory, priority=NotificationPriority.HIGH)
+
+        assert await _rows(session_factory, NotificationBatch) == []
+        assert {d.status for d in await _rows(session_factory, NotificationDelivery)} == {"pending"}
+
+    @pytest.mark.asyncio
+    async def test_without_preferences(self, session_factory):
+        """Тест: без batch_notifications в настройках сводка не создается"""
+        from core.database.models.notification_model import NotificationBatch
+
+        await _create(session_factory, channels=["email"])
+        assert await _rows(session_factory, NotificationBatch) == []
+
+
+class TestScheduler:
+    """Тесты планировщика сводок"""
+
+    @pytest.mark.asyncio
+    async def test_due_batch_sent(self, session_factory):
+        """Тест: наступившая сводка превращается в одно уведомление с записью доставки по email"""
+        from core.database.models.notification_model import Notification, NotificationBatch, NotificationDelivery
+        from backend.api.services.notification_digest_service import DIGEST_ENTITY_TYPE, DigestScheduler
+
+        await _prefer_digest(session_factory, interval_minutes=15)
+        first = await _create(session_factory)
+        second = await _create(session_factory, title="Вторая задача")
+        scheduler = DigestScheduler(batch_size=10, max_items=20)
+
+        async with session_factory() as session:
+            assert await scheduler.run_once(session) == 0
+        async with session_factory() as session:
+            assert await scheduler.run_once(session, now=datetime.utcnow() + timedelta(minutes=16)) == 1
+
+        batch = (await _rows(session_factory, NotificationBatch))[0]
+        assert (batch.status, batch.notifications_count) == ("sent", 2)
+        assert batch.summary_title == "Сводка уведомлений: 2"
+
+        notifications = await _rows(session_factory, Notification)
+        digest = notifications[-1]
+        assert (digest.related_entity_type, digest.related_entity_id) == (DIGEST_ENTITY_TYPE, batch.id)
+        assert digest.channels == ["email"]
+        assert digest.message.splitlines() == [
+            "- Вторая задача: Вам назначена задача", "- Задача назначена: Вам назначена задача"
+        ]
+        assert {n.id: n.delivered_channels for n in notifications[:2]} == {first.id: ["email"], second.id: ["email"]}
+
+        deliveries = await _rows(session_factory, NotificationDelivery)
+        email = [(d.notification_id, d.status) for d in deliveries if d.channel == "email"]
+        assert sorted(email) == [(first.id, "delivered"), (second.id, "delivered"), (digest.id, "pending")]
+
+        # Уведомление после отправки открывает новую сводку
+        await _create(session_factory, title="Третья задача")
+        statuses = [b.status for b in await _rows(session_factory, NotificationBatch)]
+        assert statuses == ["sent", "pending"]
+
+    @pytest.mark.asyncio
+    async def test_digest_not_in_feed(self, session_factory):
+        """Тест: сводка не попадает в счетчики и повтор пропущенных - там уже есть ее уведомления"""
+        from backend.api.services.notification_digest_service import DigestScheduler
+        from backend.api.services.notification_push_service import resume_state
+        from backend.api.services.notification_service import NotificationService
+
+        await _prefer_digest(session_factory, interval_minutes=15)
+        first = await _create(session_factory)
+        second = await _create(session_factory, title="Вторая задача")
+        async with session_factory() as session:
+            assert await DigestScheduler(batch_size=10).run_once(
+                session, now=datetime.utcnow() + timedelta(minutes=16)
+            ) == 1
+
+        async with session_factory() as session:
+            stats = await NotificationService(session).get_notification_stats(1)
+            seen, missed, complete, unread = await resume_state(session, 1, last_event_id=0)
+            assert await NotificationService(session).mark_all_notifications_as_read(1) == 2
+        assert (stats["total_count"], stats["unread_count"]) == (2, 2)
+        assert (seen, [event["id"] for event in missed], unread) == ({first.id, second.id}, [first.id, second.id], 2)
+
+
+class TestRender:
+    """Тесты текста сводки"""
+
+    def test_truncated(self):
+        """Тест: не больше max_items строк, остаток - одной строкой"""
+        from backend.api.services.notification_digest_service import render_digest
+
+        items = [SimpleNamespace(title=f"Задача {i}", message="готово") for i in range(5)]
+        title, message = render_digest(items, max_items=2)
+
+        assert title == "Сводка уведомлений: 5"
+        assert message.splitlines() == ["- Задача 4: готово", "- Задача 3: готово", "... и еще 3"]
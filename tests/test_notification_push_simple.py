@@ -0,0 +1,262 @@
+"""
+Простые тесты push-уведомлений в реальном времени
+"""
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_session_factory):
+    return await sqlite_session_factory(
+        "notification_templates", "notifications", "notification_batches", "notification_deliveries",
+        "user_notification_preferences", "notification_webhooks"
+    )
+
+
+@pytest.fixture
+def published():
+    """События, опубликованные в обменник (публикация фоновая - список читается после flush_push_events)"""
+    events = []
+    rabbit = SimpleNamespace(publish_event=AsyncMock(side_effect=lambda exchange, event: events.append(event)))
+    with patch("backend.api.services.notification_push_service.rabbit", rabbit):
+        yield events
+
+
+async def _create(session_factory, recipient_id=1, title="Задача назначена"):
+    from core.database.models.notification_model import NotificationType
+    from backend.api.services.notification_service import NotificationService
+
+    from backend.api.services.notification_push_service import flush_push_events
+
+    async with session_factory() as session:
+        notification = await NotificationService(session).create_notification(
+            recipient_id=recipient_id, notification_type=NotificationType.TASK, title=title,
+            message="Вам назначена задача", channels=["in_app"]
+        )
+    await flush_push_events()
+    return notification
+
+
+class TestHub:
+    """Тесты раздачи событий в процессе"""
+
+    @pytest.mark.asyncio
+    async def test_routed_to_user(self):
+        """Тест: событие получают только соединения получателя"""
+        from backend.api.services.notification_push_service import NotificationPushHub, unread_event
+
+        hub = NotificationPushHub(queue_size=10)
+        first, second, other = hub.subscribe(1), hub.subscribe(1), hub.subscribe(2)
+        await hub.dispatch(unread_event(1, -3))
+
+        assert first.get_nowait() == second.get_nowait() == {"type": "unread", "user_id": 1, "delta": -3}
+        assert other.empty()
+
+        hub.unsubscribe(1, first)
+        hub.unsubscribe(1, second)
+        assert hub.stats() == {"users": 1, "connections": 1}
+
+    @pytest.mark.asyncio
+    async def test_overflow_resync(self):
+        """Тест: переполненная очередь медленного клиента заменяется на resync"""
+        from backend.api.services.notification_push_service import RESYNC_EVENT, NotificationPushHub, unread_event
+
+        hub = NotificationPushHub(queue_size=2)
+        queue = hub.subscribe(1)
+        for _ in range(3):
+            await hub.dispatch(unread_event(1, 1))
+
+        assert queue.qsize() == 1
+        assert queue.get_nowait() == RESYNC_EVENT
+
+    @pytest.mark.asyncio
+    async def test_local_fallback(self):
+        """Тест: без брокера событие доставляется подписчикам своего процесса"""
+        from backend.api.services.notification_push_service import (
+            notification_push_hub, publish_push_event, unread_event
+        )
+
+        rabbit = SimpleNamespace(publish_event=AsyncMock(side_effect=ConnectionError("broker down")))
+        queue = notification_push_hub.subscribe(42)
+        try:
+            with patch("backend.api.services.notification_push_service.rabbit", rabbit):
+                await publish_push_event(unread_event(42, 1))
+            assert queue.get_nowait()["delta"] == 1
+        finally:
+            notification_push_hub.unsubscribe(42, queue)
+
+
+class TestPublishing:
+    """Тесты событий операций с уведомлениями"""
+
+    @pytest.mark.asyncio
+    async def test_created_and_read(self, session_factory, published):
+        """Тест: создание - событие с уведомлением, прочтение - отрицательные приращения"""
+        from backend.api.services.notification_push_service import flush_push_events
+        from backend.api.services.notification_service import NotificationService
+
+        first = await _create(session_factory)
+        await _create(session_factory, title="Вторая задача")
+        await _create(session_factory)
+        assert [(e["type"], e["id"], e["unread_delta"]) for e in published] == [
+            ("notification", first.id, 1), ("notification", first.id + 1, 1), ("notification", first.id + 2, 1)
+        ]
+        assert published[1]["notification"]["title"] == "Вторая задача"
+        assert isinstance(published[0]["notification"]["created_at"], str)
+
+        published.clear()
+        async with session_factory() as session:
+            service = NotificationService(session)
+            await service.mark_notification_as_read(first.id, user_id=1)
+            await service.mark_notification_as_read(first.id, user_id=1)  # уже прочитано
+            await service.mark_all_notifications_as_read(user_id=1)
+            await service.mark_all_notifications_as_read(user_id=1)  # ничего не изменилось
+        await flush_push_events()
+        assert published == [{"type": "unread", "user_id": 1, "delta": -1},
+                             {"type": "unread", "user_id": 1, "delta": -2}]
+
+    @pytest.mark.asyncio
+    async def test_delete_unread(self, session_factory, published):
+        """Тест: удаление уменьшает счетчик только на число непрочитанных"""
+        from backend.api.services.notification_push_service import flush_push_events
+        from backend.api.services.notification_service import NotificationService
+
+        read = await _create(session_factory)
+        await _create(session_factory)
+        await _create(session_factory)
+        published.clear()
+
+        async with session_factory() as session:
+            service = NotificationService(session)
+            await service.mark_notification_as_read(read.id, user_id=1)
+            assert await service.delete_notifications(user_id=1) == 3
+        await flush_push_events()
+        assert published[-1] == {"type": "unread", "user_id": 1, "delta": -2}
+
+
+class TestResume:
+    """Тесты состояния при подключении"""
+
+    @pytest.mark.asyncio
+    async def test_replay_after_last_event(self, session_factory, published):
+        """Тест: пропущенные после last_event_id уведомления, их id как учтенные и снимок непрочитанных"""
+        from backend.api.services.notification_push_service import resume_state
+
+        ids = [(await _create(session_factory, title=f"Задача {i}")).id for i in range(4)]
+        await _create(session_factory, recipient_id=2)
+
+        async with session_factory() as session:
+            seen, missed, complete, unread = await resume_state(session, 1, last_event_id=ids[1])
+        assert seen == set(ids[2:])
+        assert [event["id"] for event in missed] == ids[2:]
+        assert complete and unread == 4
+
+        async with session_factory() as session:
+            assert await resume_state(session, 1) == (set(ids), [], True, 4)
+            assert (await resume_state(session, 1, last_event_id=ids[-1]))[:2] == (set(), [])
+
+    @pytest.mark.asyncio
+    async def test_create_does_not_wait_for_broker(self, session_factory):
+        """Тест: создание уведомления не ждет публикации события в брокер"""
+        import asyncio
+        from core.database.models.notification_model import NotificationType
+        from backend.api.services.notification_push_service import flush_push_events
+        from backend.api.services.notification_service import NotificationService
+
+        released = asyncio.Event()
+
+        async def _slow_publish(exchange, event):
+            await released.wait()
+
+        rabbit = SimpleNamespace(publish_event=AsyncMock(side_effect=_slow_publish))
+        with patch("backend.api.services.notification_push_service.rabbit", rabbit):
+            async with session_factory() as session:
+                notification = await asyncio.wait_for(NotificationService(session).create_notification(
+                    recipient_id=1, notification_type=NotificationType.TASK, title="Задача назначена",
+                    message="Вам назначена задача", channels=["in_app"]
+                ), timeout=1)
+            assert notification.id
+            released.set()
+            await flush_push_events()
+        assert rabbit.publish_event.await_args.args[1]["id"] == notification.id
+
+    @pytest.mark.asyncio
+    async def test_too_many_missed(self, session_factory, published):
+        """Тест: пропущено больше лимита - без событий, клиент перечитывает ленту"""
+        from backend.api.services.notification_push_service import resume_state
+
+        for _ in range(4):
+            await _create(session_factory)
+
+        async with session_factory() as session:
+            _, missed, complete, _ = await resume_state(session, 1, last_event_id=0, limit=3)
+        assert (missed, complete) == ([], False)
+
+
+class TestWebSocket:
+    """Тесты WebSocket эндпоинта"""
+
+    @staticmethod
+    def _app():
+        from fastapi import FastAPI
+        from backend.api.routers.notification.router import router
+
+        app = FastAPI()
+        app.include_router(router)
+        return app
+
+    @staticmethod
+    def _db_helper():
+        @asynccontextmanager
+        async def get_session():
+            yield None
+
+        return SimpleNamespace(get_session=get_session)
+
+    def test_rejects_without_valid_token(self):
+        """Тест: соединение без действующего токена закрывается"""
+        from fastapi.testclient import TestClient
+        from starlette.websockets import WebSocketDisconnect
+
+        with patch("backend.api.routers.notification.router.authenticate_websocket", AsyncMock(return_value=None)):
+            with TestClient(self._app()) as client:
+                with pytest.raises(WebSocketDisconnect):
+                    with client.websocket_connect("/notifications/ws?token=bad") as websocket:
+                        websocket.receive_json()
+
+    def test_resume_then_live(self):
+        """Тест: пропущенные события, снимок непрочитанных, затем еще не учтенные события живого потока"""
+        from fastapi.testclient import TestClient
+        from backend.api.services.notification_push_service import notification_push_hub, unread_event
+
+        missed = [{"type": "notification", "user_id": 7, "id": 5, "unread_delta": 1, "notification": {"id": 5}}]
+        with patch("backend.api.routers.notification.router.authenticate_websocket",
+                   AsyncMock(return_value=SimpleNamespace(id=7))), \
+                patch("backend.api.routers.notification.router.get_db_helper", return_value=self._db_helper()), \
+                patch("backend.api.routers.notification.router.resume_state",
+                      AsyncMock(return_value=({5}, missed, True, 3))):
+            with TestClient(self._app()) as client:
+                with client.websocket_connect("/notifications/ws?token=t&last_event_id=4") as websocket:
+                    assert websocket.receive_json() == {"type": "notification", "id": 5, "unread_delta": 1,
+                                                        "notification": {"id": 5}}
+                    assert websocket.receive_json() == {"type": "unread", "unread_count": 3}
+
+                    websocket.send_json({"type": "ping"})
+                    assert websocket.receive_json() == {"type": "pong"}
+
+                    # Уведомление 5 уже отдано при подключении; 3 закоммичено позже 5 (id выдан раньше), 6 - новое
+                    for event_id in (5, 3, 6):
+                        client.portal.call(notification_push_hub.dispatch, {
+                            "type": "notification", "user_id": 7, "id": event_id, "unread_delta": 1,
+                            "notification": {"id": event_id}
+                        })
+                    client.portal.call(notification_push_hub.dispatch, unread_event(7, -1))
+                    assert websocket.receive_json()["id"] == 3
+                    assert websocket.receive_json()["id"] == 6
+                    assert websocket.receive_json() == {"type": "unread", "delta": -1}
+
+        assert 7 not in notification_push_hub.subscribers
@@ -0,0 +1,172 @@
+"""
+Простые тесты тихих часов и отложенной доставки уведомлений
+"""
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_session_factory):
+    return await sqlite_session_factory(
+        "notification_templates", "notifications", "notification_batches", "notification_deliveries",
+        "user_notification_preferences", "notification_webhooks"
+    )
+
+
+async def _quiet_now(session_factory, user_id=1):
+    """Тихие часы пользователя: с часа назад до часа вперед (UTC); возвращает конец окна"""
+    from core.database.models.notification_model import NotificationType, UserNotificationPreference
+
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    start, end = now - timedelta(hours=1), now + timedelta(hours=1)
+    async with session_factory() as session:
+        session.add(UserNotificationPreference(
+            user_id=user_id, notification_type=NotificationType.TASK.value, enabled_channels=["in_app", "email"],
+            min_priority="low", quiet_hours_start=start.strftime("%H:%M"), quiet_hours_end=end.strftime("%H:%M"),
+            timezone="UTC"
+        ))
+        await session.commit()
+    return end
+
+
+async def _create(session_factory, **kwargs):
+    from core.database.models.notification_model import NotificationType
+    from backend.api.services.notification_service import NotificationService
+
+    async with session_factory() as session:
+        return await NotificationService(session).create_notification(
+            recipient_id=kwargs.pop("recipient_id", 1),
+            notification_type=NotificationType.TASK,
+            title="Задача назначена",
+            message="Вам назначена задача",
+            **kwargs
+        )
+
+
+async def _deliveries(session_factory):
+    from sqlalchemy import select
+    from core.database.models.notification_model import NotificationDelivery
+
+    async with session_factory() as session:
+        return {d.channel: d for d in (await session.scalars(select(NotificationDelivery))).all()}
+
+
+class TestQuietHoursEnd:
+    """Тесты расчета окна тихих часов"""
+
+    def test_overnight_window(self):
+        """Тест: окно через полночь заканчивается на следующий день"""
+        from backend.api.services.notification_service import quiet_hours_end
+
+        assert quiet_hours_end("22:00", "07:00", "UTC", datetime(2026, 3, 2, 23, 30)) == datetime(2026, 3, 3, 7, 0)
+        assert quiet_hours_end("22:00", "07:00", "UTC", datetime(2026, 3, 3, 6, 59)) == datetime(2026, 3, 3, 7, 0)
+        assert quiet_hours_end("22:00", "07:00", "UTC", datetime(2026, 3, 3, 7, 0)) is None
+        assert quiet_hours_end("22:00", "07:00", "UTC", datetime(2026, 3, 3, 12, 0)) is None
+
+    def test_same_day_window(self):
+        """Тест: дневное окно"""
+        from backend.api.services.notification_service import quiet_hours_end
+
+        assert quiet_hours_end("13:00", "14:00", "UTC", datetime(2026, 3, 2, 13, 15)) == datetime(2026, 3, 2, 14, 0)
+        assert quiet_hours_end("13:00", "14:00", "UTC", datetime(2026, 3, 2, 12, 59)) is None
+
+    def test_user_timezone(self):
+        """Тест: окно считается в часовом поясе пользователя, результат - в UTC"""
+        from backend.api.services.notification_service import quiet_hours_end
+
+        # 20:30 UTC = 23:30 по Москве
+        assert quiet_hours_end("22:00", "07:00", "Europe/Moscow", datetime(2026, 3, 2, 20, 30)) == \
+            datetime(2026, 3, 3, 4, 0)
+        # Неизвестный пояс - UTC
+        assert quiet_hours_end("22:00", "07:00", "Mars/Olympus", datetime(2026, 3, 2, 23, 0)) == \
+            datetime(2026, 3, 3, 7, 0)
+
+    def test_invalid_window(self):
+        """Тест: пустое или некорректное окно не откладывает доставку"""
+        from backend.api.services.notification_service import quiet_hours_end
+
+        now = datetime(2026, 3, 2, 23, 0)
+        assert quiet_hours_end(None, "07:00", "UTC", now) is None
+        assert quiet_hours_end("22:00", "22:00", "UTC", now) is None
+        assert quiet_hours_end("late", "07:00", "UTC", now) is None
+
+
+class TestReleaseOffset:
+    """Тесты распределения выпуска после тихих часов"""
+
+    def test_spread(self):
+        """Тест: сдвиг постоянен для получателя, лежит в пределах окна и различается у получателей"""
+        from backend.api.services.notification_service import release_offset
+
+        offsets = [release_offset(user_id, 900) for user_id in range(1, 201)]
+        assert all(timedelta(0) <= offset < timedelta(seconds=900) for offset in offsets)
+        assert release_offset(7, 900) == release_offset(7, 900)
+        assert len(set(offsets)) > 100
+        assert release_offset(7, 0) == timedelta(0)
+
+
+class TestDeferredDelivery:
+    """Тесты отложенной доставки"""
+
+    @pytest.mark.asyncio
+    async def test_deferred_until_window_end(self, session_factory):
+        """Тест: email ждет конца окна (со сдвигом получателя), in_app доставляется сразу"""
+        from backend.api.services.notification_delivery_service import NotificationOutbox
+        from backend.api.services.notification_service import release_offset
+        from core.settings import settings
+
+        end = await _quiet_now(session_factory)
+        await _create(session_factory)
+
+        deliveries = await _deliveries(session_factory)
+        release_at = end + release_offset(1, settings.notifications.quiet_hours_release_spread_seconds)
+        assert deliveries["email"].next_attempt_at == release_at
+        assert deliveries["in_app"].next_attempt_at < end - timedelta(minutes=30)
+
+        outbox = NotificationOutbox(lease_seconds=60)
+        async with session_factory() as session:
+            assert await outbox.claim(session, "email", 10) == []
+            assert await outbox.claim(session, "email", 10, now=release_at) == [deliveries["email"].id]
+
+    @pytest.mark.asyncio
+    async def test_urgent_bypasses(self, session_factory):
+        """Тест: срочное уведомление не ждет конца тихих часов"""
+        from core.database.models.notification_model import NotificationPriority
+
+        end = await _quiet_now(session_factory)
+        await _create(session_factory, priority=NotificationPriority.URGENT)
+
+        assert (await _deliveries(session_factory))["email"].next_attempt_at < end - timedelta(minutes=30)
+
+    @pytest.mark.asyncio
+    async def test_scheduled_after_window(self, session_factory):
+        """Тест: отложенное уведомление после окна отправляется в назначенное время"""
+        end = await _quiet_now(session_factory)
+        scheduled_at = end + timedelta(hours=3)
+        await _create(session_factory, scheduled_at=scheduled_at)
+
+        deliveries = await _deliveries(session_factory)
+        assert deliveries["email"].next_attempt_at == scheduled_at
+        assert deliveries["in_app"].next_attempt_at == scheduled_at
+
+    @pytest.mark.asyncio
+    async def test_digest_waits_for_window_end(self, session_factory):
+        """Тест: сводка в тихие часы отправляется не раньше конца окна"""
+        from sqlalchemy import select
+        from core.database.models.notification_model import (
+            NotificationBatch, NotificationPriority, UserNotificationPreference
+        )
+
+        end = await _quiet_now(session_factory)
+        async with session_factory() as session:
+            preferences = await session.scalar(select(UserNotificationPreference))
+            preferences.batch_notifications = True
+            preferences.batch_interval_minutes = 5
+            await session.commit()
+        await _create(session_factory, priority=NotificationPriority.LOW)
+
+        async with session_factory() as session:
+            batch = await session.scalar(select(NotificationBatch))
+        assert batch.scheduled_at >= end
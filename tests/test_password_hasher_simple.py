@@ -0,0 +1,154 @@
+"""
+Простые тесты сервиса хеширования паролей
+"""
+import asyncio
+import threading
+import pytest
+
+
+def _hasher(**kwargs):
+    from backend.api.configuration.password_hasher import PasswordHasher, build_crypt_context
+
+    kwargs.setdefault("context", build_crypt_context(rounds=4))
+    kwargs.setdefault("workers", 2)
+    kwargs.setdefault("max_pending", 8)
+    kwargs.setdefault("wait_timeout", 5)
+    return PasswordHasher(**kwargs)
+
+
+class TestPasswordHasher:
+    """Тесты хеширования в пуле потоков"""
+
+    @pytest.mark.asyncio
+    async def test_hash_and_verify(self):
+        """Тест хеширования и проверки пароля"""
+        hasher = _hasher()
+        try:
+            password_hash = await hasher.hash("secret")
+
+            assert password_hash.startswith("$2b$04$")
+            assert await hasher.verify("secret", password_hash)
+            assert not await hasher.verify("wrong", password_hash)
+            assert hasher.pending == 0
+        finally:
+            hasher.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_runs_off_event_loop(self):
+        """Тест: хеширование выполняется не в потоке цикла событий"""
+        hasher = _hasher()
+        threads = []
+
+        def record(password):
+            threads.append(threading.get_ident())
+            return password
+
+        try:
+            await hasher._run(record, "x")
+        finally:
+            hasher.shutdown()
+
+        assert threads and threads[0] != threading.get_ident()
+
+    @pytest.mark.asyncio
+    async def test_loop_stays_responsive(self):
+        """Тест: цикл событий обслуживает другие задачи во время хеширования"""
+        from backend.api.configuration.password_hasher import build_crypt_context
+
+        hasher = _hasher(context=build_crypt_context(rounds=10))
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        try:
+            await asyncio.gather(*[hasher.hash("secret") for _ in range(4)])
+        finally:
+            task.cancel()
+            hasher.shutdown()
+
+        assert ticks > 3
+
+    @pytest.mark.asyncio
+    async def test_queue_depth_limit(self):
+        """Тест: при переполнении очереди запрос отклоняется сразу"""
+        from backend.api.configuration.password_hasher import PasswordHasherOverloaded
+
+        hasher = _hasher(workers=1, max_pending=2)
+        release = threading.Event()
+
+        def blocking(_):
+            release.wait(5)
+            return True
+
+        try:
+            first = asyncio.ensure_future(hasher._run(blocking, 1))
+            second = asyncio.ensure_future(hasher._run(blocking, 2))
+            await asyncio.sleep(0.01)
+            with pytest.raises(PasswordHasherOverloaded):
+                await hasher._run(blocking, 3)
+            assert hasher.stats["rejected"] == 1
+            release.set()
+            assert await first and await second
+        finally:
+            release.set()
+            hasher.shutdown()
+
+        await asyncio.sleep(0.01)
+        assert hasher.pending == 0
+
+    @pytest.mark.asyncio
+    async def test_wait_timeout(self):
+        """Тест: слишком долгое ожидание пула - отказ, а не накопление задержки"""
+        from backend.api.configuration.password_hasher import PasswordHasherOverloaded
+
+        hasher = _hasher(workers=1, max_pending=10)
+        release = threading.Event()
+
+        try:
+            busy = asyncio.ensure_future(hasher._run(release.wait, 5))
+            await asyncio.sleep(0.01)
+            hasher.wait_timeout = 0.05
+            with pytest.raises(PasswordHasherOverloaded):
+                await hasher._run(lambda: True)
+            assert hasher.stats["timeouts"] == 1
+        finally:
+            release.set()
+            await busy
+            hasher.shutdown()
+
+
+class TestRehashPolicy:
+    """Тесты пересчета устаревших хешей"""
+
+    @pytest.mark.asyncio
+    async def test_outdated_hash_is_rehashed(self):
+        """Тест: хеш с меньшим числом раундов пересчитывается при входе"""
+        from backend.api.configuration.password_hasher import build_crypt_context
+
+        old_hash = build_crypt_context(rounds=4).hash("secret")
+        hasher = _hasher(context=build_crypt_context(rounds=5))
+        try:
+            assert hasher.needs_update(old_hash)
+            valid, new_hash = await hasher.verify_and_update("secret", old_hash)
+        finally:
+            hasher.shutdown()
+
+        assert valid
+        assert new_hash.startswith("$2b$05$")
+        assert hasher.stats["rehashed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_current_hash_kept(self):
+        """Тест: актуальный хеш не пересчитывается, неверный пароль не дает нового хеша"""
+        hasher = _hasher()
+        try:
+            current = await hasher.hash("secret")
+            assert await hasher.verify_and_update("secret", current) == (True, None)
+            assert await hasher.verify_and_update("wrong", current) == (False, None)
+        finally:
+            hasher.shutdown()
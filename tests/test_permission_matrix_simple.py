@@ -0,0 +1,199 @@
+"""
+Простые тесты скомпилированной матрицы разрешений ролей
+"""
+import asyncio
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, patch
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_session_factory):
+    return await sqlite_session_factory("organizations", "departments", "users", "permissions", "role_permissions")
+
+
+async def _grant(session, role, resource, action):
+    from core.database.models import Permission, RolePermission
+
+    permission = Permission(name=f"{resource}:{action}:{role}", resource=resource, action=action)
+    session.add(permission)
+    await session.flush()
+    session.add(RolePermission(role=role, permission_id=permission.id))
+    await session.commit()
+    return permission
+
+
+class TestPermissionMatrix:
+    """Тесты сборки и проверки матрицы"""
+
+    def test_bit_test(self):
+        """Тест: проверка разрешения по маске роли"""
+        from backend.api.configuration.permission_matrix import PermissionMatrix
+
+        matrix = PermissionMatrix()
+        matrix.build([
+            ("manager", "task", "create"),
+            ("manager", "task", "read"),
+            ("employee", "task", "read"),
+        ])
+
+        assert matrix.has_permission("manager", "task", "create")
+        assert matrix.has_permission("employee", "task", "read")
+        assert not matrix.has_permission("employee", "task", "create")
+        assert not matrix.has_permission("employee", "user", "delete")
+        assert not matrix.has_permission("unknown", "task", "read")
+        assert not matrix.has_permission(None, "task", "read")
+        assert matrix.permissions_for("manager") == {("task", "create"), ("task", "read")}
+        assert matrix.roles() == {"manager", "employee"}
+
+    def test_version_increments(self):
+        """Тест: каждая сборка заменяет снимок и увеличивает версию"""
+        from backend.api.configuration.permission_matrix import PermissionMatrix
+
+        matrix = PermissionMatrix()
+        assert not matrix.is_loaded
+        assert matrix.build([("admin", "user", "delete")]) == 1
+        assert matrix.build([]) == 2
+        assert matrix.is_loaded
+        assert not matrix.has_permission("admin", "user", "delete")
+
+    @pytest.mark.asyncio
+    async def test_load_from_db(self, session_factory):
+        """Тест: матрица строится одним запросом из permissions и role_permissions"""
+        from backend.api.configuration.permission_matrix import PermissionMatrix
+
+        async with session_factory() as session:
+            await _grant(session, "manager", "dashboard", "read")
+            await _grant(session, "admin", "dashboard", "read")
+
+        matrix = PermissionMatrix(session_factory=session_factory)
+        assert await matrix.reload() == 1
+        assert matrix.has_permission("manager", "dashboard", "read")
+        assert matrix.has_permission("admin", "dashboard", "read")
+        assert not matrix.has_permission("employee", "dashboard", "read")
+
+    @pytest.mark.asyncio
+    async def test_concurrent_reloads_coalesce(self, session_factory):
+        """Тест: одновременные запросы перезагрузки объединяются"""
+        from backend.api.configuration.permission_matrix import PermissionMatrix
+
+        matrix = PermissionMatrix(session_factory=session_factory)
+        await asyncio.gather(*[matrix.reload() for _ in range(5)])
+
+        assert matrix.stats["reloads"] + matrix.stats["coalesced"] == 5
+        assert matrix.stats["reloads"] <= 2
+
+    @pytest.mark.asyncio
+    async def test_own_event_ignored(self):
+        """Тест: событие собственного процесса не вызывает повторную загрузку"""
+        from backend.api.configuration.permission_matrix import PermissionMatrix
+
+        matrix = PermissionMatrix()
+        with patch.object(matrix, "reload", AsyncMock()) as reload:
+            await matrix.handle_event({"version": 3, "origin": matrix.instance_id})
+            reload.assert_not_awaited()
+            await matrix.handle_event({"version": 3, "origin": "other-worker"})
+            reload.assert_awaited_once()
+
+
+class TestPermissionMatrixInvalidator:
+    """Тесты пересборки матрицы при изменении разрешений"""
+
+    @pytest.mark.asyncio
+    async def test_commit_rebuilds_matrix(self, session_factory):
+        """Тест: новое назначение роли видно после коммита, без запроса на проверке"""
+        from backend.api.configuration.permission_matrix import PermissionMatrix, PermissionMatrixInvalidator
+
+        matrix = PermissionMatrix(session_factory=session_factory)
+        await matrix.reload()
+        invalidator = PermissionMatrixInvalidator(matrix)
+        invalidator.register()
+        try:
+            with patch("backend.api.configuration.rabbitmq_server.rabbit.publish_event", AsyncMock()) as publish:
+                async with session_factory() as session:
+                    await _grant(session, "manager", "task", "delete")
+                await asyncio.gather(*invalidator._tasks)
+
+            assert matrix.version >= 2
+            assert matrix.has_permission("manager", "task", "delete")
+            publish.assert_awaited()
+            assert publish.await_args.args[1]["origin"] == matrix.instance_id
+        finally:
+            invalidator.unregister()
+
+    @pytest.mark.asyncio
+    async def test_rollback_keeps_matrix(self, session_factory):
+        """Тест: откат изменений не пересобирает матрицу"""
+        from core.database.models import Permission
+        from backend.api.configuration.permission_matrix import PermissionMatrix, PermissionMatrixInvalidator
+
+        matrix = PermissionMatrix(session_factory=session_factory)
+        await matrix.reload()
+        invalidator = PermissionMatrixInvalidator(matrix)
+        invalidator.register()
+        try:
+            async with session_factory() as session:
+                session.add(Permission(name="x", resource="task", action="read"))
+                await session.flush()
+                await session.rollback()
+            assert not invalidator._tasks
+            assert matrix.version == 1
+        finally:
+            invalidator.unregister()
+
+
+class TestCheckUserPermission:
+    """Тесты check_user_permission"""
+
+    @pytest.mark.asyncio
+    async def test_check_with_known_role_skips_db(self):
+        """Тест: при известной роли проверка не обращается к БД"""
+        from backend.api.configuration.permission_matrix import check_user_permission, permission_matrix
+
+        session = AsyncMock()
+        with patch.object(permission_matrix, "_bits", {("task", "read"): 0}), \
+                patch.object(permission_matrix, "_roles", {"employee": 1}), \
+                patch.object(permission_matrix, "loaded_at", 1.0):
+            assert await check_user_permission(session, 1, "task", "read", role="employee")
+            assert not await check_user_permission(session, 1, "task", "delete", role="employee")
+            assert await check_user_permission(session, 1, "task", "delete", role="admin")
+
+        session.execute.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_check_by_user_id(self, session_factory):
+        """Тест: роль берется у пользователя, матрица строится при первой проверке"""
+        from core.database.models import User
+        from backend.api.configuration.permission_matrix import PermissionMatrix, check_user_permission
+
+        async with session_factory() as session:
+            await _grant(session, "manager", "report", "export")
+            user = User(login="ivan", username="Ivan", email="ivan@example.com", password_hash="h", role="manager")
+            session.add(user)
+            await session.commit()
+
+            matrix = PermissionMatrix()
+            with patch("backend.api.configuration.permission_matrix.permission_matrix", matrix):
+                assert await check_user_permission(session, user.id, "report", "export")
+                assert not await check_user_permission(session, user.id, "report", "delete")
+                assert not await check_user_permission(session, user.id + 100, "report", "export")
+            assert matrix.version == 1
+
+    @pytest.mark.asyncio
+    async def test_require_permission_dependency(self):
+        """Тест: зависимость require_permission пропускает роль с разрешением и отказывает остальным"""
+        from types import SimpleNamespace
+        from fastapi import HTTPException
+        from backend.api.configuration.auth import require_permission
+        from backend.api.configuration.permission_matrix import permission_matrix
+
+        checker = require_permission("report", "reconcile")
+        manager = SimpleNamespace(id=1, role="manager")
+        employee = SimpleNamespace(id=2, role="employee")
+        with patch.object(permission_matrix, "_bits", {("report", "reconcile"): 0}), \
+                patch.object(permission_matrix, "_roles", {"manager": 1}), \
+                patch.object(permission_matrix, "loaded_at", 1.0):
+            assert await checker(user=manager, session=AsyncMock()) is manager
+            with pytest.raises(HTTPException) as error:
+                await checker(user=employee, session=AsyncMock())
+        assert error.value.status_code == 403
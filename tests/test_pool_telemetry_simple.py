@@ -0,0 +1,140 @@
+"""
+Простые тесты телеметрии пула соединений и расчета его размера
+"""
+import asyncio
+import pytest
+import pytest_asyncio
+
+from sqlalchemy import text
+
+
+@pytest_asyncio.fixture
+async def database(tmp_path):
+    from core.database.engine import Database
+
+    db = Database(
+        url=f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.2,
+        pool_long_held_seconds=0.05,
+    )
+    db.engine  # движок и его телеметрия создаются при первом обращении
+    yield db
+    await db.dispose()
+
+
+class TestHistogram:
+    """Тесты гистограммы"""
+
+    def test_buckets_and_quantiles(self):
+        """Тест: наблюдения попадают в корзины, квантили - по верхней границе"""
+        from core.database.pool_telemetry import Histogram
+
+        histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+        for value in (0.005, 0.05, 0.05, 0.5, 5.0):
+            histogram.observe(value)
+
+        assert histogram.count == 5
+        assert histogram.to_dict()["buckets"] == {"0.01": 1, "0.1": 3, "1.0": 4, "+Inf": 5}
+        assert histogram.quantile(0.5) == 0.1
+        assert histogram.quantile(1.0) == float("inf")
+        assert Histogram().quantile(0.5) is None
+
+
+class TestPoolTelemetry:
+    """Тесты телеметрии на пуле движка"""
+
+    @pytest.mark.asyncio
+    async def test_checkout_wait_and_gauges(self, database):
+        """Тест: измеряется ожидание соединения, видны занятые и сверхлимитные соединения"""
+        telemetry = database.pool_telemetry["primary"]
+
+        async with database.engine.connect() as first:
+            await first.execute(text("SELECT 1"))
+            async with database.engine.connect() as second:
+                await second.execute(text("SELECT 1"))
+                gauges = telemetry.gauges()
+                assert gauges["checked_out"] == 2
+                assert gauges["overflow"] == 1
+
+        snapshot = database.pool_stats()[0]
+        assert snapshot["name"] == "primary"
+        assert snapshot["checked_out"] == 0
+        assert snapshot["checkouts"] == 2
+        assert snapshot["checkout_wait"]["count"] == 2
+        assert snapshot["hold_time"]["count"] == 2
+
+    @pytest.mark.asyncio
+    async def test_timeout_counted(self, database):
+        """Тест: таймаут ожидания соединения учитывается"""
+        from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+        telemetry = database.pool_telemetry["primary"]
+        async with database.engine.connect() as first, database.engine.connect() as second:
+            await first.execute(text("SELECT 1"))
+            await second.execute(text("SELECT 1"))
+            with pytest.raises(PoolTimeoutError):
+                async with database.engine.connect() as third:
+                    await third.execute(text("SELECT 1"))
+
+        assert telemetry.stats["timeouts"] == 1
+
+    @pytest.mark.asyncio
+    async def test_long_held_with_stack(self, database, caplog):
+        """Тест: долго удерживаемое соединение сообщается один раз со стеком места выдачи"""
+        telemetry = database.pool_telemetry["primary"]
+
+        async def forgotten_transaction():
+            async with database.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                await asyncio.sleep(0.1)
+                return telemetry.long_held(), telemetry.report_long_held(), telemetry.report_long_held()
+
+        held, reported, reported_again = await forgotten_transaction()
+
+        assert len(held) == 1
+        assert any("forgotten_transaction" in line for line in held[0]["stack"])
+        assert not any("/sqlalchemy/" in line for line in held[0]["stack"])
+        assert (reported, reported_again) == (1, 0)
+        assert "connection held for" in caplog.text
+        assert telemetry.long_held() == []
+
+    @pytest.mark.asyncio
+    async def test_survives_dispose(self, database):
+        """Тест: после пересоздания пула телеметрия продолжает работать"""
+        telemetry = database.pool_telemetry["primary"]
+        async with database.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        await database.engine.dispose()
+        async with database.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+        assert telemetry.pool is database.engine.sync_engine.pool
+        assert telemetry.checkout_wait.count == 2
+
+
+class TestPoolSizing:
+    """Тесты расчета размера пула из общего лимита"""
+
+    def test_budget_split(self):
+        """Тест: лимит за вычетом резерва делится между процессами"""
+        from core.database.pool_telemetry import size_pool_from_budget
+
+        assert size_pool_from_budget(100, 4, reserved=20, overflow_ratio=0.25) == (15, 5)
+        assert size_pool_from_budget(10, 4, reserved=0, overflow_ratio=0.5) == (1, 1)
+        assert size_pool_from_budget(5, 4, reserved=0) == (1, 0)
+        with pytest.raises(ValueError):
+            size_pool_from_budget(10, 4, reserved=8)
+
+    def test_settings_sizing(self):
+        """Тест: без лимита используются статические настройки"""
+        from core.settings.config import DatabaseConfig
+
+        static = DatabaseConfig(pool_size=20, max_overflow=10, connection_budget=0)
+        assert static.get_pool_sizing(workers=4) == (20, 10)
+
+        budgeted = DatabaseConfig(connection_budget=90, budget_reserved_connections=10, pool_overflow_ratio=0.25)
+        pool_size, max_overflow = budgeted.get_pool_sizing(workers=4)
+        assert (pool_size, max_overflow) == (15, 5)
+        assert (pool_size + max_overflow) * 4 + 10 <= 90
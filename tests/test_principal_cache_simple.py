@@ -0,0 +1,389 @@
+"""
+Простые тесты ключей JWT и кэша аутентифицированных пользователей
+"""
+import asyncio
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+pytestmark = pytest.mark.usefixtures("related_models")
+
+
+def _security(**overrides):
+    values = dict(
+        algorithm="HS256",
+        secret_key="current-secret",
+        previous_secret_keys=[],
+        previous_public_key_paths=[],
+        private_key_path="/nonexistent/privkey.pem",
+        public_key_path="/nonexistent/pubkey.pem",
+        key_reload_interval_seconds=300,
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def _principal(**overrides):
+    from backend.api.configuration.principal_cache import Principal
+
+    values = dict(id=1, login="ivan", username="Ivan", role="employee", is_active=True)
+    values.update(overrides)
+    return Principal(**values)
+
+
+class TestTokenKeyRing:
+    """Тесты загрузки и ротации ключей"""
+
+    def test_roundtrip_with_kid(self):
+        """Тест: токен подписывается текущим ключом и содержит kid"""
+        from jose import jwt
+        from backend.api.configuration.token_keys import TokenKeyRing
+
+        ring = TokenKeyRing(_security())
+        token = ring.encode({"sub": "ivan"})
+
+        assert jwt.get_unverified_header(token)["kid"] == ring.signing_key()[0]
+        assert ring.decode(token)["sub"] == "ivan"
+
+    def test_previous_key_still_accepted(self):
+        """Тест: после ротации токены прежнего ключа остаются валидными"""
+        from backend.api.configuration.token_keys import TokenKeyRing
+
+        old_token = TokenKeyRing(_security(secret_key="old-secret")).encode({"sub": "ivan"})
+        rotated = TokenKeyRing(_security(secret_key="new-secret", previous_secret_keys=["old-secret"]))
+
+        assert rotated.decode(old_token)["sub"] == "ivan"
+
+    def test_unknown_key_rejected(self):
+        """Тест: токен неизвестного ключа отклоняется"""
+        from jose import JWTError
+        from backend.api.configuration.token_keys import TokenKeyRing
+
+        token = TokenKeyRing(_security(secret_key="other")).encode({"sub": "ivan"})
+        with pytest.raises(JWTError):
+            TokenKeyRing(_security()).decode(token)
+
+    def test_token_without_kid(self):
+        """Тест: токены, выпущенные до появления kid, принимаются"""
+        from jose import jwt
+        from backend.api.configuration.token_keys import TokenKeyRing
+
+        legacy = jwt.encode({"sub": "ivan"}, "current-secret", algorithm="HS256")
+        assert TokenKeyRing(_security()).decode(legacy)["sub"] == "ivan"
+
+    def test_rsa_keys_read_once_and_reloaded_on_change(self, tmp_path):
+        """Тест RS256: файлы читаются один раз, замена файла подхватывается"""
+        import os
+        from jose import JWTError
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from backend.api.configuration.token_keys import TokenKeyRing
+
+        def write_pair(suffix):
+            key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            private = tmp_path / f"priv{suffix}.pem"
+            public = tmp_path / f"pub{suffix}.pem"
+            private.write_bytes(key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            ))
+            public.write_bytes(key.public_key().public_bytes(
+                serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+            ))
+            return private, public
+
+        private, public = write_pair("")
+        ring = TokenKeyRing(_security(
+            algorithm="RS256", private_key_path=private, public_key_path=public, key_reload_interval_seconds=0
+        ))
+        token = ring.encode({"sub": "ivan"})
+
+        with patch("pathlib.Path.read_bytes", side_effect=AssertionError("key file re-read")):
+            for _ in range(3):
+                assert ring.decode(token)["sub"] == "ivan"
+
+        new_private, new_public = write_pair("_new")
+        os.replace(new_private, private)
+        os.replace(new_public, public)
+        os.utime(public, (1, 1))
+
+        new_token = ring.encode({"sub": "petr"})
+        assert ring.decode(new_token)["sub"] == "petr"
+        with pytest.raises(JWTError):
+            ring.decode(token)
+
+
+class TestPrincipal:
+    """Тесты снимка пользователя"""
+
+    def test_attribute_and_mapping_access(self):
+        """Тест: доступ как к атрибутам и как к словарю"""
+        principal = _principal(department_id=3)
+
+        assert principal.role == "employee"
+        assert principal.get("department_id") == 3
+        assert principal["id"] == 1
+        assert principal.get("password_hash") is None
+        with pytest.raises(KeyError):
+            principal["password_hash"]
+
+    def test_read_only(self):
+        """Тест: снимок нельзя изменить между запросами"""
+        with pytest.raises(AttributeError):
+            _principal().role = "admin"
+
+    def test_from_user(self):
+        """Тест: снимок не содержит хеш пароля"""
+        from backend.api.configuration.principal_cache import Principal
+        from core.database.models import User
+
+        user = User(id=5, login="petr", username="Petr", email="p@x.io", password_hash="hash", role="manager",
+                    is_active=True, created_at=datetime(2025, 1, 1))
+        principal = Principal.from_user(user)
+
+        assert principal.login == "petr"
+        assert "password_hash" not in principal.to_dict()
+
+    def test_user_response_from_principal(self):
+        """Тест: principal сериализуется в схему пользователя"""
+        from backend.api.configuration.schemas.user import UserResponse
+
+        principal = _principal(email="ivan@example.com", created_at=datetime(2025, 1, 1), updated_at=datetime(2025, 1, 2))
+        response = UserResponse.model_validate(principal, from_attributes=True)
+        assert response.login == "ivan"
+
+
+class TestPrincipalCache:
+    """Тесты кэша principal"""
+
+    @pytest.mark.asyncio
+    async def test_second_lookup_is_cached(self):
+        """Тест: повторная аутентификация не обращается к загрузчику"""
+        from backend.api.configuration.principal_cache import PrincipalCache
+
+        cache = PrincipalCache(max_entries=10, ttl=60)
+        load = AsyncMock(return_value=_principal())
+
+        await cache.get_or_load("ivan", load)
+        await cache.get_or_load("ivan", load)
+
+        assert load.await_count == 1
+        assert cache.hit_ratio() == 0.5
+
+    @pytest.mark.asyncio
+    async def test_ttl_and_eviction(self):
+        """Тест TTL и ограничения размера"""
+        from backend.api.configuration.principal_cache import PrincipalCache
+
+        expired = PrincipalCache(max_entries=10, ttl=0)
+        expired.set("ivan", _principal())
+        assert expired.get("ivan") is None
+
+        cache = PrincipalCache(max_entries=2, ttl=60)
+        for user_id, login in enumerate(["a", "b", "c"], start=1):
+            cache.set(login, _principal(id=user_id, login=login))
+        assert list(cache.entries) == ["b", "c"]
+        assert 1 not in cache.subjects_by_user
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_coalesced(self):
+        """Тест: одновременные промахи по одному sub - одна загрузка"""
+        from backend.api.configuration.principal_cache import PrincipalCache
+
+        cache = PrincipalCache(max_entries=10, ttl=60)
+        calls = 0
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return _principal()
+
+        results = await asyncio.gather(*[cache.get_or_load("ivan", load) for _ in range(5)])
+        assert calls == 1
+        assert all(result.id == 1 for result in results)
+
+    @pytest.mark.asyncio
+    async def test_invalidate_by_user_and_subject(self):
+        """Тест сброса по ID пользователя и по прежнему логину"""
+        from backend.api.configuration.principal_cache import PrincipalCache
+
+        cache = PrincipalCache(max_entries=10, ttl=60)
+        cache.set("ivan", _principal(id=1))
+        cache.set("petr", _principal(id=2, login="petr"))
+        cache.set("old", _principal(id=3, login="old"))
+
+        cache.invalidate(user_ids=[1], subjects=["old"])
+
+        assert cache.get("ivan") is None
+        assert cache.get("old") is None
+        assert cache.get("petr") is not None
+
+    @pytest.mark.asyncio
+    async def test_change_during_load_not_cached(self):
+        """Тест: изменение пользователя во время загрузки не оставляет устаревшую запись"""
+        from backend.api.configuration.principal_cache import PrincipalCache
+
+        cache = PrincipalCache(max_entries=10, ttl=60)
+
+        async def load():
+            cache.invalidate(user_ids=[1])
+            return _principal()
+
+        await cache.get_or_load("ivan", load)
+        assert "ivan" not in cache.entries
+
+    @pytest.mark.asyncio
+    async def test_remote_event(self):
+        """Тест события другого воркера, включая полный сброс"""
+        from backend.api.configuration.principal_cache import PrincipalCache
+
+        cache = PrincipalCache(max_entries=10, ttl=60)
+        cache.set("ivan", _principal())
+        cache.set("petr", _principal(id=2, login="petr"))
+
+        await cache.handle_event({"user_ids": [1], "subjects": []})
+        assert list(cache.entries) == ["petr"]
+        await cache.handle_event({"user_ids": ["*"]})
+        assert not cache.entries
+
+
+class TestPrincipalCacheInvalidator:
+    """Тесты сброса кэша при изменении пользователей"""
+
+    @pytest.fixture
+    def db(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import Session
+        from core.database.base import Base
+
+        engine = create_engine("sqlite://")
+        tables = Base.metadata.tables
+        Base.metadata.create_all(engine, tables=[tables[name] for name in ("organizations", "departments", "users")])
+        with Session(engine) as session:
+            yield session
+
+    def _cached(self):
+        from backend.api.configuration.principal_cache import PrincipalCache, PrincipalCacheInvalidator
+
+        cache = PrincipalCache(max_entries=10, ttl=60)
+        invalidator = PrincipalCacheInvalidator(cache)
+        invalidator.register()
+        return cache, invalidator
+
+    def _user(self, session):
+        from core.database.models import User
+
+        user = User(login="ivan", username="Ivan", email="ivan@example.com", password_hash="h1", role="employee")
+        session.add(user)
+        session.commit()
+        return user
+
+    @pytest.mark.parametrize("field,value", [("is_active", False), ("role", "manager"), ("password_hash", "h2")])
+    def test_commit_invalidates(self, db, field, value):
+        """Тест: деактивация, смена роли и пароля сбрасывают кэш после коммита"""
+        user = self._user(db)
+        cache, invalidator = self._cached()
+        try:
+            cache.set("ivan", _principal(id=user.id))
+            setattr(user, field, value)
+            db.flush()
+            assert cache.get("ivan") is not None  # до коммита изменения не видны
+            db.commit()
+            assert cache.get("ivan") is None
+        finally:
+            invalidator.unregister()
+
+    def test_last_login_does_not_invalidate(self, db):
+        """Тест: обновление времени входа не сбрасывает кэш"""
+        user = self._user(db)
+        cache, invalidator = self._cached()
+        try:
+            cache.set("ivan", _principal(id=user.id))
+            user.last_login = datetime(2025, 1, 1)
+            db.commit()
+            assert cache.get("ivan") is not None
+        finally:
+            invalidator.unregister()
+
+    def test_login_change_drops_old_subject(self, db):
+        """Тест: смена логина сбрасывает запись старого sub"""
+        user = self._user(db)
+        cache, invalidator = self._cached()
+        try:
+            cache.set("ivan", _principal(id=user.id))
+            user.login = "ivan2"
+            db.commit()
+            assert cache.get("ivan") is None
+        finally:
+            invalidator.unregister()
+
+    def test_rollback_keeps_cache(self, db):
+        """Тест: откат не сбрасывает кэш"""
+        user = self._user(db)
+        cache, invalidator = self._cached()
+        try:
+            cache.set("ivan", _principal(id=user.id))
+            user.role = "admin"
+            db.flush()
+            db.rollback()
+            assert cache.get("ivan") is not None
+        finally:
+            invalidator.unregister()
+
+    def test_bulk_update_clears_cache(self, db):
+        """Тест: массовый UPDATE пользователей сбрасывает кэш целиком"""
+        from sqlalchemy import update
+        from core.database.models import User
+
+        self._user(db)
+        cache, invalidator = self._cached()
+        try:
+            cache.set("ivan", _principal())
+            db.execute(update(User).values(is_active=False))
+            db.commit()
+            assert not cache.entries
+        finally:
+            invalidator.unregister()
+
+
+class TestVerifyAuthorization:
+    """Тесты verify_authorization с кэшем"""
+
+    @pytest.mark.asyncio
+    async def test_steady_state_without_db(self):
+        """Тест: повторная проверка токена не обращается к БД"""
+        from backend.api.configuration import auth
+        from backend.api.configuration.principal_cache import PrincipalCache
+        from core.database.models import User
+
+        user = User(id=1, login="ivan", username="Ivan", email="i@x.io", password_hash="h", role="employee", is_active=True)
+        token = auth.create_access_token({"sub": "ivan"})
+
+        with patch.object(auth, "principal_cache", PrincipalCache(max_entries=10, ttl=60)), \
+                patch.object(auth, "orm_get_user_by_login", new=AsyncMock(return_value=user)) as lookup:
+            first = await auth.verify_authorization(token=token, session=MagicMock())
+            second = await auth.verify_authorization(token=token, session=MagicMock())
+
+        assert lookup.await_count == 1
+        assert first.id == second.id == 1
+        assert second.get("role") == "employee"
+
+    @pytest.mark.asyncio
+    async def test_inactive_user_rejected(self):
+        """Тест: неактивный пользователь получает 403"""
+        from fastapi import HTTPException
+        from backend.api.configuration import auth
+        from backend.api.configuration.principal_cache import PrincipalCache
+        from core.database.models import User
+
+        user = User(id=1, login="ivan", username="Ivan", email="i@x.io", password_hash="h", role="employee", is_active=False)
+        token = auth.create_access_token({"sub": "ivan"})
+
+        with patch.object(auth, "principal_cache", PrincipalCache(max_entries=10, ttl=60)), \
+                patch.object(auth, "orm_get_user_by_login", new=AsyncMock(return_value=user)):
+            with pytest.raises(HTTPException) as error:
+                await auth.verify_authorization(token=token, session=MagicMock())
+
+        assert error.value.status_code == 403
@@ -0,0 +1,171 @@
+"""
+Простые тесты сэмплирующего профайлера и монитора задержки цикла событий
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+
+def _busy_wait(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+class TestCollapse:
+    """Тесты формата collapsed stacks"""
+
+    def test_stack_from_root_to_leaf(self):
+        """Тест: кадры идут от корня к листу, строки - 'стек число' по убыванию"""
+        from collections import Counter
+        from backend.api.configuration.profiler import collapse_stack, render_collapsed
+
+        def leaf():
+            return collapse_stack(sys._getframe(), max_depth=2)
+
+        def middle():
+            return leaf()
+
+        assert middle() == f"{__name__}:middle;{__name__}:leaf"
+        assert render_collapsed(Counter({"a;b": 1, "a;c": 3})) == "a;c 3\na;b 1\n"
+
+
+class TestSamplingProfiler:
+    """Тесты профайлера"""
+
+    def test_samples_target_thread(self):
+        """Тест: сэмплируется только заданный поток, занятая функция видна в стеке"""
+        from backend.api.configuration.profiler import SamplingProfiler
+
+        stop = threading.Event()
+
+        def hot_loop():
+            while not stop.is_set():
+                pass
+
+        worker = threading.Thread(target=hot_loop)
+        worker.start()
+        profiler = SamplingProfiler(interval=0.002)
+        try:
+            profiler.start(worker.ident)
+            time.sleep(0.2)
+        finally:
+            profiler.stop()
+            stop.set()
+            worker.join()
+
+        stacks = profiler.collect(60)
+        assert profiler.samples > 10
+        assert stacks
+        assert all(f"{__name__}:hot_loop" in stack for stack in stacks)
+        assert not profiler.running
+
+    def test_window(self):
+        """Тест: выборка за окно берет только свежие секунды, буфер ограничен"""
+        from collections import Counter
+        from backend.api.configuration.profiler import SamplingProfiler
+
+        profiler = SamplingProfiler(window_seconds=3)
+        now = int(time.time())
+        for second in range(now - 10, now + 1):
+            profiler._buckets.append((second, Counter({f"s{second % 2}": 1})))
+
+        assert len(profiler._buckets) == 3
+        assert sum(profiler.collect(1).values()) == 2
+        assert sum(profiler.collect(60).values()) == 3
+
+    @pytest.mark.asyncio
+    async def test_capture_on_demand(self):
+        """Тест: снимок по запросу профилирует блокирующий код цикла и останавливает поток"""
+        from backend.api.configuration.profiler import SamplingProfiler
+
+        profiler = SamplingProfiler(interval=0.002)
+
+        async def blocker():
+            await asyncio.sleep(0.05)
+            _busy_wait(0.3)
+
+        task = asyncio.create_task(blocker())
+        stacks = await profiler.capture(0.5)
+        await task
+
+        assert any(stack.endswith(f"{__name__}:_busy_wait") for stack in stacks)
+        assert not profiler.running
+        assert profiler.collect(60) == {}
+
+
+class TestLoopLagMonitor:
+    """Тесты монитора задержки"""
+
+    @pytest.mark.asyncio
+    async def test_blocking_task_reported(self, caplog):
+        """Тест: блокировка цикла записывается в лог с задачей и стеком блокирующего кода"""
+        from backend.api.configuration.profiler import LoopLagMonitor
+
+        monitor = LoopLagMonitor(threshold=0.05, interval=0.01)
+        monitor_task = asyncio.create_task(monitor.run())
+        await asyncio.sleep(0.05)
+
+        async def handler():
+            _busy_wait(0.3)
+
+        with caplog.at_level(logging.WARNING, logger="backend.api.configuration.profiler"):
+            await asyncio.create_task(handler(), name="slow-handler")
+            await asyncio.sleep(0.05)
+        monitor_task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await monitor_task
+
+        assert len(monitor.stalls) == 1
+        stall = monitor.stalls[0]
+        assert stall["task"] == "slow-handler"
+        assert stall["coroutine"].endswith("handler")
+        assert "_busy_wait" in "".join(stall["stack"])
+        assert monitor.max_lag >= 0.2
+        assert "Event loop blocked" in caplog.text and "slow-handler" in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_no_report_when_responsive(self):
+        """Тест: короткие задержки не считаются блокировкой"""
+        from backend.api.configuration.profiler import LoopLagMonitor
+
+        monitor = LoopLagMonitor(threshold=0.2, interval=0.01)
+        monitor_task = asyncio.create_task(monitor.run())
+        for _ in range(10):
+            _busy_wait(0.005)
+            await asyncio.sleep(0.01)
+        monitor_task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await monitor_task
+
+        assert monitor.checks > 0
+        assert monitor.snapshot()["stalls"] == []
+
+
+class TestEndpoint:
+    """Тесты эндпоинтов администратора"""
+
+    @pytest.mark.asyncio
+    async def test_profile_formats(self):
+        """Тест: профиль по запросу отдается текстом collapsed stacks и в JSON"""
+        from backend.api.routers.diagnostics.router import get_event_loop_stats, get_profile
+
+        admin = SimpleNamespace(login="admin")
+        response = await get_profile(seconds=1, format="collapsed", user=admin)
+        assert response.media_type == "text/plain"
+        assert response.headers["x-profile-mode"] == "on-demand"
+        assert int(response.headers["x-profile-samples"]) > 0
+        line = response.body.decode().splitlines()[0]
+        assert line.rsplit(" ", 1)[1].isdigit()
+
+        result = await get_profile(seconds=1, format="json", user=admin)
+        assert result["samples"] == sum(item["count"] for item in result["stacks"])
+
+        stats = await get_event_loop_stats(user=admin)
+        assert stats["profiler_running"] is False
+        assert "max_lag_ms" in stats
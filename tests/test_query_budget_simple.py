@@ -0,0 +1,241 @@
+"""
+Простые тесты бюджета SQL-запросов и поиска N+1
+"""
+import logging
+
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+
+pytestmark = pytest.mark.usefixtures("related_models")
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'budget.db'}")
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, owner_id INTEGER)"))
+        await conn.execute(text("INSERT INTO items (owner_id) VALUES (1), (2), (3), (4), (5), (6)"))
+    yield engine
+    await engine.dispose()
+
+
+async def _load_owners_one_by_one(engine, owners=6):
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT id FROM items"))
+        for owner_id in range(1, owners + 1):
+            await conn.execute(text("SELECT id FROM items WHERE owner_id = :owner"), {"owner": owner_id})
+
+
+class TestFingerprint:
+    """Тесты отпечатков запросов"""
+
+    def test_literals_and_params_replaced(self):
+        """Тест: запросы, различающиеся только значениями, имеют один отпечаток"""
+        from core.database.query_inspector import fingerprint
+
+        first = fingerprint("SELECT * FROM users WHERE id = 5 AND login = 'ivan'  -- comment")
+        second = fingerprint("SELECT *\n  FROM users WHERE id = 17 AND login = 'o''neil'")
+        assert first == second == "SELECT * FROM users WHERE id = ? AND login = ?"
+
+        assert fingerprint("SELECT a FROM t WHERE id = $1 AND b = %(b)s AND c = :c") == \
+            "SELECT a FROM t WHERE id = ? AND b = ? AND c = ?"
+        assert fingerprint("SELECT created_at::date, users_1.id FROM users AS users_1") == \
+            "SELECT created_at::date, users_1.id FROM users AS users_1"
+
+    def test_lists_collapsed(self):
+        """Тест: длина списков IN и VALUES не меняет отпечаток"""
+        from core.database.query_inspector import fingerprint
+
+        assert fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3)") == \
+            fingerprint("SELECT * FROM t WHERE id IN ($1)") == "SELECT * FROM t WHERE id IN (...)"
+        assert fingerprint("INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'y'), (3, 'z')") == \
+            "INSERT INTO t (a, b) VALUES (?, ?), ..."
+
+
+class TestRecorder:
+    """Тесты записи запросов"""
+
+    @pytest.mark.asyncio
+    async def test_counts_and_repeats(self, engine):
+        """Тест: запросы считаются по отпечаткам, повторы находятся"""
+        from core.database.query_inspector import record_queries
+
+        with record_queries() as outer:
+            await _load_owners_one_by_one(engine, owners=3)
+            with record_queries() as inner:
+                await _load_owners_one_by_one(engine, owners=3)
+
+        assert inner.count == 4
+        assert outer.count == 8
+        assert outer.repeated(threshold=5) == [("SELECT id FROM items WHERE owner_id = ?", 6)]
+        assert "8 SQL statements" in outer.report()
+
+    @pytest.mark.asyncio
+    async def test_not_recorded_outside_block(self, engine):
+        """Тест: вне блока запросы не записываются"""
+        from core.database.query_inspector import current_recorder, record_queries
+
+        with record_queries() as recorder:
+            pass
+        await _load_owners_one_by_one(engine, owners=1)
+
+        assert recorder.count == 0
+        assert current_recorder() is None
+
+
+class TestAssertMaxQueries:
+    """Тесты помощника для тестов"""
+
+    @pytest.mark.asyncio
+    async def test_budget(self, engine):
+        """Тест: превышение числа запросов - ошибка с отчетом"""
+        from core.database.query_inspector import QueryBudgetExceeded, assert_max_queries
+
+        with assert_max_queries(7):
+            await _load_owners_one_by_one(engine)
+
+        with pytest.raises(QueryBudgetExceeded) as exc:
+            with assert_max_queries(3):
+                await _load_owners_one_by_one(engine)
+        assert "7 SQL statements, budget is 3" in str(exc.value)
+        assert exc.value.recorder.count == 7
+
+    @pytest.mark.asyncio
+    async def test_repeats(self, engine):
+        """Тест: запрос в цикле находится даже в пределах общего бюджета"""
+        from core.database.query_inspector import QueryBudgetExceeded, assert_max_queries
+
+        with pytest.raises(QueryBudgetExceeded) as exc:
+            with assert_max_queries(100, max_repeats=2):
+                await _load_owners_one_by_one(engine)
+        assert "repeated 6 times" in str(exc.value)
+
+    @pytest.mark.asyncio
+    async def test_chat_unread_count_within_budget(self, tmp_path):
+        """Тест: непрочитанные по всем чатам считаются одним запросом, без запросов в цикле"""
+        from datetime import datetime
+        from core.database.models.chat_model import ChatMember, ChatMessage
+        from core.database.query_inspector import assert_max_queries
+        from backend.api.services.chat_service import ChatService
+
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'chat.db'}")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(
+                    lambda sync_conn: ChatMember.metadata.create_all(
+                        sync_conn, tables=[ChatMember.__table__, ChatMessage.__table__]
+                    )
+                )
+            async with AsyncSession(engine) as session:
+                read_marks = {1: None, 2: datetime(2024, 1, 2, 12), 3: datetime(2024, 1, 9), 4: None}
+                for chat_id, last_read_at in read_marks.items():
+                    session.add(ChatMember(id=chat_id, chat_id=chat_id, user_id=1,
+                                           joined_at=datetime(2024, 1, 1), last_read_at=last_read_at))
+                # Чужое членство не должно влиять на счетчики пользователя 1
+                session.add(ChatMember(id=5, chat_id=4, user_id=2, joined_at=datetime(2024, 1, 1)))
+                message_id = 0
+                for chat_id in (1, 2, 3):
+                    for day in (1, 2, 3):
+                        message_id += 1
+                        session.add(ChatMessage(id=message_id, chat_id=chat_id, sender_id=2, message_type="text",
+                                                content="hi", sent_at=datetime(2024, 1, day)))
+                session.add(ChatMessage(id=100, chat_id=1, sender_id=2, message_type="text", content="deleted",
+                                        is_deleted=True, sent_at=datetime(2024, 1, 4)))
+                await session.commit()
+
+                with assert_max_queries(1, max_repeats=1) as recorder:
+                    counts = await ChatService(session).get_unread_count(1)
+
+            assert counts == {1: 3, 2: 1}
+            assert recorder.count == 1
+        finally:
+            await engine.dispose()
+
+
+class TestMiddleware:
+    """Тесты middleware бюджета"""
+
+    def _app(self, engine, strict):
+        from backend.api.middleware.query_budget_middleware import query_budget, setup_query_budget_middleware
+
+        app = FastAPI()
+
+        @app.get("/owners")
+        async def owners():
+            await _load_owners_one_by_one(engine)
+            return {"ok": True}
+
+        @app.get("/owners/budgeted")
+        @query_budget(10, max_repeats=10)
+        async def owners_budgeted():
+            await _load_owners_one_by_one(engine)
+            return {"ok": True}
+
+        setup_query_budget_middleware(app, max_queries=5, max_repeats=3, strict=strict)
+        return app
+
+    @pytest.mark.asyncio
+    async def test_warning_and_header(self, engine, caplog):
+        """Тест: без строгого режима - предупреждение в логе и заголовок с числом запросов"""
+        app = self._app(engine, strict=False)
+        with caplog.at_level(logging.WARNING, logger="app_fastapi.query_budget"):
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+                response = await client.get("/owners")
+
+        assert response.status_code == 200
+        assert response.headers["x-query-count"] == "7"
+        assert "Query budget violated by GET /owners" in caplog.text
+        assert "repeated 6 times" in caplog.text
+
+    @pytest.mark.asyncio
+    async def test_strict_rejects(self, engine):
+        """Тест: в строгом режиме нарушение превращается в 500 с отчетом; бюджет маршрута учитывается"""
+        app = self._app(engine, strict=True)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            rejected = await client.get("/owners")
+            allowed = await client.get("/owners/budgeted")
+
+        assert rejected.status_code == 500
+        body = rejected.json()
+        assert body["route"] == "GET /owners"
+        assert body["statements"][0] == {"count": 6, "sql": "SELECT id FROM items WHERE owner_id = ?"}
+        assert allowed.status_code == 200
+        assert allowed.headers["x-query-count"] == "7"
+
+
+class TestQueryTiming:
+    """Тесты общего замера времени запросов"""
+
+    @pytest.mark.asyncio
+    async def test_single_timer_fans_out(self, engine):
+        """Тест: один обработчик движка раздает время всем подписчикам"""
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        from core.database import query_inspector, query_timing, slow_queries
+        from core.database.query_timing import add_query_observer, remove_query_observer
+
+        assert event.contains(Engine, "after_cursor_execute", query_timing._after_cursor_execute)
+        assert not hasattr(query_inspector, "_after_cursor_execute")
+        assert not hasattr(slow_queries, "_after_cursor_execute")
+        assert slow_queries._observe_query in query_timing.query_observers()
+
+        calls = []
+
+        def observer(conn, statement, parameters, context, executemany, seconds):
+            calls.append(seconds)
+
+        add_query_observer(observer)
+        add_query_observer(observer)
+        try:
+            with query_inspector.record_queries() as recorder:
+                async with engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+        finally:
+            remove_query_observer(observer)
+        assert len(calls) == 1 and calls[0] >= 0
+        assert recorder.count == 1
@@ -0,0 +1,193 @@
+"""
+Простые тесты ограничения частоты входа и регистрации
+"""
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+
+def _config(**overrides):
+    values = dict(
+        enabled=True,
+        redis_url="",
+        max_local_keys=1000,
+        trust_forwarded_for=False,
+        forwarded_for_trusted_hops=1,
+        login_per_ip="5/minute",
+        login_per_login="2/minute",
+        register_per_ip="1/hour",
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def _request(host="10.0.0.1", headers=None):
+    return SimpleNamespace(client=SimpleNamespace(host=host), headers=headers or {})
+
+
+class TestTokenBucket:
+    """Тесты корзины в памяти процесса"""
+
+    @pytest.mark.asyncio
+    async def test_capacity_and_refill(self):
+        """Тест: емкость корзины расходуется и восстанавливается со временем"""
+        from backend.api.configuration.rate_limiter import LocalTokenBucketStore
+
+        store = LocalTokenBucketStore()
+        with patch("backend.api.configuration.rate_limiter.time.monotonic", return_value=100.0):
+            assert await store.take("k", capacity=2, rate=1.0) == 0
+            assert await store.take("k", capacity=2, rate=1.0) == 0
+            assert await store.take("k", capacity=2, rate=1.0) == pytest.approx(1.0)
+
+        with patch("backend.api.configuration.rate_limiter.time.monotonic", return_value=101.5):
+            assert await store.take("k", capacity=2, rate=1.0) == 0
+            assert await store.take("k", capacity=2, rate=1.0) == pytest.approx(0.5)
+
+    @pytest.mark.asyncio
+    async def test_key_limit(self):
+        """Тест: число корзин ограничено, вытесняются давно не используемые"""
+        from backend.api.configuration.rate_limiter import LocalTokenBucketStore
+
+        store = LocalTokenBucketStore(max_keys=2)
+        for key in ("a", "b", "a", "c"):
+            await store.take(key, capacity=1, rate=1.0)
+
+        assert list(store.buckets) == ["a", "c"]
+
+    def test_policy_parse(self):
+        """Тест: разбор политики из настроек"""
+        from backend.api.configuration.rate_limiter import BucketPolicy
+
+        policy = BucketPolicy.parse("ip", "30/minute")
+        assert policy.capacity == 30
+        assert policy.rate == pytest.approx(0.5)
+        for value in ("abc", "10/week", "0/minute"):
+            with pytest.raises(ValueError):
+                BucketPolicy.parse("ip", value)
+
+
+class TestRateLimiter:
+    """Тесты политик маршрутов"""
+
+    @pytest.mark.asyncio
+    async def test_login_limited_by_login_across_ips(self):
+        """Тест: перебор паролей одного логина с разных IP ограничен"""
+        from backend.api.configuration.rate_limiter import RateLimiter, RateLimitExceeded
+
+        limiter = RateLimiter(_config())
+        await limiter.hit("login", ip="1.1.1.1", login="ivan")
+        await limiter.hit("login", ip="2.2.2.2", login="ivan")
+        with pytest.raises(RateLimitExceeded) as exc:
+            await limiter.hit("login", ip="3.3.3.3", login="ivan")
+
+        assert exc.value.scope == "login"
+        await limiter.hit("login", ip="3.3.3.3", login="petr")
+
+    @pytest.mark.asyncio
+    async def test_login_limited_by_ip(self):
+        """Тест: перебор логинов с одного IP ограничен"""
+        from backend.api.configuration.rate_limiter import RateLimiter, RateLimitExceeded
+
+        limiter = RateLimiter(_config())
+        for index in range(5):
+            await limiter.hit("login", ip="1.1.1.1", login=f"user{index}")
+        with pytest.raises(RateLimitExceeded) as exc:
+            await limiter.hit("login", ip="1.1.1.1", login="user9")
+
+        assert exc.value.scope == "ip"
+        assert limiter.stats["rejected:login:ip"] == 1
+
+    @pytest.mark.asyncio
+    async def test_disabled(self):
+        """Тест: отключенный лимитер пропускает все запросы"""
+        from backend.api.configuration.rate_limiter import RateLimiter
+
+        limiter = RateLimiter(_config(enabled=False))
+        for _ in range(10):
+            await limiter.hit("register", ip="1.1.1.1")
+
+    @pytest.mark.asyncio
+    async def test_shared_store_and_fallback(self):
+        """Тест: общее хранилище используется, при ошибке - корзины процесса"""
+        from backend.api.configuration.rate_limiter import RateLimiter, RateLimitExceeded
+
+        shared = SimpleNamespace(take=AsyncMock(return_value=0.0))
+        limiter = RateLimiter(_config(), shared_store=shared)
+        await limiter.hit("register", ip="1.1.1.1")
+        shared.take.assert_awaited_once_with("register:ip:1.1.1.1", 1, pytest.approx(1 / 3600))
+
+        shared.take = AsyncMock(side_effect=ConnectionError("redis down"))
+        await limiter.hit("register", ip="1.1.1.1")
+        with pytest.raises(RateLimitExceeded):
+            await limiter.hit("register", ip="1.1.1.1")
+        assert limiter.stats["shared_errors"] == 2
+
+    @pytest.mark.asyncio
+    async def test_check_raises_429(self):
+        """Тест: превышение - 429 с Retry-After, логин нормализуется"""
+        from fastapi import HTTPException
+        from backend.api.configuration.rate_limiter import RateLimiter
+
+        limiter = RateLimiter(_config())
+        await limiter.check("login", _request(), login="Ivan ")
+        await limiter.check("login", _request("10.0.0.2"), login="ivan")
+        with pytest.raises(HTTPException) as exc:
+            await limiter.check("login", _request("10.0.0.3"), login="IVAN")
+
+        assert exc.value.status_code == 429
+        assert int(exc.value.headers["Retry-After"]) >= 1
+
+    def test_client_ip(self):
+        """Тест: X-Forwarded-For учитывается только за доверенным прокси"""
+        from backend.api.configuration.rate_limiter import RateLimiter
+
+        request = _request("10.0.0.1", {"x-forwarded-for": "203.0.113.5"})
+        assert RateLimiter(_config()).client_ip(request) == "10.0.0.1"
+        assert RateLimiter(_config(trust_forwarded_for=True)).client_ip(request) == "203.0.113.5"
+
+    @pytest.mark.asyncio
+    async def test_spoofed_forwarded_for(self):
+        """Тест: поддельные записи X-Forwarded-For слева не дают обойти лимит по IP"""
+        from fastapi import HTTPException
+        from backend.api.configuration.rate_limiter import RateLimiter
+
+        limiter = RateLimiter(_config(trust_forwarded_for=True))
+        for n in range(5):
+            # Прокси дописывает настоящий адрес клиента справа
+            request = _request("10.0.0.1", {"x-forwarded-for": f"198.51.100.{n}, 203.0.113.5"})
+            assert limiter.client_ip(request) == "203.0.113.5"
+            await limiter.check("login", request)
+        with pytest.raises(HTTPException):
+            await limiter.check("login", _request("10.0.0.1", {"x-forwarded-for": "198.51.100.99, 203.0.113.5"}))
+
+        # Два доверенных прокси: адрес клиента - вторая запись справа
+        two_hops = RateLimiter(_config(trust_forwarded_for=True, forwarded_for_trusted_hops=2))
+        request = _request("10.0.0.2", {"x-forwarded-for": "198.51.100.1, 203.0.113.5, 10.0.0.3"})
+        assert two_hops.client_ip(request) == "203.0.113.5"
+
+
+class TestLoginEndpoint:
+    """Тесты: отказ до обращения к БД и хеширования"""
+
+    @pytest.mark.asyncio
+    async def test_login_rejected_before_db(self):
+        """Тест: при исчерпанной корзине обработчик не трогает БД и пул хеширования"""
+        from fastapi import HTTPException
+        from backend.api.configuration.rate_limiter import RateLimiter
+        from backend.api.routers.auth import router as auth_router
+
+        limiter = RateLimiter(_config(login_per_login="1/hour"))
+        session = AsyncMock()
+        form = SimpleNamespace(username="ivan", password="secret")
+        with patch.object(auth_router, "rate_limiter", limiter), \
+                patch.object(auth_router, "orm_get_user", AsyncMock(return_value=None)) as get_user, \
+                patch.object(auth_router.password_hasher, "verify_and_update", AsyncMock()) as verify:
+            with pytest.raises(HTTPException) as first:
+                await auth_router.login_for_access_token(_request(), form, session)
+            assert first.value.status_code == 401
+            with pytest.raises(HTTPException) as second:
+                await auth_router.login_for_access_token(_request(), form, session)
+
+        assert second.value.status_code == 429
+        assert get_user.await_count == 1
+        verify.assert_not_awaited()
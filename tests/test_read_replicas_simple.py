@@ -0,0 +1,246 @@
+"""
+Простые тесты маршрутизации чтения на реплики (две локальные БД)
+"""
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+
+from sqlalchemy import text
+
+
+pytestmark = pytest.mark.usefixtures("related_models")
+
+
+async def _zero_lag(conn):
+    return 0.0
+
+
+@pytest_asyncio.fixture
+async def databases(tmp_path):
+    """Основная БД и "реплика" - два отдельных файла SQLite с меткой источника"""
+    from core.database.engine import Database
+
+    primary_url = f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}"
+    replica_url = f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"
+    db = Database(
+        url=primary_url,
+        replica_urls=[replica_url],
+        max_replica_lag=5.0,
+        replica_check_interval=60.0,
+        read_your_writes_seconds=30.0,
+        lag_probe=_zero_lag,
+    )
+    for engine, name in ((db.engine, "primary"), (db.replicas[0].engine, "replica")):
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE source (name TEXT)"))
+            await conn.execute(text("INSERT INTO source VALUES (:name)"), {"name": name})
+    yield db
+    await db.dispose()
+
+
+async def _read_source(db):
+    async with db.read_session() as session:
+        return (await session.execute(text("SELECT name FROM source"))).scalar()
+
+
+class TestReadRouting:
+    """Тесты выбора БД для сессий чтения"""
+
+    @pytest.mark.asyncio
+    async def test_reads_go_to_healthy_replica(self, databases):
+        """Тест: после проверки отставания чтение идет в реплику"""
+        assert await _read_source(databases) == "primary"  # реплика еще не проверена
+
+        await databases.check_replicas()
+        assert await _read_source(databases) == "replica"
+        assert databases.read_stats["replica"] == 1
+        assert databases.read_stats["fallback_primary"] == 1
+
+    @pytest.mark.asyncio
+    async def test_lagging_replica_falls_back(self, databases):
+        """Тест: реплика с большим отставанием не используется"""
+        async def lagging(conn):
+            return 60.0
+
+        databases.lag_probe = lagging
+        status = await databases.check_replicas()
+
+        assert status[0]["healthy"] is False
+        assert status[0]["lag_seconds"] == 60.0
+        assert await _read_source(databases) == "primary"
+
+    @pytest.mark.asyncio
+    async def test_failed_check_falls_back(self, databases):
+        """Тест: недоступная реплика не используется"""
+        async def broken(conn):
+            raise ConnectionError("replica down")
+
+        databases.lag_probe = broken
+        status = await databases.check_replicas()
+
+        assert status[0]["error"] == "replica down"
+        assert await _read_source(databases) == "primary"
+
+    @pytest.mark.asyncio
+    async def test_stale_check_falls_back(self, databases):
+        """Тест: без свежей проверки (монитор остановлен) реплика не используется"""
+        await databases.check_replicas()
+        databases.replicas[0].checked_at -= databases.replica_check_interval * 4
+
+        assert await _read_source(databases) == "primary"
+
+    @pytest.mark.asyncio
+    async def test_read_session_is_read_only(self, databases):
+        """Тест: запись через сессию чтения запрещена"""
+        from core.database.models import Permission
+
+        async with databases.read_session() as session:
+            session.add(Permission(name="x", resource="task", action="read"))
+            with pytest.raises(RuntimeError):
+                await session.flush()
+
+    @pytest.mark.asyncio
+    async def test_without_replicas(self, tmp_path):
+        """Тест: без реплик все чтение идет в основную БД"""
+        from core.database.engine import Database
+
+        db = Database(url=f"sqlite+aiosqlite:///{tmp_path / 'single.db'}")
+        try:
+            assert db.choose_read_engine() is db.engine
+            assert await db.check_replicas() == []
+        finally:
+            await db.dispose()
+
+
+class TestReadYourWrites:
+    """Тесты окна read-your-writes"""
+
+    @pytest.mark.asyncio
+    async def test_commit_with_writes_pins_user_to_primary(self, databases):
+        """Тест: после записи пользователя его чтения идут в основную БД"""
+        from core.database.replicas import read_your_writes_key
+
+        await databases.check_replicas()
+        token = read_your_writes_key.set(7)
+        try:
+            async with databases.get_session() as session:
+                await session.execute(text("INSERT INTO source VALUES ('written')"))
+                await session.commit()
+            # Сырой SQL не проходит через flush - окно открывается явно
+            assert await _read_source(databases) == "replica"
+
+            databases.mark_write()
+            assert await _read_source(databases) == "primary"
+            assert databases.read_stats["sticky_primary"] == 1
+        finally:
+            read_your_writes_key.reset(token)
+
+        # Другой пользователь продолжает читать из реплики
+        token = read_your_writes_key.set(8)
+        try:
+            assert await _read_source(databases) == "replica"
+        finally:
+            read_your_writes_key.reset(token)
+
+    @pytest.mark.asyncio
+    async def test_orm_flush_opens_window(self, databases):
+        """Тест: коммит ORM-изменений открывает окно автоматически, откат - нет"""
+        from sqlalchemy import Column, Integer, MetaData, String, Table
+        from sqlalchemy.orm import registry
+        from core.database.replicas import read_your_writes_key
+
+        metadata = MetaData()
+        notes = Table("notes", metadata, Column("id", Integer, primary_key=True), Column("body", String))
+
+        class Note:
+            pass
+
+        registry().map_imperatively(Note, notes)
+        async with databases.engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+
+        await databases.check_replicas()
+        token = read_your_writes_key.set(9)
+        try:
+            async with databases.get_session() as session:
+                note = Note()
+                note.body = "draft"
+                session.add(note)
+                await session.flush()
+                await session.rollback()
+            assert not databases.sticky.is_sticky(9)
+
+            async with databases.get_session() as session:
+                note = Note()
+                note.body = "saved"
+                session.add(note)
+                await session.commit()
+            assert databases.sticky.is_sticky(9)
+            assert await _read_source(databases) == "primary"
+        finally:
+            read_your_writes_key.reset(token)
+
+    def test_window_expires(self):
+        """Тест: окно закрывается по истечении времени"""
+        from core.database.replicas import StickyWindows
+
+        windows = StickyWindows(seconds=10)
+        with patch("core.database.replicas.time.monotonic", return_value=100.0):
+            windows.mark("u1")
+            assert windows.is_sticky("u1")
+        with patch("core.database.replicas.time.monotonic", return_value=111.0):
+            assert not windows.is_sticky("u1")
+            assert "u1" not in windows.until
+
+    @pytest.mark.asyncio
+    async def test_windows_shared_between_processes(self):
+        """Тест: окно, открытое в одном процессе, подгружается другим через общее хранилище"""
+        import asyncio
+        from core.database.replicas import StickyWindows
+
+        class MemoryStore:
+            def __init__(self):
+                self.windows = {}
+
+            async def mark(self, key, seconds):
+                self.windows[key] = seconds
+
+            async def remaining(self, key):
+                return self.windows.get(key, 0.0)
+
+        store = MemoryStore()
+        writer, reader = StickyWindows(10.0, shared_store=store), StickyWindows(10.0, shared_store=store)
+        writer.mark(5)
+        await asyncio.sleep(0)
+        assert not reader.is_sticky(5)
+
+        await reader.load(5)
+        await reader.load(6)
+        assert reader.is_sticky(5)
+        assert not reader.is_sticky(6)
+
+    @pytest.mark.asyncio
+    async def test_shared_store_errors_ignored(self):
+        """Тест: недоступное хранилище не ломает запрос - окна остаются локальными"""
+        import asyncio
+        from unittest.mock import AsyncMock, MagicMock
+        from core.database.replicas import StickyWindows
+
+        store = MagicMock(mark=AsyncMock(side_effect=ConnectionError), remaining=AsyncMock(side_effect=ConnectionError))
+        windows = StickyWindows(10.0, shared_store=store)
+        windows.mark(1)
+        await asyncio.sleep(0)
+        await windows.load(2)
+        assert windows.is_sticky(1)
+        assert not windows.is_sticky(2)
+
+    @pytest.mark.asyncio
+    async def test_start_read_your_writes(self, databases):
+        """Тест: ключ запроса выставляется, окно подгружается из общего хранилища"""
+        from unittest.mock import AsyncMock
+        from core.database.replicas import read_your_writes_key
+
+        with patch.object(databases.sticky, "load", AsyncMock()) as load:
+            await databases.start_read_your_writes(3)
+        assert read_your_writes_key.get() == 3
+        load.assert_awaited_once_with(3)
@@ -0,0 +1,251 @@
+"""
+Простые тесты кэша отчетов
+"""
+import asyncio
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+class TestReportCacheKeys:
+    """Тесты ключей и тегов кэша"""
+
+    def test_key_is_stable(self):
+        """Тест: ключ не зависит от порядка параметров и None-значений"""
+        from backend.api.services.report_cache import make_cache_key
+        from backend.api.services.reports_service import ReportType
+
+        first = make_cache_key(ReportType.TASK_SUMMARY, {
+            "department_id": 3, "start_date": datetime(2025, 1, 1), "user_id": None
+        })
+        second = make_cache_key("task_summary", {
+            "start_date": datetime(2025, 1, 1), "department_id": 3
+        })
+
+        assert first == second
+        assert first.startswith("report:task_summary:")
+
+    def test_key_differs_by_params(self):
+        """Тест: разные параметры - разные ключи"""
+        from backend.api.services.report_cache import make_cache_key
+
+        assert make_cache_key("performance", {"department_id": 1}) != make_cache_key("performance", {"department_id": 2})
+        assert make_cache_key("performance", {"department_id": 1}) != make_cache_key("task_summary", {"department_id": 1})
+
+    def test_list_order_ignored(self):
+        """Тест: порядок значений фильтра не влияет на ключ"""
+        from backend.api.services.report_cache import make_cache_key
+        from core.database.models.task_model import TaskStatus
+
+        assert make_cache_key("task_summary", {"status_filter": [TaskStatus.REVIEW, TaskStatus.CREATED]}) == \
+            make_cache_key("task_summary", {"status_filter": ["created", "review"]})
+
+    def test_report_tags(self):
+        """Тест тегов отчета по фильтрам"""
+        from backend.api.services.report_cache import report_tags
+
+        assert report_tags({}) == ["global"]
+        assert report_tags({"organization_id": 1, "department_id": 2}) == ["department:2"]
+        assert report_tags({"user_id": 5, "department_id": 2}) == ["user:5"]
+        assert report_tags({"task_id": 9, "user_id": 5}) == ["task:9"]
+
+    def test_write_tags(self):
+        """Тест тегов изменения задачи и записи времени"""
+        from backend.api.services.report_cache import task_tags, time_log_tags
+
+        assert task_tags({"id": 1, "owner_id": 2, "executor_id": 3, "department_id": 4, "organization_id": 5}) == {
+            "global", "task:1", "user:2", "user:3", "department:4", "organization:5"
+        }
+        assert time_log_tags({"task_id": 1, "user_id": 2}) == {"global", "task:1", "user:2"}
+
+    def test_serialization_roundtrip(self):
+        """Тест сериализации отчета для общего уровня"""
+        from backend.api.services.report_cache import dumps, loads
+        from backend.api.services.reports_service import ReportType
+
+        value = {"report_type": ReportType.PERFORMANCE, "generated_at": datetime(2025, 1, 2, 3, 4, 5)}
+        restored = loads(dumps(value))
+
+        assert restored["report_type"] == ReportType.PERFORMANCE
+        assert restored["generated_at"] == datetime(2025, 1, 2, 3, 4, 5)
+
+
+class TestReportCache:
+    """Тесты локального уровня кэша"""
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction(self):
+        """Тест вытеснения самых старых записей"""
+        from backend.api.services.report_cache import ReportCache
+
+        cache = ReportCache(max_entries=2, ttl=60)
+        await cache.set("a", 1, {})
+        await cache.set("b", 2, {})
+        assert await cache.get("a") == 1  # a становится самой свежей
+        await cache.set("c", 3, {})
+
+        assert list(cache.entries) == ["a", "c"]
+        assert cache.stats["evictions"] == 1
+
+    @pytest.mark.asyncio
+    async def test_ttl_expiry(self):
+        """Тест истечения TTL"""
+        from backend.api.services.report_cache import ReportCache
+
+        cache = ReportCache(max_entries=2, ttl=0)
+        await cache.set("a", 1, {})
+
+        assert await cache.get("a") is None
+        assert "a" not in cache.entries
+
+    @pytest.mark.asyncio
+    async def test_tag_invalidation(self):
+        """Тест инвалидации по тегам"""
+        from backend.api.services.report_cache import ReportCache
+
+        cache = ReportCache(max_entries=10, ttl=60)
+        await cache.get_or_compute("dept", AsyncMock(return_value={"n": 1}), tags=["department:3"])
+        await cache.get_or_compute("user", AsyncMock(return_value={"n": 2}), tags=["user:7"])
+
+        await cache.invalidate_tags(["department:3", "global"])
+
+        assert await cache.get("dept") is None
+        assert await cache.get("user") == {"n": 2}
+
+    @pytest.mark.asyncio
+    async def test_clear_invalidates_everything(self):
+        """Тест полной очистки"""
+        from backend.api.services.report_cache import ReportCache
+
+        cache = ReportCache(max_entries=10, ttl=60)
+        await cache.get_or_compute("a", AsyncMock(return_value={"n": 1}))
+        cache.clear()
+
+        assert len(cache.entries) == 0
+        assert await cache.get("a") is None
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_coalesced(self):
+        """Тест: одинаковые конкурентные запросы считаются один раз"""
+        from backend.api.services.report_cache import ReportCache
+
+        cache = ReportCache(max_entries=10, ttl=60)
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return {"value": 42}
+
+        results = await asyncio.gather(*[cache.get_or_compute("key", compute) for _ in range(5)])
+
+        assert calls == 1
+        assert all(result == {"value": 42} for result in results)
+        assert cache.stats["coalesced"] == 4
+
+    @pytest.mark.asyncio
+    async def test_failed_computation_not_shared(self):
+        """Тест: ошибка лидера не отдается ожидающим, они считают сами"""
+        from backend.api.services.report_cache import ReportCache
+
+        cache = ReportCache(max_entries=10, ttl=60)
+        started = asyncio.Event()
+
+        async def failing():
+            started.set()
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        async def follower():
+            await started.wait()
+            return await cache.get_or_compute("key", AsyncMock(return_value={"ok": True}))
+
+        leader, result = await asyncio.gather(
+            cache.get_or_compute("key", failing), follower(), return_exceptions=True
+        )
+
+        assert isinstance(leader, RuntimeError)
+        assert result == {"ok": True}
+
+    @pytest.mark.asyncio
+    async def test_invalidation_during_computation(self):
+        """Тест: запись во время расчета делает результат устаревшим"""
+        from backend.api.services.report_cache import ReportCache
+
+        cache = ReportCache(max_entries=10, ttl=60)
+
+        async def compute():
+            await cache.invalidate_tags(["global"])
+            return {"stale": True}
+
+        await cache.get_or_compute("key", compute, tags=["global"])
+        assert await cache.get("key") is None
+
+    @pytest.mark.asyncio
+    async def test_nowait_invalidation_task_kept(self):
+        """Тест: фоновая инвалидация общего кэша держится до завершения"""
+        from backend.api.services.report_cache import ReportCache
+
+        cache = ReportCache(max_entries=10, ttl=60, redis_url="redis://cache.test")
+        with patch.object(cache, "invalidate_tags", new=AsyncMock()) as invalidate:
+            cache.invalidate_tags_nowait(["global"])
+            assert len(cache._tasks) == 1
+            await asyncio.gather(*cache._tasks)
+            await asyncio.sleep(0)
+
+        invalidate.assert_awaited_once_with({"global"})
+        assert not cache._tasks
+
+
+class TestReportCacheInvalidator:
+    """Тесты инвалидации после коммита"""
+
+    def test_commit_invalidates_collected_tags(self):
+        """Тест: теги инвалидируются только после коммита"""
+        from backend.api.services.report_cache import ReportCache, ReportCacheInvalidator
+
+        cache = ReportCache(max_entries=10, ttl=60)
+        invalidator = ReportCacheInvalidator(cache)
+        session = MagicMock()
+        session.info = {"report_cache_tags": {"global", "user:1"}}
+
+        invalidator._after_commit(session)
+
+        assert cache._tag_versions["global"] == 1
+        assert cache._tag_versions["user:1"] == 1
+        assert "report_cache_tags" not in session.info
+
+    def test_rollback_discards_tags(self):
+        """Тест: откат транзакции не инвалидирует кэш"""
+        from backend.api.services.report_cache import ReportCache, ReportCacheInvalidator
+
+        cache = ReportCache(max_entries=10, ttl=60)
+        invalidator = ReportCacheInvalidator(cache)
+        session = MagicMock()
+        session.info = {"report_cache_tags": {"global"}}
+
+        invalidator._after_rollback(session)
+        invalidator._after_commit(session)
+
+        assert cache._tag_versions["global"] == 0
+
+
+class TestReportGeneratorCache:
+    """Тесты генератора отчетов с новым кэшем"""
+
+    @pytest.mark.asyncio
+    async def test_generator_uses_cache(self):
+        """Тест: повторный запрос отчета берется из кэша"""
+        from backend.api.services.reports_service import ReportGenerator, ReportType
+
+        generator = ReportGenerator()
+        with patch(
+            "backend.api.services.reports_service.ReportsService.generate_task_summary_report",
+            new=AsyncMock(return_value={"summary": {"total_tasks": 3}})
+        ) as generate:
+            first = await generator.get_or_generate_report(MagicMock(), ReportType.TASK_SUMMARY, department_id=1)
+            second = await generator.get_or_generate_report(MagicMock(), ReportType.TASK_SUMMARY, department_id=1)
+
+        assert first == second
+        assert generate.await_count == 1
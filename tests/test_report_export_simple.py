@@ -0,0 +1,250 @@
+"""
+Простые тесты потокового экспорта отчетов
+"""
+import io
+import json
+import re
+import zipfile
+import pytest
+from datetime import datetime
+from xml.etree import ElementTree
+
+
+COLUMNS = ["ID", "Name", "Created", "Hours"]
+
+
+def _rows(count):
+    return [[i, f"Задача <{i}> & co", datetime(2025, 1, 1, 9, 30), i * 0.5] for i in range(count)]
+
+
+def _render_in_batches(writer, rows, batch_size=100):
+    chunks = [writer.begin(COLUMNS)]
+    for index in range(0, len(rows), batch_size):
+        chunks.append(writer.write_rows(rows[index:index + batch_size]))
+    chunks.append(writer.finish())
+    return chunks
+
+
+def _pdf_text(data):
+    """Текст страниц PDF: строки Tj, глифы переводятся обратно через ToUnicode"""
+    import zlib
+
+    streams = re.findall(rb"stream\n(.*?)\nendstream", data, re.S)
+    to_unicode = {}
+    for stream in streams:
+        try:
+            stream = zlib.decompress(stream)
+        except zlib.error:
+            continue
+        if b"beginbfchar" in stream:
+            for glyph, code in re.findall(rb"<([0-9A-F]{4})> <([0-9A-F]{4})>", stream):
+                to_unicode[glyph.decode()] = chr(int(code, 16))
+    lines = []
+    for operand in re.findall(rb"(<[0-9A-F]*>|\((?:[^\\)]|\\.)*\)) Tj", data):
+        if operand.startswith(b"<"):
+            hex_text = operand[1:-1].decode()
+            lines.append("".join(to_unicode.get(hex_text[i:i + 4], "?") for i in range(0, len(hex_text), 4)))
+        else:
+            lines.append(re.sub(rb"\\(.)", rb"\1", operand[1:-1]).decode("latin-1"))
+    return "\n".join(lines)
+
+
+class TestStreamWriters:
+    """Тесты потоковых писателей"""
+
+    def test_csv_writer(self):
+        """Тест CSV: заголовок и строки приходят отдельными частями"""
+        from backend.api.services.report_export_service import CSVStreamWriter
+
+        chunks = _render_in_batches(CSVStreamWriter(), _rows(250))
+        text = b"".join(chunks).decode("utf-8")
+        lines = text.strip().splitlines()
+
+        assert chunks[0].startswith(b"ID,Name,Created,Hours")
+        assert len(lines) == 251
+        assert lines[1] == '0,Задача <0> & co,2025-01-01 09:30:00,0.0'
+
+    def test_json_writer(self):
+        """Тест JSON-массива"""
+        from backend.api.services.report_export_service import JSONStreamWriter
+
+        data = json.loads(b"".join(_render_in_batches(JSONStreamWriter(), _rows(250))))
+
+        assert len(data) == 250
+        assert data[3] == {"ID": 3, "Name": "Задача <3> & co", "Created": "2025-01-01 09:30:00", "Hours": 1.5}
+
+    def test_json_writer_empty(self):
+        """Тест пустого JSON-массива"""
+        from backend.api.services.report_export_service import JSONStreamWriter
+
+        assert json.loads(b"".join(_render_in_batches(JSONStreamWriter(), []))) == []
+
+    def test_xlsx_writer(self):
+        """Тест XLSX: корректный ZIP с листом и всеми строками"""
+        from backend.api.services.report_export_service import XLSXStreamWriter
+
+        data = b"".join(_render_in_batches(XLSXStreamWriter(sheet_name="Time"), _rows(250)))
+
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.testzip() is None
+            names = set(archive.namelist())
+            assert {"[Content_Types].xml", "_rels/.rels", "xl/workbook.xml", "xl/worksheets/sheet1.xml"} <= names
+            sheet = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+
+        namespace = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        rows = sheet.findall("s:sheetData/s:row", namespace)
+        assert len(rows) == 251
+        assert rows[1].find("s:c[@r='B2']/s:is/s:t", namespace).text == "Задача <0> & co"
+        assert rows[2].find("s:c[@r='D3']/s:v", namespace).text == "0.5"
+
+    def test_xlsx_column_names(self):
+        """Тест имен колонок Excel"""
+        from backend.api.services.report_export_service import _xlsx_column_name
+
+        assert _xlsx_column_name(0) == "A"
+        assert _xlsx_column_name(25) == "Z"
+        assert _xlsx_column_name(26) == "AA"
+        assert _xlsx_column_name(701) == "ZZ"
+
+    def test_pdf_writer(self):
+        """Тест PDF: страницы пишутся по мере заполнения, xref указывает на объекты"""
+        from backend.api.services.report_export_service import PDFStreamWriter
+
+        chunks = _render_in_batches(PDFStreamWriter(title="Tasks"), _rows(250))
+        data = b"".join(chunks)
+
+        assert data.startswith(b"%PDF-1.4")
+        assert data.rstrip().endswith(b"%%EOF")
+        assert any(b"/Type /Page " in chunk for chunk in chunks[1:-1])
+
+        startxref = int(re.search(rb"startxref\n(\d+)", data).group(1))
+        assert data[startxref:startxref + 4] == b"xref"
+        entries = re.findall(rb"(\d{10}) 00000 n", data[startxref:])
+        for object_id, offset in enumerate(entries, start=1):
+            assert data[int(offset):].startswith(f"{object_id} 0 obj".encode())
+
+        pages = re.search(rb"/Count (\d+)", data)
+        assert int(pages.group(1)) == data.count(b"/Type /Page ")
+
+    def test_pdf_writer_empty(self):
+        """Тест PDF без строк - одна пустая страница"""
+        from backend.api.services.report_export_service import PDFStreamWriter
+
+        data = b"".join(_render_in_batches(PDFStreamWriter(), []))
+        assert b"/Count 1" in data
+
+    def test_pdf_writer_embeds_cyrillic_font(self):
+        """Тест PDF: кириллица набирается встроенным шрифтом, а не заменяется на "?" """
+        import zlib
+        from backend.api.services.report_export_service import PDFStreamWriter, load_pdf_font
+
+        font = load_pdf_font()
+        if font is None:
+            pytest.skip("Шрифт DejaVu не установлен")
+        data = b"".join(_render_in_batches(PDFStreamWriter(title="Отчет"), _rows(3)))
+
+        assert b"/Subtype /Type0" in data and b"/FontFile2" in data and b"/Identity-H" in data
+        glyphs = "".join(f"{font.cmap[ord(char)]:04X}" for char in "Отчет")
+        assert f"<{glyphs}>".encode() in data
+        to_unicode = re.findall(rb"stream\n(.*?)\nendstream", data, re.S)[-1]
+        assert f"<{font.cmap[ord('З')]:04X}> <0417>".encode() in zlib.decompress(to_unicode)
+        assert "Отчет" in _pdf_text(data) and "Задача <1> & co" in _pdf_text(data)
+
+    def test_pdf_writer_without_font(self):
+        """Тест PDF без шрифта с кириллицей - прежний вывод Helvetica"""
+        from unittest.mock import patch
+        from backend.api.services.report_export_service import PDFStreamWriter
+
+        with patch("backend.api.services.report_export_service.load_pdf_font", return_value=None):
+            data = b"".join(_render_in_batches(PDFStreamWriter(title="Отчет"), _rows(3)))
+        assert b"/BaseFont /Helvetica" in data
+        assert b"(?????) Tj" in data
+
+    def test_get_stream_writer(self):
+        """Тест выбора писателя по формату"""
+        from backend.api.services.report_export_service import (
+            get_stream_writer, CSVStreamWriter, XLSXStreamWriter, PDFStreamWriter
+        )
+        from backend.api.services.reports_service import ExportFormat
+
+        assert isinstance(get_stream_writer(ExportFormat.CSV), CSVStreamWriter)
+        assert isinstance(get_stream_writer(ExportFormat.EXCEL), XLSXStreamWriter)
+        assert isinstance(get_stream_writer("pdf"), PDFStreamWriter)
+        with pytest.raises(ValueError):
+            get_stream_writer("docx")
+
+    def test_incomplete_writer_rejected(self):
+        """Тест: писатель без одного из методов не создается"""
+        from backend.api.services.report_export_service import StreamWriter
+
+        class HeaderOnlyWriter(StreamWriter):
+            def begin(self, columns):
+                return b""
+
+            def write_rows(self, rows):
+                return b""
+
+        with pytest.raises(TypeError):
+            HeaderOnlyWriter()
+
+
+@pytest.mark.usefixtures("related_models")
+class TestExportDatasets:
+    """Тесты наборов данных для выгрузки"""
+
+    def test_datasets_registered(self):
+        """Тест зарегистрированных наборов"""
+        from backend.api.services.report_export_service import EXPORT_DATASETS
+
+        assert set(EXPORT_DATASETS) == {"time_logs", "tasks"}
+
+    def test_time_logs_query_filters(self):
+        """Тест фильтров запроса учета времени"""
+        from backend.api.services.report_export_service import EXPORT_DATASETS
+
+        query = EXPORT_DATASETS["time_logs"].build_query(user_id=5, start_date=datetime(2025, 1, 1))
+        sql = str(query)
+
+        assert "task_time_logs.user_id = :user_id_1" in sql
+        assert "task_time_logs.start_time >= :start_time_1" in sql
+        assert len(query.selected_columns) == len(EXPORT_DATASETS["time_logs"].columns)
+
+    def test_tasks_query_columns(self):
+        """Тест количества колонок задач"""
+        from backend.api.services.report_export_service import EXPORT_DATASETS
+
+        dataset = EXPORT_DATASETS["tasks"]
+        assert len(dataset.build_query().selected_columns) == len(dataset.columns)
+
+
+class TestReportsServiceExport:
+    """Тесты экспорта готовых отчетов"""
+
+    @pytest.mark.asyncio
+    async def test_excel_export_is_xlsx(self):
+        """Тест: экспорт в Excel больше не заглушка"""
+        from unittest.mock import MagicMock
+        from backend.api.services.reports_service import ReportsService, ReportType
+
+        report = {
+            "report_type": ReportType.TIME_TRACKING,
+            "time_by_user": [
+                {"user_id": 1, "username": "ivan", "total_hours": 3.5, "entries_count": 2, "avg_hours_per_entry": 1.75}
+            ]
+        }
+        data = await ReportsService(MagicMock())._export_to_excel(report)
+
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert b"ivan" in archive.read("xl/worksheets/sheet1.xml")
+
+    @pytest.mark.asyncio
+    async def test_pdf_export_is_pdf(self):
+        """Тест: экспорт в PDF больше не заглушка"""
+        from unittest.mock import MagicMock
+        from backend.api.services.reports_service import ReportsService, ReportType
+
+        report = {"report_type": ReportType.TASK_SUMMARY, "status_breakdown": {"created": {"count": 2, "percentage": 100.0}}}
+        data = await ReportsService(MagicMock())._export_to_pdf(report)
+
+        assert data.startswith(b"%PDF")
+        assert "Status: created" in _pdf_text(data)
@@ -0,0 +1,332 @@
+"""
+Простые тесты фоновых заданий отчетов
+"""
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+pytestmark = pytest.mark.usefixtures("related_models")
+
+
+def _job(**overrides):
+    from core.database.models.report_model import ReportJob
+
+    values = dict(
+        id=1, job_uuid="job-1", user_id=7, report_type=None, dataset="time_logs", format_type="csv",
+        params={"user_id": 7}, status="queued", progress=0, progress_message="Queued",
+        created_at=datetime(2025, 1, 1, 12, 0)
+    )
+    values.update(overrides)
+    return ReportJob(**values)
+
+
+class TestReportJobModel:
+    """Тесты модели задания"""
+
+    def test_model_registered(self):
+        """Тест регистрации модели в пакете моделей"""
+        from core.database.models import ReportJob, ReportJobStatus
+
+        assert ReportJob.__tablename__ == "report_jobs"
+        assert ReportJobStatus.QUEUED == "queued"
+        assert ReportJob.__table__.c.job_uuid.unique
+
+    def test_job_to_dict(self):
+        """Тест представления задания для API"""
+        from backend.api.services.report_job_service import job_to_dict
+
+        data = job_to_dict(_job())
+        assert data["job_id"] == "job-1"
+        assert data["status"] == "queued"
+        assert data["download_ready"] is False
+        assert data["created_at"] == "2025-01-01T12:00:00"
+
+        completed = job_to_dict(_job(status="completed", artifact_path="/tmp/report.csv"))
+        assert completed["download_ready"] is True
+
+    def test_decode_params(self):
+        """Тест восстановления типов фильтров из JSON"""
+        from backend.api.services.report_job_service import decode_job_params
+        from core.database.models.task_model import TaskStatus
+
+        params = decode_job_params({"start_date": "2025-01-01T00:00:00", "status_filter": ["completed"], "user_id": 3})
+        assert params["start_date"] == datetime(2025, 1, 1)
+        assert params["status_filter"] == [TaskStatus.COMPLETED]
+        assert params["user_id"] == 3
+
+
+class TestReportJobService:
+    """Тесты постановки заданий в очередь"""
+
+    @pytest.mark.asyncio
+    async def test_requires_report_type_or_dataset(self):
+        """Тест: нужен ровно один источник данных"""
+        from backend.api.services.report_job_service import ReportJobService
+        from backend.api.services.reports_service import ReportType
+
+        service = ReportJobService(AsyncMock())
+        with pytest.raises(ValueError):
+            await service.submit_job(1, "csv")
+        with pytest.raises(ValueError):
+            await service.submit_job(1, "csv", report_type=ReportType.PERFORMANCE, dataset="tasks")
+        with pytest.raises(ValueError):
+            await service.submit_job(1, "csv", dataset="unknown")
+        with pytest.raises(ValueError):
+            await service.submit_job(1, "docx", dataset="tasks")
+
+    @pytest.mark.asyncio
+    async def test_active_jobs_limit(self):
+        """Тест ограничения числа активных заданий пользователя"""
+        from backend.api.services.report_job_service import ReportJobService, ReportJobLimitError
+        from core.settings import settings
+
+        session = AsyncMock()
+        session.scalar.return_value = settings.reports.jobs_max_active_per_user
+        with pytest.raises(ReportJobLimitError):
+            await ReportJobService(session).submit_job(1, "csv", dataset="tasks")
+        session.add.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_submit_publishes_to_queue(self):
+        """Тест: задание сохраняется и публикуется в очередь без TTL"""
+        from backend.api.services.report_job_service import ReportJobService, REPORT_JOB_QUEUE_ARGUMENTS
+
+        session = AsyncMock()
+        session.add = MagicMock()
+        session.scalar.return_value = 0
+        with patch("backend.api.services.report_job_service.rabbit.send_message", new=AsyncMock()) as send:
+            job = await ReportJobService(session).submit_job(7, "excel", dataset="tasks", params={"department_id": 2})
+
+        assert job.status == "queued"
+        assert job.format_type == "excel"
+        session.commit.assert_awaited()
+        queue, message = send.await_args.args
+        assert message == {"job_uuid": job.job_uuid}
+        assert send.await_args.kwargs["arguments"] == REPORT_JOB_QUEUE_ARGUMENTS
+        assert "x-message-ttl" not in REPORT_JOB_QUEUE_ARGUMENTS
+
+    @pytest.mark.asyncio
+    async def test_submit_marks_failed_when_queue_unavailable(self):
+        """Тест: задание не остается в очереди навсегда, если брокер недоступен"""
+        from backend.api.services.report_job_service import ReportJobService
+
+        session = AsyncMock()
+        session.add = MagicMock()
+        session.scalar.return_value = 0
+        with patch(
+            "backend.api.services.report_job_service.rabbit.send_message",
+            new=AsyncMock(side_effect=ConnectionError("down"))
+        ):
+            with pytest.raises(ConnectionError):
+                await ReportJobService(session).submit_job(7, "csv", dataset="tasks")
+
+        job = session.add.call_args.args[0]
+        assert job.status == "failed"
+
+
+class TestReportJobProgress:
+    """Тесты прогресса и отмены"""
+
+    @pytest.mark.asyncio
+    async def test_progress_throttled(self):
+        """Тест: частые обновления прогресса не пишутся в БД"""
+        from backend.api.services.report_job_service import ReportJobProgress
+
+        session = AsyncMock()
+        session.scalar.return_value = "running"
+        job = _job(status="running")
+        progress = ReportJobProgress(session, job, interval=60)
+        with patch("backend.api.services.report_job_service.publish_job_event", new=AsyncMock()) as publish:
+            await progress.update(10, "first")
+            await progress.update(20, "second")
+            await progress.update(30, "forced", force=True)
+
+        assert publish.await_count == 2
+        assert job.progress == 30
+
+    @pytest.mark.asyncio
+    async def test_cancelled_job_interrupted(self):
+        """Тест: отмененное задание прерывается на обновлении прогресса"""
+        from backend.api.services.report_job_service import ReportJobProgress, ReportJobCancelled
+
+        session = AsyncMock()
+        session.scalar.return_value = "cancelled"
+        with pytest.raises(ReportJobCancelled):
+            await ReportJobProgress(session, _job(status="running"), interval=0).update(50)
+
+    @pytest.mark.asyncio
+    async def test_cancel_after_last_progress_check(self, tmp_path):
+        """Тест: отмена после последней проверки прогресса не перезаписывается завершением"""
+        from contextlib import asynccontextmanager
+        from types import SimpleNamespace
+        from backend.api.services.report_job_service import ReportJobWorker
+
+        job = _job()
+        session = AsyncMock()
+        session.scalar.side_effect = [job, "cancelled"]
+
+        @asynccontextmanager
+        async def get_session():
+            yield session
+
+        async def write_dataset(self, job, writer, artifact, progress):
+            await artifact.write(b"id,hours\n")
+
+        module = "backend.api.services.report_job_service"
+        with patch(f"{module}.get_db_helper", return_value=SimpleNamespace(get_session=get_session)), \
+                patch(f"{module}.artifacts_dir", return_value=tmp_path), \
+                patch(f"{module}.publish_job_event", new=AsyncMock()) as publish, \
+                patch.object(ReportJobWorker, "_write_dataset", new=write_dataset):
+            await ReportJobWorker(concurrency=1).run_job(job.job_uuid)
+
+        assert job.status == "running" and job.artifact_path is None
+        assert list(tmp_path.iterdir()) == []
+        assert publish.await_count == 1
+        session.rollback.assert_awaited_once()
+
+
+class TestReportJobEventHub:
+    """Тесты доставки событий подписчикам процесса"""
+
+    @pytest.mark.asyncio
+    async def test_dispatch_to_job_subscribers(self):
+        """Тест: событие получают только подписчики своего задания"""
+        from backend.api.services.report_job_service import ReportJobEventHub
+
+        hub = ReportJobEventHub()
+        first = hub.subscribe("a")
+        other = hub.subscribe("b")
+        await hub.dispatch({"job_id": "a", "progress": 10})
+
+        assert first.get_nowait() == {"job_id": "a", "progress": 10}
+        assert other.empty()
+
+        hub.unsubscribe("a", first)
+        hub.unsubscribe("b", other)
+        assert hub.subscribers == {}
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_keeps_latest(self):
+        """Тест: у медленного подписчика отбрасываются старые события"""
+        from backend.api.services.report_job_service import ReportJobEventHub
+
+        hub = ReportJobEventHub(queue_size=2)
+        queue = hub.subscribe("a")
+        for progress in (1, 2, 3):
+            await hub.dispatch({"job_id": "a", "progress": progress})
+
+        assert [queue.get_nowait()["progress"] for _ in range(queue.qsize())] == [2, 3]
+
+
+class TestReportJobsRouter:
+    """Тесты эндпоинтов заданий"""
+
+    def test_job_endpoints_exist(self):
+        """Тест наличия эндпоинтов отправки, опроса, подписки, скачивания и отмены"""
+        from backend.api.routers.reports.router import router
+
+        routes = {(method, route.path) for route in router.routes if hasattr(route, "methods") for method in route.methods}
+        for method, path in [
+            ("POST", "/jobs"), ("GET", "/jobs"), ("GET", "/jobs/{job_id}"),
+            ("GET", "/jobs/{job_id}/events"), ("GET", "/jobs/{job_id}/download"), ("DELETE", "/jobs/{job_id}")
+        ]:
+            assert (method, f"{router.prefix}{path}") in routes
+
+    def test_check_report_access(self):
+        """Тест: права на задание те же, что у синхронных отчетов"""
+        from fastapi import HTTPException
+        from backend.api.routers.reports.router import check_report_access
+        from backend.api.services.reports_service import ReportType
+
+        employee = {"id": 1, "role": "employee", "organization_id": 1, "department_id": 2}
+        check_report_access(employee, dataset="time_logs", user_id=1)
+        with pytest.raises(HTTPException):
+            check_report_access(employee, report_type=ReportType.TIME_TRACKING, user_id=5)
+        with pytest.raises(HTTPException):
+            check_report_access(employee, report_type=ReportType.PERFORMANCE, organization_id=9, department_id=2)
+
+
+def _session_helper(*jobs):
+    """Фабрика сессий, где опрос задания возвращает заданные состояния по очереди"""
+    from contextlib import asynccontextmanager
+    from types import SimpleNamespace
+
+    session = MagicMock()
+    session.scalar = AsyncMock(side_effect=list(jobs))
+
+    @asynccontextmanager
+    async def get_session():
+        yield session
+
+    return SimpleNamespace(get_session=get_session)
+
+
+async def _collect_events(job_uuid, helper):
+    import json
+    from backend.api.services.report_job_service import job_event_stream
+
+    with patch("backend.api.services.report_job_service.get_db_helper", return_value=helper):
+        chunks = [chunk async for chunk in job_event_stream(job_uuid, poll_timeout=0.01)]
+    events = []
+    for chunk in chunks:
+        event, data = chunk.strip().split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+class TestReportJobEventStream:
+    """Тесты потока SSE задания"""
+
+    @pytest.mark.asyncio
+    async def test_stream_ends_with_terminal_event(self):
+        """Тест: прогресс до завершения задания, затем событие end"""
+        from backend.api.services.report_job_service import report_job_events
+
+        helper = _session_helper(_job(status="running"), _job(status="completed", progress=100))
+        events = await _collect_events("job-1", helper)
+
+        assert [event for event, _ in events] == ["progress", "progress", "end"]
+        assert events[-1][1] == {"job_id": "job-1", "status": "completed"}
+        assert "job-1" not in report_job_events.subscribers
+
+    @pytest.mark.asyncio
+    async def test_missing_job_ends_stream(self):
+        """Тест: задание удалено во время подписки - событие error и конец потока"""
+        helper = _session_helper(_job(status="queued"), None)
+        events = await _collect_events("job-1", helper)
+
+        assert [event for event, _ in events] == ["progress", "error", "end"]
+        assert events[1][1]["detail"] == "Задание отчета не найдено"
+
+        assert [event for event, _ in await _collect_events("job-2", _session_helper(None))] == ["error", "end"]
+
+
+class TestReportJobArtifacts:
+    """Тесты файлов заданий"""
+
+    @pytest.mark.asyncio
+    async def test_remove_artifact(self, tmp_path):
+        """Тест: удаление файла не падает, если его уже нет"""
+        from backend.api.services.report_job_service import remove_artifact
+
+        path = tmp_path / "report.csv"
+        path.write_bytes(b"data")
+        await remove_artifact(path)
+        await remove_artifact(path)
+        assert not path.exists()
+
+    @pytest.mark.asyncio
+    async def test_invalid_job_request_detail_in_russian(self):
+        """Тест: ошибка параметров задания отдается по-русски, без текста исключения"""
+        from fastapi import HTTPException
+        from backend.api.routers.reports.router import ReportJobRequest, submit_report_job
+
+        request = ReportJobRequest(dataset="tasks", format_type="csv")
+        user = {"id": 1, "role": "admin"}
+        with patch("backend.api.routers.reports.router.ReportJobService") as service:
+            service.return_value.submit_job = AsyncMock(side_effect=ValueError("Unknown export dataset: tasks"))
+            with pytest.raises(HTTPException) as error:
+                await submit_report_job(request, user=user, session=MagicMock())
+        assert error.value.status_code == 400
+        assert error.value.detail == "Некорректные параметры задания отчета"
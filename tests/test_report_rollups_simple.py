@@ -0,0 +1,366 @@
+"""
+Простые тесты предагрегированных показателей отчетов (report_rollups)
+"""
+import pytest
+import pytest_asyncio
+from datetime import datetime, date, timedelta
+
+
+class TestReportRollupModel:
+    """Тесты модели агрегатов"""
+
+    def test_model_registered(self):
+        """Тест регистрации модели в пакете моделей"""
+        from core.database.models import ReportRollup, ReportRollupScope
+
+        assert ReportRollup.__tablename__ == "report_rollups"
+        assert ReportRollupScope.GLOBAL == "global"
+        assert ReportRollupScope.PARTICIPANT == "participant"
+
+    def test_unique_key(self):
+        """Тест уникального ключа агрегата"""
+        from core.database.models import ReportRollup
+
+        constraints = [c for c in ReportRollup.__table__.constraints if c.name == "uq_report_rollups_key"]
+        assert len(constraints) == 1
+        assert [c.name for c in constraints[0].columns] == ["scope_type", "scope_id", "day", "metric", "bucket"]
+
+
+class TestRollupContributions:
+    """Тесты вычисления вклада задач и записей времени"""
+
+    def _task(self, **overrides):
+        snapshot = {
+            "created_at": datetime(2025, 3, 10, 14, 0),
+            "status": "in_progress",
+            "priority": "high",
+            "task_type": "bug",
+            "due_date": None,
+            "completed_at": None,
+            "owner_id": 1,
+            "executor_id": 2,
+            "department_id": 3,
+            "organization_id": 4,
+        }
+        snapshot.update(overrides)
+        return snapshot
+
+    def test_task_scopes(self):
+        """Тест областей задачи"""
+        from backend.api.services.report_rollup_service import task_scopes
+
+        scopes = task_scopes(owner_id=1, executor_id=2, department_id=3, organization_id=4)
+        assert ("global", 0) in scopes
+        assert ("organization", 4) in scopes
+        assert ("department", 3) in scopes
+        assert ("user", 2) in scopes
+        assert ("participant", 1) in scopes
+        assert ("participant", 2) in scopes
+
+    def test_task_scopes_owner_is_executor(self):
+        """Тест: владелец-исполнитель учитывается как участник один раз"""
+        from backend.api.services.report_rollup_service import task_scopes
+
+        scopes = task_scopes(owner_id=5, executor_id=5, department_id=None, organization_id=None)
+        assert scopes.count(("participant", 5)) == 1
+        assert ("department", None) not in scopes
+
+    def test_task_contribution(self):
+        """Тест вклада задачи в метрики дня создания"""
+        from backend.api.services.report_rollup_service import task_contribution
+
+        contribution = task_contribution(self._task(), datetime(2025, 3, 11))
+        day = date(2025, 3, 10)
+
+        assert contribution[("global", 0, day, "tasks", "total")] == 1
+        assert contribution[("department", 3, day, "status", "in_progress")] == 1
+        assert contribution[("user", 2, day, "priority", "high")] == 1
+        assert ("global", 0, day, "completed", "total") not in contribution
+        assert ("global", 0, day, "overdue", "total") not in contribution
+
+    def test_completed_task_contribution(self):
+        """Тест вклада завершенной задачи во время выполнения"""
+        from backend.api.services.report_rollup_service import task_contribution
+
+        snapshot = self._task(status="completed", completed_at=datetime(2025, 3, 10, 20, 0))
+        contribution = task_contribution(snapshot, datetime(2025, 3, 11))
+        day = date(2025, 3, 10)
+
+        assert contribution[("global", 0, day, "completed", "total")] == 1
+        assert contribution[("global", 0, day, "completion_hours", "sum")] == pytest.approx(6.0)
+        assert contribution[("global", 0, day, "completion_hours", "count")] == 1
+
+    def test_overdue_task_contribution(self):
+        """Тест просроченной задачи"""
+        from backend.api.services.report_rollup_service import task_contribution
+
+        snapshot = self._task(due_date=datetime(2025, 3, 12))
+        day = date(2025, 3, 10)
+
+        assert ("global", 0, day, "overdue", "total") not in task_contribution(snapshot, datetime(2025, 3, 11))
+        assert task_contribution(snapshot, datetime(2025, 3, 13))[("global", 0, day, "overdue", "total")] == 1
+
+        cancelled = self._task(due_date=datetime(2025, 3, 12), status="cancelled")
+        assert ("global", 0, day, "overdue", "total") not in task_contribution(cancelled, datetime(2025, 3, 13))
+
+    def test_status_change_delta(self):
+        """Тест разницы вклада при смене статуса"""
+        from backend.api.services.report_rollup_service import task_contribution, diff_contributions
+
+        now = datetime(2025, 3, 11)
+        old = task_contribution(self._task(), now)
+        new = task_contribution(self._task(status="review"), now)
+        delta = diff_contributions(old, new)
+        day = date(2025, 3, 10)
+
+        assert delta[("global", 0, day, "status", "in_progress")] == -1
+        assert delta[("global", 0, day, "status", "review")] == 1
+        assert ("global", 0, day, "tasks", "total") not in delta
+
+    def test_deleted_task_delta(self):
+        """Тест разницы вклада при удалении задачи"""
+        from backend.api.services.report_rollup_service import task_contribution, diff_contributions
+
+        now = datetime(2025, 3, 11)
+        delta = diff_contributions(task_contribution(self._task(), now), task_contribution(None, now))
+
+        assert delta[("participant", 1, date(2025, 3, 10), "tasks", "total")] == -1
+        assert all(value < 0 for value in delta.values())
+
+    def test_time_log_contribution(self):
+        """Тест вклада записи времени"""
+        from backend.api.services.report_rollup_service import time_log_contribution, diff_contributions
+
+        old = time_log_contribution({"user_id": 7, "hours": 2.5, "start_time": datetime(2025, 3, 1, 9, 0)})
+        new = time_log_contribution({"user_id": 7, "hours": 4.0, "start_time": datetime(2025, 3, 1, 9, 0)})
+        day = date(2025, 3, 1)
+
+        assert old[("user", 7, day, "hours", "total")] == 2.5
+        assert old[("global", 0, day, "time_entries", "total")] == 1
+        assert diff_contributions(old, new) == {
+            ("global", 0, day, "hours", "total"): 1.5,
+            ("user", 7, day, "hours", "total"): 1.5,
+        }
+
+
+class TestRollupWindow:
+    """Тесты разбиения периода отчета"""
+
+    def test_open_range(self):
+        """Тест периода без границ - только агрегаты"""
+        from backend.api.services.report_rollup_service import split_report_range
+
+        window = split_report_range(None, None)
+        assert window.days == (None, None)
+        assert window.head is None
+        assert window.tail is None
+
+    def test_partial_days(self):
+        """Тест неполных первого и последнего дней"""
+        from backend.api.services.report_rollup_service import split_report_range
+
+        start = datetime(2025, 3, 1, 10, 30)
+        end = datetime(2025, 3, 10, 18, 0)
+        window = split_report_range(start, end)
+
+        assert window.head == (start, datetime(2025, 3, 2))
+        assert window.days == (date(2025, 3, 2), date(2025, 3, 9))
+        assert window.tail == (datetime(2025, 3, 10), end)
+
+    def test_midnight_start(self):
+        """Тест начала периода в полночь"""
+        from backend.api.services.report_rollup_service import split_report_range
+
+        window = split_report_range(datetime(2025, 3, 1), None)
+        assert window.head is None
+        assert window.days == (date(2025, 3, 1), None)
+        assert window.tail is None
+
+    def test_same_day(self):
+        """Тест периода внутри одного дня"""
+        from backend.api.services.report_rollup_service import split_report_range
+
+        start = datetime(2025, 3, 1, 9, 0)
+        end = datetime(2025, 3, 1, 17, 0)
+        window = split_report_range(start, end)
+
+        assert window.days is None
+        assert window.head is None
+        assert window.tail == (start, end)
+
+    def test_adjacent_days(self):
+        """Тест соседних дней без полных дней между ними"""
+        from backend.api.services.report_rollup_service import split_report_range
+
+        start = datetime(2025, 3, 1, 9, 0)
+        end = datetime(2025, 3, 2, 5, 0)
+        window = split_report_range(start, end)
+
+        assert window.days is None
+        assert window.head == (start, datetime(2025, 3, 2))
+        assert window.tail == (datetime(2025, 3, 2), end)
+
+    def test_empty_range(self):
+        """Тест пустого периода"""
+        from backend.api.services.report_rollup_service import split_report_range
+
+        window = split_report_range(datetime(2025, 3, 2), datetime(2025, 3, 1))
+        assert window.days is None and window.head is None and window.tail is None
+
+
+class TestReportsSummaryScope:
+    """Тесты выбора области агрегатов для сводного отчета"""
+
+    def test_single_filter_uses_rollup_scope(self):
+        """Тест: один фильтр - одна область агрегатов"""
+        from backend.api.services.reports_service import ReportsService
+
+        assert ReportsService._task_summary_scope(None, None, None, None, None) == ("global", None, None)
+        assert ReportsService._task_summary_scope(5, None, None, None, None) == ("participant", [5], None)
+        assert ReportsService._task_summary_scope(None, 3, None, None, None) == ("department", [3], None)
+
+    def test_combined_filters_use_conditions(self):
+        """Тест: комбинация фильтров считается по таблице задач"""
+        from backend.api.services.reports_service import ReportsService
+        from core.database.models.task_model import TaskStatus
+
+        scope_type, scope_ids, conditions = ReportsService._task_summary_scope(
+            None, 3, 4, [TaskStatus.COMPLETED], None
+        )
+        assert scope_type == "global"
+        assert scope_ids is None
+        assert len(conditions) == 3
+
+    def test_tracker_registration_idempotent(self):
+        """Тест идемпотентной регистрации обработчиков flush"""
+        from backend.api.services.report_rollup_service import ReportRollupTracker
+
+        tracker = ReportRollupTracker()
+        tracker.register()
+        tracker.register()
+        assert tracker.is_registered
+        tracker.unregister()
+        assert not tracker.is_registered
+
+
+class TestRollupStorage:
+    """Тесты записи агрегатов и сверки (SQLite)"""
+
+    @pytest_asyncio.fixture
+    async def session_factory(self, sqlite_session_factory):
+        return await sqlite_session_factory("users", "tasks", "task_time_logs", "report_rollups")
+
+    async def _seed_tasks(self, session_factory, days):
+        from sqlalchemy import insert
+        from core.database.models.task_model import Task
+
+        async with session_factory() as session:
+            await session.execute(insert(Task.__table__), [
+                {"title": f"Задача {i}", "status": "created", "priority": "medium", "task_type": "task",
+                 "owner_id": 1, "created_at": datetime.now() - timedelta(days=day)}
+                for i, day in enumerate(days)
+            ])
+            await session.commit()
+
+    async def _total_tasks(self, session_factory):
+        from sqlalchemy import func, select
+        from core.database.models import ReportRollup
+
+        async with session_factory() as session:
+            return (await session.execute(
+                select(func.sum(ReportRollup.value)).where(
+                    ReportRollup.scope_type == "global", ReportRollup.metric == "tasks"
+                )
+            )).scalar()
+
+    @pytest.mark.asyncio
+    async def test_portable_upsert_fallback(self, session_factory):
+        """Тест: без ON CONFLICT строки складываются через SELECT + UPDATE/INSERT"""
+        from sqlalchemy import select
+        from core.database.models import ReportRollup
+        from backend.api.services.report_rollup_service import _delta_rows, write_rollup_rows
+
+        key = ("global", 0, date(2025, 3, 10), "hours", "total")
+        async with session_factory() as session:
+            for value in (1.5, 2.0):
+                await session.run_sync(write_rollup_rows, _delta_rows({key: value}), "mssql")
+            await session.commit()
+            values = (await session.execute(select(ReportRollup.value))).scalars().all()
+        assert values == [3.5]
+
+    @pytest.mark.asyncio
+    async def test_full_rebuild_only_when_empty_or_outdated(self, session_factory):
+        """Тест: полный пересчет при пустых агрегатах, затем только по мере надобности"""
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from sqlalchemy import update
+        from core.database.models import ReportRollup
+        from backend.api.services.report_rollup_service import ReportRollupReconciler, _REBUILT_METRIC
+
+        await self._seed_tasks(session_factory, [1, 3, 3, 60])
+        reconciler = ReportRollupReconciler()
+        with patch("backend.api.services.report_rollup_service.get_db_helper",
+                   return_value=SimpleNamespace(get_session=session_factory)):
+            first = await reconciler.reconcile_once()
+            assert first["full"] and first["days"] >= 61
+            assert await self._total_tasks(session_factory) == 4
+
+            assert (await reconciler.reconcile_once())["full"] is False
+            # Новый процесс: отметка полного пересчета хранится в БД
+            assert (await ReportRollupReconciler().reconcile_once())["full"] is False
+
+            async with session_factory() as session:
+                stale = (datetime.now() - timedelta(days=2)).timestamp()
+                await session.execute(update(ReportRollup).where(ReportRollup.metric == _REBUILT_METRIC)
+                                      .values(value=stale))
+                await session.commit()
+            assert (await ReportRollupReconciler().reconcile_once())["full"] is True
+        assert await self._total_tasks(session_factory) == 4
+
+    @pytest.mark.asyncio
+    async def test_time_tracking_report_from_rollups(self, session_factory):
+        """Тест: отчет по учету времени из агрегатов совпадает с расчетом по исходной таблице"""
+        from unittest.mock import patch
+        from sqlalchemy import insert
+        from core.database.models.main_models import User
+        from core.database.models.task_model import TaskTimeLog
+        from core.settings import settings
+        from backend.api.services.report_rollup_service import rebuild_rollup_days
+        from backend.api.services.reports_service import ReportsService
+
+        await self._seed_tasks(session_factory, [0, 0])
+        start = datetime(2025, 3, 1, 12, 0)
+        async with session_factory() as session:
+            await session.execute(insert(User.__table__), [
+                {"id": 1, "login": "ivan", "username": "Иван", "email": "ivan@example.com", "password_hash": "x"},
+                {"id": 2, "login": "olga", "username": "Ольга", "email": "olga@example.com", "password_hash": "x"},
+            ])
+            await session.execute(insert(TaskTimeLog.__table__), [
+                {"task_id": 1, "user_id": 1, "hours": 2.0, "start_time": start},
+                {"task_id": 1, "user_id": 2, "hours": 1.5, "start_time": start + timedelta(days=1)},
+                {"task_id": 2, "user_id": 2, "hours": 4.0, "start_time": start + timedelta(days=2)},
+                {"task_id": 2, "user_id": 1, "hours": 0.5, "start_time": start + timedelta(days=3, hours=6)},
+            ])
+            await rebuild_rollup_days(session, date(2025, 3, 1), date(2025, 3, 4))
+            await session.commit()
+
+        reports = {}
+        for use_rollups in (True, False):
+            with patch.object(settings.reports, "use_rollups", use_rollups):
+                for filters in ({}, {"user_id": 2}, {"task_id": 1}):
+                    async with session_factory() as session:
+                        report = await ReportsService(session).generate_time_tracking_report(
+                            start_date=datetime(2025, 3, 1, 18, 0), end_date=datetime(2025, 3, 5), **filters
+                        )
+                    reports[(use_rollups, tuple(filters))] = {
+                        key: report[key] for key in ("summary", "time_by_user", "time_by_task", "daily_breakdown")
+                    }
+
+        for filters in ((), ("user_id",), ("task_id",)):
+            assert reports[(True, filters)] == reports[(False, filters)]
+        full = reports[(True, ())]
+        assert full["summary"] == {"total_hours": 6.0, "total_entries": 3, "avg_hours_per_entry": 2.0}
+        assert [row["username"] for row in full["time_by_user"]] == ["olga", "ivan"]
+        assert [(row["task_id"], row["total_hours"]) for row in full["time_by_task"]] == [(2, 4.5), (1, 1.5)]
+        assert [row["date"] for row in full["daily_breakdown"]] == ["2025-03-02", "2025-03-03", "2025-03-04"]
+        assert reports[(True, ("task_id",))]["summary"]["total_hours"] == 1.5
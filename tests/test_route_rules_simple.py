@@ -0,0 +1,259 @@
+"""
+Простые тесты правил доступа к маршрутам и middleware авторизации
+"""
+import pytest
+from unittest.mock import AsyncMock, patch
+
+
+pytestmark = pytest.mark.usefixtures("related_models")
+
+
+def _principal(role="employee", is_active=True):
+    from backend.api.configuration.principal_cache import Principal
+
+    return Principal(id=1, login="ivan", role=role, is_active=is_active)
+
+
+class TestRouteMatcher:
+    """Тесты дерева правил"""
+
+    def _matcher(self):
+        from backend.api.middleware.route_rules import RouteMatcher, RouteRule
+
+        return RouteMatcher([
+            RouteRule("/auth/login_user/*", public=True),
+            RouteRule("/api/*", roles=["employee"]),
+            RouteRule("/api/admin/*", roles=["admin"]),
+            RouteRule("/api/users/{user_id}/", ["GET"], permission=("user", "read")),
+            RouteRule("/api/users/me/", roles=["staff"]),
+            RouteRule("/api/users/", ["POST"], roles=["manager"]),
+        ])
+
+    def test_exact_and_subtree(self):
+        """Тест: точный путь, поддерево и правило по умолчанию"""
+        from backend.api.middleware.route_rules import AUTHENTICATED
+
+        matcher = self._matcher()
+
+        assert matcher.match("POST", "/auth/login_user/").public
+        assert matcher.match("POST", "/auth/login_user").public
+        assert matcher.match("GET", "/auth/login_user/extra/path").public
+        assert matcher.match("GET", "/other") is AUTHENTICATED
+        assert matcher.match("GET", "/") is AUTHENTICATED
+
+    def test_deepest_subtree_wins(self):
+        """Тест: из нескольких поддеревьев выигрывает самое глубокое"""
+        matcher = self._matcher()
+
+        assert matcher.match("GET", "/api/tasks/5").roles == ("employee",)
+        assert matcher.match("GET", "/api/admin/stats").roles == ("admin",)
+        assert matcher.match("GET", "/api/admin").roles == ("admin",)
+
+    def test_param_and_static_priority(self):
+        """Тест: точный сегмент важнее параметра"""
+        matcher = self._matcher()
+
+        assert matcher.match("GET", "/api/users/42/").permission == ("user", "read")
+        assert matcher.match("GET", "/api/users/me/").roles == ("staff",)
+        # Метод без правила на узле - правило поддерева
+        assert matcher.match("DELETE", "/api/users/42/").roles == ("employee",)
+
+    def test_param_not_shadowed_by_static(self):
+        """Тест: точный сегмент без продолжения не закрывает правило ветки параметра"""
+        from backend.api.middleware.route_rules import AUTHENTICATED, RouteMatcher, RouteRule
+
+        matcher = RouteMatcher([
+            RouteRule("/api/users/me"),
+            RouteRule("/api/users/{id}/secret", roles=["admin"]),
+            RouteRule("/api/users/me/settings/*", roles=["staff"]),
+        ])
+
+        assert matcher.match("GET", "/api/users/me/secret").roles == ("admin",)
+        assert matcher.match("GET", "/api/users/42/secret").roles == ("admin",)
+        assert matcher.match("GET", "/api/users/me/settings/mail").roles == ("staff",)
+        assert matcher.match("GET", "/api/users/me").roles == ()
+        assert matcher.match("GET", "/api/users/me/other") is AUTHENTICATED
+
+    def test_method_specific(self):
+        """Тест: правило для конкретного метода"""
+        matcher = self._matcher()
+
+        assert matcher.match("post", "/api/users/").roles == ("manager",)
+        assert matcher.match("GET", "/api/users/").roles == ("employee",)
+
+    def test_invalid_rules(self):
+        """Тест: дублирующиеся правила и '*' в середине шаблона отклоняются"""
+        from backend.api.middleware.route_rules import RouteMatcher, RouteRule
+
+        with pytest.raises(ValueError):
+            RouteMatcher([RouteRule("/a/", ["GET"]), RouteRule("/a", ["GET"])])
+        with pytest.raises(ValueError):
+            RouteMatcher([RouteRule("/a/*/b")])
+
+    def test_default_rules_compile(self):
+        """Тест: правила приложения компилируются и сохраняют прежние требования"""
+        from backend.api.middleware.route_rules import compile_route_rules
+
+        matcher = compile_route_rules()
+
+        assert matcher.match("POST", "/auth/register/").public
+        assert matcher.match("POST", "/auth/refresh-token/").public
+        assert matcher.match("GET", "/docs").public
+        assert not matcher.match("GET", "/auth/user/me/").public
+        assert matcher.match("GET", "/auth/users/").roles == ("admin", "CEO")
+        assert matcher.match("POST", "/auth/users/").roles == ("admin",)
+        assert matcher.match("GET", "/auth/departments/").roles == ("admin", "CEO", "manager")
+        assert matcher.match("GET", "/auth/permissions/7/").roles == ("admin",)
+        assert matcher.match("POST", "/api/reports/rollups/reconcile").permission == ("report", "reconcile")
+        assert matcher.match("DELETE", "/api/reports/cache/").permission == ("report", "clear_cache")
+        assert matcher.match("GET", "/api/reports/types").permission is None
+
+
+class TestAuthMiddleware:
+    """Тесты middleware на приложении с правилами"""
+
+    def _client(self):
+        from fastapi import FastAPI, Request
+        from fastapi.testclient import TestClient
+        from backend.api.middleware.auth_middleware import setup_auth_middleware
+        from backend.api.middleware.route_rules import RouteRule
+
+        app = FastAPI()
+
+        @app.get("/public/")
+        async def public():
+            return {"ok": True}
+
+        @app.get("/private/")
+        async def private(request: Request):
+            return {"login": request.scope["user"].login}
+
+        @app.get("/admin/")
+        async def admin():
+            return {"ok": True}
+
+        @app.get("/reports/")
+        async def reports():
+            return {"ok": True}
+
+        setup_auth_middleware(app, rules=[
+            RouteRule("/public/*", public=True),
+            RouteRule("/admin/", roles=["CEO"]),
+            RouteRule("/reports/", permission=("report", "read")),
+        ])
+        return TestClient(app)
+
+    def test_public_path_skips_auth(self):
+        """Тест: публичный путь не требует токена"""
+        response = self._client().get("/public/")
+        assert response.status_code == 200
+
+    def test_missing_token(self):
+        """Тест: без токена закрытый путь возвращает 401"""
+        response = self._client().get("/private/")
+        assert response.status_code == 401
+        assert response.headers["www-authenticate"] == "Bearer"
+
+    def test_authenticated_user_in_scope(self):
+        """Тест: пользователь токена доступен обработчику через scope"""
+        from backend.api.middleware.auth_middleware import AuthMiddleware
+
+        with patch.object(AuthMiddleware, "_authenticate", AsyncMock(return_value=_principal())):
+            response = self._client().get("/private/", headers={"Authorization": "Bearer x"})
+
+        assert response.status_code == 200
+        assert response.json() == {"login": "ivan"}
+
+    def test_role_check(self):
+        """Тест: проверка роли по правилу маршрута; admin проходит всегда"""
+        from backend.api.middleware.auth_middleware import AuthMiddleware
+
+        client = self._client()
+        with patch.object(AuthMiddleware, "_authenticate", AsyncMock(return_value=_principal("employee"))):
+            assert client.get("/admin/").status_code == 403
+        with patch.object(AuthMiddleware, "_authenticate", AsyncMock(return_value=_principal("CEO"))):
+            assert client.get("/admin/").status_code == 200
+        with patch.object(AuthMiddleware, "_authenticate", AsyncMock(return_value=_principal("admin"))):
+            assert client.get("/admin/").status_code == 200
+
+    def test_permission_check_uses_matrix(self):
+        """Тест: разрешение маршрута проверяется по матрице ролей"""
+        from backend.api.configuration.permission_matrix import permission_matrix
+        from backend.api.middleware.auth_middleware import AuthMiddleware
+
+        client = self._client()
+        with patch.object(permission_matrix, "_bits", {("report", "read"): 0}), \
+                patch.object(permission_matrix, "_roles", {"manager": 1}):
+            with patch.object(AuthMiddleware, "_authenticate", AsyncMock(return_value=_principal("manager"))):
+                assert client.get("/reports/").status_code == 200
+            with patch.object(AuthMiddleware, "_authenticate", AsyncMock(return_value=_principal("employee"))):
+                response = client.get("/reports/")
+
+        assert response.status_code == 403
+        assert "report:read" in response.json()["detail"]
+
+    @pytest.mark.asyncio
+    async def test_inactive_user_rejected(self):
+        """Тест: неактивный пользователь получает 403"""
+        from fastapi import HTTPException
+        from backend.api.middleware.auth_middleware import AuthMiddleware
+
+        middleware = AuthMiddleware(app=None)
+        scope = {"type": "http", "headers": [(b"authorization", b"Bearer token")]}
+        with patch("backend.api.middleware.auth_middleware.get_current_token_payload", return_value={"sub": "ivan"}), \
+                patch("backend.api.middleware.auth_middleware.validate_token_type"), \
+                patch("backend.api.middleware.auth_middleware.get_principal_by_token_sub",
+                      AsyncMock(return_value=_principal(is_active=False))):
+            with pytest.raises(HTTPException) as exc:
+                await middleware._authenticate(scope)
+
+        assert exc.value.status_code == 403
+
+
+class TestDefaultRulesOnRoutes:
+    """Тесты правил приложения на настоящих маршрутах"""
+
+    def _client(self):
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from backend.api.configuration.auth import verify_authorization
+        from backend.api.configuration.server import Server
+        from backend.api.middleware.auth_middleware import setup_auth_middleware
+        from backend.api.routers.reports.router import router
+
+        app = FastAPI()
+        app.include_router(router)
+        setup_auth_middleware(app)
+
+        async def principal():
+            return self.user
+
+        async def db():
+            yield AsyncMock()
+
+        app.dependency_overrides[verify_authorization] = principal
+        app.dependency_overrides[Server.get_db] = db
+        return TestClient(app)
+
+    def _post_reconcile(self, role):
+        from backend.api.middleware.auth_middleware import AuthMiddleware
+        from backend.api.services.report_rollup_service import report_rollup_reconciler
+
+        self.user = _principal(role)
+        with patch.object(AuthMiddleware, "_authenticate", AsyncMock(return_value=self.user)), \
+                patch.object(report_rollup_reconciler, "reconcile_once", AsyncMock(return_value={"skipped": True})):
+            return self._client().post("/api/reports/rollups/reconcile", headers={"Authorization": "Bearer x"})
+
+    def test_permission_rule_denies_real_route(self):
+        """Тест: сверка агрегатов без разрешения report:reconcile запрещена правилом по умолчанию"""
+        from backend.api.configuration.permission_matrix import permission_matrix
+
+        with patch.object(permission_matrix, "_bits", {("report", "reconcile"): 0}), \
+                patch.object(permission_matrix, "_roles", {"manager": 1}), \
+                patch.object(permission_matrix, "loaded_at", 1.0):
+            denied = self._post_reconcile("employee")
+            assert self._post_reconcile("manager").status_code == 200
+            assert self._post_reconcile("admin").status_code == 200
+
+        assert denied.status_code == 403
+        assert denied.json()["detail"] == "Access denied. Required permission: report:reconcile"
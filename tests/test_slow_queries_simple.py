@@ -0,0 +1,169 @@
+"""
+Простые тесты журнала медленных запросов
+"""
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+
+@pytest.fixture
+def slow_log():
+    """Глобальный журнал: каждый запрос считается медленным, после теста - исходные настройки"""
+    from core.database.slow_queries import slow_query_log
+
+    saved = dict(
+        enabled=slow_query_log.enabled,
+        threshold_ms=slow_query_log.threshold_ms,
+        explain=slow_query_log.explain,
+        max_entries=slow_query_log.entries.maxlen,
+    )
+    slow_query_log.clear()
+    slow_query_log.configure(enabled=True, threshold_ms=0.0, explain=False)
+    yield slow_query_log
+    slow_query_log.configure(**saved)
+    slow_query_log.clear()
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'slow.db'}")
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, title TEXT)"))
+    yield engine
+    await engine.dispose()
+
+
+async def _search(engine, pattern):
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT id FROM items WHERE title LIKE :pattern LIMIT 10 OFFSET 500"),
+                           {"pattern": pattern})
+
+
+class TestRedaction:
+    """Тесты скрытия параметров"""
+
+    def test_values(self):
+        """Тест: строки скрыты, числа и даты сохранены, шаблоны LIKE видны"""
+        from core.database.slow_queries import redact_parameters
+
+        assert redact_parameters({"login": "ivan", "limit": 10, "day": date(2024, 1, 2), "flag": None}) == \
+            {"login": "<str:4>", "limit": 10, "day": "2024-01-02", "flag": None}
+        assert redact_parameters(("%secret%", b"\x00\x01", [1, 2])) == ["%<str:8>%", "<bytes:2>", "<list:2>"]
+        assert redact_parameters([("a",), ("b",), ("c",), ("d",)], executemany=True, max_rows=2) == \
+            [["<str:1>"], ["<str:1>"], "<2 more rows>"]
+
+
+class TestSlowQueryLog:
+    """Тесты записи медленных запросов"""
+
+    @pytest.mark.asyncio
+    async def test_entry(self, engine, slow_log):
+        """Тест: запись содержит отпечаток, скрытые параметры и источник"""
+        from core.database.slow_queries import query_origin, set_query_origin
+
+        token = set_query_origin("report_job:42")
+        try:
+            await _search(engine, "%ivan%")
+        finally:
+            query_origin.reset(token)
+
+        entry = slow_log.recent(limit=1)[0]
+        assert entry["fingerprint"] == "SELECT id FROM items WHERE title LIKE ? LIMIT ? OFFSET ?"
+        assert entry["parameters"] == ["%<str:6>%"]
+        assert entry["origin"] == "report_job:42"
+        assert entry["plan"] is None
+        assert "ivan" not in str(entry)
+
+    @pytest.mark.asyncio
+    async def test_threshold(self, engine, slow_log):
+        """Тест: быстрые запросы не записываются"""
+        slow_log.configure(threshold_ms=60_000)
+        await _search(engine, "%a%")
+
+        assert slow_log.recent() == []
+
+    def test_threshold_default_matches_settings(self):
+        """Тест: порог по умолчанию совпадает с настройками"""
+        from core.database.slow_queries import SlowQueryLog
+        from core.settings.config import DatabaseConfig
+
+        assert SlowQueryLog().threshold_ms == DatabaseConfig.model_fields["slow_query_threshold_ms"].default
+
+    @pytest.mark.asyncio
+    async def test_explain_with_cooldown(self, engine, slow_log):
+        """Тест: план запрашивается для SELECT, повторно - не раньше паузы"""
+        slow_log.configure(explain=True, explain_cooldown=300.0)
+        await _search(engine, "%a%")
+        await _search(engine, "%b%")
+        async with engine.begin() as conn:
+            await conn.execute(text("INSERT INTO items (title) VALUES ('x')"))
+
+        insert, second, first = slow_log.recent(limit=3)
+        assert any("SCAN items" in line for line in first["plan"])
+        assert second["plan"] is None
+        assert insert["plan"] is None
+        # EXPLAIN выполняется мимо событий движка и сам в журнал не попадает
+        assert not any(entry["sql"].startswith("EXPLAIN") for entry in slow_log.recent(limit=100))
+
+    @pytest.mark.asyncio
+    async def test_bounded_store_and_summary(self, engine, slow_log):
+        """Тест: хранилище ограничено, сводка считает виды запросов"""
+        slow_log.configure(max_entries=2)
+        for pattern in ("%a%", "%b%", "%c%"):
+            await _search(engine, pattern)
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT count(*) FROM items"))
+
+        assert len(slow_log.recent(limit=100)) == 2
+        top = slow_log.top(order_by="count")
+        assert top[0]["fingerprint"].startswith("SELECT id FROM items WHERE title LIKE")
+        assert top[0]["count"] == 3
+        assert top[0]["origins"] == {"<unknown>": 3}
+        assert slow_log.recent(contains="count(*)")[0]["fingerprint"] == "SELECT count(*) FROM items"
+
+    @pytest.mark.asyncio
+    async def test_route_origin(self, engine, slow_log):
+        """Тест: источником запроса HTTP является шаблон маршрута"""
+        from backend.api.middleware.query_origin_middleware import setup_query_origin_middleware
+
+        app = FastAPI()
+
+        @app.get("/items/{item_id}")
+        async def get_item(item_id: int):
+            await _search(engine, "%x%")
+            return {"id": item_id}
+
+        setup_query_origin_middleware(app)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            assert (await client.get("/items/7")).status_code == 200
+
+        assert slow_log.recent(limit=1)[0]["origin"] == "GET /items/{item_id}"
+        assert slow_log.recent(origin="/items/")
+
+
+class TestEndpoint:
+    """Тесты эндпоинта администратора"""
+
+    @pytest.mark.asyncio
+    async def test_get_and_clear(self, engine, slow_log):
+        """Тест: эндпоинт отдает сводку и записи, очистка опустошает журнал"""
+        from backend.api.routers.diagnostics.router import clear_slow_queries, get_slow_queries
+
+        await _search(engine, "%a%")
+        admin = SimpleNamespace(login="admin")
+        result = await get_slow_queries(
+            limit=10, min_ms=None, origin=None, contains="LIKE", top=5, order_by="total_ms", user=admin
+        )
+
+        assert result["enabled"] is True
+        assert len(result["recent"]) == 1
+        assert result["top"][0]["count"] == 1
+
+        await clear_slow_queries(user=admin)
+        assert slow_log.recent() == []
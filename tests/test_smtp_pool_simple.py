@@ -0,0 +1,297 @@
+"""
+Простые тесты пула SMTP-соединений (с локальным SMTP-сервером)
+"""
+import asyncio
+import base64
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+
+
+class StubSMTPServer:
+    """Минимальный SMTP-сервер: EHLO, AUTH PLAIN, MAIL/RCPT/DATA, RSET, QUIT.
+
+    С pipelining=True ответы на MAIL и RCPT отдаются только после DATA -
+    клиент без конвейера повиснет на первом ответе.
+    """
+
+    def __init__(self, pipelining=True):
+        self.pipelining = pipelining
+        self.messages = []
+        self.logins = 0
+        self.connections = 0
+        self.active = 0
+        self.max_active = 0
+        self._writers = set()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.drop_all()
+        self._server.close()
+        await self._server.wait_closed()
+
+    def drop_all(self):
+        """Сервер закрывает все сессии (таймаут простоя на его стороне)"""
+        for writer in list(self._writers):
+            writer.close()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self._writers.add(writer)
+        pending, envelope = [], {"from": None, "to": []}
+
+        def reply(line):
+            if self.pipelining:
+                pending.append(line)
+            else:
+                writer.write(line.encode() + b"\r\n")
+
+        try:
+            writer.write(b"220 stub ESMTP\r\n")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode().rstrip("\r\n")
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    extensions = ["250-stub", "250-AUTH PLAIN LOGIN"]
+                    if self.pipelining:
+                        extensions.append("250-PIPELINING")
+                    writer.write(("\r\n".join(extensions + ["250 SIZE 1000000"]) + "\r\n").encode())
+                elif verb == "AUTH":
+                    _, user, password = base64.b64decode(command.split()[2]).decode().split("\0")
+                    ok = (user, password) == ("sender", "secret")
+                    self.logins += ok
+                    writer.write(b"235 ok\r\n" if ok else b"535 bad credentials\r\n")
+                elif verb == "MAIL":
+                    envelope = {"from": command[11:-1], "to": []}
+                    reply("250 sender ok")
+                elif verb == "RCPT":
+                    address = command[9:-1]
+                    if "bad" in address:
+                        reply("550 no such user")
+                    else:
+                        envelope["to"].append(address)
+                        reply("250 recipient ok")
+                elif verb == "DATA":
+                    writer.write("".join(f"{item}\r\n" for item in pending).encode())
+                    pending.clear()
+                    if not envelope["to"]:
+                        writer.write(b"554 no valid recipients\r\n")
+                        continue
+                    writer.write(b"354 go ahead\r\n")
+                    lines = []
+                    while (data_line := await reader.readline()) != b".\r\n":
+                        lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                    self.messages.append({**envelope, "data": b"".join(lines)})
+                    writer.write(b"250 queued\r\n")
+                elif verb == "RSET":
+                    pending.clear()
+                    writer.write(b"250 reset\r\n")
+                elif verb == "QUIT":
+                    writer.write(b"221 bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"502 unknown command\r\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.active -= 1
+            self._writers.discard(writer)
+            writer.close()
+
+
+@pytest_asyncio.fixture
+async def server():
+    stub = StubSMTPServer()
+    stub.port = await stub.start()
+    yield stub
+    await stub.stop()
+
+
+def _target(port, **kwargs):
+    from backend.api.configuration.smtp_pool import SMTPTarget
+    return SMTPTarget(host="127.0.0.1", port=port, username="sender", password="secret", use_tls=False, **kwargs)
+
+
+def _pool(**kwargs):
+    from backend.api.configuration.smtp_pool import SMTPConnectionPool
+    return SMTPConnectionPool(local_hostname="test.local", connect_timeout=2, command_timeout=2, **kwargs)
+
+
+def _message(subject="Отчет", body="Добрый день"):
+    from email.mime.text import MIMEText
+
+    msg = MIMEText(body, "plain", "utf-8")
+    msg["From"] = "sender@example.com"
+    msg["Subject"] = subject
+    return msg
+
+
+class TestConnectionReuse:
+    """Тесты переиспользования соединений"""
+
+    @pytest.mark.asyncio
+    async def test_one_session_for_many_messages(self, server):
+        """Тест: несколько писем - одно соединение и один AUTH; конвейер MAIL/RCPT/DATA"""
+        pool = _pool()
+        try:
+            for i in range(5):
+                refused = await pool.send_message(_target(server.port), _message(subject=f"Письмо {i}"),
+                                                  "sender@example.com", ["a@example.com", "b@example.com"])
+                assert refused == {}
+        finally:
+            await pool.close()
+
+        assert (server.connections, server.logins, pool.connections_opened) == (1, 1, 1)
+        assert len(server.messages) == 5
+        assert server.messages[0]["from"] == "sender@example.com"
+        assert server.messages[0]["to"] == ["a@example.com", "b@example.com"]
+
+    @pytest.mark.asyncio
+    async def test_dot_stuffing(self, server):
+        """Тест: строка, начинающаяся с точки, доходит без изменений"""
+        pool = _pool()
+        try:
+            await pool.send_message(_target(server.port), b"Subject: t\n\nfirst\n.hidden\nlast",
+                                    "sender@example.com", ["a@example.com"])
+        finally:
+            await pool.close()
+        assert server.messages[0]["data"] == b"Subject: t\r\n\r\nfirst\r\n.hidden\r\nlast\r\n"
+
+    @pytest.mark.asyncio
+    async def test_per_account_cap(self, server):
+        """Тест: одновременных сессий аккаунта не больше max_per_account"""
+        pool = _pool(max_per_account=2)
+        try:
+            await asyncio.gather(*(
+                pool.send_message(_target(server.port), _message(), "sender@example.com", ["a@example.com"])
+                for _ in range(8)
+            ))
+        finally:
+            await pool.close()
+        assert len(server.messages) == 8
+        assert server.max_active <= 2
+        assert pool.connections_opened <= 2
+
+    @pytest.mark.asyncio
+    async def test_rotation_after_max_messages(self, server):
+        """Тест: после max_messages писем соединение закрывается и открывается новое"""
+        pool = _pool(max_messages=2)
+        try:
+            for _ in range(5):
+                await pool.send_message(_target(server.port), _message(), "sender@example.com", ["a@example.com"])
+        finally:
+            await pool.close()
+        assert pool.connections_opened == 3
+
+
+class TestFailures:
+    """Тесты ошибок и переподключения"""
+
+    @pytest.mark.asyncio
+    async def test_reconnect_after_server_closed_idle(self, server):
+        """Тест: закрытая сервером сессия заменяется новой, письмо уходит один раз"""
+        pool = _pool()
+        try:
+            await pool.send_message(_target(server.port), _message(), "sender@example.com", ["a@example.com"])
+            server.drop_all()
+            await asyncio.sleep(0.05)
+            await pool.send_message(_target(server.port), _message(), "sender@example.com", ["a@example.com"])
+        finally:
+            await pool.close()
+        assert pool.connections_opened == 2
+        assert len(server.messages) == 2
+
+    @pytest.mark.asyncio
+    async def test_refused_recipients(self, server):
+        """Тест: отклоненные адреса возвращаются; если отклонены все - ошибка, сессия остается рабочей"""
+        from backend.api.configuration.smtp_pool import SMTPRecipientsRefused
+
+        pool = _pool()
+        try:
+            refused = await pool.send_message(_target(server.port), _message(), "sender@example.com",
+                                              ["a@example.com", "bad@example.com"])
+            assert list(refused) == ["bad@example.com"]
+            assert refused["bad@example.com"][0] == 550
+
+            with pytest.raises(SMTPRecipientsRefused):
+                await pool.send_message(_target(server.port), _message(), "sender@example.com",
+                                        ["bad@example.com"])
+
+            await pool.send_message(_target(server.port), _message(), "sender@example.com", ["c@example.com"])
+        finally:
+            await pool.close()
+        assert pool.connections_opened == 1
+        assert [message["to"] for message in server.messages] == [["a@example.com"], ["c@example.com"]]
+
+    @pytest.mark.asyncio
+    async def test_bad_credentials(self, server):
+        """Тест: отказ AUTH - ошибка SMTP, соединение в пул не попадает"""
+        from backend.api.configuration.smtp_pool import SMTPError, SMTPTarget
+
+        pool = _pool()
+        target = SMTPTarget(host="127.0.0.1", port=server.port, username="sender", password="wrong", use_tls=False)
+        with pytest.raises(SMTPError) as error:
+            await pool.send_message(target, _message(), "sender@example.com", ["a@example.com"])
+        assert error.value.code == 535
+        assert pool.stats()[f"127.0.0.1:{server.port}/sender"] == {"idle": 0, "in_use": 0}
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_without_pipelining(self):
+        """Тест: сервер без PIPELINING - команды по одной"""
+        stub = StubSMTPServer(pipelining=False)
+        port = await stub.start()
+        pool = _pool()
+        try:
+            refused = await pool.send_message(_target(port), _message(), "sender@example.com",
+                                              ["a@example.com", "bad@example.com"])
+        finally:
+            await pool.close()
+            await stub.stop()
+        assert list(refused) == ["bad@example.com"]
+        assert stub.messages[0]["to"] == ["a@example.com"]
+
+
+class TestEmailServiceDelivery:
+    """Тесты отправки писем сервисом через пул"""
+
+    @pytest.mark.asyncio
+    async def test_envelope_and_delivery_status(self, server):
+        """Тест: в конверте - адреса без имен, отклоненный получатель не отмечен доставленным"""
+        from core.database.models.email_model import EmailStatus
+        from backend.api.services.email_service import EmailService
+
+        sender = SimpleNamespace(email="sender@example.com", smtp_host="127.0.0.1", smtp_port=server.port,
+                                 smtp_username="sender", smtp_password="secret", smtp_use_tls=False)
+        recipients = [
+            SimpleNamespace(email_address="a@example.com", display_name="Анна", recipient_type="to",
+                            is_delivered=False, delivered_at=None),
+            SimpleNamespace(email_address="bad@example.com", display_name=None, recipient_type="cc",
+                            is_delivered=False, delivered_at=None),
+        ]
+        email_obj = SimpleNamespace(sender=sender, subject="Отчет", body_html=None, body_text="Добрый день",
+                                    recipients=recipients, attachments=[], status=EmailStatus.DRAFT, sent_at=None)
+
+        pool = _pool()
+        try:
+            with patch("backend.api.services.email_service.smtp_pool", pool):
+                await EmailService(session=None)._deliver_email(email_obj)
+        finally:
+            await pool.close()
+
+        assert server.messages[0]["to"] == ["a@example.com"]
+        assert email_obj.status == EmailStatus.SENT
+        assert [r.is_delivered for r in recipients] == [True, False]
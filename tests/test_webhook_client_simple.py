@@ -0,0 +1,224 @@
+"""
+Простые тесты общего HTTP-клиента webhook'ов (против локального HTTP-сервера)
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class _Stub:
+    """Локальный HTTP/1.1 сервер: запоминает запросы, соединения и параллелизм"""
+
+    def __init__(self):
+        self.status = 200
+        self.delay = 0.0
+        self.requests = []
+        self.connections = set()
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub._lock:
+                    stub.connections.add(self.client_address)
+                    stub.requests.append((dict(self.headers), body))
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                time.sleep(stub.delay)
+                with stub._lock:
+                    stub.active -= 1
+                try:
+                    self.send_response(stub.status)
+                    self.send_header("Content-Length", "2")
+                    self.end_headers()
+                    self.wfile.write(b"{}")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # клиент отменил запрос
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = _Stub()
+    yield server
+    server.close()
+
+
+class TestPool:
+    """Тесты пула соединений"""
+
+    @pytest.mark.asyncio
+    async def test_keep_alive(self, stub):
+        """Тест: последовательные вызовы идут по одному соединению"""
+        from backend.api.configuration.webhook_client import WebhookHttpClient
+
+        client = WebhookHttpClient()
+        try:
+            for i in range(5):
+                response = await client.request("POST", stub.url, json_body={"n": i})
+                assert response.status_code == 200
+        finally:
+            await client.close()
+
+        assert len(stub.requests) == 5
+        assert len(stub.connections) == 1
+        assert json.loads(stub.requests[-1][1]) == {"n": 4}
+
+    @pytest.mark.asyncio
+    async def test_per_host_limit(self, stub):
+        """Тест: к одному адресу одновременно не больше max_per_host запросов"""
+        from backend.api.configuration.webhook_client import WebhookHttpClient
+
+        stub.delay = 0.1
+        client = WebhookHttpClient(max_per_host=2)
+        try:
+            await asyncio.gather(*(client.request("POST", stub.url, json_body={}) for _ in range(5)))
+        finally:
+            await client.close()
+
+        assert len(stub.requests) == 5
+        assert stub.max_active == 2
+
+    @pytest.mark.asyncio
+    async def test_overloaded(self, stub):
+        """Тест: нет свободного слота за pool_timeout - отказ без вызова"""
+        from backend.api.configuration.webhook_client import WebhookClientOverloaded, WebhookHttpClient
+
+        stub.delay = 0.3
+        client = WebhookHttpClient(max_per_host=1, pool_timeout=0.05)
+        try:
+            results = await asyncio.gather(
+                client.request("POST", stub.url, json_body={}),
+                client.request("POST", stub.url, json_body={}),
+                return_exceptions=True
+            )
+        finally:
+            await client.close()
+
+        assert results[0].status_code == 200
+        assert isinstance(results[1], WebhookClientOverloaded)
+        assert len(stub.requests) == 1
+
+
+class TestSignature:
+    """Тесты подписи HMAC"""
+
+    @pytest.mark.asyncio
+    async def test_signed_body(self, stub):
+        """Тест: получатель проверяет подпись тела; чужое тело, секрет или старая метка не проходят"""
+        from backend.api.configuration.webhook_client import (
+            SIGNATURE_HEADER, TIMESTAMP_HEADER, WebhookHttpClient, verify_signature
+        )
+
+        client = WebhookHttpClient()
+        try:
+            await client.request("POST", stub.url, json_body={"title": "Задача"}, secret="s3cret")
+            await client.request("POST", stub.url, json_body={"title": "Без подписи"})
+        finally:
+            await client.close()
+
+        (signed_headers, body), (plain_headers, _) = stub.requests
+        timestamp, signature = signed_headers[TIMESTAMP_HEADER], signed_headers[SIGNATURE_HEADER]
+        assert signature.startswith("sha256=")
+        assert verify_signature("s3cret", body, timestamp, signature)
+        assert not verify_signature("other", body, timestamp, signature)
+        assert not verify_signature("s3cret", body + b" ", timestamp, signature)
+        assert not verify_signature("s3cret", body, timestamp, signature, now=int(timestamp) + 3600)
+        assert SIGNATURE_HEADER not in plain_headers
+
+
+class TestCircuitBreaker:
+    """Тесты предохранителя"""
+
+    def test_states(self):
+        """Тест: размыкание после порога, одна пробная попытка, замыкание после успеха"""
+        from backend.api.configuration.webhook_client import CircuitBreaker
+
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open" and not breaker.allow()
+
+        now[0] = 10.0
+        assert breaker.allow()
+        assert not breaker.allow()  # только одна пробная попытка
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+        now[0] = 20.0
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed" and breaker.failures == 0
+
+    @pytest.mark.asyncio
+    async def test_failing_endpoint_short_circuited(self, stub):
+        """Тест: после ошибок 5xx адрес не вызывается до истечения паузы"""
+        from backend.api.configuration.webhook_client import CircuitOpenError, WebhookHttpClient
+
+        stub.status = 503
+        client = WebhookHttpClient(failure_threshold=2, reset_seconds=0.2)
+        try:
+            for _ in range(2):
+                assert (await client.request("POST", stub.url, json_body={})).status_code == 503
+            with pytest.raises(CircuitOpenError):
+                await client.request("POST", stub.url, json_body={})
+            assert len(stub.requests) == 2
+            assert list(client.stats().values()) == [{"state": "open", "failures": 2}]
+
+            stub.status = 200
+            await asyncio.sleep(0.25)
+            assert (await client.request("POST", stub.url, json_body={})).status_code == 200
+            assert list(client.stats().values())[0]["state"] == "closed"
+        finally:
+            await client.close()
+
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_released(self, stub):
+        """Тест: отмененная пробная попытка считается ошибкой и не блокирует следующие пробы"""
+        from backend.api.configuration.webhook_client import CircuitOpenError, WebhookHttpClient
+
+        stub.status = 503
+        client = WebhookHttpClient(failure_threshold=1, reset_seconds=0.2)
+        try:
+            assert (await client.request("POST", stub.url, json_body={})).status_code == 503
+            await asyncio.sleep(0.25)
+
+            stub.delay = 1.0
+            probe = asyncio.create_task(client.request("POST", stub.url, json_body={}))
+            await asyncio.sleep(0.1)
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+            assert list(client.stats().values()) == [{"state": "open", "failures": 2}]
+            with pytest.raises(CircuitOpenError):
+                await client.request("POST", stub.url, json_body={})
+
+            stub.status, stub.delay = 200, 0.0
+            await asyncio.sleep(0.25)
+            assert (await client.request("POST", stub.url, json_body={})).status_code == 200
+            assert list(client.stats().values())[0]["state"] == "closed"
+        finally:
+            await client.close()